@@ -4,7 +4,7 @@ from flask import render_template, request, jsonify
 
 from .blueprint import admin_bp
 from .routes import login_required  # reuse decorator
-from app.api.push import _load_subs, _save_subs, _send_one
+from app.services.push import get_push_store, push_to_all
 
 
 @admin_bp.get('/push-test')
@@ -28,31 +28,17 @@ def admin_push_test_send():
         'tag':  'vinor-push-test'
     }
 
-    subs = _load_subs()
-    if not subs:
+    if not get_push_store().count():
         return jsonify({'ok': False, 'error': 'NO_SUBSCRIBERS'}), 400
 
-    sent = removed = failed = 0
-    alive = []
-    for s in subs:
-        r = _send_one(s, payload)
-        if r.get('ok'):
-            sent += 1
-            alive.append(s)
-        else:
-            if r.get('remove'):
-                removed += 1
-            else:
-                failed += 1
-
-    _save_subs(alive)
+    stats = push_to_all(payload)
 
     return jsonify({
         'ok': True,
-        'sent': sent,
-        'removed': removed,
-        'failed': failed,
-        'remaining': len(alive)
+        'sent': stats['sent'],
+        'removed': stats['removed'],
+        'failed': stats['failed'],
+        'remaining': get_push_store().count()
     })
 
 
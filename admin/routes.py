@@ -5,14 +5,15 @@ from __future__ import annotations
 import os
 import json
 import re
+import time
 import random
 from datetime import datetime, timedelta
 from functools import wraps
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 from flask import (
     render_template, request, redirect, url_for,
-    session, current_app, flash, abort, jsonify, send_from_directory
+    session, current_app, flash, abort, jsonify
 )
 from werkzeug.utils import secure_filename
 
@@ -37,6 +38,26 @@ def _get_express_docs_dir():
     os.makedirs(docs_dir, exist_ok=True)
     return docs_dir
 
+def _take_express_documents(form, land_code) -> List[str]:
+    """مدارکی که با آپلود تکه‌ای ارسال شده‌اند (فیلدهای document_N_upload_id)."""
+    saved: List[str] = []
+    for key in form:
+        if not (key.startswith('document_') and key.endswith('_upload_id')):
+            continue
+        for upload_id in form.getlist(key):
+            upload_id = (upload_id or '').strip()
+            if not upload_id:
+                continue
+            try:
+                original = get_chunked_store().status(upload_id, 'admin').get('filename') or 'document'
+            except ChunkedUploadError:
+                continue
+            timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+            filename = secure_filename(f"{land_code}_{timestamp}_{original}")
+            if take_upload(upload_id, 'admin', 'document', os.path.join(_get_express_docs_dir(), filename)):
+                saved.append(filename)
+    return saved
+
 def _save_express_document(file, land_code):
     """ذخیره مدارک اکسپرس"""
     if not file or not file.filename:
@@ -49,8 +70,15 @@ def _save_express_document(file, land_code):
     file_path = os.path.join(docs_dir, filename)
     file.save(file_path)
     return filename
-from app.api.push import _load_subs, _send_one, _save_subs
+from app.services.chunked_uploads import ChunkedUploadError, get_chunked_store, take_upload
+from app.services.blob_store import drop_listing_refs, parse_blob_path, sync_listing_refs
+from app.services.image_ingest import image_meta_entry, ingest_images
+from app.services.metrics import record_storage_io
+from app.services.push import get_push_store, push_to_all, push_to_user, push_to_users
 from app.services.sms import send_sms_template, send_sms_direct, send_sms_code
+from app.services.sms_history import get_sms_history_sink, record_sms
+from app.services.sms_queue import enqueue_sms
+from app.routes.uploads import send_upload
 from app.utils.storage import load_users, load_reports, save_reports, save_ads
 from app.utils.storage import (
     load_express_partner_apps,
@@ -65,8 +93,6 @@ from app.utils.storage import (
     save_partner_files_meta,
     load_active_cities,
     save_active_cities,
-    load_sms_history,
-    save_sms_history,
     load_landing_views,
     load_express_views,
     load_express_partner_views,
@@ -104,7 +130,7 @@ def notify_status_change(ad: Dict[str, Any], status: str, reason: Optional[str]
             ad_id=code,
             action_url=action_url
         )
-        # تلاش برای ارسال Web Push به تمام مشترکین
+        # ارسال Web Push فقط به دستگاه‌های صاحب آگهی
         try:
             payload = {
                 'title': 'آگهی شما تأیید شد',
@@ -114,8 +140,7 @@ def notify_status_change(ad: Dict[str, Any], status: str, reason: Optional[str]
                 'badge': '/static/icons/monochrome-192.png',
                 'tag': 'vinor-ad-approved'
             }
-            for s in (_load_subs() or []):
-                _send_one(s, payload)
+            push_to_user(uid, payload)
         except Exception:
             pass
     elif status == 'rejected':
@@ -139,8 +164,7 @@ def notify_status_change(ad: Dict[str, Any], status: str, reason: Optional[str]
                 'badge': '/static/icons/monochrome-192.png',
                 'tag': 'vinor-ad-rejected'
             }
-            for s in (_load_subs() or []):
-                _send_one(s, payload)
+            push_to_user(uid, payload)
         except Exception:
             pass
     elif status == 'expired':
@@ -161,8 +185,7 @@ def notify_status_change(ad: Dict[str, Any], status: str, reason: Optional[str]
                 'badge': '/static/icons/monochrome-192.png',
                 'tag': 'vinor-ad-expired'
             }
-            for s in (_load_subs() or []):
-                _send_one(s, payload)
+            push_to_user(uid, payload)
         except Exception:
             pass
 
@@ -189,8 +212,7 @@ def notify_admin_edit(ad: Dict[str, Any]):
             'badge': '/static/icons/monochrome-192.png',
             'tag': 'vinor-ad-edited'
         }
-        for s in (_load_subs() or []):
-            _send_one(s, payload)
+        push_to_user(uid, payload)
     except Exception:
         pass
 
@@ -218,8 +240,7 @@ def notify_admin_create(ad: Dict[str, Any]):
             'badge': '/static/icons/monochrome-192.png',
             'tag': 'vinor-ad-created'
         }
-        for s in (_load_subs() or []):
-            _send_one(s, payload)
+        push_to_user(uid, payload)
     except Exception:
         pass
 
@@ -382,23 +403,48 @@ def _lands_path() -> str:
 def _uploads_root() -> str:
     return os.path.join(current_app.static_folder, 'uploads')
 
+
+def _ingest_listing_images(files, image_meta: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    ذخیرهٔ تصاویر آگهی در blob store از مسیر مشترک ingest (stream، نرمال‌سازی، واریانت پس‌زمینه).
+    مسیرهای ذخیره‌شده مثل 'uploads/blobs/<hh>/<sha256>.jpg' برگردانده می‌شوند (عکس تکراری یک بار)؛
+    ابعاد و حجم هر تصویر در image_meta (در صورت ارسال) ثبت می‌شود.
+    تصاویر ردشده (حجم زیاد، نوع نامعتبر) کنار گذاشته و با flash به ادمین اعلام می‌شوند.
+    ارجاع‌ها بعد از ذخیرهٔ آگهی با sync_listing_refs ثبت می‌شوند.
+    """
+    rejected: List[Tuple[str, str]] = []
+    infos = ingest_images(files, _uploads_root(), prefix='uploads/', content_addressed=True,
+                          rejected=rejected)
+    for filename, reason in rejected:
+        flash(f'تصویر «{filename}» ذخیره نشد: {reason}', 'warning')
+    if image_meta is not None:
+        for info in infos:
+            image_meta[info['path']] = image_meta_entry(info)
+    return list(dict.fromkeys(info['path'] for info in infos))
+
 # -----------------------------------------------------------------------------
 # توابع کمکی JSON
 # -----------------------------------------------------------------------------
 def load_json(path: str):
     if os.path.exists(path):
+        started = time.perf_counter()
         with open(path, 'r', encoding='utf-8') as f:
             try:
                 data = json.load(f)
-                return data if isinstance(data, (list, dict)) else []
+                data = data if isinstance(data, (list, dict)) else []
             except json.JSONDecodeError:
-                return []
+                data = []
+            record_storage_io(path, 'load', os.fstat(f.fileno()).st_size, time.perf_counter() - started)
+        return data
     return []
 
 def save_json(path: str, data):
     os.makedirs(os.path.dirname(path), exist_ok=True)
+    started = time.perf_counter()
     with open(path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+        nbytes = f.tell()
+    record_storage_io(path, 'save', nbytes, time.perf_counter() - started)
 
 # -----------------------------------------------------------------------------
 # تنظیمات سیستم
@@ -522,12 +568,15 @@ def _safe_unlink(path: str):
     except Exception:
         pass
 
-def _delete_ad_images(ad: Dict[str, Any]):
-    imgs = ad.get("images") or []
+def _release_listing_images(imgs) -> None:
+    """
+    آزادسازی تصاویر آگهی: blobها مشترک‌اند و فقط با GC (scripts/gc_blobs.py) حذف می‌شوند؛
+    فایل‌های قدیمی غیر blob (static/uploads/<timestamp>__name) مستقیماً پاک می‌شوند.
+    """
     if isinstance(imgs, str):
         imgs = [imgs]
-    for img in imgs:
-        if not isinstance(img, str) or not img:
+    for img in imgs or []:
+        if not isinstance(img, str) or not img or parse_blob_path(img):
             continue
         candidates = []
         if os.path.isabs(img):
@@ -547,6 +596,12 @@ def _delete_ad_images(ad: Dict[str, Any]):
             except Exception:
                 pass
 
+
+def _delete_ad_images(ad: Dict[str, Any]):
+    # ارجاع‌های blob برداشته می‌شود؛ blob بدون ارجاع دیگر را GC حذف می‌کند
+    drop_listing_refs(ad.get("code"))
+    _release_listing_images(ad.get("images"))
+
     # حذف ویدئو (اگر وجود داشته باشد)
     try:
         video = ad.get("video")
@@ -767,15 +822,16 @@ def logout():
 # -----------------------------------------------------------------------------
 @admin_bp.route('/manifest.webmanifest')
 def admin_manifest():
-    """سرو manifest برای PWA ادمین"""
-    from flask import send_from_directory, Response
+    """سرو manifest برای PWA ادمین (نسخهٔ .br/.gz پیش‌فشرده در صورت وجود)"""
+    from flask import Response
+    from app.utils.compression import send_static
     import os
     
     static_dir = os.path.join(os.path.dirname(__file__), 'static')
     manifest_path = os.path.join(static_dir, 'admin-manifest.webmanifest')
     
     if os.path.exists(manifest_path):
-        return send_from_directory(static_dir, 'admin-manifest.webmanifest', mimetype='application/manifest+json')
+        return send_static(static_dir, 'admin-manifest.webmanifest', mimetype='application/manifest+json')
     
     # Fallback
     fallback = {
@@ -799,15 +855,15 @@ def admin_manifest():
 
 @admin_bp.route('/sw.js')
 def admin_service_worker():
-    """سرو service worker برای PWA ادمین"""
-    from flask import send_from_directory
+    """سرو service worker برای PWA ادمین (نسخهٔ .br/.gz پیش‌فشرده در صورت وجود)"""
+    from app.utils.compression import send_static
     import os
     
     static_dir = os.path.join(os.path.dirname(__file__), 'static')
     sw_path = os.path.join(static_dir, 'admin-sw.js')
     
     if os.path.exists(sw_path):
-        return send_from_directory(static_dir, 'admin-sw.js', mimetype='application/javascript')
+        return send_static(static_dir, 'admin-sw.js', mimetype='application/javascript')
     
     return ('// Admin Service Worker not found', 404)
 
@@ -1097,20 +1153,22 @@ def users_page():
 # -----------------------------------------------------------------------------
 # ارسال اعلان همگانی به همهٔ کاربران
 # -----------------------------------------------------------------------------
+def _push_subs_count() -> int:
+    try:
+        return get_push_store().count()
+    except Exception:
+        return 0
+
 @admin_bp.route('/notifications/broadcast', methods=['GET', 'POST'])
 @login_required
 def notifications_broadcast():
     message = None
     error = None
     # Diagnostics for push configuration/subscribers
-    try:
-        subs_for_diag = _load_subs()
-    except Exception:
-        subs_for_diag = []
     push_diag = {
         'has_public': bool(current_app.config.get('VAPID_PUBLIC_KEY')),
         'has_private': bool(current_app.config.get('VAPID_PRIVATE_KEY')),
-        'subs_count': len(subs_for_diag or []),
+        'subs_count': _push_subs_count(),
     }
     if request.method == 'POST':
         title = (request.form.get('title') or '').strip()
@@ -1141,11 +1199,6 @@ def notifications_broadcast():
                     pass
 
             # تلاش برای ارسال Web Push با صدا (در کلاینت)
-            try:
-                subs = _load_subs()
-            except Exception:
-                subs = []
-            push_sent = 0
             payload = {
                 "title": title,
                 "body": body,
@@ -1154,16 +1207,13 @@ def notifications_broadcast():
                 "url": url_for('main.app_home', _external=True),
                 "sound": "/static/sounds/notify.mp3"
             }
-            for s in subs:
-                res = _send_one(s, payload)
-                if res.get('ok'): push_sent += 1
-            message = f'اعلان برای {sent} کاربر ثبت و {push_sent} پوش ارسال شد.'
-            # update diagnostics after send
             try:
-                subs_for_diag = _load_subs()
+                push_sent = push_to_all(payload)['sent']
             except Exception:
-                subs_for_diag = []
-            push_diag.update({'subs_count': len(subs_for_diag or [])})
+                push_sent = 0
+            message = f'اعلان برای {sent} کاربر ثبت و {push_sent} پوش ارسال شد.'
+            # update diagnostics after send
+            push_diag.update({'subs_count': _push_subs_count()})
 
     return render_template('admin/broadcast.html', message=message, error=error, push_diag=push_diag)
 
@@ -1181,14 +1231,10 @@ def notifications_colleagues():
     message = None
     error = None
     # Diagnostics for push configuration/subscribers
-    try:
-        subs_for_diag = _load_subs()
-    except Exception:
-        subs_for_diag = []
     push_diag = {
         'has_public': bool(current_app.config.get('VAPID_PUBLIC_KEY')),
         'has_private': bool(current_app.config.get('VAPID_PRIVATE_KEY')),
-        'subs_count': len(subs_for_diag or []),
+        'subs_count': _push_subs_count(),
     }
     
     # اجرای merge خودکار کلیدهای تکراری برای اطمینان از صحت داده‌ها
@@ -1247,8 +1293,6 @@ def notifications_colleagues():
                     # partner['phone'] قبلاً normalize شده است
                     phone_normalized = partner['phone']
                     if phone_normalized and len(phone_normalized) == 11:
-                        # Log برای debug
-                        current_app.logger.info(f"Admin: Sending notification to partner: {partner['name']} ({phone_normalized})")
                         add_notification(
                             user_id=phone_normalized,
                             title=title,
@@ -1257,63 +1301,39 @@ def notifications_colleagues():
                             action_url=url_for('express_partner.dashboard', _external=True)
                         )
                         sent += 1
-                        current_app.logger.info(f"Admin: Notification sent successfully to {phone_normalized}")
                     else:
                         failed += 1
                         current_app.logger.warning(f"Admin: Invalid phone number format: {partner.get('phone', 'unknown')} (length: {len(phone_normalized) if phone_normalized else 0})")
                 except Exception as e:
                     failed += 1
                     current_app.logger.error(f"Admin: Failed to send notification to {partner.get('name', 'unknown')} ({partner.get('phone', 'unknown')}): {e}", exc_info=True)
+            # یک خط خلاصه به جای دو خط INFO برای هر همکار
+            current_app.logger.info("Admin: in-app notification sent to %d partners (%d failed)", sent, failed)
 
-            # تلاش برای ارسال Web Push با صدا (در کلاینت)
-            # توجه: چون push subscriptions با user_id مرتبط نیستند، 
-            # به همه subscriptions ارسال می‌شود (ممکن است شامل همکاران و غیرهمکاران باشد)
+            # ارسال Web Push فقط به دستگاه‌های همکاران (اشتراک‌ها با شماره تلفن صاحبشان ذخیره می‌شوند)
             push_sent = 0
             push_failed = 0
+            payload = {
+                "title": title,
+                "body": body,
+                "icon": "/static/icons/icon-192.png",
+                "badge": "/static/icons/monochrome-192.png",
+                "url": url_for('express_partner.dashboard', _external=True),
+                "sound": "/static/sounds/notify.mp3"
+            }
             try:
-                subs = _load_subs()
-            except Exception:
-                subs = []
-            
-            if subs:
-                payload = {
-                    "title": title,
-                    "body": body,
-                    "icon": "/static/icons/icon-192.png",
-                    "badge": "/static/icons/monochrome-192.png",
-                    "url": url_for('express_partner.dashboard', _external=True),
-                    "sound": "/static/sounds/notify.mp3"
-                }
-                for s in subs:
-                    try:
-                        res = _send_one(s, payload)
-                        if res.get('ok'):
-                            push_sent += 1
-                        elif res.get('remove'):
-                            # حذف subscription نامعتبر
-                            try:
-                                subs_updated = _load_subs()
-                                subs_updated = [sub for sub in subs_updated if sub.get('endpoint') != s.get('endpoint')]
-                                _save_subs(subs_updated)
-                            except Exception:
-                                pass
-                        else:
-                            push_failed += 1
-                    except Exception as e:
-                        push_failed += 1
-                        current_app.logger.error(f"Failed to send push: {e}")
-            
+                push_stats = push_to_users([p['phone'] for p in approved_partners], payload)
+                push_sent, push_failed = push_stats['sent'], push_stats['failed']
+            except Exception as e:
+                current_app.logger.error(f"Failed to send push: {e}")
+
             if failed > 0:
                 message = f'اعلان برای {sent} همکار ثبت شد ({failed} خطا). {push_sent} پوش ارسال شد ({push_failed} خطا).'
             else:
                 message = f'اعلان برای {sent} همکار ثبت و {push_sent} پوش ارسال شد.'
             
             # update diagnostics after send
-            try:
-                subs_for_diag = _load_subs()
-            except Exception:
-                subs_for_diag = []
-            push_diag.update({'subs_count': len(subs_for_diag or [])})
+            push_diag.update({'subs_count': _push_subs_count()})
     
     # بخش تست سیستم اعلان‌ها
     test_message = None
@@ -1449,7 +1469,6 @@ def sms_colleagues():
             sent = 0
             failed = 0
             failed_details = []
-            from datetime import datetime
             
             if send_mode == 'direct':
                 # حالت ارسال مستقیم
@@ -1475,28 +1494,10 @@ def sms_colleagues():
                                 )
                                 
                                 # ذخیره سابقه
-                                try:
-                                    history = load_sms_history() or []
-                                    record = {
-                                        'id': len(history) + 1,
-                                        'mobile': phone_normalized,
-                                        'recipient_name': partner['name'],
-                                        'template_id': None,
-                                        'message': direct_message,
-                                        'parameters': {},
-                                        'success': result.get('ok', False),
-                                        'status_code': result.get('status', 0),
-                                        'response': result.get('body', {}),
-                                        'source': 'admin_colleagues_direct',
-                                        'created_at': datetime.now().isoformat(),
-                                        'error': None if result.get('ok') else str(result.get('body', {}).get('message', 'Unknown error'))
-                                    }
-                                    history.append(record)
-                                    if len(history) > 10000:
-                                        history = history[-10000:]
-                                    save_sms_history(history)
-                                except Exception as hist_err:
-                                    current_app.logger.error(f"Failed to save SMS history: {hist_err}")
+                                record_sms(
+                                    phone_normalized, result, 'admin_colleagues_direct',
+                                    message=direct_message, recipient_name=partner['name'],
+                                )
                                 
                                 if result.get('ok'):
                                     sent += 1
@@ -1586,27 +1587,11 @@ def sms_colleagues():
                                 )
                                 
                                 # ذخیره سابقه
-                                try:
-                                    history = load_sms_history() or []
-                                    record = {
-                                        'id': len(history) + 1,
-                                        'mobile': phone_normalized,
-                                        'recipient_name': partner['name'],
-                                        'template_id': template_id,
-                                        'parameters': parameters or {},
-                                        'success': result.get('ok', False),
-                                        'status_code': result.get('status', 0),
-                                        'response': result.get('body', {}),
-                                        'source': 'admin_colleagues',
-                                        'created_at': datetime.now().isoformat(),
-                                        'error': None if result.get('ok') else str(result.get('body', {}).get('message', 'Unknown error'))
-                                    }
-                                    history.append(record)
-                                    if len(history) > 10000:
-                                        history = history[-10000:]
-                                    save_sms_history(history)
-                                except Exception as hist_err:
-                                    current_app.logger.error(f"Failed to save SMS history: {hist_err}")
+                                record_sms(
+                                    phone_normalized, result, 'admin_colleagues',
+                                    template_id=template_id, parameters=parameters,
+                                    recipient_name=partner['name'],
+                                )
                                 
                                 if result.get('ok'):
                                     sent += 1
@@ -1645,26 +1630,21 @@ def sms_colleagues():
     
     # واکشی سابقه ارسال‌ها
     try:
-        history = load_sms_history() or []
-        # فیلتر سابقه برای همکاران (هم با قالب و هم مستقیم)
-        colleagues_history = [h for h in history if h.get('source') in ('admin_colleagues', 'admin_colleagues_direct')]
-        # مرتب‌سازی بر اساس تاریخ (جدیدترین اول)
-        colleagues_history.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        # فیلتر سابقه برای همکاران (هم با قالب و هم مستقیم) از روی ایندکس source
+        colleagues_sources = ('admin_colleagues', 'admin_colleagues_direct')
+        sink = get_sms_history_sink()
         
-        # Pagination برای سابقه
+        # Pagination برای سابقه (جدیدترین اول)
         history_page = int(request.args.get('history_page', 1))
         history_per_page = 20
-        history_total = len(colleagues_history)
-        history_start = (history_page - 1) * history_per_page
-        history_end = history_start + history_per_page
-        paginated_history = colleagues_history[history_start:history_end]
+        history_total, paginated_history = sink.query(
+            sources=colleagues_sources,
+            offset=(history_page - 1) * history_per_page,
+            limit=history_per_page,
+        )
         
         # آمار سابقه
-        history_stats = {
-            'total': history_total,
-            'sent': len([h for h in colleagues_history if h.get('success')]),
-            'failed': len([h for h in colleagues_history if not h.get('success')])
-        }
+        history_stats = sink.stats(sources=colleagues_sources)
     except Exception as e:
         current_app.logger.error(f"Error loading SMS history: {e}")
         paginated_history = []
@@ -1701,40 +1681,31 @@ def sms_colleagues():
 def sms_history():
     """نمایش سابقه ارسال پیامک‌ها"""
     try:
-        history = load_sms_history() or []
-        
         # فیلترها
         mobile_filter = request.args.get('mobile', '').strip()
         success_filter = request.args.get('success')
         source_filter = request.args.get('source', '').strip()
+        date_filter = request.args.get('date', '').strip()
         
-        filtered_history = history
-        
-        if mobile_filter:
-            mobile_normalized = _normalize_for_sms_ir(mobile_filter)
-            filtered_history = [h for h in filtered_history if h.get('mobile') == mobile_normalized]
-        
+        success_bool = None
         if success_filter is not None and success_filter != '':
             success_bool = success_filter.lower() == 'true'
-            filtered_history = [h for h in filtered_history if h.get('success') == success_bool]
         
-        if source_filter:
-            filtered_history = [h for h in filtered_history if h.get('source') == source_filter]
-        
-        # مرتب‌سازی بر اساس تاریخ (جدیدترین اول)
-        filtered_history.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        
-        # Pagination
+        # Pagination (جدیدترین اول؛ فیلتر از روی ایندکس‌های mobile/source/date)
         page = int(request.args.get('page', 1))
         per_page = 50
-        total = len(filtered_history)
-        start = (page - 1) * per_page
-        end = start + per_page
-        paginated_history = filtered_history[start:end]
+        sink = get_sms_history_sink()
+        total, paginated_history = sink.query(
+            mobile=_normalize_for_sms_ir(mobile_filter) if mobile_filter else None,
+            source=source_filter or None,
+            success=success_bool,
+            date=date_filter or None,
+            offset=(page - 1) * per_page,
+            limit=per_page,
+        )
         
         # آمار
-        total_sent = len([h for h in history if h.get('success')])
-        total_failed = len([h for h in history if not h.get('success')])
+        overall = sink.stats()
         
         return render_template(
             'admin/sms_history.html',
@@ -1746,10 +1717,11 @@ def sms_history():
             mobile_filter=mobile_filter,
             success_filter=success_filter,
             source_filter=source_filter,
+            date_filter=date_filter,
             stats={
-                'total_records': len(history),
-                'total_sent': total_sent,
-                'total_failed': total_failed,
+                'total_records': overall['total'],
+                'total_sent': overall['sent'],
+                'total_failed': overall['failed'],
                 'filtered_total': total
             }
         )
@@ -1766,6 +1738,7 @@ def sms_history():
             mobile_filter='',
             success_filter='',
             source_filter='',
+            date_filter='',
             stats={'total_records': 0, 'total_sent': 0, 'total_failed': 0, 'filtered_total': 0}
         )
 
@@ -2128,12 +2101,13 @@ def _next_numeric_code(lands: List[Dict[str, Any]]) -> str:
     ]
     return str(max(existing_codes) + 1) if existing_codes else '1'
 
-def _normalize_images_from_form(form, files) -> List[str]:
+def _normalize_images_from_form(form, files, image_meta: Optional[Dict[str, Any]] = None) -> List[str]:
     """
     پذیرش هر دو ورودی:
     - images[] متنی (URL/مسیر)
     - images فایل
     ذخیره فایل‌ها در static/uploads و برگرداندن مسیر نسبی مثل 'uploads/filename.jpg'
+    image_meta: ابعاد/حجم فایل‌های آپلودشده در آن ثبت می‌شود
     """
     image_urls: List[str] = []
 
@@ -2147,20 +2121,20 @@ def _normalize_images_from_form(form, files) -> List[str]:
     # فایل
     upload_files = files.getlist('images')
     if upload_files:
-        upload_folder = _uploads_root()
-        os.makedirs(upload_folder, exist_ok=True)
-        for f in upload_files:
-            if f and f.filename:
-                filename = secure_filename(f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}__{f.filename}")
-                f.save(os.path.join(upload_folder, filename))
-                image_urls.append(f'uploads/{filename}')
+        image_urls.extend(_ingest_listing_images(upload_files, image_meta))
 
     return image_urls
 
-def _save_video_from_form(files) -> str | None:
+def _save_video_from_form(files, form=None) -> str | None:
     """
     ذخیره ویدیو از فرم و برگرداندن مسیر نسبی مثل 'uploads/video.mp4'
+    اگر ویدیو با آپلود تکه‌ای ارسال شده باشد، فرم فقط video_upload_id را دارد.
     """
+    upload_id = (form.get('video_upload_id') or '').strip() if form is not None else ''
+    if upload_id:
+        result = take_upload(upload_id, 'admin', 'video')
+        return result.get('path') if result else None
+
     video_file = files.get('video')
     if not video_file or not video_file.filename:
         return None
@@ -2201,7 +2175,8 @@ def add_land():
             expiry_days = 0
 
         new_code = form.get("code") or _next_numeric_code(lands)
-        images = _normalize_images_from_form(request.form, request.files)
+        image_meta: Dict[str, Any] = {}
+        images = _normalize_images_from_form(request.form, request.files, image_meta)
 
         deal_type = (form.get('deal_type') or '').strip()
         if not deal_type:
@@ -2221,6 +2196,7 @@ def add_land():
             'price_total': form.get('price_total', '').strip(),
             'price_per_meter': form.get('price_per_meter', '').strip(),
             'images': images,
+            'image_meta': image_meta,
             'approval_method': approval_method,
             'status': status,
             'created_at': iso_z(created_at_dt),
@@ -2235,6 +2211,7 @@ def add_land():
 
         lands.append(new_land)
         save_json(_lands_path(), lands)
+        sync_listing_refs(new_land)
 
         # ✅ اعلان (در صورت داشتن owner)
         notify_admin_create(new_land)
@@ -2270,7 +2247,7 @@ def add_land_video(code: str):
             flash('ثبت آگهی بدون کلیپ انجام شد.', 'info')
             return redirect(url_for('admin.lands'))
 
-        video_path = _save_video_from_form(request.files)
+        video_path = _save_video_from_form(request.files, request.form)
         if not video_path:
             flash('هیچ فایلی انتخاب نشده یا فرمت ویدیو نامعتبر است.', 'warning')
             return redirect(url_for('admin.add_land_video', code=code))
@@ -2343,17 +2320,12 @@ def edit_land(land_id: Optional[int] = None):
 
         # حذف همه تصاویر (اختیاری)
         if request.form.get('remove_all_images') == 'on':
-            for img in land.get('images', []):
-                path = os.path.join(current_app.static_folder, img)
-                if os.path.exists(path):
-                    try:
-                        os.remove(path)
-                    except Exception:
-                        pass
+            _release_listing_images(land.get('images'))
             land['images'] = []
+            land.pop('image_meta', None)
 
         # افزودن تصاویر جدید (متنی/فایل)
-        new_images = _normalize_images_from_form(request.form, request.files)
+        new_images = _normalize_images_from_form(request.form, request.files, land.setdefault('image_meta', {}))
         if new_images:
             land.setdefault('images', []).extend(new_images)
 
@@ -2370,7 +2342,7 @@ def edit_land(land_id: Optional[int] = None):
                 land.pop('video', None)
 
         # ذخیره ویدیو جدید (اگر آپلود شده)
-        new_video = _save_video_from_form(request.files)
+        new_video = _save_video_from_form(request.files, request.form)
         if new_video:
             # حذف ویدیو قدیمی در صورت وجود
             old_video = land.get('video')
@@ -2384,6 +2356,7 @@ def edit_land(land_id: Optional[int] = None):
             land['video'] = new_video
 
         save_json(_lands_path(), lands)
+        sync_listing_refs(land)
 
         # ✅ اعلان: ویرایش توسط ادمین
         notify_admin_edit(land)
@@ -2666,17 +2639,13 @@ def add_express_listing():
                 doc_filename = _save_express_document(file, new_code)
                 if doc_filename:
                     documents.append(doc_filename)
+        documents.extend(_take_express_documents(form, new_code))
         
         # پردازش تصاویر (از input multiple)
         images = []
+        image_meta: Dict[str, Any] = {}
         if 'images' in files:
-            upload_folder = _uploads_root()
-            os.makedirs(upload_folder, exist_ok=True)
-            for file in files.getlist('images'):
-                if file.filename:
-                    filename = secure_filename(f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}__{file.filename}")
-                    file.save(os.path.join(upload_folder, filename))
-                    images.append(f'uploads/{filename}')
+            images = _ingest_listing_images(files.getlist('images'), image_meta)
         
         # کمیسیون همکاران (الزامی)
         pct_raw = (form.get('express_commission_pct') or '').strip()
@@ -2730,7 +2699,7 @@ def add_express_listing():
         # ویدئو (اختیاری)
         video_path = None
         try:
-            video_path = _save_video_from_form(files)
+            video_path = _save_video_from_form(files, form)
         except Exception:
             video_path = None
 
@@ -2767,6 +2736,7 @@ def add_express_listing():
             'price_per_meter': price_per_meter,
             'description': form.get('description', '').strip(),
             'images': images,
+            'image_meta': image_meta,
             'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'owner': 'vinor_support',  # شماره پشتیبانی وینور
             'status': 'approved',  # آگهی‌های اکسپرس مستقیماً تأیید می‌شوند
@@ -2797,6 +2767,7 @@ def add_express_listing():
         lands = load_json(_lands_path())
         lands.append(new_express_land)
         save_ads(lands)
+        sync_listing_refs(new_express_land)
         
         # ارسال نوتیفیکیشن به کاربران منطقه
         # در صورت انتخاب «ارسال خودکار برای تمامی همکاران» → ساخت انتساب برای همه + اعلان
@@ -2922,12 +2893,9 @@ def edit_express_listing(code):
         for i in range(1, 4):  # image_1, image_2, image_3
             img_key = f'image_{i}'
             if img_key in files and files[img_key].filename:
-                file = files[img_key]
-                upload_folder = _uploads_root()
-                os.makedirs(upload_folder, exist_ok=True)
-                filename = secure_filename(f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}__{file.filename}")
-                file.save(os.path.join(upload_folder, filename))
-                land.setdefault('images', []).append(f'uploads/{filename}')
+                land.setdefault('images', []).extend(
+                    _ingest_listing_images([files[img_key]], land.setdefault('image_meta', {}))
+                )
         
         # اضافه کردن مدارک جدید
         for key, file in files.items():
@@ -2935,6 +2903,9 @@ def edit_express_listing(code):
                 doc_filename = _save_express_document(file, code)
                 if doc_filename:
                     land.setdefault('express_documents', []).append(doc_filename)
+        chunked_docs = _take_express_documents(form, code)
+        if chunked_docs:
+            land.setdefault('express_documents', []).extend(chunked_docs)
 
         # حذف/تغییر ویدئو (اختیاری)
         try:
@@ -2956,7 +2927,7 @@ def edit_express_listing(code):
             pass
 
         try:
-            new_video = _save_video_from_form(files)
+            new_video = _save_video_from_form(files, form)
             if new_video:
                 # حذف ویدئوی قبلی
                 old_video = land.get('video')
@@ -2976,6 +2947,7 @@ def edit_express_listing(code):
         
         # ذخیره تغییرات
         save_json(_lands_path(), lands_list)
+        sync_listing_refs(land)
         flash('آگهی اکسپرس با موفقیت به‌روزرسانی شد.', 'success')
         return redirect(url_for('admin.express_listings'))
     
@@ -3046,7 +3018,7 @@ def serve_express_document(filename):
     """سرو کردن مدارک اکسپرس"""
     try:
         docs_dir = _get_express_docs_dir()
-        return send_from_directory(docs_dir, filename)
+        return send_upload(docs_dir, filename)
     except Exception as e:
         current_app.logger.error(f"Error serving express document {filename}: {e}")
         abort(404)
@@ -3333,6 +3305,32 @@ def express_commission_approve(cid: int):
         except Exception as e:
             current_app.logger.error(f"Error updating partner stats: {e}")
 
+        # اطلاع‌رسانی فقط به همان همکار (اعلان داخلی + Web Push روی دستگاه‌های خودش)
+        try:
+            partner_phone = _normalize_phone(str(commission_record.get('partner_phone', '')).strip())
+            if partner_phone:
+                amount_txt = f"{int(commission_record.get('commission_amount') or 0):,}"
+                note_title = 'پورسانت شما تأیید شد'
+                note_body = f'پورسانت {amount_txt} تومانی شما تأیید شد.'
+                action_url = url_for('express_partner.commissions')
+                add_notification(
+                    user_id=partner_phone,
+                    title=note_title,
+                    body=note_body,
+                    ntype='success',
+                    action_url=action_url
+                )
+                push_to_user(partner_phone, {
+                    'title': note_title,
+                    'body': note_body,
+                    'url': action_url,
+                    'icon': '/static/icons/icon-192.png',
+                    'badge': '/static/icons/monochrome-192.png',
+                    'tag': 'vinor-commission-approved'
+                })
+        except Exception as e:
+            current_app.logger.error(f"Error notifying partner about approved commission: {e}")
+
         if is_referral:
             flash('پورسانت دعوت همکار تایید شد و آمار همکار به‌روز شد.', 'success')
         else:
@@ -3561,7 +3559,7 @@ def express_partner_file_download(fid: int):
     fp = os.path.join(base, meta.get('filename') or '')
     if not os.path.isfile(fp):
         abort(404)
-    return send_from_directory(base, os.path.basename(fp), as_attachment=True)
+    return send_upload(base, os.path.basename(fp), as_attachment=True)
 
 
 @admin_bp.post('/express/partner-files/<int:fid>/delete')
@@ -3699,42 +3697,13 @@ def express_partner_application_approve(aid: int):
             if not sms_message or not sms_message.strip():
                 sms_message = 'پنل همکاری وینور برای شما فعال شد. وینور'
             
-            current_app.logger.info(f"Sending approval SMS to partner: {name} ({phone})")
-            
-            sms_result = send_sms_direct(
-                mobile=phone,
-                message=sms_message,
-                line_number=sms_line_number
+            # ارسال در صف پس‌زمینه تا تأیید درخواست منتظر sms.ir نماند
+            enqueue_sms(
+                'direct',
+                history={'source': 'admin_partner_approval', 'message': sms_message, 'recipient_name': name},
+                mobile=phone, message=sms_message, line_number=sms_line_number,
             )
-            
-            # ذخیره سابقه ارسال پیامک
-            try:
-                history = load_sms_history() or []
-                record = {
-                    'id': len(history) + 1,
-                    'mobile': phone,
-                    'recipient_name': name,
-                    'template_id': None,
-                    'message': sms_message,
-                    'parameters': {},
-                    'success': sms_result.get('ok', False),
-                    'status_code': sms_result.get('status', 0),
-                    'response': sms_result.get('body', {}),
-                    'source': 'admin_partner_approval',
-                    'created_at': datetime.now().isoformat(),
-                    'error': None if sms_result.get('ok') else str(sms_result.get('body', {}).get('message', 'Unknown error'))
-                }
-                history.append(record)
-                if len(history) > 10000:
-                    history = history[-10000:]
-                save_sms_history(history)
-            except Exception as hist_err:
-                current_app.logger.error(f"Failed to save SMS history: {hist_err}")
-            
-            if sms_result.get('ok'):
-                current_app.logger.info(f"✅ Partner approval SMS sent successfully to {phone}")
-            else:
-                current_app.logger.error(f"❌ Failed to send partner approval SMS to {phone}. Status: {sms_result.get('status')}, Body: {sms_result.get('body')}")
+            current_app.logger.info(f"Partner approval SMS queued for {name} ({phone})")
     except Exception as sms_err:
         current_app.logger.error(f"Error sending partner approval SMS: {sms_err}", exc_info=True)
 
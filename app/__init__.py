@@ -13,10 +13,9 @@ import logging
 import mimetypes
 from datetime import timedelta, datetime
 from flask import (
-    Flask, request, redirect, url_for, session, current_app, send_from_directory
+    Flask, request, redirect, url_for, session, current_app
 )
 from werkzeug.exceptions import RequestEntityTooLarge
-from .utils.storage import load_settings
 
 # CSRF (Flask-WTF)
 try:
@@ -31,6 +30,16 @@ FIRST_VISIT_COOKIE = "vinor_first_visit_done"
 SESSION_COOKIE_NAME = "vinor_session"
 
 
+def _parse_offload_map(value: str) -> dict:
+    """UPLOADS_OFFLOAD_MAP از env: '/srv/uploads=/_protected/uploads;/srv/docs=/_protected/docs'"""
+    out = {}
+    for item in (value or "").split(";"):
+        root, sep, uri = item.partition("=")
+        if sep and root.strip() and uri.strip():
+            out[root.strip()] = uri.strip()
+    return out
+
+
 def _ensure_instance_folder(app: Flask) -> None:
     try:
         os.makedirs(app.instance_path, exist_ok=True)
@@ -43,13 +52,15 @@ def _setup_logging(app: Flask) -> None:
     handler.setLevel(logging.INFO)
     fmt = logging.Formatter("[%(asctime)s] %(levelname)s in %(module)s: %(message)s")
     handler.setFormatter(fmt)
-    if not any(isinstance(h, logging.StreamHandler) for h in app.logger.handlers):
+    # app.logger بین appهای یک پردازه مشترک است و ممکن است handlerها پشت صف لاگ باشند
+    from .utils.log_queue import effective_handlers
+    if not any(isinstance(h, logging.StreamHandler) for h in effective_handlers(app.logger)):
         app.logger.addHandler(handler)
     app.logger.setLevel(logging.INFO)
 
 
 def _register_jinja_filters(app: Flask) -> None:
-    """ثبت فیلترهای Jinja موردنیاز پروژه: time_ago، date_ymd، your_time_filter، basename."""
+    """ثبت فیلترهای Jinja موردنیاز پروژه: time_ago، date_ymd، your_time_filter، basename، srcset."""
     def _parse_dt(value):
         if not value:
             return None
@@ -74,24 +85,15 @@ def _register_jinja_filters(app: Flask) -> None:
 
     @app.template_filter("static_version")
     def static_version(filename):
-        """افزودن version query parameter به فایل‌های static برای جلوگیری از کش"""
+        """
+        URL فایل static با fingerprint محتوایی (?v=<hash>).
+        هش از manifest ساخته‌شده در startup می‌آید (app.utils.static_manifest) و
+        url_for('static') آن را خودکار اضافه می‌کند؛ اینجا stat یا خواندن فایل انجام نمی‌شود.
+        """
         try:
-            import os
-            from flask import url_for, current_app
-            # در template filter، current_app در دسترس است
-            static_path = os.path.join(current_app.static_folder, filename)
-            if os.path.exists(static_path):
-                # استفاده از modification time به عنوان version
-                mtime = int(os.path.getmtime(static_path))
-                base_url = url_for('static', filename=filename)
-                return f"{base_url}?v={mtime}"
             return url_for('static', filename=filename)
         except Exception:
-            # Fallback: بدون version
-            try:
-                return url_for('static', filename=filename)
-            except Exception:
-                return f"/static/{filename}"
+            return f"/static/{filename}"
 
     @app.template_filter("time_ago")
     def time_ago(value):
@@ -151,6 +153,12 @@ def _register_jinja_filters(app: Flask) -> None:
             except Exception:
                 return ''
 
+    # تصاویر واکنش‌گرا: {% set v = responsive_image(url, meta=land.image_meta[url]) %}
+    #   → v.thumb / v.card / v.srcset / v.sizes (+ v.placeholder / v.color / v.width / v.height)
+    from .utils.images import build_srcset, prepare_variants_dict
+    app.add_template_global(prepare_variants_dict, "responsive_image")
+    app.add_template_filter(build_srcset, "srcset")
+
 
 def create_app() -> Flask:
     # اطمینان از MIME صحیح برای فونت‌ها (برخی سرورها پسوند woff2 را نمی‌شناسند)
@@ -160,7 +168,17 @@ def create_app() -> Flask:
     except Exception:
         pass
 
-    app = Flask(__name__, instance_relative_config=True)
+    # VINOR_STARTUP_PROFILE=1 → زمان importها و مراحل create_app (app.utils.startup_profile)
+    from .utils.startup_profile import begin as _begin_startup_profile
+    startup = _begin_startup_profile()
+
+    # INSTANCE_PATH (مثل Passenger و benchmarks/) همان مسیری است که storage در نبود app استفاده می‌کند
+    instance_path = os.environ.get("INSTANCE_PATH")
+    app = Flask(
+        __name__,
+        instance_relative_config=True,
+        instance_path=os.path.abspath(instance_path) if instance_path else None,
+    )
 
     # ---------- پایه‌های امنیت/پیکربندی ----------
     app.secret_key = os.environ.get("SECRET_KEY") or "super-secret-key-change-this"
@@ -187,6 +205,7 @@ def create_app() -> Flask:
     except Exception:
         pass
     db_url = os.environ.get("DATABASE_URL") or f"sqlite:///{os.path.join(app.instance_path, 'vinor.db')}"
+    startup.mark("dotenv")
 
     app.config.update(
         SESSION_COOKIE_NAME=SESSION_COOKIE_NAME,
@@ -195,11 +214,20 @@ def create_app() -> Flask:
         SESSION_COOKIE_HTTPONLY=True,
         PERMANENT_SESSION_LIFETIME=timedelta(days=180),
         PREFERRED_URL_SCHEME="https" if cookie_secure else "http",
-        TEMPLATES_AUTO_RELOAD=True,
+        # None → پیروی از app.debug (در production قالب‌ها در هر render stat نمی‌شوند)
+        TEMPLATES_AUTO_RELOAD=(
+            os.environ["TEMPLATES_AUTO_RELOAD"] == "1" if os.environ.get("TEMPLATES_AUTO_RELOAD") else None
+        ),
+        # bytecode cache و precompile قالب‌ها در startup (app.utils.template_cache)
+        TEMPLATE_BYTECODE_CACHE=os.environ.get("TEMPLATE_BYTECODE_CACHE", "1") == "1",
+        TEMPLATE_CACHE_DIR=os.environ.get("TEMPLATE_CACHE_DIR", ""),
+        TEMPLATE_WARMUP=os.environ.get("TEMPLATE_WARMUP", "1") == "1",
         JSON_AS_ASCII=False,
         UPLOAD_FOLDER=os.environ.get("UPLOAD_FOLDER", default_upload_folder),
         SQLALCHEMY_DATABASE_URI=db_url,
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # SQLAlchemy در startup (init_app + create_all)؛ در غیر این صورت با get_db(app) (app.extensions)
+        DB_INIT_ON_STARTUP=os.environ.get("DB_INIT_ON_STARTUP", "0") == "1",
         # Upload limit (برای ویدئو هم استفاده می‌شود)
         MAX_CONTENT_LENGTH=getattr(Config, "MAX_CONTENT_LENGTH", 200 * 1024 * 1024),
         VAPID_PUBLIC_KEY=vapid_public,
@@ -208,25 +236,106 @@ def create_app() -> Flask:
         VAPID_CLAIMS={"sub": vapid_sub},
         VAPID_CLAIMS_SUB=vapid_sub,
         PUSH_STORE_PATH=os.environ.get("PUSH_STORE_PATH", default_push_store),
+        PUSH_DISPATCH_WORKERS=int(os.environ.get("PUSH_DISPATCH_WORKERS", "8") or 8),
         APP_BRAND_NAME="وینور اکسپرس | Vinor Express",
         WTF_CSRF_ENABLED=True,
         WTF_CSRF_TIME_LIMIT=3600,  # 1 hour
         WTF_CSRF_CHECK_DEFAULT=True,
         WTF_CSRF_METHODS=("POST", "PUT", "PATCH", "DELETE"),
+        # Rate limiting (OTP/SMS/Upload): memory یا sqlite (مشترک بین workerها)
+        RATE_LIMIT_ENABLED=os.environ.get("RATE_LIMIT_ENABLED", "1") == "1",
+        RATE_LIMIT_BACKEND=os.environ.get("RATE_LIMIT_BACKEND", "memory"),
+        # صف ارسال پیامک (OTP و پیامک‌های تراکنشی) در پس‌زمینه؛ با چند worker، SMS_QUEUE_STORE=sqlite
+        SMS_QUEUE_ENABLED=os.environ.get("SMS_QUEUE_ENABLED", "1") == "1",
+        SMS_QUEUE_WORKERS=int(os.environ.get("SMS_QUEUE_WORKERS", "2") or 2),
+        SMS_QUEUE_STORE=os.environ.get("SMS_QUEUE_STORE", "memory"),
+        # کانال زندهٔ همکاران: auto | sse | longpoll | poll
+        PARTNER_EVENTS_MODE=os.environ.get("PARTNER_EVENTS_MODE", "auto"),
+        PARTNER_EVENTS_MAX_STREAMS=int(os.environ.get("PARTNER_EVENTS_MAX_STREAMS", "50") or 50),
+        # ETag/304 برای endpointهای JSON پنل همکاران بر اساس نسخهٔ فایل‌های داده (express_partner.conditional)
+        PARTNER_CONDITIONAL_GET=os.environ.get("PARTNER_CONDITIONAL_GET", "1") == "1",
+        # ساخت واریانت تصاویر در پس‌زمینه: process | thread | inline
+        IMAGE_VARIANT_POOL=os.environ.get("IMAGE_VARIANT_POOL", "process"),
+        IMAGE_VARIANT_WORKERS=int(os.environ.get("IMAGE_VARIANT_WORKERS", "0") or 0) or None,
+        IMAGE_VARIANT_WAIT_SECONDS=float(os.environ.get("IMAGE_VARIANT_WAIT_SECONDS", "0.8") or 0.8),
+        IMAGE_VARIANT_FAILURE_TTL=float(os.environ.get("IMAGE_VARIANT_FAILURE_TTL", "600") or 0),
+        # نرمال‌سازی تصاویر آپلودی (API و پنل ادمین)
+        IMAGE_INGEST_MAX_MB=int(os.environ.get("IMAGE_INGEST_MAX_MB", "12") or 12),
+        IMAGE_INGEST_MAX_SIDE=int(os.environ.get("IMAGE_INGEST_MAX_SIDE", "1600") or 1600),
+        IMAGE_INGEST_QUALITY=int(os.environ.get("IMAGE_INGEST_QUALITY", "82") or 82),
+        # کش مسیر → ریشهٔ /uploads
+        UPLOADS_RESOLVE_CACHE_SIZE=int(os.environ.get("UPLOADS_RESOLVE_CACHE_SIZE", "4096") or 4096),
+        # سپردن ارسال فایل‌های آپلود به وب‌سرور: '' | x-accel (nginx) | x-sendfile (Apache/LiteSpeed)
+        UPLOADS_OFFLOAD=os.environ.get("UPLOADS_OFFLOAD", ""),
+        UPLOADS_OFFLOAD_PREFIX=os.environ.get("UPLOADS_OFFLOAD_PREFIX", "/_offload"),
+        UPLOADS_OFFLOAD_MAP=_parse_offload_map(os.environ.get("UPLOADS_OFFLOAD_MAP", "")),
+        # آپلود تکه‌ای و قابل ادامه (ویدئو و مدارک حجیم)
+        CHUNKED_UPLOAD_MAX_MB=int(os.environ.get("CHUNKED_UPLOAD_MAX_MB", "500") or 500),
+        CHUNKED_UPLOAD_CHUNK_MB=int(os.environ.get("CHUNKED_UPLOAD_CHUNK_MB", "4") or 4),
+        CHUNKED_UPLOAD_TTL_HOURS=int(os.environ.get("CHUNKED_UPLOAD_TTL_HOURS", "24") or 24),
+        # manifest فایل‌های static: مسیر ذخیره و پایش تغییرات (پیش‌فرض پایش فقط در debug)
+        STATIC_MANIFEST_PATH=os.environ.get("STATIC_MANIFEST_PATH", ""),
+        STATIC_MANIFEST_WATCH=(
+            os.environ["STATIC_MANIFEST_WATCH"] == "1" if os.environ.get("STATIC_MANIFEST_WATCH") else None
+        ),
+        STATIC_MANIFEST_WATCH_INTERVAL=float(os.environ.get("STATIC_MANIFEST_WATCH_INTERVAL", "1.0") or 1.0),
+        # blob store محتوامحور: حداقل سن blob بدون ارجاع برای حذف (scripts/gc_blobs.py)
+        BLOB_GC_GRACE_HOURS=float(os.environ.get("BLOB_GC_GRACE_HOURS", "24") or 24),
+        # متریک‌ها (/metrics، /diag) و هدر Server-Timing (پیش‌فرض فقط در debug)
+        METRICS_ENABLED=os.environ.get("METRICS_ENABLED", "1") == "1",
+        METRICS_DIR=os.environ.get("METRICS_DIR", ""),
+        METRICS_FLUSH_SECONDS=float(os.environ.get("METRICS_FLUSH_SECONDS", "15") or 15),
+        METRICS_SERVER_TIMING=(
+            os.environ["METRICS_SERVER_TIMING"] == "1" if os.environ.get("METRICS_SERVER_TIMING") else None
+        ),
+        METRICS_TOKEN=os.environ.get("METRICS_TOKEN", ""),
+        # مسیر سریع static/media: بدون session، کوکی CSRF، gate و tracking (app.utils.route_classes)
+        ROUTE_FAST_PATH=os.environ.get("ROUTE_FAST_PATH", "1") == "1",
+        # لاگ غیرمسدودکننده: صف + writer پس‌زمینه، نرخ‌محدودسازی و JSON lines (app.utils.log_queue)
+        LOG_QUEUE_ENABLED=os.environ.get("LOG_QUEUE_ENABLED", "1") == "1",
+        LOG_QUEUE_SIZE=int(os.environ.get("LOG_QUEUE_SIZE", "10000") or 10000),
+        LOG_RATE_LIMIT=float(os.environ.get("LOG_RATE_LIMIT", "50") or 0),
+        LOG_RATE_BURST=int(os.environ.get("LOG_RATE_BURST", "200") or 200),
+        LOG_FORMAT=os.environ.get("LOG_FORMAT", "json"),
+        # فشرده‌سازی br/gzip پاسخ‌های متنی و سرو .br/.gz فایل‌های static (app.utils.compression)
+        COMPRESS_ENABLED=os.environ.get("COMPRESS_ENABLED", "1") == "1",
+        COMPRESS_MIN_SIZE=int(os.environ.get("COMPRESS_MIN_SIZE", "1024") or 1024),
+        COMPRESS_GZIP_LEVEL=int(os.environ.get("COMPRESS_GZIP_LEVEL", "6") or 6),
+        COMPRESS_BR_QUALITY=int(os.environ.get("COMPRESS_BR_QUALITY", "4") or 4),
+        COMPRESS_CACHE_MB=float(os.environ.get("COMPRESS_CACHE_MB", "32") or 0),
+        COMPRESS_STATIC_PRECOMPRESSED=os.environ.get("COMPRESS_STATIC_PRECOMPRESSED", "1") == "1",
     )
 
     _ensure_instance_folder(app)
     _setup_logging(app)
+    from .utils.log_queue import init_log_queue, sampled
+    init_log_queue(app)
+    startup.mark("config")
+
+    # دسته‌بندی routeها: session برای static/media نه خوانده و نه ذخیره می‌شود
+    from .utils.route_classes import RouteAwareSessionInterface, STATIC, is_lightweight, route_class
+    app.session_interface = RouteAwareSessionInterface()
     _register_jinja_filters(app)
+    startup.mark("session + jinja filters")
 
-    # Initialize DB (SQLAlchemy)
-    try:
-        from .extensions import db
-        db.init_app(app)
-        with app.app_context():
-            db.create_all()
-    except Exception as e:
-        app.logger.warning(f"DB init/create_all skipped: {e}")
+    # manifest هش محتوایی فایل‌های static (url_for('static') → ?v=<hash>)
+    from .utils.static_manifest import IMMUTABLE_CACHE_CONTROL, get_static_manifest, init_static_manifest
+    init_static_manifest(app)
+    startup.mark("static manifest")
+
+    # متریک درخواست‌ها/IO (قبل از بقیهٔ hookها تا latency کل درخواست را بسنجد)
+    from .services.metrics import init_metrics
+    init_metrics(app)
+    startup.mark("metrics")
+
+    # Initialize DB (SQLAlchemy) – فقط با DB_INIT_ON_STARTUP؛ بقیه با get_db(app) در اولین استفاده
+    if app.config.get("DB_INIT_ON_STARTUP"):
+        try:
+            from .extensions import get_db
+            get_db(app, create_all=True)
+        except Exception as e:
+            app.logger.warning(f"DB init/create_all skipped: {e}")
+        startup.mark("database")
 
     # Enable CORS for /api/* (mobile app consumption)
     try:
@@ -234,6 +343,7 @@ def create_app() -> Flask:
         CORS(app, resources={r"/api/*": {"origins": "*"}})
     except Exception as e:
         app.logger.warning(f"CORS not enabled: {e}")
+    startup.mark("cors")
 
     # ---------- Upload too large (413) ----------
     @app.errorhandler(RequestEntityTooLarge)
@@ -249,20 +359,11 @@ def create_app() -> Flask:
         flash(msg, "warning")
         return redirect(request.referrer or url_for("admin.add_express_listing"))
 
-    @app.context_processor
-    def inject_vinor_globals():
-        is_logged = bool(session.get("user_id") or session.get("user_phone"))
-        try:
-            settings = load_settings(app)
-        except Exception:
-            settings = {}
-        return {
-            "VAPID_PUBLIC_KEY": app.config.get("VAPID_PUBLIC_KEY", ""),
-            "VINOR_IS_LOGGED_IN": is_logged,
-            "APP_BRAND_NAME": app.config.get("APP_BRAND_NAME", "Vinor Express"),
-            "csrf_token": generate_csrf,
-            "SHOW_SUBMIT_BUTTON": bool(settings.get("show_submit_button", True)),
-        }
+    # context قالب‌ها: یک provider با مقادیر lazy (app.utils.template_context)؛
+    # مقادیر پرهزینه فقط در صورت استفاده در قالب و یک بار در هر درخواست محاسبه می‌شوند
+    from .utils.template_context import init_template_context
+    init_template_context(app, generate_csrf)
+    startup.mark("template context")
 
     # ---------- رجیستر بلوپرینت‌ها ----------
     from .routes import main_bp
@@ -319,6 +420,7 @@ def create_app() -> Flask:
         app.register_blueprint(push_api_bp)
     if uploads_bp is not None:
         app.register_blueprint(uploads_bp)
+    startup.mark("blueprints main + api")
 
     # Public REST API v1 (removed)
 
@@ -327,11 +429,18 @@ def create_app() -> Flask:
     def add_cache_headers(resp):
         try:
             path = request.path or ""
+            # static با fingerprint محتوایی فعلی (?v=<hash>) → محتوای URL هرگز عوض نمی‌شود
+            static_prefix = (app.static_url_path or "/static").rstrip("/") + "/"
+            if path.startswith(static_prefix) and resp.status_code == 200 and get_static_manifest(app).is_fingerprinted(
+                path[len(static_prefix):], request.args.get("v")
+            ):
+                resp.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+                return resp
             # اگر هدر Cache-Control قبلاً ست شده (مثلاً برای واریانت تصاویر)، دست نزن
             if resp.headers.get("Cache-Control"):
                 return resp
-            # Long cache for static assets and uploads
-            if path.startswith("/static/") or path.startswith("/uploads/"):
+            # Long cache for static assets and uploads (404 نباید یک سال کش شود)
+            if (path.startswith("/static/") or path.startswith("/uploads/")) and resp.status_code < 400:
                 resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
                 return resp
             # HTML should not be cached aggressively
@@ -349,6 +458,7 @@ def create_app() -> Flask:
         app.register_blueprint(express_partner_bp)
     except Exception as e:
         app.logger.warning(f"Express Partner blueprint not available: {e}")
+    startup.mark("blueprint express_partner")
 
     # Admin blueprint
     try:
@@ -357,6 +467,17 @@ def create_app() -> Flask:
         app.logger.info(f"Admin blueprint registered successfully: {admin_bp.name}")
     except Exception as e:
         app.logger.error(f"Admin blueprint registration failed: {e}", exc_info=True)
+    startup.mark("blueprint admin")
+
+    # فشرده‌سازی پاسخ‌ها و static از پیش فشرده (بعد از همهٔ blueprintها تا viewهای static آن‌ها هم پوشش داده شوند)
+    from .utils.compression import init_compression, send_static
+    init_compression(app)
+    startup.mark("compression")
+
+    # قالب‌ها: bytecode cache و precompile همهٔ قالب‌های app و بلوپرینت‌ها
+    from .utils.template_cache import init_template_cache
+    init_template_cache(app)
+    startup.mark("template cache + warm-up")
 
     # ---------- CSRF ----------
     if CSRFProtect is not None:
@@ -412,6 +533,9 @@ def create_app() -> Flask:
 
         @app.after_request
         def set_csrf_cookie(resp):
+            # فایل‌های static/media کوکی نمی‌گیرند (قابل کش در proxy و بدون ساخت توکن)
+            if is_lightweight():
+                return resp
             try:
                 token = generate_csrf()
                 resp.set_cookie(
@@ -431,12 +555,15 @@ def create_app() -> Flask:
             @app.errorhandler(CSRFError)
             def handle_csrf_error(e):
                 from flask import flash
-                current_app.logger.error(
-                    "CSRF_ERROR: %s | path=%s | form=%s | headers=%s",
+                # فقط نام فیلدها و چند هدر لازم (بدون مقادیر فرم، کوکی و توکن‌ها)
+                current_app.logger.warning(
+                    "CSRF_ERROR: %s | path=%s | fields=%s | referer=%s | origin=%s | ua=%s",
                     getattr(e, "description", str(e)),
                     request.path,
-                    dict(request.form),
-                    dict(request.headers),
+                    sorted(request.form.keys()),
+                    request.headers.get("Referer", ""),
+                    request.headers.get("Origin", ""),
+                    (request.headers.get("User-Agent") or "")[:120],
                 )
                 flash("لطفاً صفحه را تازه کنید و دوباره تلاش کنید.", "warning")
                 try:
@@ -448,6 +575,7 @@ def create_app() -> Flask:
     # Service Worker وینور غیرفعال شد - فقط همکاران اکسپرس از Service Worker استفاده می‌کنند
     # اما برای جلوگیری از 404، یک fallback اضافه می‌کنیم
     @app.get("/sw.js")
+    @route_class(STATIC)
     def service_worker_fallback():
         """Fallback route for /sw.js - redirects to express partner service worker"""
         from flask import redirect, url_for
@@ -461,6 +589,7 @@ def create_app() -> Flask:
                           status=404)
 
     @app.get("/manifest.webmanifest")
+    @route_class(STATIC)
     def serve_manifest():
         from flask import Response
         static_dir = os.path.join(app.root_path, "static")
@@ -470,7 +599,7 @@ def create_app() -> Flask:
         current_app.logger.info("Manifest lookup at: %s", file_path)
 
         if os.path.exists(file_path):
-            return send_from_directory(static_dir, "manifest.webmanifest", mimetype=mimetype)
+            return send_static(static_dir, "manifest.webmanifest", mimetype=mimetype)
 
         fallback_json = r'''{
           "id": "/",
@@ -499,16 +628,23 @@ def create_app() -> Flask:
         return Response(fallback_json, status=200, mimetype=mimetype)
 
     # ---------- Gate ----------
+    def gate_log(decision):
+        # در هر درخواست اجرا می‌شود: فقط با DEBUG و نمونه‌ای از هر call site
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug("%s: %s", decision, request.path, extra=sampled(50))
+
     @app.before_request
     def landing_gate():
+        if is_lightweight():
+            return
         # مسیری که گیت‌وی اصلاً در آن دخالت نکند (پنل ادمین، خودش لایهٔ امنیتی جدا دارد)
         if request.path.startswith("/admin"):
-            current_app.logger.debug("PASS (admin-scope): %s", request.path)
+            gate_log("PASS (admin-scope)")
             return
 
         safe_prefixes = ("/static", "/api", "/uploads")
         if request.path.startswith(safe_prefixes):
-            current_app.logger.debug("PASS (prefix): %s", request.path)
+            gate_log("PASS (prefix)")
             return
 
         safe_paths = {
@@ -516,7 +652,7 @@ def create_app() -> Flask:
             "/favicon.ico", "/robots.txt", "/sitemap.xml",
             "/site.webmanifest", "/manifest.webmanifest", "/sw.js",
             "/git-webhook", "/git-webhook/",
-            "/healthz", "/diag", "/connection",
+            "/healthz", "/diag", "/metrics", "/connection",
             # Public help pages (accessible بدون لاگین)
             "/help", "/راهنما",
             # Public landing pages
@@ -531,22 +667,24 @@ def create_app() -> Flask:
         # Public dynamic paths (prefix-based)
         public_prefixes = ("/express/", "/uploads/")
         if request.path.startswith(public_prefixes):
-            current_app.logger.debug("PASS (public-prefix): %s", request.path)
+            gate_log("PASS (public-prefix)")
             return
         if request.path in safe_paths:
             # صفحه اصلی (/) حالا لندینگ همکاران است و باید عمومی باشد
             # دیگر کاربران لاگین شده را از / به /app redirect نمی‌کنیم
-            current_app.logger.debug("PASS (path): %s", request.path)
+            gate_log("PASS (path)")
             return
 
         user_logged_in = bool(session.get("user_id") or session.get("user_phone"))
 
         if user_logged_in:
-            current_app.logger.debug("PASS (logged-in): %s", request.path)
+            gate_log("PASS (logged-in)")
             return
 
         # New policy: All users can access landing page
-        current_app.logger.debug("REDIRECT → / (guest): %s", request.path)
+        gate_log("REDIRECT → / (guest)")
         return redirect(url_for("main.index"))
 
+    startup.mark("csrf + hooks")
+    startup.finish(app)
     return app
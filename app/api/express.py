@@ -6,12 +6,36 @@ Express Listings API endpoints for Vinor Express feature
 
 from flask import Blueprint, jsonify, request, current_app, make_response, session, url_for
 from app.utils.storage import load_express_lands_cached, get_lands_file_stats, load_express_reposts, load_express_partners, load_settings
-from app.utils.images import prepare_variants_dict
+from app.utils.images import image_meta_for, prepare_variants_dict
 from app.services.notifications import add_notification
 from app.utils.share_tokens import encode_partner_ref
 
 express_api_bp = Blueprint('express_api', __name__, url_prefix='/api')
 
+
+def _listing_image_fields(land):
+    """
+    فیلدهای تصویر کاور (thumb/card/srcset/...) و images_v2؛ ابعاد، placeholder تار و رنگ غالب
+    از image_meta آگهی می‌آیند تا کلاینت بدون درخواست اضافه چیدمان و رنگ اولیه را بکشد.
+    """
+    images = land.get('images', []) or []
+    images_v2 = [prepare_variants_dict(i, meta=image_meta_for(land, i)) for i in images]
+    cover = images_v2[0] if images_v2 else prepare_variants_dict(None)
+    return {
+        'image_thumb': cover.get('thumb'),
+        'image_card': cover.get('card'),
+        'image_srcset': cover.get('srcset'),
+        'image_sizes': cover.get('sizes'),
+        'image_full': cover.get('full'),
+        'image_raw': cover.get('raw'),
+        'image_width': cover.get('width'),
+        'image_height': cover.get('height'),
+        'image_placeholder': cover.get('placeholder'),
+        'image_color': cover.get('color'),
+        'images_v2': images_v2,
+    }
+
+
 @express_api_bp.route('/app/version', methods=['GET'])
 def get_app_version():
     """
@@ -114,19 +138,15 @@ def express_search():
         minimal_lands = []
         for land in express_lands[:50]:  # محدود کردن به 50 نتیجه اول
             images = land.get('images', []) or []
-            cover = images[0] if images else None
-            cover_variants = prepare_variants_dict(cover)
-            minimal_lands.append({
+            item = {
                 'code': land.get('code'),
                 'title': land.get('title'),
                 'location': land.get('location'),
                 'images': images[:1],
-                'image_thumb': cover_variants.get('thumb'),
-                'image_full': cover_variants.get('full'),
-                'image_raw': cover_variants.get('raw'),
-                'images_v2': [prepare_variants_dict(i) for i in images],
-                'video': land.get('video')
-            })
+            }
+            item.update(_listing_image_fields(land))
+            item['video'] = land.get('video')
+            minimal_lands.append(item)
         
         response = make_response(jsonify({
             'success': True,
@@ -221,24 +241,22 @@ def express_list():
         minimal_lands = []
         for land in paginated_lands:
             images = land.get('images', []) or []
-            cover = images[0] if images else None
-            cover_variants = prepare_variants_dict(cover)
-            minimal_lands.append({
+            item = {
                 'code': land.get('code'),
                 'title': land.get('title'),
                 'location': land.get('location'),
                 'category': land.get('category'),
                 'images': images[:1],  # فقط اولین تصویر
-                'image_thumb': cover_variants.get('thumb'),
-                'image_full': cover_variants.get('full'),
-                'image_raw': cover_variants.get('raw'),
-                'images_v2': [prepare_variants_dict(i) for i in images],
+            }
+            item.update(_listing_image_fields(land))
+            item.update({
                 'video': land.get('video'),
                 'price_total': land.get('price_total'),
                 'created_at': land.get('created_at'),
                 '_share_token': land.get('_share_token',''),
                 '_repost_by_name': land.get('_repost_by_name',''),
             })
+            minimal_lands.append(item)
         
         response = make_response(jsonify({
             'success': True,
@@ -290,15 +308,8 @@ def get_express_detail(code):
             resp.headers['Cache-Control'] = 'public, max-age=300, stale-while-revalidate=600'
             return resp
 
-        images = express_land.get('images') or []
-        cover_variants = prepare_variants_dict(images[0] if images else None)
         express_land = dict(express_land)
-        express_land.update({
-            'image_thumb': cover_variants.get('thumb'),
-            'image_full': cover_variants.get('full'),
-            'image_raw': cover_variants.get('raw'),
-            'images_v2': [prepare_variants_dict(i) for i in images],
-        })
+        express_land.update(_listing_image_fields(express_land))
 
         response = make_response(jsonify({
             'success': True,
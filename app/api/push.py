@@ -5,47 +5,56 @@ from __future__ import annotations
 import os
 import json
 from typing import List, Dict, Any
-from flask import Blueprint, current_app, request, jsonify
+from flask import Blueprint, current_app, request, jsonify, session
+
+from ..services.metrics import timed_outbound
+from ..services.push import get_push_store
 
 # اگر pywebpush ندارید: pip install pywebpush cryptography aiohttp
 # نسخه‌های قدییم pywebpush با cryptography≥۴۵ هشدار SECP256R1 می‌دادند؛ pywebpush≥۲ اصلاح شده است.
-try:
-    from pywebpush import webpush, WebPushException
-except Exception:
-    webpush = None
-    WebPushException = Exception  # fallback برای import
+# pywebpush (همراه cryptography و aiohttp) سنگین است؛ در اولین ارسال import می‌شود نه در startup.
+_WEBPUSH = None  # None: هنوز بارگذاری نشده، False: نصب نیست
+
+
+def _load_webpush():
+    """(webpush, WebPushException) یا None اگر pywebpush نصب نباشد."""
+    global _WEBPUSH
+    if _WEBPUSH is None:
+        try:
+            from pywebpush import webpush, WebPushException
+            _WEBPUSH = (webpush, WebPushException)
+        except Exception:
+            _WEBPUSH = False
+    return _WEBPUSH or None
 
 api_push_bp = Blueprint('api_push', __name__, url_prefix='/api/push')
 
 # -------------------------------
-# مسیر فایل سابسکرایب‌ها
+# سابسکرایب‌ها (SQLite با ایندکس endpoint/phone؛ app/services/push.py)
 # -------------------------------
 def _subs_path() -> str:
+    """مسیر فایل قدیمی push_subs.json (فقط برای مهاجرت)."""
     base = current_app.instance_path
     path = os.path.join(base, 'data', 'push_subs.json')
     os.makedirs(os.path.dirname(path), exist_ok=True)
     return path
 
 def _load_subs() -> List[Dict[str, Any]]:
-    path = _subs_path()
-    if os.path.exists(path):
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-        except Exception:
-            return []
-    return []
+    try:
+        return get_push_store().all()
+    except Exception:
+        return []
 
 def _save_subs(subs: List[Dict[str, Any]]) -> None:
-    path = _subs_path()
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(subs, f, ensure_ascii=False, indent=2)
+    get_push_store().replace_all(subs)
 
 # این توابع را ادمین برای تست هم استفاده می‌کند
+@timed_outbound('push', 'webpush')
 def _send_one(subscription: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
-    if webpush is None:
+    loaded = _load_webpush()
+    if loaded is None:
         return {'ok': False, 'error': 'PYWEBPUSH_NOT_INSTALLED', 'remove': False}
+    webpush, WebPushException = loaded
 
     vapid_private = current_app.config.get('VAPID_PRIVATE_KEY', '')
     vapid_claims = {'sub': current_app.config.get('VAPID_CLAIMS_SUB', 'mailto:support@vinor.ir')}
@@ -91,17 +100,10 @@ def subscribe():
     if not isinstance(sub, dict) or 'endpoint' not in sub:
         return jsonify({'ok': False, 'error': 'INVALID_SUBSCRIPTION'}), 400
 
-    subs = _load_subs()
-    endpoint = sub.get('endpoint')
-
-    idx = next((i for i, s in enumerate(subs) if s.get('endpoint') == endpoint), None)
-    if idx is not None:
-        subs[idx] = sub
-    else:
-        subs.append(sub)
-
-    _save_subs(subs)
-    return jsonify({'ok': True, 'count': len(subs)})
+    # صاحب اشتراک فقط از session تعیین می‌شود (نه از بدنهٔ درخواست)
+    store = get_push_store()
+    store.upsert(sub, phone=session.get('user_phone'))
+    return jsonify({'ok': True, 'count': store.count()})
 
 # -------------------------------
 # API: Unsubscribe (body: {"endpoint": "..."})
@@ -113,18 +115,16 @@ def unsubscribe():
     if not endpoint:
         return jsonify({'ok': False, 'error': 'MISSING_ENDPOINT'}), 400
 
-    subs = _load_subs()
-    subs = [s for s in subs if s.get('endpoint') != endpoint]
-    _save_subs(subs)
-    return jsonify({'ok': True, 'count': len(subs)})
+    store = get_push_store()
+    store.remove(endpoint)
+    return jsonify({'ok': True, 'count': store.count()})
 
 # -------------------------------
 # دیباگ: شمار مشترک‌ها
 # -------------------------------
 @api_push_bp.get('/subs')
 def list_subs():
-    subs = _load_subs()
-    return jsonify({'ok': True, 'count': len(subs)})
+    return jsonify({'ok': True, 'count': get_push_store().count()})
 
 # -------------------------------
 # سازگاری عقب‌رو (alias)
@@ -4,10 +4,10 @@
 SMS API endpoints for communication with sms.ir
 """
 
-from datetime import datetime
 from flask import Blueprint, jsonify, request, current_app
 from app.services.sms import send_sms_template, SMS_API_KEY
-from app.utils.storage import load_sms_history, save_sms_history
+from app.services.sms_history import get_sms_history_sink, record_sms
+from app.services.rate_limit import rate_limited, SMS_API_RULES
 
 sms_api_bp = Blueprint('sms_api', __name__, url_prefix='/api/sms')
 
@@ -30,34 +30,12 @@ def _normalize_phone_for_sms(mobile: str) -> str:
 
 def _save_sms_record(mobile: str, template_id: int, parameters: dict, result: dict, 
                      source: str = 'api', recipient_name: str = None):
-    """ذخیره سابقه ارسال پیامک"""
-    try:
-        history = load_sms_history(current_app) or []
-        record = {
-            'id': len(history) + 1,
-            'mobile': mobile,
-            'recipient_name': recipient_name,
-            'template_id': template_id,
-            'parameters': parameters or {},
-            'success': result.get('ok', False),
-            'status_code': result.get('status', 0),
-            'response': result.get('body', {}),
-            'source': source,  # 'api', 'admin_colleagues', 'admin_campaign'
-            'created_at': datetime.now().isoformat(),
-            'error': None if result.get('ok') else str(result.get('body', {}).get('message', 'Unknown error'))
-        }
-        history.append(record)
-        # نگه داشتن فقط 10000 رکورد آخر
-        if len(history) > 10000:
-            history = history[-10000:]
-        save_sms_history(history, current_app)
-    except Exception as e:
-        try:
-            current_app.logger.error(f"Failed to save SMS history: {e}")
-        except Exception:
-            pass
+    """ذخیره سابقه ارسال پیامک (بافرشده؛ بدون بازنویسی کل فایل)"""
+    record_sms(mobile, result, source, template_id=template_id, parameters=parameters,
+               recipient_name=recipient_name, app=current_app)
 
 @sms_api_bp.route('/send', methods=['POST'])
+@rate_limited(*SMS_API_RULES)
 def send_sms():
     """
     ارسال پیامک با استفاده از sms.ir
@@ -164,9 +142,7 @@ def sms_status():
     """
     try:
         has_api_key = bool(SMS_API_KEY)
-        history = load_sms_history(current_app) or []
-        total_sent = len([h for h in history if h.get('success')])
-        total_failed = len([h for h in history if not h.get('success')])
+        stats = get_sms_history_sink(current_app).stats()
         
         return jsonify({
             'success': True,
@@ -174,9 +150,9 @@ def sms_status():
             'api_key_configured': has_api_key,
             'endpoint': 'https://api.sms.ir/v1/send/verify',
             'stats': {
-                'total_records': len(history),
-                'total_sent': total_sent,
-                'total_failed': total_failed
+                'total_records': stats['total'],
+                'total_sent': stats['sent'],
+                'total_failed': stats['failed']
             }
         }), 200
     except Exception as e:
@@ -196,31 +172,33 @@ def sms_history():
         - limit: تعداد رکوردها (پیش‌فرض: 100)
         - offset: شروع از رکورد (پیش‌فرض: 0)
         - mobile: فیلتر بر اساس شماره موبایل
+        - source: فیلتر بر اساس منبع ارسال (api, api_bulk, admin_colleagues, ...)
+        - date: فیلتر بر اساس تاریخ (YYYY-MM-DD)
         - success: فیلتر بر اساس موفقیت (true/false)
     """
     try:
-        history = load_sms_history(current_app) or []
-        
         # فیلتر بر اساس شماره موبایل
         mobile_filter = request.args.get('mobile')
         if mobile_filter:
             mobile_filter = _normalize_phone_for_sms(mobile_filter)
-            history = [h for h in history if h.get('mobile') == mobile_filter]
         
         # فیلتر بر اساس موفقیت
         success_filter = request.args.get('success')
+        success_bool = None
         if success_filter is not None:
             success_bool = success_filter.lower() == 'true'
-            history = [h for h in history if h.get('success') == success_bool]
-        
-        # مرتب‌سازی بر اساس تاریخ (جدیدترین اول)
-        history.sort(key=lambda x: x.get('created_at', ''), reverse=True)
         
-        # Pagination
+        # Pagination (جدیدترین اول)
         limit = int(request.args.get('limit', 100))
         offset = int(request.args.get('offset', 0))
-        total = len(history)
-        history = history[offset:offset + limit]
+        total, history = get_sms_history_sink(current_app).query(
+            mobile=mobile_filter or None,
+            source=(request.args.get('source') or '').strip() or None,
+            success=success_bool,
+            date=(request.args.get('date') or '').strip() or None,
+            offset=offset,
+            limit=limit,
+        )
         
         return jsonify({
             'success': True,
@@ -238,6 +216,7 @@ def sms_history():
 
 
 @sms_api_bp.route('/bulk-send', methods=['POST'])
+@rate_limited(*SMS_API_RULES)
 def bulk_send_sms():
     """
     ارسال پیامک به چند شماره به صورت گروهی
@@ -2,162 +2,44 @@
 """
 Uploads API for Vinor (vinor.ir)
 - Endpoint: POST /api/uploads/images  → برمی‌گرداند: {"success": true, "id": "...", "url": "..."}
-- Static serve: GET  /uploads/<path:filename>
+- آپلود تکه‌ای و قابل ادامه: /api/uploads/chunked (app/services/chunked_uploads.py)
+- سرو فایل‌ها: GET /uploads/<path:filename> در app/routes/uploads.py
 - هماهنگ با CONFIG: app.config["UPLOAD_FOLDER"]
 """
 from __future__ import annotations
-import os
-import uuid
-import imghdr
-from datetime import datetime
-from typing import Tuple
-from flask import Blueprint, current_app, request, jsonify, send_from_directory
-from app.utils.storage import legacy_dir
-from app.utils.images import (
-    generate_thumb_and_full,
-    THUMB_WIDTH,
-    THUMB_QUALITY,
-    FULL_WIDTH,
-    FULL_QUALITY,
-    variant_headers_for_width,
-)
-from werkzeug.utils import secure_filename
-from io import BytesIO
-
-try:
-    from PIL import Image, ImageOps
-    _PIL_OK = True
-except Exception:
-    _PIL_OK = False
+from flask import Blueprint, current_app, request, jsonify, session
+from app.services.rate_limit import rate_limited, UPLOAD_RULES
+from app.services.chunked_uploads import ChunkedUploadError, get_chunked_store
+from app.services.image_ingest import IngestError, image_meta_entry, ingest_image
+from app.utils.images import PRESET_QUALITY, VARIANT_PRESETS, build_srcset, preset_url
 
 uploads_bp = Blueprint("uploads", __name__)
 
-# محدودیت‌ها
-ALLOWED_EXTS = {"jpg", "jpeg", "png", "gif", "webp"}
-MAX_SIZE_MB = 12  # با فرانت هماهنگ
-
-def _ensure_folder(path: str) -> None:
-    os.makedirs(path, exist_ok=True)
-
-def _guess_ext_from_bytes(b: bytes) -> str:
-    kind = imghdr.what(None, b)
-    if kind == "jpeg":
-        return "jpg"
-    return kind or "jpg"
-
-def _validate_file(fieldname: str = "file") -> Tuple[bytes, str]:
-    """
-    برمی‌گرداند: (file_bytes, ext) — در صورت خطا raise Exception
-    """
-    if fieldname not in request.files:
-        raise ValueError("فایلی ارسال نشده است.")
-    f = request.files[fieldname]
-    if not f or f.filename == "":
-        raise ValueError("نام فایل نامعتبر است.")
-
-    raw = f.read()
-    if not raw:
-        raise ValueError("فایل خالی است.")
-
-    # محدودیت حجم
-    if len(raw) > MAX_SIZE_MB * 1024 * 1024:
-        raise ValueError(f"حجم بیش از {MAX_SIZE_MB} مگابایت است.")
-
-    ext = _guess_ext_from_bytes(raw)
-    if ext not in ALLOWED_EXTS:
-        # اگر حدس اشتباه بود، از پسوند امن‌شده استفاده کنیم
-        original_ext = secure_filename(f.filename).rsplit(".", 1)[-1].lower() if "." in f.filename else ""
-        if original_ext in ALLOWED_EXTS:
-            ext = original_ext
-        else:
-            raise ValueError("فقط تصاویر مجاز هستند.")
-
-    return raw, ext
-
-
-def _process_image_bytes(raw: bytes, ext_hint: str) -> Tuple[bytes, str]:
-    """
-    Resize and compress image to a web-friendly size.
-    - Keeps GIF as-is to avoid breaking animations
-    - Otherwise, outputs optimized JPEG (RGB, max 1600x1600, quality ~82)
-    Returns: (processed_bytes, output_ext)
-    """
-    # Keep GIF untouched
-    if (ext_hint or '').lower() == 'gif' or not _PIL_OK:
-        return raw, ext_hint
-
-    try:
-        with Image.open(BytesIO(raw)) as im:
-            # Auto-orient using EXIF
-            try:
-                im = ImageOps.exif_transpose(im)
-            except Exception:
-                pass
-
-            # Convert to RGB, flatten alpha onto white background
-            if im.mode in ("RGBA", "LA"):
-                bg = Image.new("RGB", im.size, (255, 255, 255))
-                bg.paste(im, mask=im.split()[-1])
-                im = bg
-            elif im.mode != 'RGB':
-                im = im.convert('RGB')
-
-            # Resize to fit within 1600x1600 preserving aspect ratio
-            im.thumbnail((1600, 1600), Image.LANCZOS)
-
-            buf = BytesIO()
-            im.save(buf, format='JPEG', quality=82, optimize=True, progressive=True)
-            return buf.getvalue(), 'jpg'
-    except Exception:
-        # On any processing error, fall back to original bytes
-        return raw, ext_hint
-
 @uploads_bp.post("/api/uploads/images")
+@rate_limited(*UPLOAD_RULES)
 def upload_image():
     """
     ذخیرهٔ تصویر و برگرداندن شناسه
     پاسخ استاندارد:
     {
       "success": true,
-      "id": "2025/08/31/4d2f...e7.jpg",
-      "url": "/uploads/2025/08/31/4d2f...e7.jpg"
+      "id": "blobs/4d/4d2f...e7.jpg",
+      "url": "/uploads/blobs/4d/4d2f...e7.jpg"
     }
+    فایل با SHA-256 محتوا در blob store ذخیره می‌شود؛ آپلود تکراری همان id را برمی‌گرداند.
     """
     try:
-        raw, ext = _validate_file("file")
-        # Resize/compress
-        raw, out_ext = _process_image_bytes(raw, ext)
-
         base_dir = current_app.config.get("UPLOAD_FOLDER")
         if not base_dir:
             return jsonify({"success": False, "error": "UPLOAD_FOLDER تنظیم نشده"}), 500
 
-        # ساخت مسیر تاریخ‌محور: /YYYY/MM/DD/
-        today = datetime.utcnow()
-        rel_dir = os.path.join(str(today.year), f"{today.month:02d}", f"{today.day:02d}")
-        abs_dir = os.path.join(base_dir, rel_dir)
-        _ensure_folder(abs_dir)
+        # ذخیرهٔ stream، نرمال‌سازی، ذخیرهٔ محتوامحور (blobs/<hh>/<sha256>) و ساخت پس‌زمینهٔ واریانت‌ها
+        info = ingest_image(request.files.get("file"), base_dir, content_addressed=True)
 
-        # نام یکتا
-        uid = uuid.uuid4().hex
-        filename = f"{uid}.{(out_ext or ext).lower()}"
-        abs_path = os.path.join(abs_dir, filename)
-
-        # نوشتن فایل
-        with open(abs_path, "wb") as out:
-            out.write(raw)
-
-        rel_path = os.path.join(rel_dir, filename).replace("\\", "/")
+        rel_path = info["rel"]
         url = f"/uploads/{rel_path}"
-
-        # Pre-generate thumb/full variants for faster first paint
-        try:
-            variants = generate_thumb_and_full(base_dir, rel_path)
-            url_thumb = f"/uploads/{variants['thumb_rel']}" if variants.get("thumb_rel") else ""
-            url_full = f"/uploads/{variants['full_rel']}" if variants.get("full_rel") else ""
-        except Exception:
-            url_thumb = ""
-            url_full = ""
+        url_thumb = preset_url(url, "thumb")
+        url_full = preset_url(url, "full")
 
         return jsonify({
             "success": True,
@@ -167,81 +49,88 @@ def upload_image():
             "url_thumb": url_thumb,
             "url_full": url_full,
             "meta": {
-                "thumb": {"width": THUMB_WIDTH, "quality": THUMB_QUALITY, "format": "webp"},
-                "full": {"width": FULL_WIDTH, "quality": FULL_QUALITY, "format": "webp"},
+                name: {"width": VARIANT_PRESETS[name], "quality": PRESET_QUALITY[name], "format": "webp"}
+                for name in VARIANT_PRESETS
             },
+            "srcset": build_srcset(url),
+            "image": image_meta_entry(info),
         })
+    except IngestError as e:
+        return jsonify({"success": False, "ok": False, "error": str(e)}), 400
     except Exception as e:
         current_app.logger.exception("Upload failed")
         return jsonify({"success": False, "ok": False, "error": str(e)}), 400
 
-@uploads_bp.get("/uploads/<path:filename>")
-def serve_uploads(filename: str):
-    """
-    سرو فایل‌های آپلود شده از UPLOAD_FOLDER.
-    پشتیبانی از پارامترهای واریانت:
-      - w: عرض هدف
-      - q: کیفیت
-      - fmt: فرمت خروجی (webp)
-      - variant: thumb|full (صرفاً برای دیباگ)
-    """
-    def _try_variant(root: str, safe_name: str):
-        try:
-            width = int(request.args.get("w", 0) or 0)
-            quality = int(request.args.get("q", 0) or 0) or 80
-            fmt = (request.args.get("fmt") or "webp").lower()
-        except Exception:
-            width = 0
-            quality = 80
-            fmt = "webp"
-
-        if width <= 0:
-            return None
-
-        variant_abs = None
-        try:
-            variant_abs = generate_variant_path(root, safe_name, width, quality, fmt)
-        except Exception:
-            variant_abs = None
-
-        if not variant_abs:
-            return None
-
-        variant_dir, variant_file = os.path.split(variant_abs)
-        resp = send_from_directory(variant_dir, variant_file)
-        resp.headers["Cache-Control"] = variant_headers_for_width(width)
-        resp.headers["Content-Type"] = "image/webp"
-        return resp
-
-    def generate_variant_path(root: str, safe_name: str, width: int, quality: int, fmt: str):
-        # استفاده از همان ساختار __variants__/... برای کش دیسکی
-        from app.utils.images import generate_variant  # محلی برای جلوگیری از چرخه
-
-        variant_rel = generate_variant(root, safe_name, width, quality, f"w{width}_q{quality}", fmt.upper())
-        if not variant_rel:
-            return None
-        abs_path = os.path.join(root, variant_rel)
-        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-        return abs_path
-
-    base_dir = current_app.config.get("UPLOAD_FOLDER")
-    if base_dir:
-        safe_path = os.path.normpath(filename).replace("\\", "/")
-        try:
-            # در صورت درخواست واریانت (w/q) سعی کن از کش بسازی/بخوانی
-            variant_resp = _try_variant(base_dir, safe_path)
-            if variant_resp:
-                return variant_resp
-        except Exception:
-            current_app.logger.debug("Variant generation skipped", exc_info=True)
-        try:
-            resp = send_from_directory(base_dir, safe_path)
-            resp.headers["Cache-Control"] = "public, max-age=86400, stale-while-revalidate=86400"
-            return resp
-        except Exception:
-            pass
-
-    # فالبک به مسیر قدیمی کنار کد
-    legacy_base = os.path.join(legacy_dir(current_app), "uploads")
-    safe_path = os.path.normpath(filename).replace("\\", "/")
-    return send_from_directory(legacy_base, safe_path)
+
+# -------- آپلود تکه‌ای (ویدئو و مدارک حجیم) --------
+PARTNER_CHUNKED_KINDS = {"document"}
+
+
+def _chunked_owner(kind: str = "") -> str:
+    """ادمین → 'admin'؛ همکار لاگین‌شده → شماره تلفن (فقط مدارک)؛ در غیر این صورت 401/403."""
+    if session.get("logged_in"):
+        return "admin"
+    phone = (session.get("user_phone") or "").strip()
+    if not phone:
+        raise ChunkedUploadError("unauthorized", 401)
+    if kind and kind not in PARTNER_CHUNKED_KINDS:
+        raise ChunkedUploadError("forbidden", 403)
+    return f"partner:{phone}"
+
+
+def _chunked_error(e: ChunkedUploadError):
+    body = {"success": False, "ok": False, "error": str(e)}
+    body.update(e.extra)
+    return jsonify(body), e.status
+
+
+@uploads_bp.post("/api/uploads/chunked")
+@rate_limited(*UPLOAD_RULES)
+def chunked_init():
+    data = request.get_json(silent=True) or request.form
+    kind = str(data.get("kind") or "").strip()
+    try:
+        size = int(data.get("size") or 0)
+    except (TypeError, ValueError):
+        size = 0
+    try:
+        status = get_chunked_store().init(_chunked_owner(kind), str(data.get("filename") or ""), size, kind)
+    except ChunkedUploadError as e:
+        return _chunked_error(e)
+    return jsonify({"success": True, "ok": True, **status}), 201
+
+
+@uploads_bp.put("/api/uploads/chunked/<upload_id>")
+def chunked_put(upload_id: str):
+    try:
+        offset = int(request.args.get("offset", -1))
+    except (TypeError, ValueError):
+        offset = -1
+    store = get_chunked_store()
+    try:
+        new_offset = store.write_chunk(
+            upload_id, _chunked_owner(), offset, request.stream, request.content_length
+        )
+    except ChunkedUploadError as e:
+        return _chunked_error(e)
+    return jsonify({"success": True, "ok": True, "id": upload_id, "offset": new_offset})
+
+
+@uploads_bp.get("/api/uploads/chunked/<upload_id>")
+def chunked_status(upload_id: str):
+    try:
+        status = get_chunked_store().status(upload_id, _chunked_owner())
+    except ChunkedUploadError as e:
+        return _chunked_error(e)
+    return jsonify({"success": True, "ok": True, **status})
+
+
+@uploads_bp.post("/api/uploads/chunked/<upload_id>/finalize")
+def chunked_finalize(upload_id: str):
+    try:
+        status = get_chunked_store().finalize(upload_id, _chunked_owner())
+    except ChunkedUploadError as e:
+        return _chunked_error(e)
+    except IngestError as e:
+        return jsonify({"success": False, "ok": False, "error": str(e)}), 400
+    return jsonify({"success": True, "ok": True, **status})
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Conditional GET برای endpointهای JSON پنل همکاران – ETag قوی از نسخهٔ فایل‌های داده
+
+هر endpoint وابستگی‌هایش را اعلام می‌کند و decorator زیر ``require_partner_access`` قرار می‌گیرد
+(تا 304 فقط به کاربر مجاز داده شود):
+
+    @express_partner_bp.get('/commissions/data', endpoint='commissions_data')
+    @require_partner_access(allow_pending=True, allow_guest=True)
+    @conditional_json('express_commissions')
+    def commissions_data(): ...
+
+tag از endpoint، شمارهٔ همکار جاری، query string، host، نسخهٔ کد و نسخهٔ (mtime/size) فایل‌های
+اعلام‌شده ساخته می‌شود (``app.utils.storage.storage_version``)؛ یعنی فقط چند stat و قبل از هر
+load یا محاسبه. اگر If-None-Match با آن بخواند 304 برمی‌گردد و view اجرا نمی‌شود. نسخه از خود
+فایل می‌آید، پس بین workerها یکسان است و نوشتن از هر پردازه‌ای tag را عوض می‌کند.
+
+خروجی‌هایی که به زمان هم وابسته‌اند (انقضای آگهی، توکن CSRF، ماه جاری) با ``bucket`` (ثانیه)
+یا ``vary`` (تابعی که رشتهٔ اضافه برمی‌گرداند) در tag لحاظ می‌شوند.
+پاسخ بدون Cache-Control صریح ``private, no-cache`` می‌گیرد: کلاینت نگه می‌دارد و هر بار می‌پرسد.
+
+تنظیمات (app.config):
+  PARTNER_CONDITIONAL_GET   فعال/غیرفعال (پیش‌فرض True)
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from functools import wraps
+from typing import Callable, Optional
+
+from flask import current_app, make_response, request, session
+
+from ..services.metrics import record_cache
+from ..utils.storage import STORAGE_FILES, storage_version
+
+PRIVATE_REVALIDATE = 'private, no-cache'
+
+_code_version: Optional[str] = None
+
+
+def _code_salt() -> str:
+    """تغییر کد پنل (شکل پاسخ‌ها) بدون تغییر داده هم tagها را باطل کند؛ بین workerها یکسان است."""
+    global _code_version
+    if _code_version is None:
+        here = os.path.dirname(os.path.abspath(__file__))
+        mtimes = []
+        for fn in sorted(os.listdir(here)):
+            if fn.endswith('.py'):
+                try:
+                    mtimes.append(os.stat(os.path.join(here, fn)).st_mtime_ns)
+                except OSError:
+                    continue
+        _code_version = '%x' % max(mtimes or [0])
+    return _code_version
+
+
+def partner_etag(collections, bucket: Optional[int] = None, vary: Optional[Callable[[], str]] = None) -> str:
+    parts = [
+        _code_salt(), request.endpoint or '', (session.get('user_phone') or '').strip(),
+        request.host, request.query_string.decode('latin-1'),
+    ]
+    parts.extend(f"{name}={storage_version(name)}" for name in collections)
+    if bucket:
+        parts.append('t=%d' % (int(time.time()) // bucket))
+    if vary is not None:
+        parts.append(str(vary()))
+    return hashlib.blake2b('|'.join(parts).encode('utf-8'), digest_size=12).hexdigest()
+
+
+def conditional_json(*collections: str, bucket: Optional[int] = None, vary: Optional[Callable[[], str]] = None):
+    """Decorator: پاسخ 304 بدون اجرای view اگر داده‌های ``collections`` از آخرین درخواست کلاینت تغییر نکرده باشند."""
+    unknown = [name for name in collections if name not in STORAGE_FILES]
+    if unknown:
+        raise ValueError(f"unknown storage collections: {unknown}")
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('PARTNER_CONDITIONAL_GET', True):
+                return fn(*args, **kwargs)
+            etag = partner_etag(collections, bucket, vary)
+            hit = request.if_none_match.contains_weak(etag)
+            record_cache('conditional:' + (request.endpoint or ''), hit, layer='http')
+            if hit:
+                resp = current_app.response_class(status=304)
+                resp.set_etag(etag)
+                resp.headers['Cache-Control'] = PRIVATE_REVALIDATE
+                return resp
+            resp = make_response(fn(*args, **kwargs))
+            if resp.status_code == 200 and 'ETag' not in resp.headers:
+                resp.set_etag(etag)
+                if not resp.headers.get('Cache-Control'):
+                    resp.headers['Cache-Control'] = PRIVATE_REVALIDATE
+            return resp
+        return wrapper
+    return decorator
+
+
+__all__ = ['conditional_json', 'partner_etag', 'PRIVATE_REVALIDATE']
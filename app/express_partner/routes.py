@@ -6,10 +6,10 @@ from typing import Any, Dict, List
 
 from flask import (
     render_template, request, redirect, url_for, session,
-    send_from_directory, current_app, abort, flash, g
+    current_app, abort, flash, g
 )
 from functools import wraps
-import random, re, time
+import random, re, threading, time
 
 from . import express_partner_bp
 from ..utils.storage import (
@@ -20,20 +20,31 @@ from ..utils.storage import (
     load_express_assignments, save_express_assignments, load_express_commissions, load_express_commissions_cached, save_express_commissions,
     load_express_reposts, save_express_reposts,
     load_ads_cached, load_active_cities, load_express_lands_cached,
-    load_sms_history, save_sms_history,
     load_settings,
     load_express_partner_views, save_express_partner_views,
     load_partner_routines, load_partner_routines_cached, save_partner_routines,
     load_partner_bank_accounts, save_partner_bank_accounts,
+    ensure_file,
 )
+from .conditional import conditional_json
 from .partner_bank_accounts import (
     validate_new_account,
     public_account_dict,
     accounts_for_phone,
     catalog_public,
 )
+from ..services.blob_store import avatar_owner, get_blob_store
+from ..routes.uploads import send_upload
+from ..services.chunked_uploads import ChunkedUploadError, get_chunked_store, take_upload
+from ..services.image_ingest import IngestError, ingest_image
 from ..services.notifications import get_user_notifications, unread_count, mark_read, mark_all_read
-from ..services.sms import send_sms_direct
+from ..services.rate_limit import Rule, rate_limited, key_ip, UPLOAD_RULES
+from ..services.sms_queue import enqueue_otp, enqueue_sms, job_status
+from ..services import events as partner_events_bus
+from ..services.metrics import record_cache
+from ..utils.log_queue import sampled
+from ..utils.route_classes import STATIC, is_lightweight, route_class
+from ..utils.template_context import template_value
 from flask import jsonify, make_response
 
 
@@ -45,6 +56,7 @@ def _sort_by_created_at_desc(items: List[Dict[str, Any]]) -> List[Dict[str, Any]
 def _express_partners_cached() -> List[Dict[str, Any]]:
     """در هر درخواست فقط یک‌بار لیست همکاران از دیسک خوانده می‌شود."""
     cached = getattr(g, '_express_partners_list_cached', None)
+    record_cache('express_partners', cached is not None, layer='request')
     if cached is not None:
         return cached
     try:
@@ -85,7 +97,9 @@ def _ensure_session_partner_on_g() -> None:
 
 
 def _express_commissions_cached() -> List[Dict[str, Any]]:
-    if getattr(g, '_express_commissions_cached', None) is not None:
+    hit = getattr(g, '_express_commissions_cached', None) is not None
+    record_cache('express_commissions', hit, layer='request')
+    if hit:
         return g._express_commissions_cached
     try:
         lst = load_express_commissions_cached() or []
@@ -166,6 +180,7 @@ def _invalidate_partner_session_cache() -> None:
 def _active_cities_cached() -> List[str]:
     """لیست شهرهای فعال — یک‌بار در هر درخواست."""
     cached = getattr(g, '_active_cities_cached', None)
+    record_cache('active_cities', cached is not None, layer='request')
     if cached is not None:
         return cached
     try:
@@ -180,7 +195,9 @@ def _active_cities_cached() -> List[str]:
 
 def _express_settings_cached() -> Dict[str, Any]:
     """در هر درخواست یک‌بار تنظیمات (برای پروفایل و غیره)."""
-    if getattr(g, '_express_settings_loaded', False):
+    hit = getattr(g, '_express_settings_loaded', False)
+    record_cache('settings', hit, layer='request')
+    if hit:
         return getattr(g, '_express_settings_data', {}) or {}
     g._express_settings_loaded = True
     try:
@@ -208,6 +225,50 @@ def _normalize_phone(phone: str) -> str:
     return p[:11]
 
 
+def _otp_phone_key() -> str:
+    """کلید سطل OTP: شماره نرمال‌شده از JSON، فرم یا سشن (شماره نامعتبر → بدون محدودیت تلفنی)."""
+    data = request.get_json(silent=True) or {}
+    phone = _normalize_phone(
+        (data.get('phone') or request.form.get('phone') or session.get('otp_phone') or '').strip()
+    )
+    return phone if len(phone) == 11 else ''
+
+
+# سقف ارسال کد تأیید: هر شماره ۳ کد در ۱۰ دقیقه، هر IP ۱۰ کد در ۱۰ دقیقه (مشترک بین وب، اپ و ارسال مجدد)
+OTP_RULES = (
+    Rule('otp_phone', 3, 600, _otp_phone_key),
+    Rule('otp_ip', 10, 600, key_ip),
+)
+OTP_LIMITED_MESSAGE = 'درخواست کد تأیید بیش از حد مجاز است. لطفاً {wait} ثانیه دیگر دوباره تلاش کنید.'
+
+
+def _login_rate_limited(retry_after: int):
+    flash(OTP_LIMITED_MESSAGE.format(wait=retry_after), 'warning')
+    return render_template('express_partner/auth/login_step1.html'), 429
+
+
+def _api_login_rate_limited(retry_after: int):
+    return jsonify({
+        'success': False,
+        'error': OTP_LIMITED_MESSAGE.format(wait=retry_after),
+        'retry_after': retry_after,
+    }), 429
+
+
+def _otp_resend_rate_limited(retry_after: int):
+    return jsonify({
+        'ok': False,
+        'error': OTP_LIMITED_MESSAGE.format(wait=retry_after),
+        'retry_after': retry_after,
+    }), 429
+
+
+def _upload_rate_limited(retry_after: int):
+    flash('تعداد آپلودها بیش از حد مجاز است. لطفاً کمی بعد دوباره تلاش کنید.', 'warning')
+    return redirect(url_for('express_partner.dashboard'))
+
+
+
 def _mark_routine_today(phone: str) -> bool:
     """ثبت روز جاری برای روتین همکار (بازگشت True در صورت تغییر)."""
     if not phone:
@@ -481,7 +542,7 @@ def _express_partner_no_store_html(resp):
 @express_partner_bp.before_request
 def track_online_partner():
     """فعالیت آنلاین سبک — بدون نوشتن فایل روتین روی هر درخواست."""
-    if not session.get("user_phone"):
+    if is_lightweight() or not session.get("user_phone"):
         return
     session.permanent = True
     try:
@@ -531,48 +592,36 @@ def track_online_partner():
     except Exception:
         pass
 
-@express_partner_bp.app_context_processor
-def inject_role_flags():
-    try:
-        me = str(session.get("user_phone") or "").strip()
-    except Exception:
-        me = ""
-    is_express_partner = False
-    if me:
-        if 'VINOR_IS_EXPRESS_PARTNER' in session:
-            is_express_partner = bool(session.get('VINOR_IS_EXPRESS_PARTNER'))
-        else:
-            _ensure_session_partner_on_g()
-            is_express_partner = _is_partner_approved(getattr(g, 'express_partner_profile', None))
-            session['VINOR_IS_EXPRESS_PARTNER'] = is_express_partner
-    
-    # دریافت VAPID_PUBLIC_KEY از config
-    try:
-        from flask import current_app
-        vapid_public = current_app.config.get("VAPID_PUBLIC_KEY", "")
-    except Exception:
-        vapid_public = ""
-    
-    return {
-        "VINOR_IS_EXPRESS_PARTNER": is_express_partner,
-        "VAPID_PUBLIC_KEY": vapid_public,
-    }
+@template_value('VINOR_IS_EXPRESS_PARTNER', default=False)
+def _template_is_express_partner() -> bool:
+    """نقش همکار تأییدشده برای قالب‌ها؛ فقط در صورت استفاده در قالب محاسبه و در session نگه داشته می‌شود."""
+    me = str(session.get("user_phone") or "").strip()
+    if not me:
+        return False
+    if 'VINOR_IS_EXPRESS_PARTNER' in session:
+        return bool(session.get('VINOR_IS_EXPRESS_PARTNER'))
+    _ensure_session_partner_on_g()
+    is_express_partner = _is_partner_approved(getattr(g, 'express_partner_profile', None))
+    session['VINOR_IS_EXPRESS_PARTNER'] = is_express_partner
+    return is_express_partner
 
 
 # -------------------------
 # PWA Routes (Separate from main VINOR PWA)
 # -------------------------
 @express_partner_bp.route('/manifest.webmanifest', methods=['GET'], endpoint='manifest')
+@route_class(STATIC)
 def serve_manifest():
     """Serve Express Partner manifest separately"""
-    from flask import Response, send_from_directory
+    from flask import Response
+    from ..utils.compression import send_static
     import os
     static_dir = os.path.join(current_app.root_path, "static")
     file_path = os.path.join(static_dir, "express-partner.webmanifest")
     mimetype = "application/manifest+json"
     
     if os.path.exists(file_path):
-        return send_from_directory(static_dir, "express-partner.webmanifest", mimetype=mimetype)
+        return send_static(static_dir, "express-partner.webmanifest", mimetype=mimetype)
     
     # Fallback JSON
     fallback_json = '''{
@@ -601,16 +650,18 @@ def serve_manifest():
 
 
 @express_partner_bp.route('/sw.js', methods=['GET'], endpoint='service_worker')
+@route_class(STATIC)
 def serve_service_worker():
     """Serve Express Partner service worker separately"""
-    from flask import send_from_directory, Response
+    from flask import Response
+    from ..utils.compression import send_static
     import os
     static_dir = os.path.join(current_app.root_path, "static")
     sw_file = "express-partner-sw.js"
     sw_path = os.path.join(static_dir, sw_file)
     
     if os.path.exists(sw_path):
-        return send_from_directory(static_dir, sw_file, mimetype="application/javascript")
+        return send_static(static_dir, sw_file, mimetype="application/javascript")
     
     # Fallback: return empty service worker if file not found
     current_app.logger.warning(f"Service worker file not found: {sw_path}")
@@ -780,38 +831,17 @@ def apply_step3():
                 if not sms_message or not sms_message.strip():
                     sms_message = 'درخواست همکاری شما ثبت شد و در حال بررسی است. وینور'
                 
-                current_app.logger.info(f"Attempting to send SMS to {phone_normalized} (original: {me_phone})")
-                
-                sms_result = send_sms_direct(mobile=phone_normalized, message=sms_message, line_number=sms_line_number)
-                
-                # ذخیره سابقه ارسال پیامک به همکار
-                try:
-                    history = load_sms_history(current_app) or []
-                    record = {
-                        'id': len(history) + 1,
-                        'mobile': phone_normalized,
-                        'recipient_name': data.get('name', ''),
-                        'template_id': None,
-                        'message': sms_message,
-                        'parameters': {},
-                        'success': sms_result.get('ok', False),
-                        'status_code': sms_result.get('status', 0),
-                        'response': sms_result.get('body', {}),
+                # ارسال در صف پس‌زمینه؛ سابقه پس از ارسال ثبت می‌شود
+                enqueue_sms(
+                    'direct',
+                    history={
                         'source': 'express_partner_application',
-                        'created_at': datetime.utcnow().isoformat() + 'Z',
-                        'error': None if sms_result.get('ok') else str(sms_result.get('body', {}).get('message', 'Unknown error'))
-                    }
-                    history.append(record)
-                    if len(history) > 10000:
-                        history = history[-10000:]
-                    save_sms_history(history, current_app)
-                except Exception as hist_err:
-                    current_app.logger.error(f"Failed to save SMS history: {hist_err}")
-                
-                if sms_result.get('ok'):
-                    current_app.logger.info(f"✅ Application confirmation SMS sent successfully to {phone_normalized}")
-                else:
-                    current_app.logger.error(f"❌ Failed to send application confirmation SMS to {phone_normalized}. Status: {sms_result.get('status')}, Body: {sms_result.get('body')}")
+                        'message': sms_message,
+                        'recipient_name': data.get('name', ''),
+                    },
+                    mobile=phone_normalized, message=sms_message, line_number=sms_line_number,
+                )
+                current_app.logger.info(f"Application confirmation SMS queued for {phone_normalized}")
             else:
                 current_app.logger.error(f"❌ Invalid phone number format: {me_phone} -> normalized: {phone_normalized}")
 
@@ -827,42 +857,16 @@ def apply_step3():
                     admin_sms_message = 'درخواست همکاری جدید همکار در وینور ثبت شد.'
 
                 if admin_phone and len(admin_phone) == 11 and admin_phone.startswith('09'):
-                    current_app.logger.info(f"Attempting to send admin SMS about new partner application to {admin_phone}")
-
-                    admin_sms_result = send_sms_direct(
-                        mobile=admin_phone,
-                        message=admin_sms_message,
-                        line_number=sms_line_number,
-                    )
-
-                    # ذخیره سابقه ارسال پیامک به ادمین
-                    try:
-                        history = load_sms_history(current_app) or []
-                        record_admin = {
-                            'id': len(history) + 1,
-                            'mobile': admin_phone,
-                            'recipient_name': 'admin',
-                            'template_id': None,
-                            'message': admin_sms_message,
-                            'parameters': {},
-                            'success': admin_sms_result.get('ok', False),
-                            'status_code': admin_sms_result.get('status', 0),
-                            'response': admin_sms_result.get('body', {}),
+                    enqueue_sms(
+                        'direct',
+                        history={
                             'source': 'express_partner_application_admin',
-                            'created_at': datetime.utcnow().isoformat() + 'Z',
-                            'error': None if admin_sms_result.get('ok') else str(admin_sms_result.get('body', {}).get('message', 'Unknown error'))
-                        }
-                        history.append(record_admin)
-                        if len(history) > 10000:
-                            history = history[-10000:]
-                        save_sms_history(history, current_app)
-                    except Exception as hist_err_admin:
-                        current_app.logger.error(f"Failed to save admin SMS history: {hist_err_admin}")
-
-                    if admin_sms_result.get('ok'):
-                        current_app.logger.info(f"✅ Admin notification SMS sent successfully to {admin_phone}")
-                    else:
-                        current_app.logger.error(f"❌ Failed to send admin notification SMS to {admin_phone}. Status: {admin_sms_result.get('status')}, Body: {admin_sms_result.get('body')}")
+                            'message': admin_sms_message,
+                            'recipient_name': 'admin',
+                        },
+                        mobile=admin_phone, message=admin_sms_message, line_number=sms_line_number,
+                    )
+                    current_app.logger.info(f"Admin notification SMS queued for {admin_phone}")
                 else:
                     current_app.logger.error(f"❌ Invalid admin phone format: {admin_phone_raw} -> normalized: {admin_phone}")
             except Exception as admin_err:
@@ -1209,7 +1213,7 @@ def _dashboard_data_payload(me_phone, profile, has_pending_app, assigned_lands,
             'commission_pct': land.get('_commission_pct'),
             'assignment_status': (land.get('_assignment_status') or 'active').strip(),
             'is_expired': bool(land.get('_is_expired')),
-            'size': (land.get('size') or '').strip(),
+            'size': str(land.get('size') or '').strip(),
             'location': (land.get('location') or '').strip(),
             'city': (land.get('city') or '').strip(),
             'category': (land.get('category') or '').strip(),
@@ -1265,7 +1269,7 @@ def _public_lands_payload(limit=50):
             'commission_pct': None,
             'assignment_status': 'active',
             'is_expired': False,
-            'size': (land.get('size') or '').strip(),
+            'size': str(land.get('size') or '').strip(),
             'location': (land.get('location') or '').strip(),
             'city': (land.get('city') or '').strip(),
             'category': (land.get('category') or '').strip(),
@@ -1278,6 +1282,9 @@ def _public_lands_payload(limit=50):
 
 @express_partner_bp.get('/dashboard/data', endpoint='dashboard_data')
 @require_partner_access(allow_pending=True, allow_guest=True)
+# انقضای آگهی و رفع خودکار معامله به زمان وابسته‌اند → tag حداکثر ۵ دقیقه معتبر
+@conditional_json('lands', 'express_partners', 'express_partner_apps', 'express_assignments',
+                  'express_commissions', bucket=300)
 def dashboard_data():
     """API JSON برای اپ اندروید: داده داشبورد (فایل‌های ارسالی، آمار، وضعیت)."""
     me_phone = (session.get("user_phone") or "").strip()
@@ -1553,6 +1560,7 @@ def commissions_page():
 
 @express_partner_bp.get('/commissions/data', endpoint='commissions_data')
 @require_partner_access(allow_pending=True, allow_guest=True)
+@conditional_json('express_commissions')
 def commissions_data():
     """API JSON برای اپ اندروید: خلاصه و لیست پورسانت‌های همکار جاری."""
     me_phone = (session.get("user_phone") or "").strip()
@@ -1638,6 +1646,7 @@ def _rebalance_partner_bank_defaults(all_rows: List[Dict[str, Any]], phone: str)
 
 @express_partner_bp.get('/bank-accounts/data', endpoint='bank_accounts_data')
 @require_partner_access(json_response=True)
+@conditional_json('partner_bank_accounts')
 def bank_accounts_data():
     """فهرست حساب‌های ذخیره‌شدهٔ همکار + کاتالوگ بانک برای فرم."""
     me_phone = (session.get("user_phone") or "").strip()
@@ -1853,17 +1862,31 @@ def add_sale():
 
 @express_partner_bp.post('/files/upload')
 @require_partner_access(allow_pending=True)
+@rate_limited(*UPLOAD_RULES, on_limited=_upload_rate_limited)
 def upload_file():
     me_phone = (session.get("user_phone") or "").strip()
     f = request.files.get('file')
-    if not f or not f.filename:
+    # فایل حجیم با آپلود تکه‌ای (/api/uploads/chunked) ارسال شده و فقط upload_id می‌آید
+    upload_id = (request.form.get('upload_id') or '').strip()
+    chunked = None
+    if upload_id:
+        try:
+            chunked = get_chunked_store().status(upload_id, f"partner:{me_phone}")
+        except ChunkedUploadError:
+            chunked = None
+    if chunked is None and (not f or not f.filename):
         return redirect(url_for("express_partner.dashboard"))
     base = os.path.join(current_app.instance_path, 'data', 'uploads', 'partner', me_phone)
     os.makedirs(base, exist_ok=True)
-    tsname = datetime.utcnow().strftime('%Y%m%d%H%M%S%f') + "__" + f.filename
+    original = chunked.get('filename') if chunked else f.filename
+    tsname = datetime.utcnow().strftime('%Y%m%d%H%M%S%f') + "__" + (original or 'file')
     safe_name = tsname.replace('..','_').replace('/','_').replace('\\','_')
     path = os.path.join(base, safe_name)
-    f.save(path)
+    if chunked:
+        if not take_upload(upload_id, f"partner:{me_phone}", 'document', path):
+            return redirect(url_for("express_partner.dashboard"))
+    else:
+        f.save(path)
     metas = load_partner_files_meta() or []
     new_id = (max([int(x.get('id',0) or 0) for x in metas if isinstance(x, dict)], default=0) or 0) + 1
     metas.append({"id": new_id, "phone": me_phone, "filename": safe_name, "stored_at": datetime.utcnow().isoformat()+"Z"})
@@ -1883,7 +1906,7 @@ def download_file(fid: int):
     fp = os.path.join(base, meta.get('filename') or '')
     if not os.path.isfile(fp):
         abort(404)
-    return send_from_directory(base, os.path.basename(fp), as_attachment=True)
+    return send_upload(base, os.path.basename(fp), as_attachment=True)
 
 
 # -------------------------
@@ -1891,7 +1914,7 @@ def download_file(fid: int):
 # -------------------------
 def _clear_express_partner_auth_session() -> None:
     """فقط خروج از حساب همکار؛ سشن ادمین یا پیش‌نویس apply_data حذف نمی‌شود."""
-    for k in ('user_id', 'user_phone', 'otp_code', 'otp_phone', 'next'):
+    for k in ('user_id', 'user_phone', 'otp_code', 'otp_phone', 'otp_job_id', 'next'):
         session.pop(k, None)
     if not session.get('logged_in'):
         session.permanent = False
@@ -1902,6 +1925,7 @@ def _clear_express_partner_auth_session() -> None:
 
 
 @express_partner_bp.route('/login', methods=['GET', 'POST'], endpoint='login')
+@rate_limited(*OTP_RULES, methods=('POST',), on_limited=_login_rate_limited)
 def login():
     try:
         from .referrals import capture_ref_on_login
@@ -1932,27 +1956,19 @@ def login():
         session.update({'otp_code': code, 'otp_phone': phone})
         session.permanent = True
 
-        # Try sending SMS; ignore errors in dev
+        # ارسال در صف پس‌زمینه؛ صفحهٔ مرحلهٔ دوم بدون انتظار برای sms.ir نمایش داده می‌شود
         try:
-            from ..services.sms import send_sms_code
-            sms_result = send_sms_code(phone, code)
-            if sms_result.get('ok'):
-                flash('کد تأیید ارسال شد.', 'info')
-            else:
-                current_app.logger.error(
-                    "OTP send failed in login | phone=%s | status=%s | body=%s",
-                    phone,
-                    sms_result.get('status'),
-                    sms_result.get('body'),
-                )
-                flash('ارسال کد تأیید با خطا مواجه شد. لطفاً دوباره تلاش کنید.', 'warning')
+            session['otp_job_id'] = enqueue_otp(phone, code)
+            flash('کد تأیید در حال ارسال است.', 'info')
         except Exception:
+            current_app.logger.error("OTP enqueue failed in login | phone=%s", phone, exc_info=True)
             flash('ارسال کد تأیید با خطا مواجه شد. لطفاً دوباره تلاش کنید.', 'warning')
 
         nxt = request.args.get('next')
         if nxt:
             session['next'] = nxt
-        return render_template('express_partner/auth/login_step2.html', phone=phone)
+        return render_template('express_partner/auth/login_step2.html', phone=phone,
+                               otp_job_id=session.get('otp_job_id'))
     return render_template('express_partner/auth/login_step1.html')
 
 
@@ -2083,6 +2099,7 @@ def routine():
 
 @express_partner_bp.route('/routine/data', methods=['GET'], endpoint='routine_data')
 @require_partner_access(allow_pending=True)
+@conditional_json('partner_routines', vary=lambda: datetime.now().strftime('%Y-%m'))
 def routine_data():
     """
     برگرداندن روزهای انجام‌شده روتین در ماه خواسته‌شده برای کاربر جاری.
@@ -2103,8 +2120,8 @@ def routine_data():
         steps = {k: int(v) for k, v in rec.get('steps', {}).items() if isinstance(k, str) and k.startswith(month + '-') and isinstance(v, (int, float))}
 
     resp = make_response(jsonify({"success": True, "month": month, "days": days, "steps": steps}))
-    # Short microcache for faster back-to-back calendar fetches
-    resp.headers["Cache-Control"] = "public, max-age=20, stale-while-revalidate=40"
+    # Short microcache for faster back-to-back calendar fetches (دادهٔ شخصی: فقط کش مرورگر)
+    resp.headers["Cache-Control"] = "private, max-age=20, stale-while-revalidate=40"
     return resp
 
 
@@ -2444,6 +2461,7 @@ def api_logout():
 
 
 @express_partner_bp.post('/api/login-request')
+@rate_limited(*OTP_RULES, on_limited=_api_login_rate_limited)
 def api_login_request():
     """درخواست ارسال کد OTP برای اپ اندروید (ورود نیتیو). ورودی JSON: {"phone": "09..."}."""
     data = request.get_json(silent=True) or {}
@@ -2455,18 +2473,16 @@ def api_login_request():
     session.update({'otp_code': code, 'otp_phone': phone})
     session.permanent = True
     try:
-        from ..services.sms import send_sms_code
-        sms_result = send_sms_code(phone, code)
-        if not sms_result.get('ok'):
-            return jsonify({
-                'success': False,
-                'error': 'ارسال کد ناموفق بود.',
-                'status': sms_result.get('status'),
-                'details': sms_result.get('body'),
-            }), 502
+        job_id = enqueue_otp(phone, code)
+        session['otp_job_id'] = job_id
     except Exception:
         return jsonify({'success': False, 'error': 'خطا در ارسال کد تأیید.'}), 502
-    return jsonify({'success': True, 'message': 'کد تأیید ارسال شد.'})
+    return jsonify({
+        'success': True,
+        'message': 'کد تأیید در حال ارسال است.',
+        'job_id': job_id,
+        'status_url': url_for('express_partner.otp_status'),
+    })
 
 
 @express_partner_bp.post('/api/verify')
@@ -2497,6 +2513,7 @@ def api_verify():
 
 
 @express_partner_bp.route('/otp/resend', methods=['POST'], endpoint='otp_resend')
+@rate_limited(*OTP_RULES, on_limited=_otp_resend_rate_limited)
 def otp_resend():
     # پشتیبانی از JSON (اپ) و form (وب)
     data = request.get_json(silent=True) or {}
@@ -2511,26 +2528,36 @@ def otp_resend():
         code = f"{random.randint(10000, 99999)}"
         session.update({'otp_code': code, 'otp_phone': phone})
         session.permanent = True
-        from ..services.sms import send_sms_code
-        sms_result = send_sms_code(phone, code)
-        if not sms_result.get('ok'):
-            if request.is_json:
-                return jsonify({
-                    'ok': False,
-                    'error': 'ارسال مجدد کد ناموفق بود.',
-                    'status': sms_result.get('status'),
-                    'details': sms_result.get('body'),
-                }), 502
-            return {'ok': False, 'error': 'ارسال مجدد کد ناموفق بود.'}, 502
+        job_id = enqueue_otp(phone, code)
+        session['otp_job_id'] = job_id
+        payload = {'ok': True, 'message': 'کد تأیید در حال ارسال است.', 'job_id': job_id}
         if request.is_json:
-            return jsonify({'ok': True, 'message': 'کد تأیید مجدد ارسال شد.'})
-        return {'ok': True}
+            return jsonify(payload)
+        return payload
     except Exception:
         if request.is_json:
             return jsonify({'ok': False, 'error': 'خطا در ارسال مجدد کد.'}), 502
         return {'ok': False, 'error': 'خطا در ارسال مجدد کد.'}, 502
 
 
+@express_partner_bp.get('/api/otp/status', endpoint='otp_status')
+def otp_status():
+    """
+    وضعیت ارسال آخرین کد تأیید این سشن (queued / sending / sent / failed / unknown).
+    فقط job متعلق به همین سشن قابل مشاهده است.
+    با SMS_QUEUE_STORE=memory و چند worker ممکن است job در صف worker دیگری باشد؛ در این حالت
+    (job همین سشن ولی ناپیدا) به‌جای 404 وضعیت خنثی 'unknown' برمی‌گردد و کلاینت به polling ادامه می‌دهد.
+    """
+    job_id = session.get('otp_job_id')
+    wanted = (request.args.get('job') or '').strip()
+    if not job_id or (wanted and wanted != job_id):
+        return jsonify({'ok': False, 'status': 'unknown'}), 404
+    info = job_status(job_id)
+    resp = jsonify({'ok': True, 'job_id': job_id, 'status': info['status'] if info else 'unknown'})
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+
 @express_partner_bp.route('/profile', methods=['GET'], endpoint='profile')
 @require_partner_access(allow_pending=True)
 def profile_page():
@@ -2565,6 +2592,8 @@ def profile_page():
 
 @express_partner_bp.get('/profile/data', endpoint='profile_data')
 @require_partner_access(allow_pending=True, allow_guest=True)
+# توکن CSRF پاسخ زمان‌دار است (WTF_CSRF_TIME_LIMIT) و به session بسته است
+@conditional_json('express_partners', 'settings', bucket=600, vary=lambda: session.get('csrf_token') or '')
 def profile_data():
     """API JSON برای اپ اندروید: داده پروفایل همکار (برای صفحه من نیتیو)."""
     me_phone = (session.get('user_phone') or '').strip()
@@ -2812,6 +2841,7 @@ def profile_delete_account():
 
 @express_partner_bp.post('/profile/avatar')
 @require_partner_access(allow_pending=True)
+@rate_limited(*UPLOAD_RULES, on_limited=_upload_rate_limited)
 def profile_avatar_upload():
     """
     آپلود و تنظیم آواتار پروفایل همکار
@@ -2821,81 +2851,35 @@ def profile_avatar_upload():
     f = request.files.get('avatar')
     if not f or not f.filename:
         return redirect(next_url if next_url.startswith('/express/partner/') else url_for('express_partner.profile'))
-    # مسیر ذخیره‌سازی: instance/data/uploads/partner/avatars/<phone>/
-    base = os.path.join(current_app.instance_path, 'data', 'uploads', 'partner', 'avatars', me_phone)
-    os.makedirs(base, exist_ok=True)
-    # حذف آواتارهای قبلی
-    try:
-        for fn in os.listdir(base):
-            try:
-                if fn.startswith('avatar.'):
-                    os.remove(os.path.join(base, fn))
-            except Exception:
-                continue
-    except Exception:
-        pass
-    # ذخیره آواتار جدید با تبدیل به JPEG و کوچک‌سازی سمت سرور (برای موبایل)
-    tmp_path = os.path.join(base, '_tmp_upload')
-    final_name = 'avatar.jpg'
-    final_path = os.path.join(base, final_name)
+    # ذخیره در blob store (محتوامحور): نرمال‌سازی JPEG، واریانت thumb و URL با کش immutable
     try:
-        f.save(tmp_path)
-        converted = False
-        try:
-            from PIL import Image, ImageOps  # type: ignore
-            im = Image.open(tmp_path)
-            try:
-                im = ImageOps.exif_transpose(im)
-            except Exception:
-                pass
-            if im.mode in ("RGBA", "LA"):
-                bg = Image.new("RGB", im.size, (255, 255, 255))
-                bg.paste(im, mask=im.split()[-1])
-                im = bg
-            elif im.mode != "RGB":
-                im = im.convert("RGB")
-            # کوچک‌سازی: حداکثر ضلع 1200px
-            im.thumbnail((1200, 1200), Image.LANCZOS)
-            im.save(final_path, format='JPEG', quality=82, optimize=True)
-            converted = True
-        except Exception:
-            converted = False
-        # اگر تبدیل موفق نبود، همان فایل را به عنوان fallback ذخیره کنیم
-        if not converted:
-            # اگر نام اصلی پسوند داشت، همان را استفاده کنیم؛ وگرنه jpg
-            orig_lower = (f.filename or '').lower()
-            ext = '.jpg'
-            for e in ('.jpg', '.jpeg', '.png', '.webp'):
-                if orig_lower.endswith(e):
-                    ext = e
-                    break
-            final_name = 'avatar' + ext
-            final_path = os.path.join(base, final_name)
-            # کپی فایل موقت به مسیر نهایی
-            try:
-                import shutil
-                shutil.move(tmp_path, final_path)
-            except Exception:
-                # آخرین تلاش: دوباره ذخیره مستقیم
-                f.stream.seek(0)
-                with open(final_path, 'wb') as out:
-                    out.write(f.read())
-        # پاک‌سازی فایل موقت
-        try:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
+        info = ingest_image(f, current_app.config.get('UPLOAD_FOLDER') or '', presets=('thumb',),
+                            content_addressed=True)
+    except IngestError as e:
+        flash(str(e), 'error')
+        return redirect(next_url if next_url.startswith('/express/partner/') else url_for('express_partner.profile'))
     except Exception:
+        current_app.logger.error("Failed to store partner avatar", exc_info=True)
         flash('خطا در ذخیره تصویر پروفایل.', 'error')
         return redirect(next_url if next_url.startswith('/express/partner/') else url_for('express_partner.profile'))
+    # آواتارهای قدیمی (instance/data/uploads/partner/avatars/<phone>/avatar.*) دیگر استفاده نمی‌شوند
+    legacy_base = os.path.join(current_app.instance_path, 'data', 'uploads', 'partner', 'avatars', me_phone)
+    try:
+        for fn in os.listdir(legacy_base):
+            if fn.startswith('avatar.'):
+                try:
+                    os.remove(os.path.join(legacy_base, fn))
+                except Exception:
+                    continue
+    except Exception:
+        pass
     # به‌روزرسانی پروفایل همکار
     partners = load_express_partners() or []
     prof = next((p for p in partners if str(p.get('phone') or '').strip() == me_phone), None)
     if not prof:
         prof = {"phone": me_phone}
         partners.append(prof)
-    rel_path = f'partner/avatars/{me_phone}/{os.path.basename(final_path)}'
+    rel_path = info['rel']
     prof['avatar'] = rel_path
     try:
         from time import time as _now
@@ -2904,6 +2888,7 @@ def profile_avatar_upload():
         prof['avatar_updated_at'] = 0
     try:
         save_express_partners(partners)
+        get_blob_store().set_refs(avatar_owner(me_phone), [rel_path])
     except Exception:
         current_app.logger.error("Failed to save partner avatar path", exc_info=True)
     return redirect(next_url if next_url.startswith('/express/partner/') else url_for('express_partner.profile'))
@@ -3074,6 +3059,7 @@ def notifications_page():
 # -------------------------
 @express_partner_bp.route('/api/notifications', methods=['GET'])
 @require_partner_access(json_response=True, allow_pending=True)
+@conditional_json('notifications')
 def get_notifications():
     """Get user notifications"""
     from app.services.notifications import get_user_notifications, unread_count, _normalize_user_id
@@ -3092,6 +3078,7 @@ def get_notifications():
 
 @express_partner_bp.route('/api/notifications/unread-count', methods=['GET'])
 @require_partner_access(json_response=True, allow_pending=True)
+@conditional_json('notifications')
 def get_unread_count():
     """Get unread notifications count"""
     from app.services.notifications import unread_count, _normalize_user_id
@@ -3209,7 +3196,7 @@ def check_status():
     """بررسی وضعیت تایید همکار - برای pull-to-refresh"""
     try:
         if not session.get("user_phone"):
-            current_app.logger.warning("check_status: No user_phone in session")
+            current_app.logger.info("check_status: No user_phone in session", extra=sampled(20))
             return jsonify({"success": False, "error": "unauthorized"}), 401
         
         me_phone = (session.get("user_phone") or "").strip()
@@ -3217,11 +3204,8 @@ def check_status():
             current_app.logger.warning("check_status: Empty user_phone")
             return jsonify({"success": False, "error": "empty_phone"}), 400
         
-        current_app.logger.info(f"check_status: Checking status for phone: {me_phone}")
-        
         try:
             partners = load_express_partners() or []
-            current_app.logger.debug(f"check_status: Loaded {len(partners)} partners")
         except Exception as load_err:
             current_app.logger.error(f"check_status: Error loading partners: {load_err}")
             return jsonify({"success": False, "error": "failed_to_load_partners"}), 500
@@ -3229,20 +3213,20 @@ def check_status():
         profile = next((p for p in partners if str(p.get("phone") or "").strip() == me_phone), None)
         
         if profile:
-            current_app.logger.info(f"check_status: Profile found for {me_phone}, status: {profile.get('status')}")
             is_approved = _is_partner_approved(profile)
-            current_app.logger.info(f"check_status: Is approved: {is_approved}")
+            current_app.logger.debug(
+                "check_status: %s status=%s approved=%s", me_phone, profile.get('status'), is_approved,
+                extra=sampled(20),
+            )
             
             if is_approved:
                 redirect_url = url_for("express_partner.dashboard")
-                current_app.logger.info(f"check_status: Partner approved, redirecting to: {redirect_url}")
                 return jsonify({
                     "success": True,
                     "approved": True,
                     "redirect_url": redirect_url
                 })
         
-        current_app.logger.info(f"check_status: Partner not approved yet for {me_phone}")
         return jsonify({
             "success": True,
             "approved": False
@@ -3257,6 +3241,228 @@ def check_status():
         }), 500
 
 
+# -----------------------------------------------------------------------------
+# کانال زندهٔ همکار (SSE / long-poll): تعداد خوانده‌نشده، اعلان جدید، تغییر وضعیت تأیید
+# -----------------------------------------------------------------------------
+_partner_streams = {'count': 0}
+_partner_streams_lock = threading.Lock()
+
+
+def _partner_events_mode() -> str:
+    """
+    'sse' | 'longpoll' | 'poll'
+    در حالت auto فقط وقتی worker می‌تواند اتصال باز نگه دارد (thread/gevent) کانال باز می‌ماند؛
+    در worker همزمان (sync) کلاینت به polling معمولی برمی‌گردد.
+    """
+    mode = str(current_app.config.get('PARTNER_EVENTS_MODE') or 'auto').strip().lower()
+    if mode != 'auto':
+        return mode
+    if request.environ.get('wsgi.multithread'):
+        return 'sse'
+    try:
+        import sys
+        monkey = sys.modules.get('gevent.monkey')
+        if monkey is not None and monkey.is_module_patched('socket'):
+            return 'sse'
+    except Exception:
+        pass
+    return 'poll'
+
+
+# جدول‌های وضعیت همهٔ همکاران در این پردازه، با کلید mtime/size فایل‌ها: یک رویداد sync همهٔ
+# اتصال‌های باز را بیدار می‌کند ولی فایل‌ها فقط یک بار parse می‌شوند؛ هر اتصال فقط lookup می‌کند
+_partner_events_tables: Dict[str, Any] = {'key': None, 'unread': {}, 'approved': {}}
+_partner_events_tables_lock = threading.Lock()
+
+
+def _file_signature(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _partner_events_state() -> Dict[str, Any]:
+    """{'unread': {phone: n}, 'approved': {phone: bool}} برای نسخهٔ فعلی notifications و express_partners."""
+    from app.services.notifications import _get_notifications_file_path, _load_all
+    paths = (_get_notifications_file_path(), ensure_file('EXPRESS_PARTNERS_FILE', 'express_partners.json', []))
+    key = tuple(_file_signature(p) for p in paths)
+    with _partner_events_tables_lock:
+        hit = _partner_events_tables['key'] == key
+        record_cache('partner_events_state', hit, layer='process')
+        if hit:
+            return _partner_events_tables
+        try:
+            grouped = _load_all() or {}
+        except Exception:
+            grouped = {}
+        try:
+            partners = load_express_partners() or []
+        except Exception:
+            partners = []
+        approved: Dict[str, bool] = {}
+        for p in partners:
+            phone = str(p.get("phone") or "").strip()
+            if phone and phone not in approved:
+                approved[phone] = _is_partner_approved(p)
+        _partner_events_tables.update(
+            key=key,
+            unread={uid: sum(1 for n in items if not n.get("is_read", False)) for uid, items in grouped.items()},
+            approved=approved,
+        )
+        return _partner_events_tables
+
+
+def _partner_events_snapshot(me_phone: str) -> Dict[str, Any]:
+    """وضعیت فعلی همکار: تعداد خوانده‌نشده و تأیید (از جدول‌های مشترک پردازه، نه parse دوبارهٔ فایل‌ها)."""
+    state = _partner_events_state()
+    return {
+        'unread_count': state['unread'].get(me_phone, 0),
+        'approved': state['approved'].get(me_phone, False),
+    }
+
+
+def _partner_approval_payload(approved: bool) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {'approved': bool(approved)}
+    if approved:
+        payload['redirect_url'] = url_for('express_partner.dashboard')
+    return payload
+
+
+def _partner_events_translate(me_phone: str, events: List[Dict[str, Any]], state: Dict[str, Any]) -> List[tuple]:
+    """تبدیل رویدادهای گذرگاه به رویدادهای کلاینت: [(seq, kind, data), ...] (بدون تکرار وضعیت‌ها)."""
+    out: List[tuple] = []
+    for e in events:
+        kind, data, seq = e['kind'], e.get('data') or {}, e['seq']
+        if kind == 'notification':
+            state['unread_count'] = data.get('unread_count')
+            out.append((seq, 'notification', data))
+        elif kind == 'unread':
+            if data.get('unread_count') != state.get('unread_count'):
+                state['unread_count'] = data.get('unread_count')
+                out.append((seq, 'unread', {'unread_count': data.get('unread_count')}))
+        elif kind == 'partner_status':
+            approved = data.get('status') in APPROVED_PARTNER_STATUSES
+            if approved != state.get('approved'):
+                state['approved'] = approved
+                out.append((seq, 'approval', _partner_approval_payload(approved)))
+        elif kind == 'sync':
+            # تغییر فایل‌ها توسط worker دیگر → مقایسه با وضعیت فعلی
+            snap = _partner_events_snapshot(me_phone)
+            if snap['unread_count'] != state.get('unread_count'):
+                out.append((seq, 'unread', {'unread_count': snap['unread_count']}))
+            if snap['approved'] != state.get('approved'):
+                out.append((seq, 'approval', _partner_approval_payload(snap['approved'])))
+            state.update(snap)
+    return out
+
+
+@express_partner_bp.route('/api/events', methods=['GET'], endpoint='partner_events')
+@require_partner_access(json_response=True, allow_pending=True)
+def partner_events():
+    """
+    کانال زندهٔ همکار.
+    - Accept: text/event-stream → SSE (رویدادها: hello، notification، unread، approval)
+    - ?mode=longpoll&since=<id> → انتظار تا رویداد بعدی و پاسخ JSON
+    - اگر worker توان نگه داشتن اتصال را نداشته باشد: SSE با 204 (EventSource دوباره وصل نمی‌شود و
+      کلاینت به polling برمی‌گردد) و long-poll با پاسخ فوری
+    """
+    from flask import Response, stream_with_context
+    from app.services.notifications import _normalize_user_id, _get_notifications_file_path
+    import json as _json
+
+    me_phone = _normalize_user_id((session.get("user_phone") or "").strip())
+    bus = partner_events_bus.get_event_bus()
+    mode = _partner_events_mode()
+    wants_stream = 'text/event-stream' in (request.headers.get('Accept') or '') and request.args.get('mode') != 'longpoll'
+    retry_ms = int(current_app.config.get('PARTNER_EVENTS_POLL_MS', 30000))
+
+    max_streams = int(current_app.config.get('PARTNER_EVENTS_MAX_STREAMS', 50))
+    if mode == 'poll' or (wants_stream and (mode == 'longpoll' or _partner_streams['count'] >= max_streams)):
+        if wants_stream:
+            return Response(status=204, headers={'Cache-Control': 'no-store'})
+        snap = _partner_events_snapshot(me_phone)
+        resp = jsonify({'success': True, 'mode': 'poll', 'retry_ms': retry_ms,
+                        'last_event_id': bus.event_id(bus.last_seq),
+                        'events': [{'event': 'hello', 'data': {**snap, **_partner_approval_payload(snap['approved'])}}]})
+        resp.headers['Cache-Control'] = 'no-store'
+        return resp
+
+    # فایل‌ها فقط با stat پایش می‌شوند تا تغییرات workerهای دیگر هم برسد
+    try:
+        partner_events_bus.watch_files([
+            _get_notifications_file_path(),
+            ensure_file('EXPRESS_PARTNERS_FILE', 'express_partners.json', []),
+        ])
+    except Exception:
+        pass
+
+    last = bus.parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('since'))
+
+    if not wants_stream:
+        # long-poll
+        timeout = float(current_app.config.get('PARTNER_EVENTS_LONGPOLL_SECONDS', 25))
+        if last is None:
+            last = bus.last_seq
+            snap = _partner_events_snapshot(me_phone)
+            out = [{'event': 'hello', 'data': {**snap, **_partner_approval_payload(snap['approved'])}}]
+        else:
+            state = {'unread_count': request.args.get('unread', type=int), 'approved': None}
+            out = []
+            while not out:
+                events, last = bus.wait(me_phone, last, timeout)
+                if events is None:
+                    snap = _partner_events_snapshot(me_phone)
+                    out = [{'event': 'hello', 'data': {**snap, **_partner_approval_payload(snap['approved'])}}]
+                    break
+                if not events:
+                    break
+                out = [{'event': k, 'data': d} for _, k, d in _partner_events_translate(me_phone, events, state)]
+        resp = jsonify({'success': True, 'mode': 'longpoll', 'events': out, 'last_event_id': bus.event_id(last)})
+        resp.headers['Cache-Control'] = 'no-store'
+        return resp
+
+    stream_seconds = float(current_app.config.get('PARTNER_EVENTS_STREAM_SECONDS', 300))
+    heartbeat = float(current_app.config.get('PARTNER_EVENTS_HEARTBEAT_SECONDS', 20))
+
+    def _sse(seq: int, kind: str, data: Dict[str, Any]) -> str:
+        return f"id: {bus.event_id(seq)}\nevent: {kind}\ndata: {_json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def generate(last_seq):
+        with _partner_streams_lock:
+            _partner_streams['count'] += 1
+        try:
+            yield "retry: 5000\n\n"
+            state: Dict[str, Any] = {'unread_count': None, 'approved': None}
+            if last_seq is None:
+                last_seq = bus.last_seq
+                state.update(_partner_events_snapshot(me_phone))
+                yield _sse(last_seq, 'hello', {**state, **_partner_approval_payload(state['approved'])})
+            deadline = time.monotonic() + stream_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                events, last_seq = bus.wait(me_phone, last_seq, min(heartbeat, remaining))
+                if events is None:
+                    state.update(_partner_events_snapshot(me_phone))
+                    yield _sse(last_seq, 'hello', {**state, **_partner_approval_payload(state['approved'])})
+                elif not events:
+                    yield ": ping\n\n"
+                else:
+                    for seq, kind, data in _partner_events_translate(me_phone, events, state):
+                        yield _sse(seq, kind, data)
+        finally:
+            with _partner_streams_lock:
+                _partner_streams['count'] -= 1
+
+    resp = Response(stream_with_context(generate(last)), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-store'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+
 @express_partner_bp.get('/lands/<string:code>', endpoint='land_detail')
 @require_partner_access(allow_pending=True, allow_guest=True)
 def land_detail(code: str):
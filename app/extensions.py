@@ -1,7 +1,46 @@
+"""
+افزونه‌های مشترک (SQLAlchemy)
+
+flask_sqlalchemy/SQLAlchemy حدود ۲۵۰ms به هر cold start اضافه می‌کرد در حالی که هنوز مدلی
+تعریف نشده است؛ برای همین import و init آن lazy است:
+  - ``DB_INIT_ON_STARTUP=1``: مثل قبل در create_app (init_app + create_all)
+  - در غیر این صورت ``get_db(app)`` اولین بار init_app می‌کند. Flask ثبت hook بعد از اولین
+    درخواست را نمی‌پذیرد؛ پس get_db را در زمان setup (create_app، ثبت بلوپرینت، دستور CLI)
+    صدا بزنید، نه داخل view.
+  - ``from app.extensions import db`` همچنان کار می‌کند (با اولین دسترسی import می‌شود).
+"""
 from __future__ import annotations
 
-from flask_sqlalchemy import SQLAlchemy
+from typing import Any
+
+_db: Any = None
+# فقط اعلان نوع (بدون مقدار)؛ مقدار را __getattr__ ماژول در اولین دسترسی می‌دهد
+db: Any
+
+
+def _instance():
+    global _db
+    if _db is None:
+        from flask_sqlalchemy import SQLAlchemy
+        _db = SQLAlchemy()
+    return _db
+
+
+def get_db(app=None, create_all: bool = False):
+    """نمونهٔ SQLAlchemy؛ با app، init_app فقط یک بار انجام می‌شود."""
+    db = _instance()
+    if app is not None and 'sqlalchemy' not in app.extensions:
+        db.init_app(app)
+        if create_all:
+            with app.app_context():
+                db.create_all()
+    return db
+
 
-db = SQLAlchemy()
+def __getattr__(name: str):
+    if name == 'db':
+        return _instance()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
+__all__ = ['get_db', 'db']
@@ -12,5 +12,7 @@ main_bp = Blueprint(
 # ⬇️ بسیار مهم: این ایمپورت‌ها باید بعد از تعریف main_bp باشند
 # با این کار، تمام روت‌های ماژول‌ها رجیستر می‌شوند
 from . import public       # صفحات عمومی (لندینگ همکاران و جزئیات اکسپرس)
+from . import uploads      # سرو /uploads/<path> (فایل اصلی و واریانت‌ها)
+from . import ops          # /healthz، /metrics و /diag
 
 __all__ = ["main_bp"]
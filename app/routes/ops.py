@@ -0,0 +1,71 @@
+# app/routes/ops.py
+# -*- coding: utf-8 -*-
+"""
+مسیرهای عملیاتی: /healthz (عمومی)، /metrics (متن Prometheus) و /diag (خلاصهٔ JSON)
+
+/metrics و /diag داده‌های همهٔ workerها را ادغام می‌کنند (app.services.metrics).
+دسترسی: اگر METRICS_TOKEN ست شده باشد فقط با همان توکن (هدر ``Authorization: Bearer`` یا ``?token=``)؛
+در غیر این صورت ادمینِ واردشده یا درخواست مستقیم از loopback (بدون هدر X-Forwarded-For).
+"""
+from __future__ import annotations
+
+import os
+import hmac
+import time
+
+from flask import Response, abort, current_app, jsonify, request, session
+
+from . import main_bp
+from ..utils.storage import data_dir
+from ..services.metrics import collect, diag_summary, get_registry, render_prometheus
+
+_LOOPBACK = {'127.0.0.1', '::1'}
+
+
+def _authorized() -> bool:
+    token = current_app.config.get('METRICS_TOKEN') or ''
+    if token:
+        auth = request.headers.get('Authorization', '')
+        given = auth[7:].strip() if auth.lower().startswith('bearer ') else (request.args.get('token') or '')
+        return bool(given) and hmac.compare_digest(given, token)
+    if session.get('logged_in'):
+        return True
+    return request.remote_addr in _LOOPBACK and not request.headers.get('X-Forwarded-For')
+
+
+def _no_store(resp):
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+
+@main_bp.get('/healthz')
+def healthz():
+    """بررسی سبک زنده بودن worker و قابل‌نوشتن بودن پوشهٔ داده (بدون خواندن فایل JSON)."""
+    try:
+        storage_ok = os.access(data_dir(), os.W_OK)
+    except Exception:
+        storage_ok = False
+    body = {
+        'status': 'ok' if storage_ok else 'degraded',
+        'pid': os.getpid(),
+        'uptime_seconds': round(time.time() - get_registry().started_at, 1),
+        'storage': 'ok' if storage_ok else 'unwritable',
+    }
+    return _no_store(jsonify(body)), (200 if storage_ok else 503)
+
+
+@main_bp.get('/metrics')
+def metrics():
+    if not _authorized():
+        abort(403)
+    text = render_prometheus(collect(current_app._get_current_object()))
+    return _no_store(Response(text, mimetype='text/plain; version=0.0.4'))
+
+
+@main_bp.get('/diag')
+def diag():
+    if not _authorized():
+        abort(403)
+    summary = diag_summary(collect(current_app._get_current_object()))
+    summary['pid'] = os.getpid()
+    return _no_store(jsonify(summary))
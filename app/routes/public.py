@@ -1,19 +1,15 @@
 # app/routes/public.py
 import os
-from urllib.parse import quote
 
 from flask import (
-    render_template, send_from_directory, request, abort,
+    render_template, request, abort,
     redirect, url_for, session, make_response, current_app,
-    has_app_context, has_request_context,
 )
 
 from . import main_bp
-from ..utils.storage import data_dir, legacy_dir
+from .uploads import send_upload
 from ..utils.storage import load_express_partners, load_landing_views, save_landing_views
-from ..utils.images import (
-    variant_headers_for_width,
-)
+from ..services.metrics import record_cache
 from datetime import datetime
 from time import time as _now
 
@@ -37,6 +33,7 @@ def _get_cached_settings():
     """Cache settings برای 60 ثانیه"""
     cache_key = "settings"
     cached = _mc_get(cache_key)
+    record_cache('settings', cached is not None, layer='microcache')
     if cached is not None:
         return cached
     try:
@@ -49,38 +46,6 @@ def _get_cached_settings():
 # ثابت‌ها
 FIRST_VISIT_COOKIE = "vinor_first_visit_done"
 
-# -------------------------
-# Context (برای استفادهٔ ساده در تمام قالب‌ها)
-# -------------------------
-@main_bp.app_context_processor
-def inject_vinor_globals():
-    """
-    متغیرهای عمومیِ وینور برای استفاده در تمپلیت‌ها
-    """
-    if not has_app_context() or not has_request_context():
-        return {}
-    # همکار اکسپرس تأییدشده
-    try:
-        me = str(session.get("user_phone") or "").strip()
-        _partners = load_express_partners(current_app._get_current_object())
-        is_express_partner = any(
-            isinstance(p, dict)
-            and str(p.get("phone") or "").strip() == me
-            and (str(p.get("status") or "").lower() == "approved" or p.get("status") is True)
-            for p in (_partners or [])
-        )
-    except Exception:
-        is_express_partner = False
-
-    return {
-        "VINOR_IS_LOGGED_IN": bool(session.get("user_id")),
-        "VINOR_HOME_URL": url_for("main.index"),
-        "VINOR_BRAND": "وینور اکسپرس",
-        "VINOR_DOMAIN": "vinor.ir",
-        # نقش‌ها
-        "VINOR_IS_EXPRESS_PARTNER": is_express_partner,
-    }
-
 # -------------------------
 # Routes
 # -------------------------
@@ -197,6 +162,7 @@ def index():
     if not is_logged_in:
         cache_key = "page:index"
         cached = _mc_get(cache_key)
+        record_cache('page:index', bool(cached), layer='microcache')
         if cached:
             resp = make_response(cached)
             # استفاده از cache برای رفرش سریع‌تر
@@ -305,6 +271,7 @@ def partners():
     if not (session.get("user_phone") or session.get("user_id") or is_admin):
         k = f"page:partners"
         cached = _mc_get(k)
+        record_cache('page:partners', bool(cached), layer='microcache')
         if cached:
             resp = make_response(cached)
             resp.headers["Cache-Control"] = "no-cache"
@@ -354,144 +321,12 @@ def express_detail(code):
     """
     return redirect(url_for('express_partner.land_detail', code=code), code=302)
 
-@main_bp.route("/uploads/<path:filename>", endpoint="uploaded_file")
-def uploaded_file(filename):
-    """
-    سرو فایل‌های آپلود:
-      1) ابتدا از UPLOAD_FOLDER (مسیر جدید تاریخ‌محور)
-      2) سپس از instance/data/uploads
-      3) سپس از <root>/data/uploads (legacy)
-    """
-    try:
-        width = int(request.args.get("w", 0) or 0)
-        quality = int(request.args.get("q", 0) or 0) or 80
-        fmt = (request.args.get("fmt") or "webp").lower()
-    except Exception:
-        width = 0
-        quality = 80
-        fmt = "webp"
-
-    def _generate_variant(root: str, safe_name: str):
-        if width <= 0:
-            return None
-        try:
-            from app.utils.images import generate_variant  # محلی برای جلوگیری از چرخه
-
-            variant_rel = generate_variant(root, safe_name, width, quality, f"w{width}_q{quality}", fmt.upper())
-            if not variant_rel:
-                return None
-            abs_path = os.path.join(root, variant_rel)
-            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-            if os.path.isfile(abs_path):
-                vdir, vfile = os.path.split(abs_path)
-                resp = send_from_directory(vdir, vfile)
-                resp.headers["Cache-Control"] = variant_headers_for_width(width)
-                resp.headers["Content-Type"] = "image/webp"
-                return resp
-        except Exception as e:
-            current_app.logger.debug("Variant generation failed: %s", e, exc_info=True)
-        return None
-
-    def _maybe_set_apk_download_name(resp):
-        try:
-            fn_norm = (filename or '').replace('\\', '/')
-            if fn_norm.lower().endswith('.apk') and fn_norm.startswith('apk/'):
-                try:
-                    from ..utils.storage import load_settings
-                    settings = load_settings()
-                except Exception:
-                    settings = {}
-                wanted_url = str(settings.get('android_apk_url') or '')
-                orig_name = str(settings.get('android_apk_original_name') or '').strip()
-                if wanted_url and orig_name:
-                    # match by basename to ensure we are serving the configured APK
-                    try:
-                        wanted_base = os.path.basename(wanted_url)
-                    except Exception:
-                        wanted_base = ''
-                    if wanted_base and wanted_base == os.path.basename(fn_norm):
-                        # Force download with the original client filename
-                        try:
-                            disp = "attachment; filename*=UTF-8''" + quote(orig_name) + f"; filename=\"{orig_name}\""
-                            resp.headers['Content-Disposition'] = disp
-                        except Exception:
-                            resp.headers['Content-Disposition'] = f'attachment; filename=\"{orig_name}\"'
-        except Exception:
-            pass
-        return resp
-    # اول مسیر تنظیم‌شده در کانفیگ
-    try:
-        base_cfg = current_app.config.get("UPLOAD_FOLDER")
-        if base_cfg:
-            fp_cfg = os.path.join(base_cfg, filename)
-            if os.path.isfile(fp_cfg):
-                # تلاش برای سرو واریانت
-                variant_resp = _generate_variant(base_cfg, filename)
-                if variant_resp:
-                    return variant_resp
-                resp = send_from_directory(base_cfg, filename)
-                resp = _maybe_set_apk_download_name(resp)
-                try:
-                    if width > 0:
-                        resp.headers["Cache-Control"] = variant_headers_for_width(width)
-                    else:
-                        resp.headers["Cache-Control"] = "public, max-age=86400, stale-while-revalidate=86400"
-                except Exception:
-                    pass
-                return resp
-    except Exception:
-        pass
-
-    # سپس مسیر instance/data/uploads و legacy data/uploads
-    upload_roots = (
-        os.path.join(data_dir(), "uploads"),
-        os.path.join(legacy_dir(), "uploads"),
-    )
-    for folder in upload_roots:
-        fp = os.path.join(folder, filename)
-        if os.path.isfile(fp):
-            variant_resp = _generate_variant(folder, filename)
-            if variant_resp:
-                return variant_resp
-            resp = send_from_directory(folder, filename)
-            resp = _maybe_set_apk_download_name(resp)
-            try:
-                resp.headers["Cache-Control"] = variant_headers_for_width(width) if width > 0 else "public, max-age=86400, stale-while-revalidate=86400"
-            except Exception:
-                pass
-            return resp
-    # در نهایت: static/uploads (تصاویر ذخیره‌شده در static)
-    try:
-        static_root = current_app.static_folder
-        # پشتیبانی از هر دو ورودی: 'uploads/...' یا فقط '...'
-        candidates = []
-        if filename.startswith('uploads/'):
-            candidates.append(os.path.join(static_root, filename))
-            candidates.append(os.path.join(static_root, filename.lstrip('/')))
-        else:
-            candidates.append(os.path.join(static_root, 'uploads', filename))
-        for cand in candidates:
-            if os.path.isfile(cand):
-                rel_dir = os.path.dirname(os.path.relpath(cand, static_root))
-                fn = os.path.basename(cand)
-                resp = send_from_directory(os.path.join(static_root, rel_dir), fn)
-                resp = _maybe_set_apk_download_name(resp)
-                try:
-                    resp.headers["Cache-Control"] = variant_headers_for_width(width) if width > 0 else "public, max-age=86400, stale-while-revalidate=86400"
-                except Exception:
-                    pass
-                return resp
-    except Exception:
-        pass
-    abort(404, description="File not found")
-
-
 @main_bp.route("/express-docs/<filename>")
 def serve_express_document(filename):
     """سرو کردن مدارک اکسپرس برای کاربران"""
     try:
         docs_dir = os.path.join(current_app.instance_path, 'data', 'express_docs')
-        return send_from_directory(docs_dir, filename)
+        return send_upload(docs_dir, filename)
     except Exception as e:
         current_app.logger.error(f"Error serving express document {filename}: {e}")
         abort(404)
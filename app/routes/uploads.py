@@ -0,0 +1,329 @@
+# app/routes/uploads.py
+# -*- coding: utf-8 -*-
+"""
+سرو یکپارچهٔ /uploads/<path> (تنها route این مسیر؛ endpoint: main.uploaded_file)
+
+ریشه‌ها به ترتیب جست‌وجو می‌شوند:
+  1) UPLOAD_FOLDER (مسیر جدید تاریخ‌محور و blob store؛ با یا بدون پیشوند 'uploads/')
+  2) <instance>/data/uploads
+  3) <root>/data/uploads (legacy)
+  4) static/uploads (تصاویر قدیمی پنل ادمین؛ با یا بدون پیشوند 'uploads/')
+
+نتیجهٔ جست‌وجو (مسیر → ریشه) در یک LRU محدود نگه داشته می‌شود؛ درخواست بعدی همان فایل
+بدون stat اضافه مستقیم سرو می‌شود و اگر فایل در ریشهٔ کش‌شده نبود (NotFound) کش آن مسیر
+باطل و جست‌وجو یک بار دیگر انجام می‌شود.
+
+blobهای محتوامحور (``blobs/<hh>/<sha256>.<ext>``، app.services.blob_store) و واریانت‌های آماده‌شان
+هرگز تغییر نمی‌کنند و با Cache-Control immutable یک‌ساله سرو می‌شوند.
+
+این route در دستهٔ media است (app.utils.route_classes): بدون session، کوکی CSRF و gate؛ پاسخ‌ها Set-Cookie ندارند.
+
+حالت offload (اختیاری، برای هر استقرار جدا): پایتون فقط مسیر را resolve و هدرهای کش را ست می‌کند و
+انتقال فایل را به وب‌سرور می‌سپارد تا worker روی اتصال‌های کند موبایل درگیر نماند:
+  - 'x-accel'    (nginx):   هدر X-Accel-Redirect با مسیر داخلی
+  - 'x-sendfile' (Apache mod_xsendfile / LiteSpeed): هدر X-Sendfile با مسیر مطلق فایل
+اگر مسیری قابل نگاشت نباشد، همان ارسال stream معمولی (send_from_directory) استفاده می‌شود.
+نمونهٔ nginx برای پیش‌فرض UPLOADS_OFFLOAD_PREFIX:
+    location /_offload/ { internal; alias /; }
+
+تنظیمات (app.config):
+  UPLOADS_RESOLVE_CACHE_SIZE   حداکثر تعداد مسیرهای کش‌شده (پیش‌فرض 4096)
+  UPLOADS_OFFLOAD              '' (غیرفعال) | 'x-accel' | 'x-sendfile'
+  UPLOADS_OFFLOAD_PREFIX       پیشوند مسیر داخلی nginx که به ریشهٔ فایل‌سیستم alias شده (پیش‌فرض '/_offload')
+  UPLOADS_OFFLOAD_MAP          نگاشت صریح {ریشهٔ فایل‌سیستم: مسیر داخلی}؛ بر PREFIX اولویت دارد
+"""
+from __future__ import annotations
+
+import os
+import stat
+import mimetypes
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from flask import abort, current_app, request, send_from_directory
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+from . import main_bp
+from ..utils.storage import data_dir, legacy_dir
+from ..utils.images import DEFAULT_FMT, resolve_variant, variant_headers_for_width
+from ..utils.route_classes import MEDIA, route_class
+from ..services.blob_store import parse_blob_path
+from ..services.image_variants import PENDING_CACHE_CONTROL, get_variant_pipeline
+
+DEFAULT_CACHE_SIZE = 4096
+ORIGINAL_CACHE_CONTROL = "public, max-age=86400, stale-while-revalidate=86400"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_OFFLOAD_PREFIX = "/_offload"
+OFFLOAD_MODES = ("x-accel", "x-sendfile")
+
+
+class UploadPathResolver:
+    """مسیر درخواست‌شده → (ریشه، مسیر نسبی) با LRU محدود و thread-safe."""
+
+    def __init__(self, roots: List[Tuple[str, bool]], max_entries: int = DEFAULT_CACHE_SIZE):
+        # (root, strip_uploads_prefix): برای UPLOAD_FOLDER و static/uploads پیشوند 'uploads/' درخواست حذف می‌شود
+        self.roots = roots
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'not_found': 0, 'invalidated': 0}
+
+    @staticmethod
+    def _candidate(root: str, strip_prefix: bool, filename: str) -> Optional[str]:
+        rel = filename
+        if strip_prefix and rel.startswith('uploads/'):
+            rel = rel[len('uploads/'):]
+        return rel if safe_join(root, rel) else None
+
+    def resolve(self, filename: str) -> Optional[Tuple[str, str]]:
+        filename = (filename or '').replace('\\', '/').lstrip('/')
+        if not filename:
+            return None
+        with self._lock:
+            hit = self._cache.get(filename)
+            if hit is not None:
+                self._cache.move_to_end(filename)
+                self._stats['hits'] += 1
+                return hit
+            self._stats['misses'] += 1
+        for root, strip_prefix in self.roots:
+            rel = self._candidate(root, strip_prefix, filename)
+            if rel and os.path.isfile(os.path.join(root, rel)):
+                with self._lock:
+                    self._cache[filename] = (root, rel)
+                    self._cache.move_to_end(filename)
+                    while len(self._cache) > self.max_entries:
+                        self._cache.popitem(last=False)
+                return root, rel
+        with self._lock:
+            self._stats['not_found'] += 1
+        return None
+
+    def invalidate(self, filename: Optional[str] = None) -> None:
+        with self._lock:
+            if filename is None:
+                self._cache.clear()
+            elif self._cache.pop((filename or '').replace('\\', '/').lstrip('/'), None) is not None:
+                self._stats['invalidated'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._stats)
+            out['size'] = len(self._cache)
+        return out
+
+
+def upload_roots(app) -> List[Tuple[str, bool]]:
+    """ریشه‌های سرو آپلود به ترتیب اولویت: (root, strip_uploads_prefix)."""
+    roots: List[Tuple[str, bool]] = []
+    if app.config.get("UPLOAD_FOLDER"):
+        # مسیرهای پنل ادمین به شکل 'uploads/blobs/...' ذخیره می‌شوند و قالب‌ها '/uploads/' + path می‌سازند
+        roots.append((app.config["UPLOAD_FOLDER"], True))
+    roots.append((os.path.join(data_dir(app), "uploads"), False))
+    roots.append((os.path.join(legacy_dir(app), "uploads"), False))
+    if app.static_folder:
+        roots.append((os.path.join(app.static_folder, "uploads"), True))
+    return roots
+
+
+_RESOLVERS: Dict[int, UploadPathResolver] = {}
+_RESOLVERS_LOCK = threading.Lock()
+
+
+def get_upload_resolver(app=None) -> UploadPathResolver:
+    """resolver مشترک پردازه برای app (ریشه‌ها یک بار محاسبه می‌شوند، بدون makedirs در هر درخواست)."""
+    if app is None:
+        app = current_app._get_current_object()
+    with _RESOLVERS_LOCK:
+        r = _RESOLVERS.get(id(app))
+        if r is None:
+            r = UploadPathResolver(
+                upload_roots(app),
+                max_entries=app.config.get("UPLOADS_RESOLVE_CACHE_SIZE", DEFAULT_CACHE_SIZE),
+            )
+            _RESOLVERS[id(app)] = r
+        return r
+
+
+# -------- offload (X-Accel-Redirect / X-Sendfile) --------
+def _accel_uri(app, abs_path: str) -> Optional[str]:
+    mapping = app.config.get("UPLOADS_OFFLOAD_MAP") or {}
+    # طولانی‌ترین ریشهٔ منطبق اول
+    for root in sorted(mapping, key=len, reverse=True):
+        root_abs = os.path.abspath(root)
+        if abs_path == root_abs or abs_path.startswith(root_abs + os.sep):
+            rel = os.path.relpath(abs_path, root_abs).replace(os.sep, "/")
+            return mapping[root].rstrip("/") + "/" + quote(rel)
+    if mapping and not app.config.get("UPLOADS_OFFLOAD_PREFIX"):
+        return None
+    prefix = (app.config.get("UPLOADS_OFFLOAD_PREFIX") or DEFAULT_OFFLOAD_PREFIX).rstrip("/")
+    return prefix + quote(abs_path.replace(os.sep, "/"))
+
+
+def _attachment_disposition(name: str) -> str:
+    """Content-Disposition دانلود؛ نام غیر ASCII با filename* (RFC 5987) مثل send_file در werkzeug."""
+    try:
+        name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = name.encode('ascii', 'ignore').decode('ascii').replace('"', '') or 'download'
+        return f"attachment; filename=\"{simple}\"; filename*=UTF-8''{quote(name, safe='')}"
+    return 'attachment; filename="%s"' % name.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def offload_response(abs_path: str, mimetype: Optional[str] = None, as_attachment: bool = False,
+                     download_name: Optional[str] = None):
+    """
+    پاسخ خالی با هدر X-Accel-Redirect/X-Sendfile اگر حالت offload فعال باشد، وگرنه None.
+    نبود فایل → NotFound (تا کش resolver باطل شود).
+    as_attachment: هدر Content-Disposition دانلود با download_name (پیش‌فرض: نام فایل)
+    """
+    app = current_app._get_current_object()
+    mode = str(app.config.get("UPLOADS_OFFLOAD") or "").lower()
+    if mode not in OFFLOAD_MODES:
+        return None
+    abs_path = os.path.abspath(abs_path)
+    try:
+        st = os.stat(abs_path)
+    except OSError:
+        raise NotFound()
+    if not stat.S_ISREG(st.st_mode):
+        raise NotFound()
+    if mode == "x-accel":
+        uri = _accel_uri(app, abs_path)
+        if not uri:
+            return None
+        header, value = "X-Accel-Redirect", uri
+    else:
+        header, value = "X-Sendfile", abs_path
+    resp = app.response_class(
+        mimetype=mimetype or mimetypes.guess_type(abs_path)[0] or "application/octet-stream"
+    )
+    resp.headers[header] = value
+    if as_attachment:
+        resp.headers["Content-Disposition"] = _attachment_disposition(download_name or os.path.basename(abs_path))
+    # وب‌سرور بدنه را می‌فرستد؛ Last-Modified برای درخواست‌های شرطی مرورگر
+    resp.last_modified = st.st_mtime
+    return resp
+
+
+def send_upload(directory: str, filename: str, mimetype: Optional[str] = None,
+                as_attachment: bool = False, download_name: Optional[str] = None):
+    """
+    ارسال فایل از directory: offload در صورت فعال بودن، وگرنه stream با send_from_directory.
+    as_attachment/download_name مثل send_from_directory (دانلود به‌جای نمایش در مرورگر).
+    """
+    path = safe_join(directory, filename)
+    if path is None:
+        raise NotFound()
+    resp = offload_response(path, mimetype, as_attachment=as_attachment, download_name=download_name)
+    if resp is None:
+        resp = send_from_directory(directory, filename, mimetype=mimetype,
+                                   as_attachment=as_attachment, download_name=download_name)
+    return resp
+
+
+def _apk_download_name(resp, filename: str):
+    """APK تنظیم‌شده در تنظیمات با نام اصلی فایل دانلود شود."""
+    try:
+        fn_norm = (filename or '').replace('\\', '/')
+        if fn_norm.lower().endswith('.apk') and fn_norm.startswith('apk/'):
+            try:
+                from ..utils.storage import load_settings
+                settings = load_settings()
+            except Exception:
+                settings = {}
+            wanted_url = str(settings.get('android_apk_url') or '')
+            orig_name = str(settings.get('android_apk_original_name') or '').strip()
+            if wanted_url and orig_name:
+                # match by basename to ensure we are serving the configured APK
+                try:
+                    wanted_base = os.path.basename(wanted_url)
+                except Exception:
+                    wanted_base = ''
+                if wanted_base and wanted_base == os.path.basename(fn_norm):
+                    # Force download with the original client filename
+                    try:
+                        disp = "attachment; filename*=UTF-8''" + quote(orig_name) + f"; filename=\"{orig_name}\""
+                        resp.headers['Content-Disposition'] = disp
+                    except Exception:
+                        resp.headers['Content-Disposition'] = f'attachment; filename=\"{orig_name}\"'
+    except Exception:
+        pass
+    return resp
+
+
+def _serve(root: str, rel: str, filename: str, variant):
+    """سرو واریانت (در صورت درخواست و آماده بودن) یا فایل اصلی؛ نبود فایل → NotFound."""
+    width = variant[1] if variant else 0
+    variant_pending = False
+    # محتوای URL یک blob (و واریانت‌های کلیدخورده با هش آن) هیچ‌وقت عوض نمی‌شود
+    immutable = parse_blob_path(rel) is not None
+    if variant:
+        try:
+            _, v_width, v_quality, v_folder = variant
+            # ساخت در pipeline پس‌زمینه (single-flight)؛ اگر آماده نشد فایل اصلی سرو می‌شود
+            abs_path, variant_pending = get_variant_pipeline().ensure(
+                root, rel, v_width, v_quality, v_folder, DEFAULT_FMT
+            )
+            if abs_path:
+                vdir, vfile = os.path.split(abs_path)
+                resp = send_upload(vdir, vfile, mimetype="image/webp")
+                resp.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if immutable else variant_headers_for_width(width)
+                return resp
+        except NotFound:
+            pass
+        except Exception as e:
+            current_app.logger.debug("Variant generation failed: %s", e, exc_info=True)
+
+    resp = _apk_download_name(send_upload(root, rel), filename)
+    # واریانت هنوز آماده نیست → کش کوتاه تا مرورگر بعداً نسخهٔ بهینه را بگیرد
+    if variant_pending:
+        resp.headers["Cache-Control"] = PENDING_CACHE_CONTROL
+    elif immutable and not variant:
+        # واریانت درخواست‌شده ولی ساخته‌نشده نباید نسخهٔ اصلی را برای همیشه روی URL واریانت کش کند
+        resp.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    else:
+        resp.headers["Cache-Control"] = variant_headers_for_width(width) if width > 0 else ORIGINAL_CACHE_CONTROL
+    return resp
+
+
+@main_bp.route("/uploads/<path:filename>", endpoint="uploaded_file")
+@route_class(MEDIA)
+def uploaded_file(filename):
+    """
+    سرو فایل‌های آپلود (ترتیب ریشه‌ها در docstring ماژول).
+    پارامترهای واریانت:
+      - w: عرض هدف (به نزدیک‌ترین preset گرد می‌شود)
+      - q: کیفیت (به نزدیک‌ترین سطح کیفیت گرد می‌شود)
+      - variant: thumb|card|full|2x (اولویت بر w)
+    """
+    # w/q دلخواه به preset/سطح کیفیت استاندارد گرد می‌شود (فقط WebP)
+    try:
+        variant = resolve_variant(
+            int(request.args.get("w", 0) or 0),
+            int(request.args.get("q", 0) or 0),
+            request.args.get("variant"),
+        )
+    except Exception:
+        variant = None
+
+    resolver = get_upload_resolver()
+    for _ in range(2):
+        hit = resolver.resolve(filename)
+        if hit is None:
+            break
+        try:
+            return _serve(hit[0], hit[1], filename, variant)
+        except NotFound:
+            # فایل از ریشهٔ کش‌شده حذف/جابه‌جا شده → باطل کردن و جست‌وجوی دوباره
+            resolver.invalidate(filename)
+    abort(404, description="File not found")
+
+
+__all__ = [
+    "UploadPathResolver", "get_upload_resolver", "upload_roots", "uploaded_file",
+    "offload_response", "send_upload",
+]
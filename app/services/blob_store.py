@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+Blob Store – ذخیرهٔ محتوامحور (content-addressed) تصاویر آپلودی با حذف نسخه‌های تکراری
+
+- هر تصویر نرمال‌شده با SHA-256 محتوایش در ``<UPLOAD_FOLDER>/blobs/<hh>/<sha256>.<ext>`` ذخیره می‌شود؛
+  آپلود دوبارهٔ همان عکس (برای آگهی دیگر یا هنگام ویرایش) فایل و واریانت جدیدی نمی‌سازد
+- هش فایل خام آپلودی هم به blob نگاشت می‌شود تا آپلود تکراری حتی decode/نرمال‌سازی نشود
+- مسیر ذخیره‌شده در آگهی‌ها: ``uploads/blobs/<hh>/<sha256>.jpg`` (URL: ``/uploads/blobs/...``)؛
+  واریانت‌ها در ``__variants__/<preset>/blobs/<hh>/<sha256>.webp`` یعنی با کلید هش ساخته می‌شوند
+  و چون محتوای یک URL هرگز عوض نمی‌شود، با Cache-Control immutable سرو می‌شوند
+- جدول ارجاع (blob_refs): صاحب‌ها ``listing:<code>`` و ``avatar:<phone>``؛ حذف آگهی فقط ارجاع‌ها را برمی‌دارد
+- GC (``scripts/gc_blobs.py``): ارجاع‌ها را از lands.json و پروفایل همکاران بازسازی می‌کند و blobهای
+  بدون ارجاع (قدیمی‌تر از مهلت) را همراه همهٔ ``__variants__`` آن‌ها حذف می‌کند
+- ذخیره‌سازی متادیتا در SQLite (``blobs.sqlite3`` در پوشهٔ داده) با WAL
+
+تنظیمات (app.config):
+  BLOB_GC_GRACE_HOURS   حداقل سن blob بدون ارجاع برای حذف توسط GC (پیش‌فرض 24)
+"""
+from __future__ import annotations
+
+import os
+import re
+import glob
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..utils.storage import data_dir, _resolve_app
+
+BLOB_DIR = 'blobs'
+DEFAULT_GC_GRACE_HOURS = 24
+HASH_CHUNK = 1024 * 1024
+_BLOB_PATH_RE = re.compile(r'(?:^|/)blobs/([0-9a-f]{2})/([0-9a-f]{64})\.([a-z0-9]{2,5})(?:[?#].*)?$')
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parse_blob_path(value: Any) -> Optional[Tuple[str, str]]:
+    """مسیر/URL ذخیره‌شده → (sha256, ext) اگر به یک blob اشاره کند، وگرنه None."""
+    if not isinstance(value, str) or 'blobs/' not in value:
+        return None
+    m = _BLOB_PATH_RE.search(value.strip().replace('\\', '/'))
+    if not m or m.group(2)[:2] != m.group(1):
+        return None
+    return m.group(2), m.group(3)
+
+
+def blob_rel(digest: str, ext: str) -> str:
+    """مسیر نسبی blob از ریشهٔ آپلود (همان مسیر /uploads/<rel>)."""
+    return f"{BLOB_DIR}/{digest[:2]}/{digest}.{ext}"
+
+
+def listing_owner(code: Any) -> str:
+    return f"listing:{code}"
+
+
+def avatar_owner(phone: Any) -> str:
+    return f"avatar:{phone}"
+
+
+def _image_values(value) -> Iterator[str]:
+    if isinstance(value, str):
+        if value.strip():
+            yield value.strip()
+    elif isinstance(value, dict):
+        for k in ('url', 'src', 'path'):
+            if isinstance(value.get(k), str) and value[k].strip():
+                yield value[k].strip()
+                break
+    elif isinstance(value, list):
+        for v in value:
+            yield from _image_values(v)
+
+
+def listing_image_paths(ad: Dict[str, Any]) -> List[str]:
+    """همهٔ مسیرهای تصویر یک آگهی (images / image / cover)."""
+    out: List[str] = []
+    for key in ('images', 'image', 'cover'):
+        out.extend(_image_values(ad.get(key)))
+    return out
+
+
+class BlobStore:
+    """فایل‌های blob زیر root/blobs و جدول‌های blobs / blob_sources / blob_refs در SQLite."""
+
+    def __init__(self, root: str, db_path: str):
+        self.root = root
+        self.db_path = db_path
+        self.tmp_dir = os.path.join(root, BLOB_DIR, '.tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " hash TEXT PRIMARY KEY, ext TEXT NOT NULL, bytes INTEGER NOT NULL DEFAULT 0,"
+            " width INTEGER, height INTEGER, placeholder TEXT, color TEXT, created_at REAL NOT NULL)"
+        )
+        # پایگاه‌های ساخته‌شده پیش از ستون‌های placeholder/color
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(blobs)").fetchall()}
+        for col in ('placeholder', 'color'):
+            if col not in cols:
+                conn.execute(f"ALTER TABLE blobs ADD COLUMN {col} TEXT")
+        conn.execute("CREATE TABLE IF NOT EXISTS blob_sources (source_hash TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS blob_refs ("
+            " hash TEXT NOT NULL, owner TEXT NOT NULL, PRIMARY KEY (hash, owner))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_blob_refs_owner ON blob_refs (owner)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None, check_same_thread=False)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            except Exception:
+                pass
+            self._local.conn = conn
+        return conn
+
+    # ---------- blobs ----------
+    def abs_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, blob_rel(digest, ext))
+
+    def _row(self, digest: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT hash, ext, bytes, width, height, placeholder, color FROM blobs WHERE hash = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            return None
+        info = {'hash': row[0], 'format': row[1], 'bytes': row[2], 'rel': blob_rel(row[0], row[1])}
+        if row[3] and row[4]:
+            info.update(width=row[3], height=row[4])
+        if row[5]:
+            info['placeholder'] = row[5]
+        if row[6]:
+            info['color'] = row[6]
+        return info
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """متادیتای blob اگر ثبت شده و فایلش موجود باشد."""
+        info = self._row(digest)
+        if info is None or not os.path.isfile(os.path.join(self.root, info['rel'])):
+            return None
+        return info
+
+    def lookup_source(self, source_hash: str) -> Optional[Dict[str, Any]]:
+        """blob ساخته‌شده از همین فایل خام (آپلود تکراری)."""
+        conn = self._conn()
+        row = conn.execute("SELECT hash FROM blob_sources WHERE source_hash = ?", (source_hash,)).fetchone()
+        info = self.get(row[0]) if row else None
+        if info is not None:
+            # استفادهٔ دوباره → مهلت GC از نو شروع شود
+            conn.execute("UPDATE blobs SET created_at = ? WHERE hash = ?", (time.time(), info['hash']))
+        return info
+
+    def put(self, path: str, ext: str, source_hash: Optional[str] = None,
+            meta: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        انتقال فایل path به blob با هش محتوا؛ اگر همان محتوا قبلاً ذخیره شده باشد path حذف می‌شود.
+        meta: width / height / placeholder / color محاسبه‌شده هنگام ingest
+        خروجی: (info, created) — created=False یعنی نسخهٔ تکراری بود.
+        """
+        ext = (ext or 'bin').lower().lstrip('.')
+        meta = meta or {}
+        digest = file_sha256(path)
+        final = self.abs_path(digest, ext)
+        created = False
+        now = time.time()
+        if os.path.isfile(final):
+            os.remove(path)
+            # استفادهٔ دوباره از blob بدون ارجاع → مهلت GC از نو شروع شود
+            try:
+                os.utime(final, None)
+            except OSError:
+                pass
+        else:
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            os.replace(path, final)
+            created = True
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO blobs (hash, ext, bytes, width, height, placeholder, color, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(hash) DO UPDATE SET created_at = excluded.created_at,"
+            " placeholder = COALESCE(blobs.placeholder, excluded.placeholder),"
+            " color = COALESCE(blobs.color, excluded.color)",
+            (digest, ext, os.path.getsize(final), meta.get('width'), meta.get('height'),
+             meta.get('placeholder'), meta.get('color'), now),
+        )
+        if source_hash:
+            conn.execute(
+                "INSERT OR REPLACE INTO blob_sources (source_hash, hash) VALUES (?, ?)", (source_hash, digest)
+            )
+        info = self._row(digest) or {'hash': digest, 'format': ext, 'rel': blob_rel(digest, ext)}
+        return info, created
+
+    # ---------- refs ----------
+    def set_refs(self, owner: str, paths: Iterable[str]) -> int:
+        """جایگزینی ارجاع‌های یک صاحب با blobهای موجود در paths؛ خروجی: تعداد ارجاع‌ها."""
+        digests = sorted({p[0] for p in map(parse_blob_path, paths or []) if p})
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM blob_refs WHERE owner = ?", (owner,))
+            conn.executemany("INSERT OR IGNORE INTO blob_refs (hash, owner) VALUES (?, ?)",
+                             [(d, owner) for d in digests])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(digests)
+
+    def drop_refs(self, owner: str) -> None:
+        self._conn().execute("DELETE FROM blob_refs WHERE owner = ?", (owner,))
+
+    def refcount(self, digest: str) -> int:
+        row = self._conn().execute("SELECT COUNT(*) FROM blob_refs WHERE hash = ?", (digest,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def rebuild_refs(self, owners: Dict[str, Iterable[str]]) -> int:
+        """بازسازی کامل جدول ارجاع از منبع اصلی (آگهی‌ها و پروفایل‌ها)؛ خروجی: تعداد ارجاع‌ها."""
+        rows = sorted({
+            (p[0], owner) for owner, paths in owners.items() for p in map(parse_blob_path, paths or []) if p
+        })
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM blob_refs")
+            conn.executemany("INSERT OR IGNORE INTO blob_refs (hash, owner) VALUES (?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    # ---------- GC ----------
+    def _variant_files(self, digest: str) -> List[str]:
+        pattern = os.path.join(self.root, '__variants__', '*', BLOB_DIR, digest[:2], digest + '.*')
+        return glob.glob(pattern)
+
+    def _orphan_files(self) -> Iterator[Tuple[str, str, str]]:
+        """فایل‌های blob روی دیسک: (hash, ext, abs_path)."""
+        base = os.path.join(self.root, BLOB_DIR)
+        for prefix in sorted(os.listdir(base)) if os.path.isdir(base) else []:
+            folder = os.path.join(base, prefix)
+            if len(prefix) != 2 or not os.path.isdir(folder):
+                continue
+            for fn in os.listdir(folder):
+                parsed = parse_blob_path(f"{BLOB_DIR}/{prefix}/{fn}")
+                if parsed:
+                    yield parsed[0], parsed[1], os.path.join(folder, fn)
+
+    def gc(self, grace_seconds: float = DEFAULT_GC_GRACE_HOURS * 3600, dry_run: bool = False) -> Dict[str, int]:
+        """
+        حذف blobهای بدون ارجاع که قدیمی‌تر از grace_seconds هستند، به همراه واریانت‌هایشان.
+        فایل‌های blob بدون ردیف در جدول (مثلاً قطع برنامه بین rename و insert) هم بر اساس mtime بررسی می‌شوند.
+        خروجی: {'blobs', 'variants', 'bytes', 'kept_recent'}
+        """
+        cutoff = time.time() - max(0.0, float(grace_seconds))
+        conn = self._conn()
+        known = {r[0]: (r[1], r[2]) for r in conn.execute("SELECT hash, ext, created_at FROM blobs").fetchall()}
+        referenced = {r[0] for r in conn.execute("SELECT DISTINCT hash FROM blob_refs").fetchall()}
+        candidates: Dict[str, str] = {}
+        stats = {'blobs': 0, 'variants': 0, 'bytes': 0, 'kept_recent': 0}
+        for digest, (ext, created_at) in known.items():
+            if digest in referenced:
+                continue
+            if created_at > cutoff:
+                stats['kept_recent'] += 1
+                continue
+            candidates[digest] = ext
+        for digest, ext, path in self._orphan_files():
+            if digest in known or digest in referenced:
+                continue
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    stats['kept_recent'] += 1
+                    continue
+            except OSError:
+                continue
+            candidates[digest] = ext
+
+        for digest, ext in candidates.items():
+            files = [self.abs_path(digest, ext)] + self._variant_files(digest)
+            for i, path in enumerate(files):
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                if not dry_run:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                stats['bytes'] += size
+                if i:
+                    stats['variants'] += 1
+            stats['blobs'] += 1
+            if not dry_run:
+                conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+                conn.execute("DELETE FROM blob_sources WHERE hash = ?", (digest,))
+        return stats
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._conn()
+        blobs, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM blobs").fetchone()
+        refs = conn.execute("SELECT COUNT(*) FROM blob_refs").fetchone()[0]
+        unreferenced = conn.execute(
+            "SELECT COUNT(*) FROM blobs WHERE hash NOT IN (SELECT hash FROM blob_refs)"
+        ).fetchone()[0]
+        return {'blobs': blobs, 'bytes': total, 'refs': refs, 'unreferenced': unreferenced}
+
+
+_STORES: Dict[str, BlobStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_blob_store(app=None) -> BlobStore:
+    """blob store مشترک پردازه؛ ریشه: UPLOAD_FOLDER (همان ریشهٔ اول /uploads/<path>)."""
+    app = _resolve_app(app)
+    root = app.config.get('UPLOAD_FOLDER') or os.path.join(data_dir(app), 'uploads')
+    db_path = os.path.join(data_dir(app), 'blobs.sqlite3')
+    with _STORES_LOCK:
+        store = _STORES.get(db_path)
+        if store is None:
+            store = BlobStore(root, db_path)
+            _STORES[db_path] = store
+        return store
+
+
+def sync_listing_refs(ad: Dict[str, Any], app=None) -> None:
+    """ثبت ارجاع‌های تصاویر یک آگهی پس از ذخیره؛ خطا فقط در لاگ (GC ارجاع‌ها را از نو می‌سازد)."""
+    app = _resolve_app(app)
+    if not isinstance(ad, dict) or not ad.get('code'):
+        return
+    try:
+        get_blob_store(app).set_refs(listing_owner(ad['code']), listing_image_paths(ad))
+    except Exception:
+        app.logger.warning("Blob refs update failed for listing %s", ad.get('code'), exc_info=True)
+
+
+def drop_listing_refs(code: Any, app=None) -> None:
+    """برداشتن ارجاع‌های آگهی حذف‌شده؛ خود فایل‌ها را GC (بعد از مهلت) حذف می‌کند."""
+    app = _resolve_app(app)
+    if not code:
+        return
+    try:
+        get_blob_store(app).drop_refs(listing_owner(code))
+    except Exception:
+        app.logger.warning("Blob refs cleanup failed for listing %s", code, exc_info=True)
+
+
+def collect_owners(app=None) -> Dict[str, List[str]]:
+    """ارجاع‌های واقعی از منبع اصلی: آگهی‌ها (lands.json) و آواتار همکاران."""
+    from ..utils.storage import load_ads, load_express_partners
+    app = _resolve_app(app)
+    owners: Dict[str, List[str]] = {}
+    with app.app_context():
+        for ad in load_ads(app) or []:
+            if isinstance(ad, dict) and ad.get('code'):
+                owners.setdefault(listing_owner(ad['code']), []).extend(listing_image_paths(ad))
+        for partner in load_express_partners(app) or []:
+            if isinstance(partner, dict) and partner.get('phone'):
+                owners.setdefault(avatar_owner(partner['phone']), []).extend(_image_values(partner.get('avatar')))
+    return owners
+
+
+__all__ = [
+    'BlobStore', 'get_blob_store', 'parse_blob_path', 'blob_rel', 'file_sha256',
+    'listing_owner', 'avatar_owner', 'listing_image_paths', 'sync_listing_refs', 'drop_listing_refs',
+    'collect_owners',
+]
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked Uploads – آپلود تکه‌ای و قابل ادامه برای ویدئوی آگهی و مدارک حجیم
+
+پروتکل (app/api/uploads.py):
+  POST /api/uploads/chunked                 {filename, size, kind} → {id, offset: 0, chunk_size}
+  PUT  /api/uploads/chunked/<id>?offset=N   بدنهٔ خام تکه؛ offset باید برابر بایت‌های دریافت‌شده باشد
+                                            (در غیر این صورت 409 با offset فعلی تا کلاینت از همان‌جا ادامه دهد)
+  GET  /api/uploads/chunked/<id>            وضعیت: {offset, size, complete}
+  POST /api/uploads/chunked/<id>/finalize   تحویل فایل به مسیر پردازش رسانه → {id, path, ...}
+
+- هر تکه مستقیماً (stream) به انتهای یک فایل موقت نوشته می‌شود؛ فایل نهایی همان فایل موقت است
+  و بدون خواندن دوباره در حافظه جابه‌جا می‌شود
+- وضعیت هر آپلود در ``<instance>/data/chunked_uploads/<id>/meta.json`` است (مشترک بین workerها)
+- finalize بر اساس kind:
+    video     → انتقال به static/uploads (مثل _save_video_from_form)
+    image     → app.services.image_ingest (نرمال‌سازی + واریانت پس‌زمینه)
+    document  → فایل نگه داشته می‌شود تا فرم مقصد با ``take`` آن را به پوشهٔ خودش منتقل کند
+- فرم‌ها به جای فایل، ``<field>_upload_id`` می‌فرستند و سرور با ``take`` نتیجه را برمی‌دارد
+- آپلودهای رها‌شده بعد از CHUNKED_UPLOAD_TTL_HOURS پاک می‌شوند
+
+تنظیمات (app.config):
+  CHUNKED_UPLOAD_MAX_MB       حداکثر حجم کل فایل (پیش‌فرض 500)
+  CHUNKED_UPLOAD_CHUNK_MB     اندازهٔ پیشنهادی/حداکثر هر تکه (پیش‌فرض 4)
+  CHUNKED_UPLOAD_TTL_HOURS    عمر آپلودهای ناتمام (پیش‌فرض 24)
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+
+from ..utils.storage import data_dir, _resolve_app
+
+DEFAULT_MAX_MB = 500
+DEFAULT_CHUNK_MB = 4
+DEFAULT_TTL_HOURS = 24
+COPY_BUFFER = 64 * 1024
+
+VIDEO_EXTS = {'.mp4', '.webm', '.mov', '.avi', '.mkv'}
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+DOCUMENT_EXTS = {'.pdf', '.jpg', '.jpeg', '.png', '.webp', '.doc', '.docx', '.xls', '.xlsx', '.zip'}
+KIND_EXTS = {'video': VIDEO_EXTS, 'image': IMAGE_EXTS, 'document': DOCUMENT_EXTS}
+
+
+class ChunkedUploadError(ValueError):
+    """خطای پروتکل؛ status کد HTTP پیشنهادی و extra داده‌های کمکی پاسخ است."""
+
+    def __init__(self, message: str, status: int = 400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def listing_filename(original: str) -> str:
+    """نام ذخیرهٔ فایل‌های آگهی در static/uploads: '<timestamp>__<نام امن>'."""
+    return secure_filename(f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}__{original}")
+
+
+class ChunkedUploadStore:
+    def __init__(self, app, root: str):
+        self.app = app
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._last_prune = 0.0
+
+    # ---------- مسیرها و meta ----------
+    def _dir(self, upload_id: str) -> str:
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise ChunkedUploadError("شناسهٔ آپلود نامعتبر است.", 404)
+        return os.path.join(self.root, upload_id)
+
+    def _part(self, upload_id: str) -> str:
+        return os.path.join(self._dir(upload_id), 'data.part')
+
+    def _lock(self, upload_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _load(self, upload_id: str, owner: Optional[str] = None) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self._dir(upload_id), 'meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise ChunkedUploadError("آپلود پیدا نشد یا منقضی شده است.", 404)
+        if owner is not None and meta.get('owner') != owner:
+            raise ChunkedUploadError("آپلود پیدا نشد یا منقضی شده است.", 404)
+        return meta
+
+    def _save(self, meta: Dict[str, Any]) -> None:
+        path = os.path.join(self._dir(meta['id']), 'meta.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _max_bytes(self) -> int:
+        return int(self.app.config.get('CHUNKED_UPLOAD_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024
+
+    def chunk_size(self) -> int:
+        return int(self.app.config.get('CHUNKED_UPLOAD_CHUNK_MB', DEFAULT_CHUNK_MB)) * 1024 * 1024
+
+    def _received(self, upload_id: str) -> int:
+        try:
+            return os.path.getsize(self._part(upload_id))
+        except OSError:
+            return 0
+
+    # ---------- پروتکل ----------
+    def init(self, owner: str, filename: str, size: int, kind: str) -> Dict[str, Any]:
+        self.prune()
+        if kind not in KIND_EXTS:
+            raise ChunkedUploadError("نوع آپلود نامعتبر است.")
+        ext = os.path.splitext(filename or '')[1].lower()
+        if not filename or ext not in KIND_EXTS[kind]:
+            raise ChunkedUploadError("فرمت فایل مجاز نیست.")
+        if size <= 0:
+            raise ChunkedUploadError("حجم فایل نامعتبر است.")
+        if size > self._max_bytes():
+            raise ChunkedUploadError(f"حجم بیش از {self._max_bytes() // (1024 * 1024)} مگابایت است.", 413)
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._dir(upload_id), exist_ok=True)
+        open(self._part(upload_id), 'wb').close()
+        meta = {
+            'id': upload_id, 'owner': owner, 'kind': kind, 'filename': filename, 'size': int(size),
+            'created_at': time.time(), 'complete': False, 'result': None,
+        }
+        self._save(meta)
+        return self.status(upload_id, owner)
+
+    def status(self, upload_id: str, owner: str) -> Dict[str, Any]:
+        meta = self._load(upload_id, owner)
+        out = {
+            'id': upload_id, 'kind': meta['kind'], 'filename': meta['filename'], 'size': meta['size'],
+            'offset': meta['size'] if meta['complete'] else self._received(upload_id),
+            'complete': meta['complete'], 'chunk_size': self.chunk_size(),
+        }
+        if meta.get('result'):
+            out.update({k: v for k, v in meta['result'].items() if k != 'staged'})
+        return out
+
+    def write_chunk(self, upload_id: str, owner: str, offset: int, stream, length: Optional[int] = None) -> int:
+        """نوشتن stream در offset؛ خروجی offset جدید. offset نادرست → 409 با offset فعلی."""
+        meta = self._load(upload_id, owner)
+        if meta['complete']:
+            raise ChunkedUploadError("آپلود قبلاً نهایی شده است.", 409, offset=meta['size'])
+        limit = self.chunk_size()
+        if length is not None and length > limit:
+            raise ChunkedUploadError("اندازهٔ تکه بیش از حد مجاز است.", 413, offset=self._received(upload_id))
+        with self._lock(upload_id):
+            received = self._received(upload_id)
+            if offset != received:
+                raise ChunkedUploadError("offset نادرست است.", 409, offset=received)
+            written = 0
+            with open(self._part(upload_id), 'r+b') as out:
+                out.seek(offset)
+                try:
+                    while True:
+                        block = stream.read(COPY_BUFFER)
+                        if not block:
+                            break
+                        written += len(block)
+                        if written > limit or offset + written > meta['size']:
+                            raise ChunkedUploadError("اندازهٔ تکه بیش از حد مجاز است.", 413)
+                        out.write(block)
+                except Exception:
+                    # تکهٔ ناقص کنار گذاشته می‌شود تا کلاینت همان تکه را دوباره بفرستد
+                    out.truncate(offset)
+                    raise
+            return offset + written
+
+    def finalize(self, upload_id: str, owner: str) -> Dict[str, Any]:
+        meta = self._load(upload_id, owner)
+        if meta['complete']:
+            return self.status(upload_id, owner)
+        with self._lock(upload_id):
+            received = self._received(upload_id)
+            if received != meta['size']:
+                raise ChunkedUploadError("فایل کامل دریافت نشده است.", 409, offset=received)
+            meta['result'] = self._hand_off(meta)
+            meta['complete'] = True
+            self._save(meta)
+        return self.status(upload_id, owner)
+
+    def _hand_off(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        part = self._part(meta['id'])
+        kind = meta['kind']
+        uploads_root = os.path.join(self.app.static_folder, 'uploads')
+        if kind == 'video':
+            os.makedirs(uploads_root, exist_ok=True)
+            name = listing_filename(meta['filename'])
+            # shutil.move: rename در همان فایل‌سیستم، وگرنه کپی stream
+            shutil.move(part, os.path.join(uploads_root, name))
+            return {'path': f'uploads/{name}', 'url': f'/uploads/{name}'}
+        if kind == 'image':
+            from .image_ingest import image_meta_entry, ingest_image
+            with open(part, 'rb') as f:
+                info = ingest_image(FileStorage(stream=f, filename=meta['filename']), uploads_root,
+                                    app=self.app, content_addressed=True)
+            os.remove(part)
+            return {'path': f"uploads/{info['rel']}", 'url': f"/uploads/{info['rel']}",
+                    'image': image_meta_entry(info)}
+        return {'staged': True}
+
+    def take(self, upload_id: str, owner: str, kind: str, dest_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        برداشتن نتیجهٔ یک آپلود نهایی‌شده توسط فرم مقصد (یک‌بار مصرف).
+        document: فایل به dest_path منتقل و 'path' برابر dest_path برگردانده می‌شود.
+        """
+        meta = self._load(upload_id, owner)
+        if not meta['complete'] or meta['kind'] != kind:
+            raise ChunkedUploadError("آپلود نهایی نشده یا نوع آن نادرست است.", 409)
+        result = dict(meta.get('result') or {})
+        if kind == 'document':
+            if not dest_path:
+                raise ChunkedUploadError("مسیر مقصد مشخص نشده است.")
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            shutil.move(self._part(upload_id), dest_path)
+            result = {'path': dest_path}
+        result['filename'] = meta['filename']
+        self.discard(upload_id)
+        return result
+
+    def discard(self, upload_id: str) -> None:
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+
+    def prune(self) -> int:
+        """حذف آپلودهای قدیمی‌تر از TTL (حداکثر هر ده دقیقه یک بار)."""
+        now = time.time()
+        if now - self._last_prune < 600:
+            return 0
+        self._last_prune = now
+        ttl = float(self.app.config.get('CHUNKED_UPLOAD_TTL_HOURS', DEFAULT_TTL_HOURS)) * 3600
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.path.getmtime(path) > ttl:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+_STORES: Dict[int, ChunkedUploadStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_chunked_store(app=None) -> ChunkedUploadStore:
+    app = _resolve_app(app)
+    with _STORES_LOCK:
+        store = _STORES.get(id(app))
+        if store is None:
+            store = ChunkedUploadStore(app, os.path.join(data_dir(app), 'chunked_uploads'))
+            _STORES[id(app)] = store
+        return store
+
+
+def take_upload(upload_id: str, owner: str, kind: str, dest_path: Optional[str] = None,
+                app=None) -> Optional[Dict[str, Any]]:
+    """میان‌بر برای فرم‌ها؛ شناسهٔ خالی/نامعتبر → None (خطا در لاگ ثبت می‌شود)."""
+    upload_id = (upload_id or '').strip()
+    if not upload_id:
+        return None
+    store = get_chunked_store(app)
+    try:
+        return store.take(upload_id, owner, kind, dest_path)
+    except ChunkedUploadError as e:
+        store.app.logger.warning("Chunked upload %s could not be used (%s): %s", upload_id, kind, e)
+        return None
+
+
+__all__ = [
+    'ChunkedUploadStore', 'ChunkedUploadError', 'get_chunked_store', 'take_upload', 'listing_filename',
+    'KIND_EXTS',
+]
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Partner Event Bus – گذرگاه رویداد درون‌پردازه‌ای برای کانال زندهٔ همکاران (SSE / long-poll)
+
+- سرویس اعلان‌ها (افزودن/خواندن) و ذخیرهٔ فایل همکاران رویدادها را منتشر می‌کنند
+  (``notification``، ``unread``، ``partner_status``)؛ مصرف‌کننده‌ها روی Condition منتظر می‌مانند
+  و کلاینت بیکار هیچ I/O دیسکی ایجاد نمی‌کند
+- رویدادها در یک بافر حلقوی با شمارهٔ ترتیبی نگه داشته می‌شوند تا اتصال مجدد
+  (``Last-Event-ID``) رویدادهای از دست رفته را دریافت کند
+- در حالت چند worker، یک thread ناظر فقط mtime فایل‌های اعلان/همکاران را بررسی می‌کند و اگر
+  پردازهٔ دیگری آن‌ها را تغییر داده باشد رویداد عمومی ``sync`` منتشر می‌کند
+"""
+from __future__ import annotations
+
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+BROADCAST = '*'
+DEFAULT_BUFFER = 1000
+WATCH_INTERVAL_SECONDS = 2.0
+
+
+class EventBus:
+    """Pub/sub سادهٔ thread-safe با بافر حلقوی."""
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER):
+        # شناسهٔ پردازه در id رویدادها تا اتصال مجدد به worker دیگر تشخیص داده شود
+        self.epoch = '%x%x' % (os.getpid(), int(time.time()))
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._events: deque = deque(maxlen=max(10, int(buffer_size)))
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, topic: str, kind: str, data: Optional[Dict[str, Any]] = None) -> int:
+        with self._cond:
+            self._seq += 1
+            self._events.append({'seq': self._seq, 'topic': topic, 'kind': kind, 'data': data or {}})
+            self._cond.notify_all()
+            return self._seq
+
+    def _since_locked(self, topic: str, last_seq: int) -> Optional[List[Dict[str, Any]]]:
+        # اگر رویدادهای بعد از last_seq از بافر خارج شده‌اند، None (کلاینت باید همگام‌سازی کامل کند)
+        if self._events and last_seq < self._events[0]['seq'] - 1:
+            return None
+        return [e for e in self._events if e['seq'] > last_seq and e['topic'] in (topic, BROADCAST)]
+
+    def since(self, topic: str, last_seq: int) -> Optional[List[Dict[str, Any]]]:
+        with self._cond:
+            return self._since_locked(topic, last_seq)
+
+    def wait(self, topic: str, last_seq: int, timeout: float):
+        """
+        انتظار تا رسیدن رویداد جدید برای topic.
+        خروجی: (events, last_seq)؛ events=None یعنی رویدادها از بافر خارج شده‌اند و همگام‌سازی کامل لازم است.
+        last_seq برگشتی شامل رویدادهای دیگر topicها هم هست تا دوباره بررسی نشوند.
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            while True:
+                events = self._since_locked(topic, last_seq)
+                if events is None:
+                    return None, self._seq
+                if events:
+                    return events, self._seq
+                last_seq = self._seq
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], last_seq
+                self._cond.wait(remaining)
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def parse_event_id(self, value: Optional[str]) -> Optional[int]:
+        """Last-Event-ID → seq؛ اگر مربوط به پردازهٔ دیگری باشد None."""
+        try:
+            epoch, seq = str(value or '').rsplit('-', 1)
+            seq = int(seq)
+        except Exception:
+            return None
+        if epoch != self.epoch or seq > self._seq:
+            return None
+        return seq
+
+
+_bus = EventBus()
+
+
+def get_event_bus() -> EventBus:
+    return _bus
+
+
+def publish(topic: str, kind: str, data: Optional[Dict[str, Any]] = None) -> int:
+    """انتشار رویداد برای یک کاربر (topic = شماره تلفن normalize شده) یا BROADCAST."""
+    return _bus.publish(topic, kind, data)
+
+
+# -------- ناظر تغییرات بین‌پردازه‌ای --------
+class _FileWatcher:
+    """بررسی دوره‌ای mtime چند فایل؛ نوشتن‌های همین پردازه با note_write نادیده گرفته می‌شوند."""
+
+    def __init__(self, bus: EventBus, interval: float = WATCH_INTERVAL_SECONDS):
+        self.bus = bus
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._paths: Dict[str, Optional[int]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def watch(self, paths: Iterable[str]) -> None:
+        with self._lock:
+            for p in paths:
+                if p and p not in self._paths:
+                    self._paths[p] = self._mtime(p)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='partner-events-watch', daemon=True)
+                self._thread.start()
+
+    def note_write(self, path: str) -> None:
+        with self._lock:
+            if path in self._paths:
+                self._paths[path] = self._mtime(path)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            changed = False
+            with self._lock:
+                for p, old in list(self._paths.items()):
+                    cur = self._mtime(p)
+                    if cur != old:
+                        self._paths[p] = cur
+                        changed = True
+            if changed:
+                self.bus.publish(BROADCAST, 'sync')
+
+
+_watcher = _FileWatcher(_bus)
+
+
+def watch_files(paths: Iterable[str]) -> None:
+    _watcher.watch(paths)
+
+
+def note_write(path: str) -> None:
+    """اعلام نوشتن فایل توسط همین پردازه (تا ناظر آن را تغییر خارجی حساب نکند)."""
+    _watcher.note_write(path)
+
+
+# -------- وضعیت همکاران --------
+_partner_status: Optional[Dict[str, str]] = None
+_partner_lock = threading.Lock()
+
+
+def _status_key(value: Any) -> str:
+    if value is True:
+        return 'true'
+    return str(value or '').strip().lower()
+
+
+def _index_partner_statuses(items: Any) -> Dict[str, str]:
+    from .notifications import _normalize_user_id
+    out: Dict[str, str] = {}
+    for p in items if isinstance(items, list) else []:
+        if isinstance(p, dict) and p.get('phone'):
+            phone = _normalize_user_id(str(p.get('phone')))
+            if phone:
+                out[phone] = _status_key(p.get('status'))
+    return out
+
+
+def publish_partner_changes(items: Any, load_previous: Callable[[], Any]) -> None:
+    """
+    مقایسهٔ وضعیت همکاران با آخرین نسخهٔ شناخته‌شده و انتشار ``partner_status`` برای تغییرات.
+    load_previous فقط در اولین فراخوانی پردازه (نبود snapshot) صدا زده می‌شود.
+    """
+    global _partner_status
+    with _partner_lock:
+        previous = _partner_status
+        if previous is None:
+            try:
+                previous = _index_partner_statuses(load_previous())
+            except Exception:
+                previous = {}
+        current = _index_partner_statuses(items)
+        _partner_status = current
+    for phone, status in current.items():
+        if previous.get(phone) != status:
+            _bus.publish(phone, 'partner_status', {'status': status})
+
+
+__all__ = [
+    'EventBus', 'BROADCAST', 'get_event_bus', 'publish', 'publish_partner_changes',
+    'watch_files', 'note_write',
+]
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Image Ingest – مسیر واحد ذخیرهٔ تصاویر آپلودی (API آپلود و فرم‌های پنل ادمین)
+
+- فایل به‌صورت stream (تکه‌تکه) در یک فایل موقت کنار مقصد نوشته می‌شود، نه با read() کامل در حافظه
+- سقف حجم هنگام نوشتن بررسی می‌شود و نوع فایل از روی سرآیند (magic bytes) تشخیص داده می‌شود
+- نرمال‌سازی: چرخش EXIF، حذف کانال آلفا روی زمینهٔ سفید، کوچک‌سازی به حداکثر 1600px و JPEG progressive
+  (برای JPEG از draft mode استفاده می‌شود تا عکس‌های ۱۲ مگاپیکسلی کامل decode نشوند)
+- GIF دست‌نخورده ذخیره می‌شود؛ اگر پردازش خطا بدهد فایل اصلی نگه داشته می‌شود
+- واریانت‌های preset در پس‌زمینه (app.services.image_variants) ساخته می‌شوند
+- خروجی ``ingest_image`` ابعاد و حجم فایل را دارد تا در متادیتای آگهی (``image_meta``) ذخیره شود
+- برای نمایش فوری کارت‌ها قبل از رسیدن thumb: placeholder تار ۱۶ پیکسلی (data URI از WebP، حدود ۲۰۰ بایت)
+  و رنگ غالب (``#rrggbb``) از همان تصویر decodeشده محاسبه و کنار ابعاد ذخیره می‌شوند
+- ``content_addressed=True``: خروجی در blob store (app.services.blob_store) با کلید SHA-256 ذخیره می‌شود؛
+  آپلود تکراری (همان فایل خام یا همان خروجی نرمال‌شده) فایل و واریانت جدید نمی‌سازد
+
+تنظیمات (app.config):
+  IMAGE_INGEST_MAX_MB     حداکثر حجم فایل آپلودی (پیش‌فرض 12)
+  IMAGE_INGEST_MAX_SIDE   بیشترین ضلع تصویر پس از نرمال‌سازی (پیش‌فرض 1600)
+  IMAGE_INGEST_QUALITY    کیفیت JPEG خروجی (پیش‌فرض 82)
+"""
+from __future__ import annotations
+
+import io
+import os
+import uuid
+import base64
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from werkzeug.utils import secure_filename
+
+from ..utils.images import VARIANT_PRESETS, load_pil
+
+ALLOWED_EXTS = {"jpg", "jpeg", "png", "gif", "webp"}
+DEFAULT_MAX_MB = 12
+DEFAULT_MAX_SIDE = 1600
+DEFAULT_QUALITY = 82
+CHUNK_SIZE = 64 * 1024
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+PREVIEW_KEYS = ('width', 'height', 'placeholder', 'color')
+
+
+class IngestError(ValueError):
+    """خطای قابل نمایش به کاربر (فایل خالی، حجم زیاد، نوع نامعتبر)."""
+
+
+def _config(app, key: str, default):
+    try:
+        return type(default)(app.config.get(key, default)) if app is not None else default
+    except Exception:
+        return default
+
+
+def _stream_to(file, path: str, max_bytes: int, digest=None) -> int:
+    """نوشتن stream فایل در path به‌صورت تکه‌ای (و به‌روزرسانی digest در صورت ارسال)؛ خروجی: تعداد بایت‌ها."""
+    stream = getattr(file, 'stream', file)
+    written = 0
+    with open(path, 'wb') as out:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise IngestError(f"حجم بیش از {max_bytes // (1024 * 1024)} مگابایت است.")
+            if digest is not None:
+                digest.update(chunk)
+            out.write(chunk)
+    return written
+
+
+def _sniff_ext(head: bytes) -> str:
+    """پسوند از روی magic bytes سرآیند فایل (فقط انواع مجاز)؛ ناشناخته → ''."""
+    if head[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return ''
+
+
+def _detect_ext(path: str, filename: str) -> str:
+    try:
+        with open(path, 'rb') as fh:
+            ext = _sniff_ext(fh.read(16))
+    except OSError:
+        ext = ''
+    if ext not in ALLOWED_EXTS:
+        # اگر تشخیص از محتوا ممکن نبود، پسوند امن‌شدهٔ نام فایل
+        original = secure_filename(filename or '').rsplit('.', 1)[-1].lower() if '.' in (filename or '') else ''
+        ext = 'jpg' if original == 'jpeg' else original
+    if ext not in ALLOWED_EXTS:
+        raise IngestError("فقط تصاویر مجاز هستند.")
+    return ext
+
+
+def _preview(im) -> Dict[str, str]:
+    """placeholder تار (data URI) و رنگ غالب یک تصویر RGB در حافظه؛ خطا → {}."""
+    pil = load_pil()
+    try:
+        small = im.copy()
+        small.thumbnail((64, 64), pil.Image.BILINEAR)
+        # رنگ غالب: پرتکرارترین رنگ پس از کاهش به ۵ رنگ (median cut)، نه میانگین که به خاکستری میل می‌کند
+        quant = small.quantize(colors=5)
+        palette = quant.getpalette() or []
+        _, idx = max(quant.getcolors() or [(0, 0)])
+        r, g, b = palette[idx * 3: idx * 3 + 3] or (128, 128, 128)
+        small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), pil.Image.BILINEAR)
+        small = small.filter(pil.ImageFilter.GaussianBlur(1))
+        buf = io.BytesIO()
+        fmt = 'WEBP' if pil.webp else 'JPEG'
+        small.save(buf, format=fmt, quality=PLACEHOLDER_QUALITY)
+        return {
+            'placeholder': f"data:image/{fmt.lower()};base64,{base64.b64encode(buf.getvalue()).decode('ascii')}",
+            'color': f"#{r:02x}{g:02x}{b:02x}",
+        }
+    except Exception:
+        return {}
+
+
+def _normalize(src: str, dst: str, max_side: int, quality: int) -> Optional[Dict[str, Any]]:
+    """نرمال‌سازی src به JPEG در dst؛ خروجی ابعاد و پیش‌نمایش یا None در صورت خطا."""
+    pil = load_pil()
+    if pil is None:
+        return None
+    try:
+        with pil.Image.open(src) as im:
+            if im.format == 'JPEG':
+                # decode با مقیاس کوچک‌تر (1/2، 1/4، 1/8) وقتی تصویر خیلی بزرگ‌تر از مقصد است
+                im.draft('RGB', (max_side, max_side))
+            try:
+                im = pil.ImageOps.exif_transpose(im)
+            except Exception:
+                pass
+            if im.mode in ("RGBA", "LA"):
+                bg = pil.Image.new("RGB", im.size, (255, 255, 255))
+                bg.paste(im, mask=im.split()[-1])
+                im = bg
+            elif im.mode != 'RGB':
+                im = im.convert('RGB')
+            im.thumbnail((max_side, max_side), pil.Image.LANCZOS)
+            im.save(dst, format='JPEG', quality=quality, optimize=True, progressive=True)
+            out: Dict[str, Any] = {'width': im.width, 'height': im.height}
+            out.update(_preview(im))
+            return out
+    except Exception:
+        return None
+
+
+def _describe(path: str) -> Dict[str, Any]:
+    """ابعاد و پیش‌نمایش فایلی که نرمال‌سازی نشده (GIF یا خطای پردازش)."""
+    pil = load_pil()
+    if pil is None:
+        return {}
+    try:
+        with pil.Image.open(path) as im:
+            out: Dict[str, Any] = {'width': im.width, 'height': im.height}
+            out.update(_preview(im.convert('RGB')))
+            return out
+    except Exception:
+        return {}
+
+
+def ingest_image(file, dest_root: str, rel_dir: str = '', name: Optional[str] = None, app=None,
+                 presets: Optional[Iterable[str]] = None, content_addressed: bool = False) -> Dict[str, Any]:
+    """
+    ذخیره و بهینه‌سازی یک تصویر آپلودی.
+    file: FileStorage (یا هر شیء با stream/read)
+    dest_root: ریشهٔ آپلود (UPLOAD_FOLDER یا static/uploads)
+    rel_dir: زیرپوشهٔ نسبی (مثلاً 2025/08/31)
+    name: نام فایل بدون پسوند (پیش‌فرض uuid)
+    presets: واریانت‌هایی که در پس‌زمینه ساخته شوند (پیش‌فرض همهٔ presetها؛ () یعنی هیچ)
+    content_addressed: ذخیره در blob store (dest_root/rel_dir/name نادیده گرفته می‌شوند؛ ریشه: UPLOAD_FOLDER)
+    خروجی: {'rel', 'width', 'height', 'placeholder', 'color', 'bytes', 'original_bytes', 'format'}
+      (+ 'hash' و 'deduplicated' در حالت content_addressed)
+    خطای ورودی کاربر: IngestError
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    filename = getattr(file, 'filename', '') or ''
+    if not file or not filename:
+        raise IngestError("فایلی ارسال نشده است.")
+    max_bytes = _config(app, 'IMAGE_INGEST_MAX_MB', DEFAULT_MAX_MB) * 1024 * 1024
+    max_side = _config(app, 'IMAGE_INGEST_MAX_SIDE', DEFAULT_MAX_SIDE)
+    quality = _config(app, 'IMAGE_INGEST_QUALITY', DEFAULT_QUALITY)
+
+    store = None
+    if content_addressed:
+        from .blob_store import get_blob_store
+        store = get_blob_store(app)
+        dest_root, rel_dir, abs_dir = store.root, '', store.tmp_dir
+    else:
+        rel_dir = (rel_dir or '').strip('/').replace('\\', '/')
+        abs_dir = os.path.join(dest_root, rel_dir) if rel_dir else dest_root
+    os.makedirs(abs_dir, exist_ok=True)
+    base = secure_filename(name) if name and store is None else uuid.uuid4().hex
+    tmp_raw = os.path.join(abs_dir, f".{base}.{uuid.uuid4().hex[:8]}.upload")
+    tmp_out = tmp_raw + '.jpg'
+    raw_digest = hashlib.sha256() if store is not None else None
+    blob: Optional[Dict[str, Any]] = None
+    created = True
+    try:
+        original_bytes = _stream_to(file, tmp_raw, max_bytes, raw_digest)
+        if not original_bytes:
+            raise IngestError("فایل خالی است.")
+        ext = _detect_ext(tmp_raw, filename)
+        if store is not None:
+            # همین فایل خام قبلاً ingest شده → بدون decode و نرمال‌سازی دوباره
+            blob = store.lookup_source(raw_digest.hexdigest())
+            created = blob is None
+        if blob is None:
+            dims = None
+            if ext != 'gif' and load_pil() is not None:
+                dims = _normalize(tmp_raw, tmp_out, max_side, quality)
+            if dims is not None:
+                ext, source = 'jpg', tmp_out
+            else:
+                source = tmp_raw
+                dims = _describe(source)
+            if store is not None:
+                blob, created = store.put(source, ext, raw_digest.hexdigest(), dims)
+            else:
+                final_name = f"{base}.{ext}"
+                final_abs = os.path.join(abs_dir, final_name)
+                os.replace(source, final_abs)
+    finally:
+        for p in (tmp_raw, tmp_out):
+            try:
+                if os.path.exists(p):
+                    os.remove(p)
+            except Exception:
+                pass
+
+    if blob is not None:
+        info: Dict[str, Any] = dict(blob)
+        info.update(original_bytes=original_bytes, deduplicated=not created)
+        rel = info['rel']
+    else:
+        rel = f"{rel_dir}/{final_name}" if rel_dir else final_name
+        info = {
+            'rel': rel,
+            'bytes': os.path.getsize(final_abs),
+            'original_bytes': original_bytes,
+            'format': ext,
+        }
+        info.update(dims)
+
+    # blob تکراری واریانت‌هایش را (با کلید هش) از قبل دارد
+    wanted = list(VARIANT_PRESETS) if presets is None else list(presets)
+    if wanted and created:
+        try:
+            from .image_variants import get_variant_pipeline
+            get_variant_pipeline(app).warm(dest_root, rel, wanted)
+        except Exception:
+            app.logger.warning("Variant pre-generation could not be scheduled for %s", rel, exc_info=True)
+    return info
+
+
+def ingest_images(files: Iterable, dest_root: str, prefix: str = '', app=None,
+                  name_for: Optional[Callable[[str], str]] = None,
+                  content_addressed: bool = False,
+                  rejected: Optional[List[Tuple[str, str]]] = None) -> List[Dict[str, Any]]:
+    """
+    ingest چند فایل فرم؛ فایل‌های نامعتبر با هشدار در لاگ کنار گذاشته می‌شوند.
+    prefix: مسیر ذخیره‌شده در آگهی (مثلاً 'uploads/')؛ در کلید 'path' خروجی اضافه می‌شود.
+    name_for: تابع ساخت نام فایل (بدون پسوند) از نام اصلی
+    rejected: در صورت ارسال، (نام فایل، پیام خطا) هر فایل ردشده به آن اضافه می‌شود تا به کاربر نمایش داده شود
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    out: List[Dict[str, Any]] = []
+    for f in files or []:
+        if not f or not getattr(f, 'filename', ''):
+            continue
+        try:
+            info = ingest_image(f, dest_root, name=name_for(f.filename) if name_for else None, app=app,
+                                content_addressed=content_addressed)
+        except IngestError as e:
+            app.logger.warning("Rejected uploaded image %r: %s", f.filename, e)
+            if rejected is not None:
+                rejected.append((f.filename, str(e)))
+            continue
+        info['path'] = f"{prefix}{info['rel']}"
+        out.append(info)
+    return out
+
+
+def image_meta_entry(info: Dict[str, Any]) -> Dict[str, Any]:
+    """ورودی ``image_meta`` آگهی: ابعاد، placeholder، رنگ غالب و حجم (کلید: مسیر ذخیره‌شده در images)."""
+    keys = PREVIEW_KEYS + ('bytes', 'original_bytes', 'format')
+    return {k: info[k] for k in keys if k in info}
+
+
+__all__ = [
+    'IngestError', 'ingest_image', 'ingest_images', 'image_meta_entry', 'ALLOWED_EXTS',
+]
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Image Variant Pipeline – ساخت پس‌زمینهٔ واریانت‌های تصویر (WebP) با حذف کار تکراری
+
+- کار Pillow (decode / LANCZOS resize / encode) در یک process pool انجام می‌شود، نه در thread درخواست
+- single-flight: برای هر واریانت فقط یک render در حال اجراست؛ درخواست‌های همزمان روی همان Future منتظر می‌مانند
+- خروجی در فایل موقت نوشته و سپس rename می‌شود (app.utils.images.render_variant)
+- اگر render در مهلت کوتاه تمام نشود، فایل اصلی با Cache-Control کوتاه سرو می‌شود
+- ``warm()`` بعد از آپلود همهٔ presetها را بدون انتظار در صف می‌گذارد
+- render ناموفق (فایل خراب، نبود Pillow) تا ``IMAGE_VARIANT_FAILURE_TTL`` ثانیه یا تا تغییر mtime مبدأ
+  به خاطر سپرده می‌شود؛ در این مدت فایل اصلی سرو و render دوباره در صف گذاشته نمی‌شود
+- آمار: عمق صف، زمان render، cache hit/miss (``stats()``)
+
+تنظیمات (app.config):
+  IMAGE_VARIANT_POOL          'process' (پیش‌فرض) | 'thread' | 'inline'
+  IMAGE_VARIANT_WORKERS       تعداد workerها (پیش‌فرض: min(4, cpu))
+  IMAGE_VARIANT_WAIT_SECONDS  حداکثر انتظار درخواست برای render (پیش‌فرض 0.8)
+  IMAGE_VARIANT_FAILURE_TTL   مدت به خاطر سپردن render ناموفق به ثانیه (پیش‌فرض 600؛ 0 = غیرفعال)
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from ..utils.images import DEFAULT_FMT, render_variant, resolve_variant, variant_target
+
+PENDING_CACHE_CONTROL = "public, max-age=60"
+DEFAULT_WAIT_SECONDS = 0.8
+DEFAULT_FAILURE_TTL = 600.0
+MAX_FAILURES = 4096
+
+
+class VariantPipeline:
+    def __init__(self, pool: str = 'process', workers: Optional[int] = None,
+                 wait_seconds: float = DEFAULT_WAIT_SECONDS, failure_ttl: float = DEFAULT_FAILURE_TTL,
+                 logger=None):
+        self.pool_kind = (pool or 'process').lower()
+        self.workers = max(1, int(workers or min(4, os.cpu_count() or 1)))
+        self.wait_seconds = max(0.0, float(wait_seconds))
+        self.failure_ttl = max(0.0, float(failure_ttl))
+        self.logger = logger
+        self._executor = None
+        self._lock = threading.RLock()
+        self._inflight: Dict[str, Future] = {}
+        # abs_variant → (mtime_ns مبدأ هنگام شکست، زمان انقضا)؛ کلید شامل root، rel، عرض/کیفیت (پوشه) و فرمت است
+        self._failures: Dict[str, Tuple[int, float]] = {}
+        self._stats = {
+            'hits': 0, 'misses': 0, 'joined': 0, 'rendered': 0, 'failed': 0, 'failed_cached': 0,
+            'served_pending': 0, 'render_seconds_total': 0.0, 'render_seconds_max': 0.0,
+        }
+
+    # ---------- executor ----------
+    def _get_executor(self):
+        if self._executor is None:
+            if self.pool_kind == 'process':
+                try:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                except Exception:
+                    self.pool_kind = 'thread'
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='img-variant')
+        return self._executor
+
+    def _submit(self, *args) -> Future:
+        if self.pool_kind == 'inline':
+            fut: Future = Future()
+            try:
+                fut.set_result(render_variant(*args))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        try:
+            return self._get_executor().submit(render_variant, *args)
+        except (BrokenProcessPool, RuntimeError):
+            # pool خراب شده (مثلاً kill شدن یک worker) → جایگزینی با thread pool
+            self.pool_kind = 'thread'
+            self._executor = None
+            return self._get_executor().submit(render_variant, *args)
+
+    # ---------- failure cache ----------
+    @staticmethod
+    def _mtime_ns(path: str) -> int:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return -1
+
+    def _known_failure(self, src_abs: str, abs_variant: str) -> bool:
+        """render قبلی همین واریانت شکست خورده و مبدأ از آن زمان تغییر نکرده است (با _lock صدا زده شود)."""
+        entry = self._failures.get(abs_variant)
+        if entry is None:
+            return False
+        mtime_ns, expires = entry
+        if time.monotonic() < expires and self._mtime_ns(src_abs) == mtime_ns:
+            return True
+        del self._failures[abs_variant]
+        return False
+
+    def _remember_failure(self, src_abs: str, abs_variant: str) -> None:
+        if self.failure_ttl <= 0:
+            return
+        mtime_ns = self._mtime_ns(src_abs)
+        now = time.monotonic()
+        with self._lock:
+            if len(self._failures) >= MAX_FAILURES:
+                # اول موارد منقضی؛ اگر نبود قدیمی‌ترین یک‌چهارم (dict به ترتیب درج است)
+                stale = [k for k, (_, exp) in self._failures.items() if exp <= now]
+                for key in stale or list(self._failures)[:MAX_FAILURES // 4]:
+                    del self._failures[key]
+            self._failures[abs_variant] = (mtime_ns, now + self.failure_ttl)
+
+    # ---------- API ----------
+    def ensure(self, upload_root: str, rel_path: str, width: int, quality: int, folder: str,
+               fmt: str = DEFAULT_FMT, wait: Optional[float] = None) -> Tuple[Optional[str], bool]:
+        """
+        واریانت را برمی‌گرداند یا در صف ساخت قرار می‌دهد.
+        خروجی: (variant_abs, pending)
+          - (path, False): واریانت آماده است
+          - (None, True): هنوز در حال ساخت است (فایل اصلی را با کش کوتاه سرو کنید)
+          - (None, False): ساخت ممکن نیست (مبدأ وجود ندارد/خطا)
+        """
+        target = variant_target(upload_root, rel_path, folder, fmt)
+        if target is None:
+            return None, False
+        src_abs, _, abs_variant = target
+        if os.path.isfile(abs_variant):
+            self._bump('hits')
+            return abs_variant, False
+
+        with self._lock:
+            fut = self._inflight.get(abs_variant)
+            if fut is None:
+                if self._known_failure(src_abs, abs_variant):
+                    self._stats['failed_cached'] += 1
+                    return None, False
+                self._stats['misses'] += 1
+                fut = self._submit(src_abs, abs_variant, int(width), int(quality), fmt)
+                self._inflight[abs_variant] = fut
+                fut.add_done_callback(lambda f, key=abs_variant, src=src_abs: self._on_done(key, f, src))
+            else:
+                self._stats['joined'] += 1
+
+        try:
+            ok, _ = fut.result(timeout=self.wait_seconds if wait is None else wait)
+        except FutureTimeout:
+            self._bump('served_pending')
+            return None, True
+        except Exception:
+            return None, False
+        return (abs_variant, False) if ok and os.path.isfile(abs_variant) else (None, False)
+
+    def warm(self, upload_root: str, rel_path: str, presets, fmt: str = DEFAULT_FMT) -> int:
+        """زمان‌بندی ساخت واریانت‌های preset بدون انتظار (بعد از آپلود)؛ خروجی: تعداد jobهای جدید."""
+        scheduled = 0
+        for preset in presets:
+            resolved = resolve_variant(preset=preset)
+            if resolved is None:
+                continue
+            _, width, quality, folder = resolved
+            target = variant_target(upload_root, rel_path, folder, fmt)
+            if target is None or os.path.isfile(target[2]):
+                continue
+            src_abs, _, abs_variant = target
+            with self._lock:
+                if abs_variant in self._inflight or self._known_failure(src_abs, abs_variant):
+                    continue
+                fut = self._submit(src_abs, abs_variant, int(width), int(quality), fmt)
+                self._inflight[abs_variant] = fut
+                fut.add_done_callback(lambda f, key=abs_variant, src=src_abs: self._on_done(key, f, src))
+                scheduled += 1
+        return scheduled
+
+    def _on_done(self, key: str, fut: Future, src_abs: str) -> None:
+        try:
+            ok, seconds = fut.result()
+        except Exception as e:
+            ok, seconds = False, 0.0
+            if self.logger is not None:
+                self.logger.warning("Image variant render crashed for %s: %s", key, e)
+        if not ok:
+            self._remember_failure(src_abs, key)
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._stats['rendered' if ok else 'failed'] += 1
+            self._stats['render_seconds_total'] += seconds
+            self._stats['render_seconds_max'] = max(self._stats['render_seconds_max'], seconds)
+        if self.logger is not None:
+            self.logger.debug("Image variant %s in %.3fs: %s", 'rendered' if ok else 'failed', seconds, key)
+
+    def _bump(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out['queue_depth'] = len(self._inflight)
+            out['failures_cached'] = len(self._failures)
+        done = out['rendered'] + out['failed']
+        out['render_seconds_avg'] = round(out['render_seconds_total'] / done, 4) if done else 0.0
+        lookups = out['hits'] + out['misses'] + out['joined']
+        out['hit_ratio'] = round(out['hits'] / lookups, 4) if lookups else 0.0
+        out['pool'] = self.pool_kind
+        out['workers'] = self.workers
+        return out
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_PIPELINES: Dict[int, VariantPipeline] = {}
+_PIPELINES_LOCK = threading.Lock()
+
+
+def get_variant_pipeline(app=None) -> VariantPipeline:
+    """pipeline مشترک این پردازه برای app (در اولین استفاده ساخته می‌شود)."""
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    with _PIPELINES_LOCK:
+        p = _PIPELINES.get(id(app))
+        if p is None:
+            p = VariantPipeline(
+                pool=app.config.get('IMAGE_VARIANT_POOL', 'process'),
+                workers=app.config.get('IMAGE_VARIANT_WORKERS'),
+                wait_seconds=app.config.get('IMAGE_VARIANT_WAIT_SECONDS', DEFAULT_WAIT_SECONDS),
+                failure_ttl=app.config.get('IMAGE_VARIANT_FAILURE_TTL', DEFAULT_FAILURE_TTL),
+                logger=app.logger,
+            )
+            _PIPELINES[id(app)] = p
+        return p
+
+
+__all__ = ['VariantPipeline', 'get_variant_pipeline', 'PENDING_CACHE_CONTROL']
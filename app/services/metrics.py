@@ -0,0 +1,545 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics Service – شمارنده‌ها و هیستوگرام‌های درون‌پردازه‌ای با خروجی Prometheus
+
+- latency هر endpoint:            vinor_http_request_duration_seconds{endpoint,method}
+- تعداد پاسخ‌ها:                  vinor_http_requests_total{endpoint,method,status}
+- IO فایل‌های JSON (_load/_save، load_json/save_json):
+    vinor_storage_ops_total / vinor_storage_bytes_total / vinor_storage_seconds{collection,op}
+    vinor_storage_ops_per_request{endpoint}  (چند بار در یک درخواست خوانده/نوشته شده)
+- لایه‌های کش:                    vinor_cache_requests_total{cache,layer,result}
+- فراخوانی‌های بیرونی (sms.ir، Web Push):  vinor_outbound_seconds{service,op,result}
+- آمار سرویس‌هایی که خودشان شمارنده دارند (resolver آپلودها، pipeline واریانت‌ها) از طریق
+  collector ثبت‌شده به شکل gauge: vinor_component_stat{component,stat}
+
+چند worker: هر پردازه هر ``METRICS_FLUSH_SECONDS`` یک snapshot در ``<METRICS_DIR>/metrics-<pid>.json``
+می‌نویسد؛ ``/metrics`` snapshot زندهٔ خودش را با فایل workerهای زندهٔ دیگر جمع می‌زند
+(شمارنده‌ها، bucketها و gaugeها جمع می‌شوند). فایل pidهای مرده پس از مدتی پاک می‌شود.
+
+هدر ``Server-Timing`` (app و storage) فقط با METRICS_SERVER_TIMING (پیش‌فرض: debug) اضافه می‌شود.
+
+تنظیمات (app.config):
+  METRICS_ENABLED          فعال/غیرفعال (پیش‌فرض True)
+  METRICS_DIR              پوشهٔ snapshotهای workerها (پیش‌فرض <instance>/data/metrics)
+  METRICS_FLUSH_SECONDS    فاصلهٔ نوشتن snapshot (پیش‌فرض 15)
+  METRICS_SERVER_TIMING    افزودن هدر Server-Timing (پیش‌فرض: فقط در debug)
+  METRICS_TOKEN            توکن دسترسی به /metrics و /diag (Bearer یا ?token=)؛ بدون آن فقط ادمین یا loopback
+"""
+from __future__ import annotations
+
+import os
+import json
+import glob
+import time
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+OPS_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+DEFAULT_FLUSH_SECONDS = 15.0
+STALE_AFTER_FLUSHES = 4
+
+Labels = Tuple[Tuple[str, str], ...]
+
+HELP = {
+    'vinor_http_request_duration_seconds': ('histogram', 'Request latency per endpoint'),
+    'vinor_http_requests_total': ('counter', 'Responses per endpoint and status'),
+    'vinor_storage_ops_total': ('counter', 'JSON file loads/saves per collection'),
+    'vinor_storage_bytes_total': ('counter', 'Bytes parsed/written per collection'),
+    'vinor_storage_seconds': ('histogram', 'JSON file load/save duration per collection'),
+    'vinor_storage_ops_per_request': ('histogram', 'JSON file loads+saves within one request'),
+    'vinor_cache_requests_total': ('counter', 'Cache lookups per cache layer'),
+    'vinor_outbound_seconds': ('histogram', 'Outbound SMS/push call duration'),
+    'vinor_component_stat': ('gauge', 'Internal counters of services (summed across workers)'),
+}
+
+
+def _labels(labels: Optional[Dict[str, Any]]) -> Labels:
+    if not labels:
+        return ()
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry:
+    """شمارنده‌ها و هیستوگرام‌های thread-safe این پردازه."""
+
+    def __init__(self):
+        self.enabled = True
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        # name → labels → [count per bucket..., +Inf, sum]
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def inc(self, name: str, labels: Optional[Dict[str, Any]] = None, value: float = 1.0) -> None:
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None,
+                buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            bounds = self._buckets.setdefault(name, tuple(buckets))
+            series = self._histograms.setdefault(name, {})
+            row = series.get(key)
+            if row is None:
+                row = series[key] = [0.0] * (len(bounds) + 2)
+            i = 0
+            while i < len(bounds) and value > bounds[i]:
+                i += 1
+            row[i] += 1
+            row[-1] += value
+
+    def register_collector(self, component: str, fn: Callable[[], Dict[str, Any]]) -> None:
+        """fn یک dict از آمار عددی برمی‌گرداند (مثل stats() سرویس‌ها)."""
+        with self._lock:
+            self._collectors[component] = fn
+
+    def _collect(self) -> List[Tuple[Dict[str, str], float]]:
+        out: List[Tuple[Dict[str, str], float]] = []
+        for component, fn in list(self._collectors.items()):
+            try:
+                stats = fn() or {}
+            except Exception:
+                continue
+            for stat, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                out.append(({'component': component, 'stat': str(stat)}, float(value)))
+        return out
+
+    def snapshot(self) -> Dict[str, Any]:
+        """نمای قابل JSON برای نوشتن در فایل worker و ادغام."""
+        gauges = self._collect() if self.enabled else []
+        with self._lock:
+            counters = {
+                name: [[dict(k), v] for k, v in series.items()] for name, series in self._counters.items()
+            }
+            histograms = {
+                name: {'buckets': list(self._buckets[name]), 'series': [[dict(k), list(v)] for k, v in series.items()]}
+                for name, series in self._histograms.items()
+            }
+        return {
+            'pid': os.getpid(),
+            'started_at': self.started_at,
+            'time': time.time(),
+            'counters': counters,
+            'histograms': histograms,
+            'gauges': {'vinor_component_stat': [[labels, v] for labels, v in gauges]},
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._buckets.clear()
+        self.started_at = time.time()
+
+
+_REGISTRY = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return _REGISTRY
+
+
+# -------- ثبت (توابع سطح بالا؛ بدون نیاز به app context) --------
+def _request_storage_totals():
+    try:
+        from flask import g, has_request_context
+        if has_request_context():
+            return getattr(g, '_metrics_storage', None)
+    except Exception:
+        pass
+    return None
+
+
+def record_storage_io(path: str, op: str, nbytes: int, seconds: float) -> None:
+    """یک load/save فایل JSON؛ collection = نام فایل بدون پسوند."""
+    if not _REGISTRY.enabled:
+        return
+    collection = os.path.splitext(os.path.basename(str(path)))[0] or 'unknown'
+    labels = {'collection': collection, 'op': op}
+    _REGISTRY.inc('vinor_storage_ops_total', labels)
+    _REGISTRY.inc('vinor_storage_bytes_total', labels, float(nbytes or 0))
+    _REGISTRY.observe('vinor_storage_seconds', seconds, labels)
+    totals = _request_storage_totals()
+    if totals is not None:
+        totals[0] += 1
+        totals[1] += seconds
+
+
+def record_cache(cache: str, hit: bool, layer: str = 'process') -> None:
+    """layer: 'process' (کش mtime/LRU پردازه) | 'request' (کش روی g) | 'microcache' (TTL) | 'http' (304)."""
+    _REGISTRY.inc('vinor_cache_requests_total', {'cache': cache, 'layer': layer, 'result': 'hit' if hit else 'miss'})
+
+
+def timed_outbound(service: str, op: str):
+    """
+    Decorator زمان‌سنجی فراخوانی بیرونی؛ نتیجه از کلید 'ok' در dict خروجی خوانده می‌شود
+    (ok / error) و استثنا به‌صورت 'exception' ثبت و دوباره raise می‌شود.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = 'exception'
+            try:
+                out = fn(*args, **kwargs)
+                result = 'ok' if isinstance(out, dict) and out.get('ok') else 'error'
+                return out
+            finally:
+                _REGISTRY.observe('vinor_outbound_seconds', time.perf_counter() - started,
+                                  {'service': service, 'op': op, 'result': result})
+        return wrapper
+    return decorator
+
+
+# -------- snapshot workerها --------
+def metrics_dir(app) -> str:
+    if app.config.get('METRICS_DIR'):
+        return app.config['METRICS_DIR']
+    from ..utils.storage import data_dir
+    return os.path.join(data_dir(app), 'metrics')
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+class SnapshotWriter:
+    """thread پس‌زمینهٔ نوشتن snapshot این پردازه؛ پس از fork (pid جدید) دوباره راه می‌افتد."""
+
+    def __init__(self, directory: str, interval: float = DEFAULT_FLUSH_SECONDS, registry: MetricsRegistry = _REGISTRY):
+        self.directory = directory
+        self.interval = max(1.0, float(interval))
+        self.registry = registry
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+
+    def ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, name='metrics-flush', daemon=True).start()
+
+    def _loop(self) -> None:
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def flush(self) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.registry.snapshot(), f, separators=(',', ':'))
+        os.replace(tmp, path)
+        return path
+
+    def peer_snapshots(self) -> List[Dict[str, Any]]:
+        """snapshot workerهای دیگر (زنده و تازه)؛ فایل pidهای مرده و کهنه حذف می‌شود."""
+        out: List[Dict[str, Any]] = []
+        me = os.getpid()
+        stale_after = self.interval * STALE_AFTER_FLUSHES
+        now = time.time()
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+            except ValueError:
+                continue
+            if pid == me:
+                continue
+            try:
+                age = now - os.path.getmtime(path)
+            except OSError:
+                continue
+            if age > stale_after and not _pid_alive(pid):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    snap = json.load(f)
+            except Exception:
+                continue
+            if isinstance(snap, dict):
+                snap['age_seconds'] = round(age, 1)
+                out.append(snap)
+        return out
+
+
+# -------- ادغام و خروجی --------
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    counters: Dict[str, Dict[Labels, float]] = {}
+    gauges: Dict[str, Dict[Labels, float]] = {}
+    histograms: Dict[str, Dict[str, Any]] = {}
+    workers = []
+    for snap in snapshots:
+        workers.append({
+            'pid': snap.get('pid'),
+            'uptime_seconds': round(float(snap.get('time', 0)) - float(snap.get('started_at', 0)), 1),
+            'age_seconds': snap.get('age_seconds', 0.0),
+        })
+        for kind, target in (('counters', counters), ('gauges', gauges)):
+            for name, series in (snap.get(kind) or {}).items():
+                dest = target.setdefault(name, {})
+                for labels, value in series:
+                    key = _labels(labels)
+                    dest[key] = dest.get(key, 0.0) + float(value)
+        for name, hist in (snap.get('histograms') or {}).items():
+            dest = histograms.setdefault(name, {'buckets': list(hist.get('buckets') or []), 'series': {}})
+            if list(hist.get('buckets') or []) != dest['buckets']:
+                continue  # bucketهای ناسازگار (نسخهٔ قدیمی‌تر کد در worker دیگر)
+            for labels, row in hist.get('series') or []:
+                key = _labels(labels)
+                cur = dest['series'].get(key)
+                if cur is None:
+                    dest['series'][key] = list(row)
+                else:
+                    dest['series'][key] = [a + b for a, b in zip(cur, row)]
+    return {'counters': counters, 'gauges': gauges, 'histograms': histograms, 'workers': workers}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _fmt_labels(key: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _fmt_num(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus(merged: Dict[str, Any]) -> str:
+    lines: List[str] = []
+
+    def header(name: str, default_type: str) -> None:
+        kind, text = HELP.get(name, (default_type, name))
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    for name in sorted(merged['counters']):
+        header(name, 'counter')
+        for key, value in sorted(merged['counters'][name].items()):
+            lines.append(f'{name}{_fmt_labels(key)} {_fmt_num(value)}')
+    for name in sorted(merged['histograms']):
+        hist = merged['histograms'][name]
+        bounds = hist['buckets']
+        header(name, 'histogram')
+        for key, row in sorted(hist['series'].items()):
+            cumulative = 0.0
+            for bound, count in zip(bounds, row):
+                cumulative += count
+                lines.append(f'{name}_bucket{_fmt_labels(key, ("le", _fmt_num(bound)))} {_fmt_num(cumulative)}')
+            cumulative += row[len(bounds)]
+            lines.append(f'{name}_bucket{_fmt_labels(key, ("le", "+Inf"))} {_fmt_num(cumulative)}')
+            lines.append(f'{name}_sum{_fmt_labels(key)} {_fmt_num(row[-1])}')
+            lines.append(f'{name}_count{_fmt_labels(key)} {_fmt_num(cumulative)}')
+    for name in sorted(merged['gauges']):
+        header(name, 'gauge')
+        for key, value in sorted(merged['gauges'][name].items()):
+            lines.append(f'{name}{_fmt_labels(key)} {_fmt_num(value)}')
+    lines.append(f'vinor_metrics_workers {len(merged["workers"])}')
+    return '\n'.join(lines) + '\n'
+
+
+def _quantile(bounds: List[float], row: List[float], q: float) -> Optional[float]:
+    """تخمین quantile از روی bucketها (کران بالای bucket)."""
+    total = sum(row[:len(bounds) + 1])
+    if not total:
+        return None
+    target = q * total
+    seen = 0.0
+    for bound, count in zip(bounds, row):
+        seen += count
+        if seen >= target:
+            return bound
+    return float('inf')
+
+
+def _hist_summary(hist: Dict[str, Any], group_by: Tuple[str, ...], unit: str = 'ms',
+                  scale: float = 1000.0) -> Dict[str, Dict[str, Any]]:
+    """count / میانگین / کران بالای p95 برای هر گروه (scale: ثانیه → ms)."""
+    bounds = hist['buckets']
+    grouped: Dict[str, List[float]] = {}
+    for key, row in hist['series'].items():
+        labels = dict(key)
+        name = ' '.join(labels.get(g, '') for g in group_by).strip() or '-'
+        cur = grouped.get(name)
+        grouped[name] = list(row) if cur is None else [a + b for a, b in zip(cur, row)]
+    out: Dict[str, Dict[str, Any]] = {}
+    for name, row in grouped.items():
+        count = sum(row[:-1])
+        p95 = _quantile(bounds, row, 0.95)
+        out[name] = {
+            'count': int(count),
+            f'avg_{unit}': round(row[-1] / count * scale, 2) if count else 0.0,
+            f'p95_{unit}_le': round(p95 * scale, 2) if p95 not in (None, float('inf')) else None,
+        }
+    return out
+
+
+def diag_summary(merged: Dict[str, Any]) -> Dict[str, Any]:
+    """خلاصهٔ قابل خواندن برای /diag (از همان دادهٔ ادغام‌شدهٔ /metrics)."""
+    counters = merged['counters']
+    hists = merged['histograms']
+    out: Dict[str, Any] = {'workers': merged['workers']}
+
+    http = hists.get('vinor_http_request_duration_seconds')
+    endpoints = _hist_summary(http, ('method', 'endpoint')) if http else {}
+    # فهرست (نه dict) تا ترتیب «بیشترین زمان کل» در jsonify حفظ شود
+    out['http'] = [
+        dict(endpoint=name, **stats)
+        for name, stats in sorted(endpoints.items(), key=lambda kv: kv[1]['count'] * kv[1]['avg_ms'], reverse=True)
+    ]
+
+    storage: Dict[str, Dict[str, Any]] = {}
+    for key, value in (counters.get('vinor_storage_ops_total') or {}).items():
+        labels = dict(key)
+        storage.setdefault(labels['collection'], {})[labels['op'] + 's'] = int(value)
+    for key, value in (counters.get('vinor_storage_bytes_total') or {}).items():
+        labels = dict(key)
+        storage.setdefault(labels['collection'], {})[labels['op'] + '_bytes'] = int(value)
+    seconds = hists.get('vinor_storage_seconds')
+    if seconds:
+        for name, s in _hist_summary(seconds, ('collection', 'op')).items():
+            collection, _, op = name.partition(' ')
+            storage.setdefault(collection, {})[op + '_avg_ms'] = s['avg_ms']
+    out['storage'] = dict(sorted(storage.items()))
+    per_request = hists.get('vinor_storage_ops_per_request')
+    if per_request:
+        out['storage_ops_per_request'] = [
+            dict(endpoint=name, **stats)
+            for name, stats in sorted(_hist_summary(per_request, ('endpoint',), unit='ops', scale=1.0).items(),
+                                      key=lambda kv: kv[1]['avg_ops'], reverse=True)
+        ]
+
+    caches: Dict[str, Dict[str, Any]] = {}
+    for key, value in (counters.get('vinor_cache_requests_total') or {}).items():
+        labels = dict(key)
+        entry = caches.setdefault(f"{labels['layer']}:{labels['cache']}", {'hit': 0, 'miss': 0})
+        entry[labels['result']] = int(value)
+    for entry in caches.values():
+        total = entry['hit'] + entry['miss']
+        entry['hit_ratio'] = round(entry['hit'] / total, 4) if total else 0.0
+    out['cache'] = dict(sorted(caches.items()))
+
+    outbound = hists.get('vinor_outbound_seconds')
+    out['outbound'] = _hist_summary(outbound, ('service', 'op', 'result')) if outbound else {}
+
+    components: Dict[str, Dict[str, float]] = {}
+    for key, value in (merged['gauges'].get('vinor_component_stat') or {}).items():
+        labels = dict(key)
+        components.setdefault(labels['component'], {})[labels['stat']] = value
+    out['components'] = components
+    return out
+
+
+# -------- اتصال به app --------
+def get_snapshot_writer(app) -> Optional[SnapshotWriter]:
+    return app.extensions.get('metrics_writer')
+
+
+def collect(app) -> Dict[str, Any]:
+    """snapshot زندهٔ این پردازه + snapshot workerهای دیگر، ادغام‌شده."""
+    snaps = [_REGISTRY.snapshot()]
+    writer = get_snapshot_writer(app)
+    if writer is not None:
+        snaps.extend(writer.peer_snapshots())
+    return merge_snapshots(snaps)
+
+
+def init_metrics(app) -> None:
+    """hookهای before/after_request برای latency، شمارش IO در هر درخواست و Server-Timing."""
+    enabled = bool(app.config.get('METRICS_ENABLED', True))
+    _REGISTRY.enabled = enabled
+    if not enabled:
+        return
+    writer = SnapshotWriter(metrics_dir(app), app.config.get('METRICS_FLUSH_SECONDS') or DEFAULT_FLUSH_SECONDS)
+    app.extensions['metrics_writer'] = writer
+
+    from flask import g, request
+
+    def _upload_stats():
+        from ..routes.uploads import get_upload_resolver
+        return get_upload_resolver(app).stats()
+
+    def _variant_stats():
+        from .image_variants import get_variant_pipeline
+        return get_variant_pipeline(app).stats()
+
+    _REGISTRY.register_collector('uploads_resolver', _upload_stats)
+    _REGISTRY.register_collector('image_variants', _variant_stats)
+
+    @app.before_request
+    def _metrics_start():
+        writer.ensure_started()
+        g._metrics_started = time.perf_counter()
+        g._metrics_storage = [0, 0.0]
+
+    @app.after_request
+    def _metrics_finish(resp):
+        started = getattr(g, '_metrics_started', None)
+        if started is None:
+            return resp
+        elapsed = time.perf_counter() - started
+        rule = request.url_rule
+        endpoint = rule.endpoint if rule is not None else 'unmatched'
+        method = request.method
+        _REGISTRY.observe('vinor_http_request_duration_seconds', elapsed, {'endpoint': endpoint, 'method': method})
+        _REGISTRY.inc('vinor_http_requests_total', {'endpoint': endpoint, 'method': method,
+                                                    'status': resp.status_code})
+        ops, storage_seconds = getattr(g, '_metrics_storage', (0, 0.0))
+        _REGISTRY.observe('vinor_storage_ops_per_request', ops, {'endpoint': endpoint}, buckets=OPS_BUCKETS)
+        server_timing = app.config.get('METRICS_SERVER_TIMING')
+        if server_timing is None:
+            server_timing = app.debug
+        if server_timing:
+            resp.headers.add(
+                'Server-Timing',
+                f'app;dur={elapsed * 1000:.1f}, storage;dur={storage_seconds * 1000:.1f};desc="{ops} ops"',
+            )
+        return resp
+
+
+__all__ = [
+    'MetricsRegistry', 'SnapshotWriter', 'get_registry', 'record_storage_io', 'record_cache', 'timed_outbound',
+    'init_metrics', 'collect', 'merge_snapshots', 'render_prometheus', 'diag_summary', 'metrics_dir',
+    'LATENCY_BUCKETS',
+]
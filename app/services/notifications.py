@@ -10,6 +10,9 @@ import json
 from typing import List, Dict, Any, Optional
 from flask import current_app
 
+from . import events as _events
+from .metrics import record_cache
+
 
 def _get_notifications_file_path() -> str:
     """مسیر فایل اعلان‌ها"""
@@ -143,6 +146,7 @@ def _load_all_cached() -> Dict[str, List[Dict[str, Any]]]:
     try:
         from flask import g
         cached = getattr(g, '_notifications_data_cached', None)
+        record_cache('notifications', cached is not None, layer='request')
         if cached is not None:
             return cached
     except Exception:
@@ -234,6 +238,7 @@ def _save_all(data: Dict[str, List[Dict[str, Any]]]) -> bool:
             json.dump(normalized_data, f, ensure_ascii=False, indent=2)
 
         _notifications_invalidate_cache()
+        _events.note_write(file_path)
         return True
     except Exception as e:
         try:
@@ -243,6 +248,17 @@ def _save_all(data: Dict[str, List[Dict[str, Any]]]) -> bool:
         return False
 
 
+def _publish_unread(user_id: str, items: List[Dict[str, Any]], kind: str = "unread",
+                    extra: Optional[Dict[str, Any]] = None) -> None:
+    """انتشار رویداد برای کانال زندهٔ همکار (تعداد خوانده‌نشده از همین داده محاسبه می‌شود)."""
+    try:
+        payload = dict(extra or {})
+        payload["unread_count"] = sum(1 for n in items if not n.get("is_read", False))
+        _events.publish(user_id, kind, payload)
+    except Exception:
+        pass
+
+
 def add_notification(user_id: str, title: str, body: str, ntype: str = "info",
                      ad_id: Optional[str] = None, action_url: Optional[str] = None) -> Dict[str, Any]:
     """
@@ -291,6 +307,10 @@ def add_notification(user_id: str, title: str, body: str, ntype: str = "info",
     # ذخیره
     if not _save_all(data):
         raise RuntimeError("Failed to save notification")
+
+    _publish_unread(normalized_user_id, data[normalized_user_id], 'notification', {
+        "id": notif["id"], "title": notif["title"], "type": notif["type"],
+    })
     
     # Logging
     try:
@@ -361,6 +381,7 @@ def mark_read(user_id: str, notif_id: str) -> bool:
         # اطمینان از اینکه items در data با کلید normalize شده ذخیره شده است
         data[normalized_user_id] = items
         _save_all(data)
+        _publish_unread(normalized_user_id, items)
         try:
             current_app.logger.info(f"Notification marked as read: user_id={normalized_user_id}, notif_id={notif_id}")
         except Exception:
@@ -408,6 +429,7 @@ def mark_all_read(user_id: str) -> int:
         # اطمینان از اینکه items در data با کلید normalize شده ذخیره شده است
         data[normalized_user_id] = items
         _save_all(data)
+        _publish_unread(normalized_user_id, items)
         try:
             current_app.logger.info(f"Marked {count} notifications as read for user_id={normalized_user_id}")
         except Exception:
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Push Service – نگه‌داری اشتراک‌های Web Push و ارسال همزمان/هدفمند
+
+- هر اشتراک با شماره تلفن صاحبش (در صورت لاگین بودن) ذخیره می‌شود
+- ذخیره‌سازی در SQLite (``push_subs.sqlite3``) با کلید اصلی endpoint و ایندکس روی phone؛
+  subscribe/unsubscribe یک upsert/delete تک‌سطری است (بدون اسکن و بازنویسی کل لیست)
+- فایل قدیمی ``push_subs.json`` در اولین اجرا مهاجرت داده می‌شود
+- ارسال‌ها با یک dispatcher همزمان (ThreadPoolExecutor) انجام می‌شوند و endpointهای
+  منقضی (404/410) خودکار حذف می‌شوند
+- ``push_to_user`` / ``push_to_users`` فقط به اشتراک‌های همان همکاران ارسال می‌کنند
+
+تنظیمات (app.config):
+  PUSH_DISPATCH_WORKERS   حداکثر ارسال همزمان (پیش‌فرض 8)
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from ..utils.storage import data_dir, _resolve_app
+
+DEFAULT_DISPATCH_WORKERS = 8
+
+
+def normalize_owner(phone: Optional[str]) -> str:
+    if not phone:
+        return ''
+    from .notifications import _normalize_user_id
+    return _normalize_user_id(phone)
+
+
+# -------- نگه‌داری اشتراک‌ها --------
+class PushSubscriptionStore:
+    """اشتراک‌ها در SQLite؛ ایندکس بر اساس endpoint (کلید اصلی) و phone."""
+
+    def __init__(self, path: str, legacy_path: Optional[str] = None):
+        self.path = path
+        self.legacy_path = legacy_path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS push_subs ("
+            " endpoint TEXT PRIMARY KEY, phone TEXT NOT NULL DEFAULT '',"
+            " data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_push_subs_phone ON push_subs (phone)")
+        self._migrate_legacy()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            except Exception:
+                pass
+            self._local.conn = conn
+        return conn
+
+    def _migrate_legacy(self) -> None:
+        """مهاجرت یک‌باره از push_subs.json (لیست بدون صاحب)."""
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM push_subs LIMIT 1").fetchone():
+            return
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except Exception:
+            items = []
+        now = time.time()
+        rows = [
+            (s['endpoint'], normalize_owner(s.get('phone')), json.dumps(s, ensure_ascii=False), now)
+            for s in (items if isinstance(items, list) else [])
+            if isinstance(s, dict) and s.get('endpoint')
+        ]
+        if rows:
+            conn.executemany(
+                "INSERT OR IGNORE INTO push_subs (endpoint, phone, data, updated_at) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def upsert(self, subscription: Dict[str, Any], phone: Optional[str] = None) -> None:
+        """
+        ثبت/به‌روزرسانی اشتراک.
+        اگر phone خالی باشد، صاحب قبلی endpoint حفظ می‌شود (مثلاً همگام‌سازی بعد از خروج).
+        """
+        owner = normalize_owner(phone)
+        self._conn().execute(
+            "INSERT INTO push_subs (endpoint, phone, data, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(endpoint) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, "
+            "phone = CASE WHEN excluded.phone != '' THEN excluded.phone ELSE push_subs.phone END",
+            (subscription['endpoint'], owner, json.dumps(subscription, ensure_ascii=False), time.time()),
+        )
+
+    def remove(self, endpoint: str) -> bool:
+        cur = self._conn().execute("DELETE FROM push_subs WHERE endpoint = ?", (endpoint,))
+        return cur.rowcount > 0
+
+    def remove_many(self, endpoints: Iterable[str]) -> int:
+        endpoints = [e for e in endpoints if e]
+        if not endpoints:
+            return 0
+        cur = self._conn().executemany("DELETE FROM push_subs WHERE endpoint = ?", [(e,) for e in endpoints])
+        return cur.rowcount
+
+    def get(self, endpoint: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM push_subs WHERE endpoint = ?", (endpoint,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def for_phone(self, phone: str) -> List[Dict[str, Any]]:
+        owner = normalize_owner(phone)
+        if not owner:
+            return []
+        rows = self._conn().execute("SELECT data FROM push_subs WHERE phone = ?", (owner,)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def for_phones(self, phones: Iterable[str]) -> List[Dict[str, Any]]:
+        owners = sorted({normalize_owner(p) for p in phones or []} - {''})
+        out: List[Dict[str, Any]] = []
+        # محدودیت تعداد پارامترهای SQLite
+        for i in range(0, len(owners), 500):
+            chunk = owners[i:i + 500]
+            rows = self._conn().execute(
+                "SELECT data FROM push_subs WHERE phone IN (%s)" % ','.join('?' * len(chunk)), chunk
+            ).fetchall()
+            out.extend(json.loads(r[0]) for r in rows)
+        return out
+
+    def all(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT data FROM push_subs").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def count(self, phone: Optional[str] = None) -> int:
+        if phone:
+            row = self._conn().execute(
+                "SELECT COUNT(*) FROM push_subs WHERE phone = ?", (normalize_owner(phone),)
+            ).fetchone()
+        else:
+            row = self._conn().execute("SELECT COUNT(*) FROM push_subs").fetchone()
+        return int(row[0] if row else 0)
+
+    def replace_all(self, subscriptions: Iterable[Dict[str, Any]]) -> None:
+        """جایگزینی کامل (فقط برای سازگاری با _save_subs قدیمی)؛ صاحب endpointهای باقی‌مانده حفظ می‌شود."""
+        subs = [s for s in subscriptions or [] if isinstance(s, dict) and s.get('endpoint')]
+        keep = {s['endpoint'] for s in subs}
+        conn = self._conn()
+        existing = [r[0] for r in conn.execute("SELECT endpoint FROM push_subs").fetchall()]
+        self.remove_many([e for e in existing if e not in keep])
+        for s in subs:
+            self.upsert(s)
+
+
+_STORES: Dict[str, PushSubscriptionStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_push_store(app=None) -> PushSubscriptionStore:
+    app = _resolve_app(app)
+    base = data_dir(app)
+    path = os.path.join(base, 'push_subs.sqlite3')
+    with _STORES_LOCK:
+        store = _STORES.get(path)
+        if store is None:
+            store = PushSubscriptionStore(path, legacy_path=os.path.join(base, 'push_subs.json'))
+            _STORES[path] = store
+        return store
+
+
+# -------- ارسال همزمان --------
+class PushDispatcher:
+    """ارسال یک payload به چند اشتراک به‌صورت همزمان و حذف endpointهای منقضی."""
+
+    def __init__(self, app, workers: int = DEFAULT_DISPATCH_WORKERS):
+        self.app = app
+        self.workers = max(1, int(workers))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='push-dispatch')
+
+    def _send(self, subscription: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+        from ..api.push import _send_one
+        with self.app.app_context():
+            try:
+                return _send_one(subscription, payload)
+            except Exception as e:
+                return {'ok': False, 'error': str(e), 'remove': False}
+
+    def dispatch(self, subscriptions: Iterable[Dict[str, Any]], payload: Dict[str, Any]) -> Dict[str, int]:
+        """خروجی: {'total', 'sent', 'failed', 'removed'}"""
+        subs = [s for s in subscriptions or [] if isinstance(s, dict) and s.get('endpoint')]
+        stats = {'total': len(subs), 'sent': 0, 'failed': 0, 'removed': 0}
+        if not subs:
+            return stats
+        if len(subs) == 1:
+            results = [self._send(subs[0], payload)]
+        else:
+            results = list(self._executor.map(lambda s: self._send(s, payload), subs))
+        dead = []
+        for sub, res in zip(subs, results):
+            if res.get('ok'):
+                stats['sent'] += 1
+            elif res.get('remove'):
+                dead.append(sub['endpoint'])
+            else:
+                stats['failed'] += 1
+        if dead:
+            try:
+                get_push_store(self.app).remove_many(dead)
+            except Exception:
+                self.app.logger.error("Failed to remove expired push subscriptions", exc_info=True)
+            stats['removed'] = len(dead)
+        return stats
+
+
+_DISPATCHERS: Dict[int, PushDispatcher] = {}
+_DISPATCHERS_LOCK = threading.Lock()
+
+
+def get_push_dispatcher(app=None) -> PushDispatcher:
+    app = _resolve_app(app)
+    with _DISPATCHERS_LOCK:
+        d = _DISPATCHERS.get(id(app))
+        if d is None:
+            d = PushDispatcher(app, workers=app.config.get('PUSH_DISPATCH_WORKERS', DEFAULT_DISPATCH_WORKERS))
+            _DISPATCHERS[id(app)] = d
+        return d
+
+
+# -------- API سطح بالا --------
+def push_to_user(phone: str, payload: Dict[str, Any], app=None) -> Dict[str, int]:
+    """ارسال به همهٔ دستگاه‌های یک کاربر/همکار."""
+    return get_push_dispatcher(app).dispatch(get_push_store(app).for_phone(phone), payload)
+
+
+def push_to_users(phones: Iterable[str], payload: Dict[str, Any], app=None) -> Dict[str, int]:
+    """ارسال به دستگاه‌های چند کاربر/همکار (هر endpoint فقط یک بار)."""
+    return get_push_dispatcher(app).dispatch(get_push_store(app).for_phones(phones), payload)
+
+
+def push_to_all(payload: Dict[str, Any], app=None) -> Dict[str, int]:
+    """ارسال به همهٔ مشترکین (اعلان عمومی)."""
+    return get_push_dispatcher(app).dispatch(get_push_store(app).all(), payload)
+
+
+__all__ = [
+    'PushSubscriptionStore', 'PushDispatcher', 'get_push_store', 'get_push_dispatcher',
+    'push_to_user', 'push_to_users', 'push_to_all', 'normalize_owner',
+]
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Rate Limit Service – محدودسازی نرخ درخواست با الگوریتم Token Bucket
+
+- هر قاعده (Rule) یک سطل توکن با ظرفیت ``capacity`` دارد که در ``per_seconds`` ثانیه کامل پر می‌شود
+- کلید سطل‌ها بر اساس شماره تلفن، IP و/یا endpoint ساخته می‌شود
+- Backend پیش‌فرض درون‌پردازه‌ای است؛ برای چند worker می‌توان ``RATE_LIMIT_BACKEND=sqlite`` گذاشت
+- در صورت عبور از سقف، پاسخ 429 همراه با هدر استاندارد ``Retry-After`` برگردانده می‌شود
+- همهٔ قواعد یک درخواست با هم و اتمیک بررسی می‌شوند: توکن فقط وقتی کم می‌شود که همهٔ قواعد اجازه بدهند؛
+  درخواست ردشده (مثلاً IP محدودشده) سهمیهٔ قاعدهٔ دیگر (مثلاً شمارهٔ تلفن قربانی) را مصرف نمی‌کند
+
+تنظیمات (app.config):
+  RATE_LIMIT_ENABLED      فعال/غیرفعال (پیش‌فرض True)
+  RATE_LIMIT_BACKEND      'memory' یا 'sqlite'
+  RATE_LIMIT_SQLITE_PATH  مسیر فایل SQLite مشترک (پیش‌فرض <instance>/data/rate_limits.sqlite3)
+  RATE_LIMITS             بازنویسی قواعد: {"otp_phone": (3, 600), ...}
+"""
+from __future__ import annotations
+
+import os
+import math
+import time
+import sqlite3
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from flask import current_app, jsonify, request
+
+from ..utils.storage import data_dir
+
+
+# -------- Backendها --------
+def _decide(levels: Sequence[Tuple[str, float, float]], cost: float) -> Tuple[bool, float]:
+    """(key, tokens پس از پر شدن، rate) → (مجاز؟، Retry-After): بیشترین انتظار میان سطل‌های ناکافی."""
+    retry_after = 0.0
+    for _, tokens, rate in levels:
+        if tokens < cost:
+            retry_after = max(retry_after, (cost - tokens) / rate if rate > 0 else float('inf'))
+    return retry_after == 0.0, retry_after
+
+
+class MemoryBackend:
+    """سطل‌های توکن در حافظهٔ همین پردازه (thread-safe)."""
+
+    MAX_KEYS = 50000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def consume(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> Tuple[bool, float]:
+        return self.consume_all([(key, capacity, rate)], cost)
+
+    def consume_all(self, buckets: Sequence[Tuple[str, float, float]], cost: float = 1.0) -> Tuple[bool, float]:
+        """همه یا هیچ: اول همهٔ سطل‌ها بررسی و فقط اگر همه اجازه دادند از همه توکن کم می‌شود."""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, capacity, rate in buckets:
+                tokens, ts = self._buckets.get(key, (capacity, now))
+                levels.append((key, min(capacity, tokens + (now - ts) * rate), rate))
+            allowed, retry_after = _decide(levels, cost)
+            for key, tokens, _ in levels:
+                self._buckets[key] = (tokens - cost if allowed else tokens, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+        return allowed, retry_after
+
+    def _prune(self, now: float) -> None:
+        # سطل‌هایی که مدت زیادی دست‌نخورده‌اند (قطعاً پر شده‌اند) حذف می‌شوند
+        stale = [k for k, (_, ts) in self._buckets.items() if now - ts > 3600]
+        for k in stale:
+            self._buckets.pop(k, None)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class SqliteBackend:
+    """سطل‌های توکن مشترک بین چند worker در یک فایل SQLite."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._ops = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, ts REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            except Exception:
+                pass
+            self._local.conn = conn
+        return conn
+
+    def consume(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> Tuple[bool, float]:
+        return self.consume_all([(key, capacity, rate)], cost)
+
+    def consume_all(self, buckets: Sequence[Tuple[str, float, float]], cost: float = 1.0) -> Tuple[bool, float]:
+        """همه یا هیچ در یک تراکنش (BEGIN IMMEDIATE): کسر توکن فقط اگر همهٔ سطل‌ها اجازه بدهند."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for key, capacity, rate in buckets:
+                row = conn.execute("SELECT tokens, ts FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, ts = (row if row else (capacity, now))
+                levels.append((key, min(capacity, tokens + max(0.0, now - ts) * rate), rate))
+            allowed, retry_after = _decide(levels, cost)
+            conn.executemany(
+                "INSERT INTO buckets (key, tokens, ts) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, ts = excluded.ts",
+                [(key, tokens - cost if allowed else tokens, now) for key, tokens, _ in levels],
+            )
+            self._ops += 1
+            if self._ops % 1000 == 0:
+                conn.execute("DELETE FROM buckets WHERE ts < ?", (now - 86400,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, retry_after
+
+    def reset(self) -> None:
+        self._conn().execute("DELETE FROM buckets")
+
+
+_BACKENDS: Dict[str, Any] = {}
+_BACKENDS_LOCK = threading.Lock()
+
+
+def get_backend(app=None):
+    """Backend فعال برای این app (یک نمونه برای هر پردازه)."""
+    app = app or current_app._get_current_object()
+    kind = str(app.config.get('RATE_LIMIT_BACKEND') or 'memory').lower()
+    if kind == 'sqlite':
+        path = app.config.get('RATE_LIMIT_SQLITE_PATH') or os.path.join(data_dir(app), 'rate_limits.sqlite3')
+        cache_key = 'sqlite:' + path
+    else:
+        path = None
+        cache_key = 'memory:%d' % id(app)
+    with _BACKENDS_LOCK:
+        backend = _BACKENDS.get(cache_key)
+        if backend is None:
+            backend = SqliteBackend(path) if path else MemoryBackend()
+            _BACKENDS[cache_key] = backend
+        return backend
+
+
+# -------- کلیدها --------
+def client_ip() -> str:
+    return request.remote_addr or 'unknown'
+
+
+def key_ip() -> str:
+    """کلید بر اساس IP کلاینت."""
+    return client_ip()
+
+
+def key_endpoint_ip() -> str:
+    """کلید بر اساس endpoint + IP (هر endpoint سهمیهٔ جداگانه دارد)."""
+    return f"{request.endpoint or request.path}|{client_ip()}"
+
+
+# -------- قواعد --------
+class Rule:
+    """
+    یک قاعدهٔ محدودیت.
+    name: نام قاعده (برای بازنویسی از RATE_LIMITS و پیشوند کلید سطل)
+    capacity: حداکثر درخواست پشت‌سرهم
+    per_seconds: زمان پر شدن کامل سطل
+    key_func: تابعی که کلید سطل را برمی‌گرداند؛ خروجی خالی یعنی این قاعده اعمال نشود
+    """
+
+    def __init__(self, name: str, capacity: int, per_seconds: float, key_func: Callable[[], Optional[str]]):
+        self.name = name
+        self.capacity = capacity
+        self.per_seconds = per_seconds
+        self.key_func = key_func
+
+    def params(self, app) -> Tuple[float, float]:
+        override = (app.config.get('RATE_LIMITS') or {}).get(self.name)
+        capacity, per_seconds = override if override else (self.capacity, self.per_seconds)
+        capacity = max(1.0, float(capacity))
+        return capacity, capacity / max(0.001, float(per_seconds))
+
+
+def check(rules: Iterable[Rule], app=None) -> Optional[int]:
+    """
+    مصرف یک توکن از هر قاعده؛ همه یا هیچ (درخواست ردشده از هیچ سطلی توکن کم نمی‌کند).
+    خروجی: None اگر مجاز است، وگرنه تعداد ثانیه‌های Retry-After.
+    """
+    app = app or current_app._get_current_object()
+    if not app.config.get('RATE_LIMIT_ENABLED', True):
+        return None
+    try:
+        backend = get_backend(app)
+    except Exception as e:
+        app.logger.warning("Rate limit backend unavailable: %s", e)
+        return None
+    buckets = []
+    for rule in rules:
+        try:
+            key = rule.key_func()
+        except Exception:
+            key = None
+        if not key:
+            continue
+        capacity, rate = rule.params(app)
+        buckets.append((f"{rule.name}:{key}", capacity, rate))
+    if not buckets:
+        return None
+    try:
+        allowed, retry_after = backend.consume_all(buckets)
+    except Exception as e:
+        # خطای backend نباید سرویس را از کار بیندازد
+        app.logger.warning("Rate limit check failed (%s): %s", ', '.join(k for k, _, _ in buckets), e)
+        return None
+    if not allowed:
+        return max(1, int(math.ceil(min(retry_after, 86400))))
+    return None
+
+
+def too_many_requests(retry_after: int, body: Optional[Dict[str, Any]] = None):
+    """پاسخ استاندارد 429 با هدر Retry-After."""
+    payload = body if body is not None else {
+        'success': False,
+        'error': 'تعداد درخواست‌ها بیش از حد مجاز است. لطفاً کمی بعد دوباره تلاش کنید.',
+        'retry_after': retry_after,
+    }
+    resp = jsonify(payload)
+    resp.status_code = 429
+    resp.headers['Retry-After'] = str(int(retry_after))
+    return resp
+
+
+def rate_limited(*rules: Rule, methods: Optional[Iterable[str]] = None,
+                 on_limited: Optional[Callable[[int], Any]] = None):
+    """
+    Decorator اعمال قواعد روی یک view.
+    methods: فقط برای این متدها اعمال شود (مثلاً ('POST',) برای فرم ورود)
+    on_limited: تابع سفارشی ساخت پاسخ (ورودی: retry_after)؛ هدر Retry-After به‌صورت خودکار ست می‌شود
+    """
+    only = {m.upper() for m in methods} if methods else None
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if only is None or request.method in only:
+                retry_after = check(rules)
+                if retry_after is not None:
+                    if on_limited is None:
+                        return too_many_requests(retry_after)
+                    resp = current_app.make_response(on_limited(retry_after))
+                    resp.headers['Retry-After'] = str(int(retry_after))
+                    return resp
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# قواعد پرکاربرد
+SMS_API_RULES = (Rule('sms_api_ip', 30, 60, key_endpoint_ip),)
+UPLOAD_RULES = (Rule('upload_ip', 60, 60, key_ip),)
+
+
+__all__ = [
+    'MemoryBackend', 'SqliteBackend', 'Rule', 'get_backend', 'check', 'rate_limited',
+    'too_many_requests', 'client_ip', 'key_ip', 'key_endpoint_ip', 'SMS_API_RULES', 'UPLOAD_RULES',
+]
@@ -4,11 +4,13 @@ sms.ir — ارسال OTP و پیامک قالب‌دار/مستقیم.
 
 اعتبارسنجی ورود همکار (کد OTP) از همین فایل با کلید و قالب زیر انجام می‌شود.
 اگر روی سرور متغیر SMS_API_KEY ست باشد، همان اولویت دارد.
+requests در اولین ارسال import می‌شود (نه در startup پردازه).
 """
 import os
-import requests
 from flask import current_app
 
+from .metrics import timed_outbound
+
 # ---------------------------------------------------------------------------
 # کلید API و قالب پیامک اعتبارسنجی (OTP) — تعریف در کد (حالت تست / پیش‌فرض)
 # پنل: sms.ir | اندپوینت: POST https://api.sms.ir/v1/send/verify
@@ -22,12 +24,14 @@ SMS_API_KEY = os.environ.get("SMS_API_KEY") or SMS_IR_OTP_API_KEY
 TEMPLATE_ID = SMS_IR_OTP_TEMPLATE_ID
 DEFAULT_LINE_NUMBER = SMS_IR_DEFAULT_LINE_NUMBER
 
+@timed_outbound('sms', 'verify')
 def send_sms_code(phone: str, code: str) -> dict:
     url = "https://api.sms.ir/v1/send/verify"
     headers = {"Content-Type":"application/json","Accept":"application/json","x-api-key":SMS_API_KEY}
     # Note: parameter name must match the template variable in sms.ir panel
     data = {"mobile": phone, "templateId": TEMPLATE_ID, "parameters":[{"name":"CODE","value":str(code)}]}
     try:
+        import requests
         resp = requests.post(url, headers=headers, json=data, timeout=10)
         content_type = resp.headers.get("content-type", "")
         body = resp.json() if content_type.lower().startswith("application/json") else {"raw": resp.text}
@@ -51,6 +55,7 @@ def send_sms_code(phone: str, code: str) -> dict:
         return {"ok": False, "status": 0, "body": {"error": str(e)}}
 
 
+@timed_outbound('sms', 'template')
 def send_sms_template(mobile: str, template_id: int, parameters: dict | None = None, api_key: str | None = None) -> dict:
     """
     ارسال پیامک با استفاده از قالب‌های آماده (Ultra Fast/Verify API در sms.ir).
@@ -73,6 +78,7 @@ def send_sms_template(mobile: str, template_id: int, parameters: dict | None = N
         "parameters": params_list,
     }
     try:
+        import requests
         resp = requests.post(url, headers=headers, json=payload, timeout=20)
         content_type = resp.headers.get("content-type", "")
         body = resp.json() if content_type.lower().startswith("application/json") else {"raw": resp.text}
@@ -86,6 +92,7 @@ def send_sms_template(mobile: str, template_id: int, parameters: dict | None = N
         return {"ok": False, "status": 0, "body": {"error": str(e)}}
 
 
+@timed_outbound('sms', 'bulk')
 def send_sms_direct(mobile: str, message: str, line_number: str | None = None, api_key: str | None = None) -> dict:
     """
     ارسال پیامک مستقیم بدون قالب (Simple SMS API در sms.ir).
@@ -113,6 +120,7 @@ def send_sms_direct(mobile: str, message: str, line_number: str | None = None, a
     }
     
     try:
+        import requests
         resp = requests.post(url, headers=headers, json=payload, timeout=20)
         content_type = resp.headers.get("content-type", "")
         body = resp.json() if content_type.lower().startswith("application/json") else {"raw": resp.text}
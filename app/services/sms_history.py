@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+SMS History Sink – ذخیره‌سازی بافرشده و افزایشی سابقه ارسال پیامک‌ها
+
+- رکوردها ابتدا در حافظه بافر می‌شوند و به‌صورت دسته‌ای (بر اساس تعداد یا زمان) flush می‌شوند
+- فرمت ذخیره‌سازی append-only است (JSON Lines: ``sms_history.jsonl``)؛ هیچ بازنویسی کامل در هر ارسال انجام نمی‌شود
+- شناسه‌ها (id) یکنواخت و صعودی هستند؛ بین چند worker با قفل فایل و فایل ``.seq`` هماهنگ می‌شوند
+- ایندکس درون‌حافظه‌ای بر اساس mobile / source / date برای صفحهٔ ادمین و ``/api/sms/history``
+- فایل قدیمی ``sms_history.json`` در اولین اجرا به فرمت جدید مهاجرت داده می‌شود
+"""
+from __future__ import annotations
+
+import os
+import json
+import atexit
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+
+try:
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover - Windows
+    fcntl = None
+
+from ..utils.storage import data_dir, legacy_dir, _resolve_app
+
+MAX_RECORDS = 10000
+DEFAULT_FLUSH_COUNT = 50
+DEFAULT_FLUSH_SECONDS = 2.0
+
+
+@contextmanager
+def _file_lock(path: str):
+    """قفل انحصاری بین‌پردازه‌ای (در نبود fcntl، فقط قفل درون‌پردازه‌ای کافی است)."""
+    if fcntl is None:
+        yield
+        return
+    fh = open(path, 'a+')
+    try:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        yield
+    finally:
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+        finally:
+            fh.close()
+
+
+def _date_key(record: Dict[str, Any]) -> str:
+    return str(record.get('created_at') or '')[:10]
+
+
+class SmsHistorySink:
+    """
+    Buffered, append-only SMS history store.
+
+    ``append`` فقط رکورد را در بافر قرار می‌دهد؛ نوشتن روی دیسک با رسیدن به
+    ``flush_count`` رکورد یا گذشت ``flush_seconds`` ثانیه انجام می‌شود.
+    خواندن‌ها (``query``/``stats``) ابتدا بافر را flush و سپس فقط بایت‌های جدید فایل را می‌خوانند.
+    """
+
+    def __init__(self, path: str, legacy_path: Optional[str] = None,
+                 flush_count: int = DEFAULT_FLUSH_COUNT,
+                 flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+                 max_records: int = MAX_RECORDS):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.seq_path = path + '.seq'
+        self.lock_path = path + '.lock'
+        self.flush_count = max(1, int(flush_count))
+        self.flush_seconds = max(0.0, float(flush_seconds))
+        self.max_records = max(1, int(max_records))
+
+        self._lock = threading.RLock()
+        self._pending: List[Dict[str, Any]] = []
+        self._timer: Optional[threading.Timer] = None
+
+        self._records: List[Dict[str, Any]] = []
+        self._by_mobile: Dict[str, List[int]] = {}
+        self._by_source: Dict[str, List[int]] = {}
+        self._by_date: Dict[str, List[int]] = {}
+        self._sent = 0
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._loaded = False
+        # میانگین بایت هر خط فایل؛ آستانهٔ حجمی فشرده‌سازی (بدون خواندن کل فایل در هر flush)
+        self._line_bytes = 0.0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # ---------- نوشتن ----------
+    def append(self, record: Dict[str, Any]) -> None:
+        """افزودن یک رکورد به بافر؛ id هنگام flush تخصیص داده می‌شود."""
+        with self._lock:
+            self._pending.append(dict(record))
+            if len(self._pending) >= self.flush_count:
+                self._flush_locked()
+            elif self._timer is None and self.flush_seconds > 0:
+                self._timer = threading.Timer(self.flush_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            elif self.flush_seconds <= 0:
+                self._flush_locked()
+
+    def flush(self) -> int:
+        """نوشتن رکوردهای بافرشده روی دیسک؛ خروجی: تعداد رکوردهای نوشته‌شده."""
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        if self._timer is not None:
+            try:
+                self._timer.cancel()
+            except Exception:
+                pass
+            self._timer = None
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, []
+        self._ensure_loaded()
+        with _file_lock(self.lock_path):
+            next_id = self._read_seq() + 1
+            lines = []
+            for rec in batch:
+                rec['id'] = next_id
+                next_id += 1
+                lines.append(json.dumps(rec, ensure_ascii=False))
+            self._write_seq(next_id - 1)
+            data = '\n'.join(lines) + '\n'
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+            if not self._line_bytes:
+                self._line_bytes = len(data.encode('utf-8')) / len(lines)
+            self._maybe_compact_locked()
+        self._refresh()
+        return len(batch)
+
+    def _read_seq(self) -> int:
+        try:
+            with open(self.seq_path, 'r', encoding='utf-8') as f:
+                return int((f.read() or '0').strip() or 0)
+        except Exception:
+            # در نبود فایل seq بزرگ‌ترین id موجود مبنا قرار می‌گیرد
+            return max((int(r.get('id') or 0) for r in self._records), default=0)
+
+    def _write_seq(self, value: int) -> None:
+        tmp = self.seq_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(str(int(value)))
+        os.replace(tmp, self.seq_path)
+
+    def _maybe_compact_locked(self) -> None:
+        """
+        وقتی فایل بیش از دو برابر سقف شد، فقط آخرین max_records رکورد نگه داشته می‌شود.
+        بررسی اول فقط یک stat است (حجم در برابر میانگین بایت هر خط)؛ کل فایل فقط وقتی خوانده می‌شود
+        که احتمالاً باید فشرده شود و میانگین با همان خواندن اصلاح می‌شود.
+        """
+        try:
+            size = os.stat(self.path).st_size
+        except OSError:
+            return
+        if size <= self._line_bytes * self.max_records * 2:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except Exception:
+            return
+        if lines:
+            self._line_bytes = size / len(lines)
+        if len(lines) <= self.max_records * 2:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.writelines(lines[-self.max_records:])
+        os.replace(tmp, self.path)
+
+    # ---------- خواندن و ایندکس ----------
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.path):
+            self._migrate_legacy()
+        self._refresh()
+
+    def _migrate_legacy(self) -> None:
+        """مهاجرت یک‌باره از sms_history.json (آرایه JSON) به فرمت JSON Lines."""
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except Exception:
+            items = []
+        if not isinstance(items, list):
+            items = []
+        items = [r for r in items if isinstance(r, dict)][-self.max_records:]
+        with _file_lock(self.lock_path):
+            if os.path.exists(self.path):
+                return
+            last_id = 0
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for rec in items:
+                    try:
+                        last_id = max(last_id, int(rec.get('id') or 0))
+                    except Exception:
+                        pass
+                    f.write(json.dumps(rec, ensure_ascii=False) + '\n')
+            os.replace(tmp, self.path)
+            self._write_seq(max(last_id, len(items)))
+
+    def _reset_index(self) -> None:
+        self._records = []
+        self._by_mobile = {}
+        self._by_source = {}
+        self._by_date = {}
+        self._sent = 0
+        self._offset = 0
+
+    def _index_record(self, rec: Dict[str, Any]) -> None:
+        pos = len(self._records)
+        self._records.append(rec)
+        self._by_mobile.setdefault(str(rec.get('mobile') or ''), []).append(pos)
+        self._by_source.setdefault(str(rec.get('source') or ''), []).append(pos)
+        self._by_date.setdefault(_date_key(rec), []).append(pos)
+        if rec.get('success'):
+            self._sent += 1
+
+    def _trim_memory(self) -> None:
+        """نگه داشتن حداکثر max_records رکورد در حافظه (با بازسازی ایندکس‌ها به‌صورت دسته‌ای)."""
+        if len(self._records) <= self.max_records + self.max_records // 10:
+            return
+        keep = self._records[-self.max_records:]
+        offset = self._offset
+        self._reset_index()
+        for rec in keep:
+            self._index_record(rec)
+        self._offset = offset
+
+    def _refresh(self) -> None:
+        """خواندن تدریجی بایت‌های جدید فایل (رکوردهای workerهای دیگر هم دیده می‌شوند)."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        if self._inode != st.st_ino or st.st_size < self._offset:
+            self._reset_index()
+            self._inode = st.st_ino
+        if st.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            return
+        for raw in chunk[:end].splitlines():
+            if not raw.strip():
+                continue
+            try:
+                rec = json.loads(raw.decode('utf-8'))
+            except Exception:
+                continue
+            if isinstance(rec, dict):
+                self._index_record(rec)
+        self._offset += end + 1
+        self._trim_memory()
+
+    def _sync(self) -> None:
+        self._ensure_loaded()
+        self._flush_locked()
+        self._refresh()
+
+    def _positions(self, mobile: Optional[str], sources: Optional[Iterable[str]],
+                   date: Optional[str]) -> Optional[List[int]]:
+        """کوچک‌ترین لیست کاندید از ایندکس‌ها؛ None یعنی «همه رکوردها»."""
+        candidates: List[List[int]] = []
+        if mobile:
+            candidates.append(self._by_mobile.get(mobile, []))
+        if sources is not None:
+            merged: List[int] = []
+            for s in sources:
+                merged.extend(self._by_source.get(s, []))
+            candidates.append(sorted(merged))
+        if date:
+            candidates.append(self._by_date.get(date[:10], []))
+        if not candidates:
+            return None
+        return min(candidates, key=len)
+
+    def query(self, mobile: Optional[str] = None, source: Optional[str] = None,
+              sources: Optional[Iterable[str]] = None, success: Optional[bool] = None,
+              date: Optional[str] = None, offset: int = 0,
+              limit: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        جستجو در سابقه (جدیدترین اول).
+        خروجی: (تعداد کل نتایج فیلترشده، لیست رکوردهای صفحهٔ درخواستی)
+        """
+        if source:
+            sources = [source]
+        source_set = set(sources) if sources is not None else None
+        with self._lock:
+            self._sync()
+            positions = self._positions(mobile, source_set, date)
+            if positions is None:
+                positions = range(len(self._records))
+            matches = []
+            for pos in reversed(positions):
+                rec = self._records[pos]
+                if mobile and rec.get('mobile') != mobile:
+                    continue
+                if source_set is not None and rec.get('source') not in source_set:
+                    continue
+                if date and _date_key(rec) != date[:10]:
+                    continue
+                if success is not None and bool(rec.get('success')) != success:
+                    continue
+                matches.append(rec)
+        offset = max(0, int(offset or 0))
+        page = matches[offset:] if limit is None else matches[offset:offset + max(0, int(limit))]
+        return len(matches), [dict(r) for r in page]
+
+    def stats(self, sources: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """آمار کل/موفق/ناموفق (اختیاری: محدود به چند source)."""
+        with self._lock:
+            self._sync()
+            if sources is None:
+                total, sent = len(self._records), self._sent
+            else:
+                total = sent = 0
+                for s in set(sources):
+                    for pos in self._by_source.get(s, []):
+                        total += 1
+                        if self._records[pos].get('success'):
+                            sent += 1
+        return {'total': total, 'sent': sent, 'failed': total - sent}
+
+    def all(self) -> List[Dict[str, Any]]:
+        """همه رکوردهای نگه‌داری‌شده (قدیمی‌ترین اول) — برای سازگاری با load_sms_history."""
+        with self._lock:
+            self._sync()
+            return [dict(r) for r in self._records]
+
+
+# -------- رجیستری sinkها (یکی برای هر مسیر فایل) --------
+_SINKS: Dict[str, SmsHistorySink] = {}
+_SINKS_LOCK = threading.Lock()
+
+
+def get_sms_history_sink(app=None) -> SmsHistorySink:
+    """sink مشترک پردازه برای مسیر سابقهٔ پیامک این app."""
+    app = _resolve_app(app)
+    cfg = app.config if app is not None else {}
+    path = cfg.get('SMS_HISTORY_LOG_FILE') or os.path.join(data_dir(app), 'sms_history.jsonl')
+    with _SINKS_LOCK:
+        sink = _SINKS.get(path)
+        if sink is None:
+            legacy = cfg.get('SMS_HISTORY_FILE') or os.path.join(data_dir(app), 'sms_history.json')
+            if not os.path.exists(legacy):
+                legacy = os.path.join(legacy_dir(app), 'sms_history.json')
+            sink = SmsHistorySink(
+                path,
+                legacy_path=legacy,
+                flush_count=cfg.get('SMS_HISTORY_FLUSH_COUNT', DEFAULT_FLUSH_COUNT),
+                flush_seconds=cfg.get('SMS_HISTORY_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS),
+                max_records=cfg.get('SMS_HISTORY_MAX_RECORDS', MAX_RECORDS),
+            )
+            _SINKS[path] = sink
+        return sink
+
+
+def flush_all() -> None:
+    """flush همه sinkها (هنگام خروج پردازه)."""
+    for sink in list(_SINKS.values()):
+        try:
+            sink.flush()
+        except Exception:
+            pass
+
+
+atexit.register(flush_all)
+
+
+def record_sms(mobile: str, result: Dict[str, Any], source: str,
+               template_id: Optional[int] = None, parameters: Optional[dict] = None,
+               message: Optional[str] = None, recipient_name: Optional[str] = None,
+               app=None) -> None:
+    """
+    ثبت یک ارسال پیامک در سابقه (ساختار رکورد همان ساختار قبلی sms_history.json است).
+    source: 'api', 'api_bulk', 'admin_colleagues', 'admin_campaign', ...
+    """
+    result = result or {}
+    body = result.get('body', {})
+    error = None
+    if not result.get('ok'):
+        error = str(body.get('message', 'Unknown error')) if isinstance(body, dict) else str(body)
+    record = {
+        'mobile': mobile,
+        'recipient_name': recipient_name,
+        'template_id': template_id,
+        'parameters': parameters or {},
+        'success': result.get('ok', False),
+        'status_code': result.get('status', 0),
+        'response': body,
+        'source': source,
+        'created_at': datetime.now().isoformat(),
+        'error': error,
+    }
+    if message is not None:
+        record['message'] = message
+    try:
+        get_sms_history_sink(app).append(record)
+    except Exception as e:
+        try:
+            current_app.logger.error(f"Failed to save SMS history: {e}")
+        except Exception:
+            pass
+
+
+__all__ = ['SmsHistorySink', 'get_sms_history_sink', 'record_sms', 'flush_all', 'MAX_RECORDS']
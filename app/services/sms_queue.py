@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+SMS Delivery Queue – ارسال پس‌زمینهٔ OTP و پیامک‌های تراکنشی
+
+- درخواست HTTP فقط job را در صف می‌گذارد و بلافاصله پاسخ می‌دهد (بدون انتظار ۱۰ تا ۲۰ ثانیه‌ای sms.ir)
+- چند thread کارگر (پیش‌فرض ۲) پیامک‌ها را ارسال می‌کنند
+- وضعیت هر job (queued → sending → sent/failed) برای endpoint سبک polling نگه داشته می‌شود
+- با ``SMS_QUEUE_STORE=sqlite`` وضعیت‌ها بین چند worker مشترک است؛ با 'memory' (پیش‌فرض) هر worker فقط
+  jobهای خودش را می‌شناسد و polling وضعیت روی worker دیگر 'unknown' می‌گیرد (استقرار چند worker: sqlite)
+- sender قابل‌تعویض است تا صف با یک stub تست شود:
+      SmsDeliveryQueue(app, sender=lambda kind, **kw: {"ok": True, "status": 200, "body": {}})
+
+تنظیمات (app.config):
+  SMS_QUEUE_ENABLED   اگر False باشد ارسال به‌صورت همزمان (inline) انجام می‌شود
+  SMS_QUEUE_WORKERS   تعداد threadهای کارگر
+  SMS_QUEUE_STORE     'memory' یا 'sqlite'
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from ..utils.storage import data_dir, _resolve_app
+
+JOB_TTL_SECONDS = 15 * 60
+DEFAULT_WORKERS = 2
+
+STATUS_QUEUED = 'queued'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+
+def default_sender(kind: str, **kwargs) -> Dict[str, Any]:
+    """ارسال واقعی از طریق app.services.sms (lookup در زمان اجرا تا mock.patch هم کار کند)."""
+    from . import sms as sms_service
+    if kind == 'otp':
+        return sms_service.send_sms_code(kwargs['phone'], kwargs['code'])
+    if kind == 'direct':
+        return sms_service.send_sms_direct(**kwargs)
+    if kind == 'template':
+        return sms_service.send_sms_template(**kwargs)
+    raise ValueError(f"Unknown SMS job kind: {kind}")
+
+
+# -------- نگه‌داری وضعیت jobها --------
+class MemoryJobStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def put(self, job: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+            if len(self._jobs) > 1000:
+                for jid in [k for k, v in self._jobs.items() if now - v.get('updated_at', 0) > JOB_TTL_SECONDS]:
+                    self._jobs.pop(jid, None)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class SqliteJobStore:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS sms_jobs (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            except Exception:
+                pass
+            self._local.conn = conn
+        return conn
+
+    def put(self, job: Dict[str, Any]) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO sms_jobs (id, data, updated_at) VALUES (?, ?, ?)",
+            (job['id'], json.dumps(job, ensure_ascii=False), now),
+        )
+        if job.get('status') in (STATUS_SENT, STATUS_FAILED):
+            conn.execute("DELETE FROM sms_jobs WHERE updated_at < ?", (now - JOB_TTL_SECONDS,))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM sms_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+# -------- صف --------
+class SmsDeliveryQueue:
+    """صف ارسال پیامک با چند thread کارگر."""
+
+    def __init__(self, app, sender: Optional[Callable[..., Dict[str, Any]]] = None,
+                 workers: int = DEFAULT_WORKERS, store=None, run_inline: bool = False):
+        self.app = app
+        self.sender = sender or default_sender
+        self.store = store or MemoryJobStore()
+        self.run_inline = run_inline
+        self.workers = max(1, int(workers))
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._threads: list = []
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"sms-queue-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def enqueue(self, kind: str, history: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        """
+        افزودن یک پیامک به صف و برگرداندن شناسهٔ job.
+        history: اگر داده شود، پس از ارسال در سابقهٔ پیامک ثبت می‌شود
+                 (کلیدها: source، message، template_id، parameters، recipient_name)
+        """
+        mobile = kwargs.get('phone') or kwargs.get('mobile') or ''
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'mobile': str(mobile),
+            'status': STATUS_QUEUED,
+            'created_at': now,
+            'updated_at': now,
+            'ok': None,
+            'status_code': None,
+        }
+        self.store.put(job)
+        task = {'job': job, 'kwargs': kwargs, 'history': history}
+        if self.run_inline:
+            self._process(task)
+        else:
+            self._ensure_started()
+            self._queue.put(task)
+        return job['id']
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id) if job_id else None
+
+    def join(self, timeout: float = 10.0) -> bool:
+        """انتظار تا خالی شدن صف (برای تست و خروج تمیز)."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._queue.unfinished_tasks == 0:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _worker(self) -> None:
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                self._process(task)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, task: Dict[str, Any]) -> None:
+        job = task['job']
+        job.update(status=STATUS_SENDING, updated_at=time.time())
+        self.store.put(job)
+        with self.app.app_context():
+            try:
+                result = self.sender(job['kind'], **task['kwargs']) or {}
+            except Exception as e:
+                result = {'ok': False, 'status': 0, 'body': {'error': str(e)}}
+            ok = bool(result.get('ok'))
+            job.update(
+                status=STATUS_SENT if ok else STATUS_FAILED,
+                ok=ok,
+                status_code=result.get('status'),
+                updated_at=time.time(),
+            )
+            self.store.put(job)
+            if not ok:
+                self.app.logger.error(
+                    "Queued SMS failed | kind=%s | mobile=%s | status=%s | body=%s",
+                    job['kind'], job['mobile'], result.get('status'), result.get('body'),
+                )
+            history = task.get('history')
+            if history:
+                try:
+                    from .sms_history import record_sms
+                    record_sms(job['mobile'], result, app=self.app, **history)
+                except Exception:
+                    self.app.logger.error("Failed to record queued SMS history", exc_info=True)
+
+
+_QUEUES: Dict[int, SmsDeliveryQueue] = {}
+_QUEUES_LOCK = threading.Lock()
+
+
+def get_sms_queue(app=None) -> SmsDeliveryQueue:
+    """صف مشترک پردازه برای این app (در اولین استفاده ساخته می‌شود)."""
+    app = _resolve_app(app)
+    with _QUEUES_LOCK:
+        q = _QUEUES.get(id(app))
+        if q is None:
+            store = None
+            if str(app.config.get('SMS_QUEUE_STORE') or 'memory').lower() == 'sqlite':
+                store = SqliteJobStore(os.path.join(data_dir(app), 'sms_jobs.sqlite3'))
+            q = SmsDeliveryQueue(
+                app,
+                workers=app.config.get('SMS_QUEUE_WORKERS', DEFAULT_WORKERS),
+                store=store,
+                run_inline=not app.config.get('SMS_QUEUE_ENABLED', True),
+            )
+            _QUEUES[id(app)] = q
+        return q
+
+
+def enqueue_sms(kind: str, history: Optional[Dict[str, Any]] = None, app=None, **kwargs) -> str:
+    """میان‌بر: افزودن پیامک به صف app جاری."""
+    return get_sms_queue(app).enqueue(kind, history=history, **kwargs)
+
+
+def enqueue_otp(phone: str, code: str, app=None) -> str:
+    return enqueue_sms('otp', app=app, phone=phone, code=code)
+
+
+def job_status(job_id: str, app=None) -> Optional[Dict[str, Any]]:
+    """وضعیت عمومی یک job برای پاسخ polling (بدون بدنهٔ پاسخ sms.ir)."""
+    job = get_sms_queue(app).get(job_id)
+    if not job:
+        return None
+    return {'id': job['id'], 'status': job['status'], 'ok': job.get('ok')}
+
+
+__all__ = [
+    'SmsDeliveryQueue', 'MemoryJobStore', 'SqliteJobStore', 'default_sender',
+    'get_sms_queue', 'enqueue_sms', 'enqueue_otp', 'job_status',
+    'STATUS_QUEUED', 'STATUS_SENDING', 'STATUS_SENT', 'STATUS_FAILED',
+]
@@ -0,0 +1,155 @@
+/*
+ * Vinor chunked uploads – آپلود تکه‌ای و قابل ادامه (ویدئو و مدارک حجیم)
+ *
+ * ورودی‌های فایل با data-chunked-upload="video|document|image" قبل از ارسال فرم
+ * تکه‌تکه به /api/uploads/chunked فرستاده می‌شوند؛ سپس فرم به جای فایل فیلد
+ * <name>_upload_id را ارسال می‌کند. قطع شبکه فقط تکهٔ جاری را تکرار می‌کند و
+ * با انتخاب دوبارهٔ همان فایل، آپلود از آخرین offset ادامه پیدا می‌کند.
+ */
+(function () {
+  'use strict';
+
+  var ENDPOINT = '/api/uploads/chunked';
+  var MAX_RETRIES = 6;
+
+  function csrfToken() {
+    var meta = document.querySelector('meta[name="csrf-token"]');
+    if (meta && meta.content) return meta.content;
+    var input = document.querySelector('input[name="csrf_token"]');
+    return input ? input.value : '';
+  }
+
+  function request(method, url, body, contentType) {
+    var headers = { 'X-CSRFToken': csrfToken(), 'Accept': 'application/json' };
+    if (contentType) headers['Content-Type'] = contentType;
+    return fetch(url, { method: method, body: body, headers: headers, credentials: 'same-origin' })
+      .then(function (res) {
+        return res.json().catch(function () { return {}; }).then(function (data) {
+          data.status = res.status;
+          data.httpOk = res.ok;
+          return data;
+        });
+      });
+  }
+
+  function sleep(ms) {
+    return new Promise(function (resolve) { setTimeout(resolve, ms); });
+  }
+
+  function resumeKey(file, kind) {
+    return 'vinor-chunked:' + kind + ':' + file.name + ':' + file.size + ':' + (file.lastModified || 0);
+  }
+
+  async function start(file, kind) {
+    var key = resumeKey(file, kind);
+    var saved = null;
+    try { saved = localStorage.getItem(key); } catch (e) {}
+    if (saved) {
+      var st = await request('GET', ENDPOINT + '/' + saved);
+      if (st.httpOk && !st.complete) return st;
+    }
+    var init = await request('POST', ENDPOINT, JSON.stringify({ filename: file.name, size: file.size, kind: kind }),
+      'application/json');
+    if (!init.httpOk) throw new Error(init.error || 'شروع آپلود ناموفق بود');
+    try { localStorage.setItem(key, init.id); } catch (e) {}
+    return init;
+  }
+
+  async function upload(file, opts) {
+    opts = opts || {};
+    var kind = opts.kind || 'document';
+    var st = await start(file, kind);
+    var offset = st.offset || 0;
+    var chunk = st.chunk_size || (4 * 1024 * 1024);
+    var retries = 0;
+    while (offset < file.size) {
+      var res;
+      try {
+        res = await request('PUT', ENDPOINT + '/' + st.id + '?offset=' + offset,
+          file.slice(offset, offset + chunk), 'application/octet-stream');
+      } catch (err) {
+        res = { httpOk: false, status: 0 };
+      }
+      if (res.httpOk) {
+        offset = res.offset;
+        retries = 0;
+      } else if (res.status === 409 && typeof res.offset === 'number') {
+        offset = res.offset; // سرور offset دیگری دارد؛ از همان‌جا ادامه
+      } else if ((res.status === 0 || res.status >= 500) && retries < MAX_RETRIES) {
+        retries += 1;
+        await sleep(Math.min(15000, 500 * Math.pow(2, retries)));
+        continue;
+      } else {
+        throw new Error(res.error || 'آپلود ناموفق بود');
+      }
+      if (opts.onProgress) opts.onProgress(offset / file.size);
+    }
+    var fin = await request('POST', ENDPOINT + '/' + st.id + '/finalize');
+    if (!fin.httpOk) throw new Error(fin.error || 'نهایی‌سازی آپلود ناموفق بود');
+    try { localStorage.removeItem(resumeKey(file, kind)); } catch (e) {}
+    return fin;
+  }
+
+  function progressLabel(input) {
+    var el = input.parentNode && input.parentNode.querySelector('[data-chunked-progress]');
+    if (!el) {
+      el = document.createElement('div');
+      el.setAttribute('data-chunked-progress', '');
+      el.className = 'text-xs text-gray-500 mt-1';
+      input.insertAdjacentElement('afterend', el);
+    }
+    return el;
+  }
+
+  function enhance(form) {
+    if (form.dataset.chunkedEnhanced) return;
+    form.dataset.chunkedEnhanced = '1';
+    form.addEventListener('submit', async function (ev) {
+      if (ev.defaultPrevented || form.dataset.chunkedReady) return;
+      var inputs = Array.prototype.filter.call(
+        form.querySelectorAll('input[type="file"][data-chunked-upload]'),
+        function (i) { return !i.disabled && i.files && i.files.length; }
+      );
+      if (!inputs.length) return;
+      ev.preventDefault();
+      try {
+        for (var n = 0; n < inputs.length; n++) {
+          var input = inputs[n];
+          var label = progressLabel(input);
+          var result = await upload(input.files[0], {
+            kind: input.dataset.chunkedUpload,
+            onProgress: function (p) { label.textContent = 'در حال آپلود: ' + Math.round(p * 100) + '%'; }
+          });
+          label.textContent = 'آپلود کامل شد';
+          var hidden = document.createElement('input');
+          hidden.type = 'hidden';
+          hidden.name = input.name + '_upload_id';
+          hidden.value = result.id;
+          form.appendChild(hidden);
+          input.disabled = true; // فایل دیگر همراه فرم ارسال نمی‌شود
+        }
+      } catch (err) {
+        alert(err.message || 'آپلود فایل ناموفق بود. دوباره تلاش کنید.');
+        inputs.forEach(function (i) { i.disabled = false; });
+        form.dispatchEvent(new CustomEvent('vinor:chunked-upload-failed'));
+        return;
+      }
+      form.dataset.chunkedReady = '1';
+      HTMLFormElement.prototype.submit.call(form);
+    });
+  }
+
+  function init() {
+    Array.prototype.forEach.call(document.querySelectorAll('form'), function (form) {
+      if (form.querySelector('input[type="file"][data-chunked-upload]')) enhance(form);
+    });
+  }
+
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', init);
+  } else {
+    init();
+  }
+
+  window.VinorChunkedUpload = { upload: upload, enhance: enhance };
+})();
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+فشرده‌سازی پاسخ‌ها – br/gzip برای پاسخ‌های متنی پویا و نسخه‌های از پیش فشردهٔ فایل‌های static
+
+پاسخ‌های پویا (HTML، JSON، JS/CSS تولیدی):
+  - encoding از ``Accept-Encoding`` انتخاب می‌شود (br در صورت نصب بودن brotli، وگرنه gzip)
+  - فقط بدنه‌های بزرگ‌تر از ``COMPRESS_MIN_SIZE``؛ پاسخ‌های stream (SSE)، فایل‌ها (send_file)،
+    پاسخ‌های دارای Content-Encoding/Content-Range و ``Cache-Control: no-transform`` دست نمی‌خورند
+  - بدنهٔ فشرده برای پاسخ‌های قابل کش (دارای ETag یا public، بدون no-store/private) با کلید
+    هش محتوا در یک LRU محدود به حجم نگه داشته می‌شود؛ polling یک JSON ثابت هر بار دوباره فشرده نمی‌شود
+  - هر پاسخ قابل فشرده‌سازی ``Vary: Accept-Encoding`` می‌گیرد
+
+ETag: نمایش فشرده tag جدا دارد (``"abc"`` → ``"abc-gz"`` / ``"abc-br"``). پسوند قبل از رسیدن
+درخواست به view از If-None-Match حذف می‌شود تا مقایسه‌های موجود (مثل /api/express-*) همان
+tag اصلی را ببینند، و روی پاسخ 304 دوباره اضافه می‌شود.
+
+static: ``scripts/precompress_static.py`` در build کنار هر فایل متنی نسخهٔ ``.br``/``.gz`` می‌سازد.
+endpointهای static (و ``send_static`` برای sw.js و manifestها) در صورت پذیرش کلاینت و تازه
+بودن نسخهٔ فشرده (mtime برابر یا جدیدتر از اصل) همان را با Content-Encoding مناسب می‌فرستند؛
+ETag و Last-Modified را send_file از خود فایل فشرده می‌سازد.
+
+تنظیمات (app.config):
+  COMPRESS_ENABLED                  فعال/غیرفعال (پیش‌فرض True)
+  COMPRESS_MIN_SIZE                 حداقل اندازهٔ بدنه به بایت (پیش‌فرض 1024)
+  COMPRESS_GZIP_LEVEL               سطح gzip پاسخ‌های پویا (پیش‌فرض 6)
+  COMPRESS_BR_QUALITY               کیفیت brotli پاسخ‌های پویا (پیش‌فرض 4)
+  COMPRESS_CACHE_MB                 سقف حافظهٔ کش بدنه‌های فشرده (پیش‌فرض 32، صفر = خاموش)
+  COMPRESS_STATIC_PRECOMPRESSED     سرو نسخه‌های .br/.gz فایل‌های static (پیش‌فرض True)
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from flask import current_app, g, request, send_from_directory
+from werkzeug.security import safe_join
+
+COMPRESSIBLE_MIMETYPES = frozenset({
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'text/xml', 'text/csv', 'text/markdown',
+    'application/json', 'application/javascript', 'application/x-javascript', 'application/xml',
+    'application/manifest+json', 'application/ld+json', 'application/geo+json', 'image/svg+xml',
+})
+PRECOMPRESS_EXTENSIONS = frozenset({
+    '.js', '.mjs', '.css', '.svg', '.json', '.webmanifest', '.html', '.txt', '.map', '.xml',
+    '.ttf', '.otf', '.eot', '.ico',
+})
+# ترتیب = ترجیح سرور در تساوی q
+ENCODINGS: Tuple[Tuple[str, str], ...] = (('br', '.br'), ('gzip', '.gz'))
+ETAG_SUFFIXES = {'br': '-br', 'gzip': '-gz'}
+_SKIP_DIRS = {'__pycache__', 'uploads', '__variants__'}
+
+_brotli_module: Any = None
+
+
+def brotli_module():
+    """ماژول brotli (یا brotlicffi) در صورت نصب؛ وابستگی اختیاری است و بدون آن فقط gzip داریم."""
+    global _brotli_module
+    if _brotli_module is None:
+        try:
+            import brotli as _mod  # type: ignore
+        except ImportError:
+            try:
+                import brotlicffi as _mod  # type: ignore
+            except ImportError:
+                _mod = False
+        _brotli_module = _mod
+    return _brotli_module or None
+
+
+def compress_bytes(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == 'br':
+        return brotli_module().compress(data, quality=11 if level is None else level)
+    # mtime=0: خروجی قطعی (همان ورودی → همان بایت‌ها، برای کش و ETag)
+    return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+
+
+# ---------- ETag ----------
+def tag_etag(etag: str, encoding: str) -> str:
+    suffix = ETAG_SUFFIXES[encoding]
+    if etag.endswith('"'):
+        return etag[:-1] + suffix + '"'
+    return etag + suffix
+
+
+def untag_etag(etag: str) -> Tuple[str, Optional[str]]:
+    """(tag اصلی، encoding) یا (همان ورودی، None) اگر پسوندی نداشت."""
+    value = etag.strip()
+    quoted = value.endswith('"')
+    core = value[:-1] if quoted else value
+    for encoding, suffix in ETAG_SUFFIXES.items():
+        if core.endswith(suffix):
+            core = core[:-len(suffix)]
+            return (core + '"' if quoted else core), encoding
+    return value, None
+
+
+class CompressionCache:
+    """LRU بدنه‌های فشرده با کلید (encoding، هش محتوا) و سقف حجم کل."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max(0, int(max_bytes))
+        self._items: 'OrderedDict[Tuple[str, bytes], bytes]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, bytes]) -> Optional[bytes]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: Tuple[str, bytes], value: bytes) -> None:
+        if len(value) > self.max_bytes // 8:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes and self._items:
+                _, old = self._items.popitem(last=False)
+                self._size -= len(old)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'cache_entries': len(self._items), 'cache_bytes': self._size}
+
+
+class Compressor:
+    def __init__(self, min_size: int = 1024, gzip_level: int = 6, br_quality: int = 4,
+                 cache_bytes: int = 32 * 1024 * 1024) -> None:
+        self.min_size = max(0, int(min_size))
+        self.gzip_level = int(gzip_level)
+        self.br_quality = int(br_quality)
+        self.cache = CompressionCache(cache_bytes) if cache_bytes > 0 else None
+        self._lock = threading.Lock()
+        self._stats = {
+            'compressed': 0, 'cache_hits': 0, 'skipped_small': 0, 'skipped_ratio': 0,
+            'bytes_in': 0, 'bytes_out': 0, 'static_precompressed': 0, 'not_modified_retagged': 0,
+        }
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+
+    def negotiate(self, accept) -> Optional[str]:
+        candidates = [enc for enc, _ in ENCODINGS if enc != 'br' or brotli_module()]
+        return accept.best_match(candidates) if accept else None
+
+    def compress(self, data: bytes, encoding: str, cacheable: bool) -> bytes:
+        key = None
+        if cacheable and self.cache is not None:
+            key = (encoding, hashlib.blake2b(data, digest_size=16).digest())
+            hit = self.cache.get(key)
+            if hit is not None:
+                self._count('cache_hits')
+                return hit
+        out = compress_bytes(data, encoding, self.br_quality if encoding == 'br' else self.gzip_level)
+        if key is not None:
+            self.cache.put(key, out)
+        return out
+
+    def process(self, resp):
+        """after_request: فشرده‌سازی بدنه یا بازگرداندن پسوند ETag روی 304."""
+        if resp.status_code == 304:
+            encoding = g.get('_compress_inm_encoding')
+            etag = resp.headers.get('ETag')
+            if encoding and etag and untag_etag(etag)[1] is None:
+                resp.headers['ETag'] = tag_etag(etag, encoding)
+                resp.vary.add('Accept-Encoding')
+                self._count('not_modified_retagged')
+            return resp
+        if resp.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return resp
+        if resp.direct_passthrough or resp.is_streamed or 'Content-Encoding' in resp.headers:
+            return resp
+        cache_control = resp.headers.get('Cache-Control', '')
+        if 'no-transform' in cache_control or 'Content-Range' in resp.headers:
+            return resp
+        resp.vary.add('Accept-Encoding')
+        if resp.status_code < 200 or resp.status_code in (204, 206) or 300 <= resp.status_code < 400:
+            return resp
+        encoding = self.negotiate(request.accept_encodings)
+        if not encoding:
+            return resp
+        data = resp.get_data()
+        if len(data) < self.min_size:
+            self._count('skipped_small')
+            return resp
+        # فقط پاسخ‌های نسخه‌دار (ETag) یا public؛ HTML با توکن CSRF هر بار بدنهٔ تازه دارد
+        cacheable = (
+            resp.status_code == 200 and ('ETag' in resp.headers or 'public' in cache_control)
+            and 'no-store' not in cache_control and 'private' not in cache_control
+        )
+        out = self.compress(data, encoding, cacheable)
+        if len(out) >= len(data):
+            self._count('skipped_ratio')
+            return resp
+        resp.set_data(out)
+        resp.headers['Content-Encoding'] = encoding
+        etag = resp.headers.get('ETag')
+        if etag:
+            resp.headers['ETag'] = tag_etag(etag, encoding)
+        with self._lock:
+            self._stats['compressed'] += 1
+            self._stats['bytes_in'] += len(data)
+            self._stats['bytes_out'] += len(out)
+        return resp
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+        out['brotli'] = 1 if brotli_module() else 0
+        if self.cache is not None:
+            out.update(self.cache.stats())
+        return out
+
+
+def get_compressor(app=None) -> Optional[Compressor]:
+    app = app or current_app
+    return app.extensions.get('compression')
+
+
+# ---------- static از پیش فشرده ----------
+def _fresh_sibling(path: str, accept) -> Tuple[Optional[str], Optional[str]]:
+    try:
+        src_mtime = os.stat(path).st_mtime
+    except OSError:
+        return None, None
+    for encoding, ext in ENCODINGS:
+        if not accept or not accept[encoding]:
+            continue
+        try:
+            if os.stat(path + ext).st_mtime >= src_mtime:
+                return encoding, ext
+        except OSError:
+            continue
+    return None, None
+
+
+def send_static(directory: str, filename: str, mimetype: Optional[str] = None, **kwargs):
+    """send_from_directory با ترجیح نسخهٔ .br/.gz ساخته‌شده در build (اگر کلاینت بپذیرد)."""
+    mimetype = mimetype or mimetypes.guess_type(filename)[0]
+    compressible = os.path.splitext(filename)[1].lower() in PRECOMPRESS_EXTENSIONS
+    compressor = get_compressor()
+    if compressible and compressor is not None and current_app.config.get('COMPRESS_STATIC_PRECOMPRESSED', True):
+        path = safe_join(directory, filename)
+        if path:
+            encoding, ext = _fresh_sibling(path, request.accept_encodings)
+            if encoding:
+                resp = send_from_directory(directory, filename + ext, mimetype=mimetype, **kwargs)
+                resp.headers['Content-Encoding'] = encoding
+                resp.vary.add('Accept-Encoding')
+                compressor._count('static_precompressed')
+                return resp
+    resp = send_from_directory(directory, filename, mimetype=mimetype, **kwargs)
+    if compressible:
+        resp.vary.add('Accept-Encoding')
+    return resp
+
+
+def _wrap_static_view(app, endpoint: str, scaffold) -> None:
+    def static_view(filename):
+        return send_static(scaffold.static_folder, filename, max_age=scaffold.get_send_file_max_age(filename))
+
+    static_view.__name__ = getattr(app.view_functions[endpoint], '__name__', 'static')
+    app.view_functions[endpoint] = static_view
+
+
+def iter_precompress_sources(root: str) -> Iterator[str]:
+    """فایل‌های متنی زیر root که ارزش نسخهٔ فشرده دارند (برای scripts/precompress_static.py)."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in _SKIP_DIRS and not d.startswith('.')]
+        for fn in filenames:
+            if not fn.startswith('.') and os.path.splitext(fn)[1].lower() in PRECOMPRESS_EXTENSIONS:
+                yield os.path.join(dirpath, fn)
+
+
+def precompress_file(path: str, min_size: int = 256, force: bool = False) -> List[Tuple[str, int, int]]:
+    """ساخت ``path.gz`` و (با brotli) ``path.br``؛ خروجی: [(encoding، اندازهٔ اصل، اندازهٔ فشرده)].
+
+    نسخهٔ فشرده mtime فایل اصل را می‌گیرد تا send_static تازگی را با یک stat بسنجد؛
+    اگر فشرده‌سازی کمتر از ۵٪ صرفه‌جویی داشته باشد، نسخهٔ قبلی هم حذف می‌شود.
+    """
+    st = os.stat(path)
+    written: List[Tuple[str, int, int]] = []
+    if st.st_size < min_size:
+        return written
+    data = None
+    for encoding, ext in ENCODINGS:
+        if encoding == 'br' and not brotli_module():
+            continue
+        target = path + ext
+        try:
+            if not force and os.stat(target).st_mtime == st.st_mtime:
+                continue
+        except OSError:
+            pass
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        out = compress_bytes(data, encoding)
+        if len(out) > len(data) * 0.95:
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        tmp = target + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(out)
+        os.utime(tmp, (st.st_atime, st.st_mtime))
+        os.replace(tmp, target)
+        written.append((encoding, len(data), len(out)))
+    return written
+
+
+def init_compression(app) -> Optional[Compressor]:
+    """hookهای فشرده‌سازی و جایگزینی viewهای static؛ بعد از ثبت همهٔ blueprintها صدا زده شود."""
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return None
+    compressor = Compressor(
+        min_size=int(app.config.get('COMPRESS_MIN_SIZE', 1024)),
+        gzip_level=int(app.config.get('COMPRESS_GZIP_LEVEL', 6)),
+        br_quality=int(app.config.get('COMPRESS_BR_QUALITY', 4)),
+        cache_bytes=int(float(app.config.get('COMPRESS_CACHE_MB', 32)) * 1024 * 1024),
+    )
+    app.extensions['compression'] = compressor
+
+    @app.before_request
+    def _compress_untag_if_none_match():
+        inm = request.environ.get('HTTP_IF_NONE_MATCH')
+        if not inm or ('-gz' not in inm and '-br' not in inm):
+            return None
+        tags, found = [], None
+        for part in inm.split(','):
+            tag, encoding = untag_etag(part)
+            tags.append(tag)
+            found = found or encoding
+        if found:
+            request.environ['HTTP_IF_NONE_MATCH'] = ', '.join(tags)
+            request.__dict__.pop('if_none_match', None)
+            g._compress_inm_encoding = found
+        return None
+
+    # Flask hookهای after_request را برعکس ترتیب ثبت اجرا می‌کند؛ اول لیست = آخرین اجرا،
+    # تا بدنه و هدرهای نهایی (Cache-Control، ETag) دیده شوند
+    app.after_request_funcs.setdefault(None, []).insert(0, compressor.process)
+
+    if app.config.get('COMPRESS_STATIC_PRECOMPRESSED', True):
+        if 'static' in app.view_functions and app.static_folder:
+            _wrap_static_view(app, 'static', app)
+        for name, bp in app.blueprints.items():
+            endpoint = f"{name}.static"
+            if bp.has_static_folder and endpoint in app.view_functions:
+                _wrap_static_view(app, endpoint, bp)
+
+    try:
+        from ..services.metrics import get_registry
+        get_registry().register_collector('compression', compressor.stats)
+    except Exception:
+        pass
+    return compressor
+
+
+__all__ = [
+    'COMPRESSIBLE_MIMETYPES', 'PRECOMPRESS_EXTENSIONS', 'Compressor', 'CompressionCache', 'brotli_module',
+    'compress_bytes', 'get_compressor', 'init_compression', 'iter_precompress_sources', 'precompress_file',
+    'send_static', 'tag_etag', 'untag_etag',
+]
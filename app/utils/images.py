@@ -2,21 +2,39 @@
 Image helper utilities for Vinor.
 
 - Normalize upload URLs to absolute `/uploads/...` form
-- Generate WebP variants (thumb/full) with cached files under `__variants__/`
+- Generate WebP variants with cached files under `__variants__/`
+- Canonical size presets (thumb/card/full/2x) and quality tiers; requested
+  `w`/`q` values are snapped to them so each image has a bounded set of variants
+- Responsive dicts carry ingest-time preview data (intrinsic size, blurred
+  placeholder, dominant color) from the listing's ``image_meta``
 """
 from __future__ import annotations
 
 import os
-from typing import Dict, Optional, Tuple
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Tuple
 
 from flask import current_app
 
-try:
-    from PIL import Image, ImageOps  # type: ignore
+_PIL: Any = None  # None: هنوز بارگذاری نشده، False: Pillow نصب نیست
 
-    _PIL_OK = True
-except Exception:  # pragma: no cover - fallback when Pillow is missing
-    _PIL_OK = False
+
+def load_pil() -> Optional[SimpleNamespace]:
+    """
+    Pillow در اولین استفاده (نه در import ماژول؛ startup پردازه‌ها آن را بارگذاری نمی‌کند).
+    خروجی: namespace با Image / ImageOps / ImageFilter / webp یا None اگر Pillow نصب نباشد.
+    """
+    global _PIL
+    if _PIL is None:
+        try:
+            from PIL import Image, ImageFilter, ImageOps, features  # type: ignore
+            _PIL = SimpleNamespace(Image=Image, ImageOps=ImageOps, ImageFilter=ImageFilter,
+                                   webp=bool(features.check('webp')))
+        except Exception:  # pragma: no cover - fallback when Pillow is missing
+            _PIL = False
+    return _PIL or None
 
 THUMB_WIDTH = 400
 THUMB_QUALITY = 60
@@ -24,6 +42,29 @@ FULL_WIDTH = 1400
 FULL_QUALITY = 80
 DEFAULT_FMT = "WEBP"
 
+# اندازه‌های استاندارد (عرض به پیکسل)؛ هر w دلخواه به نزدیک‌ترین preset بزرگ‌تر گرد می‌شود
+VARIANT_PRESETS: Dict[str, int] = {
+    "thumb": THUMB_WIDTH,   # کارت‌های کوچک / گرید سه‌ستونه
+    "card": 800,            # کارت لیست / نمایش تک‌ستونه موبایل
+    "full": FULL_WIDTH,     # صفحهٔ جزئیات
+    "2x": 2000,             # تمام‌صفحه روی نمایشگرهای با تراکم بالا
+}
+# سطوح کیفیت؛ هر q دلخواه به نزدیک‌ترین سطح گرد می‌شود
+QUALITY_TIERS: Dict[str, int] = {
+    "low": THUMB_QUALITY,
+    "medium": 70,
+    "high": FULL_QUALITY,
+}
+# کیفیت پیش‌فرض هر preset
+PRESET_QUALITY: Dict[str, int] = {
+    "thumb": QUALITY_TIERS["low"],
+    "card": QUALITY_TIERS["medium"],
+    "full": QUALITY_TIERS["high"],
+    "2x": QUALITY_TIERS["medium"],
+}
+# sizes پیش‌فرض برای کارت‌های لیست (گرید ۳ ستونه در موبایل، عریض‌تر در دسکتاپ)
+CARD_SIZES = "(max-width: 640px) 34vw, (max-width: 1024px) 25vw, 320px"
+
 
 def normalize_upload_url(value: Optional[str]) -> str:
     """
@@ -48,6 +89,35 @@ def normalize_upload_url(value: Optional[str]) -> str:
     return "/uploads/" + s
 
 
+def snap_width(width: int) -> Tuple[str, int]:
+    """نزدیک‌ترین preset با عرض >= width (یا بزرگ‌ترین preset)."""
+    ordered = sorted(VARIANT_PRESETS.items(), key=lambda kv: kv[1])
+    for name, w in ordered:
+        if width <= w:
+            return name, w
+    return ordered[-1]
+
+
+def snap_quality(quality: int) -> int:
+    """نزدیک‌ترین سطح کیفیت."""
+    return min(QUALITY_TIERS.values(), key=lambda q: (abs(q - quality), -q))
+
+
+def resolve_variant(width: int = 0, quality: int = 0, preset: Optional[str] = None) -> Optional[Tuple[str, int, int, str]]:
+    """
+    تبدیل پارامترهای درخواست به یک واریانت استاندارد.
+    خروجی: (preset, width, quality, folder) یا None اگر واریانتی خواسته نشده باشد.
+    """
+    if preset and preset in VARIANT_PRESETS:
+        name, w = preset, VARIANT_PRESETS[preset]
+    elif width and width > 0:
+        name, w = snap_width(int(width))
+    else:
+        return None
+    q = snap_quality(int(quality)) if quality and quality > 0 else PRESET_QUALITY[name]
+    return name, w, q, f"{name}_q{q}"
+
+
 def build_variant_url(base_url: str, width: int, quality: int, fmt: str = "webp", variant: str = "") -> str:
     if not base_url:
         return ""
@@ -58,17 +128,18 @@ def build_variant_url(base_url: str, width: int, quality: int, fmt: str = "webp"
     return f"{base_url}{joiner}{params}"
 
 
-def _safe_open_image(src_path: str) -> Optional[Image.Image]:
-    if not _PIL_OK:
+def _safe_open_image(src_path: str):
+    pil = load_pil()
+    if pil is None:
         return None
     try:
-        im = Image.open(src_path)
+        im = pil.Image.open(src_path)
         try:
-            im = ImageOps.exif_transpose(im)
+            im = pil.ImageOps.exif_transpose(im)
         except Exception:
             pass
         if im.mode in ("RGBA", "LA"):
-            bg = Image.new("RGB", im.size, (255, 255, 255))
+            bg = pil.Image.new("RGB", im.size, (255, 255, 255))
             bg.paste(im, mask=im.split()[-1])
             im = bg
         elif im.mode != "RGB":
@@ -86,39 +157,64 @@ def _variant_paths(upload_root: str, rel_path: str, folder: str, fmt: str = "web
     return variant_rel, variant_abs
 
 
-def generate_variant(upload_root: str, rel_path: str, width: int, quality: int, folder: str, fmt: str = DEFAULT_FMT) -> Optional[str]:
+def variant_target(upload_root: str, rel_path: str, folder: str, fmt: str = DEFAULT_FMT) -> Optional[Tuple[str, str, str]]:
     """
-    Create (or return existing) variant file and return its *relative* path from upload root.
+    مسیرهای مبدأ و مقصد یک واریانت: (src_abs, variant_rel, variant_abs)
+    اگر فایل مبدأ وجود نداشته باشد None.
     """
-    if not upload_root or not rel_path or not _PIL_OK or width <= 0:
+    if not upload_root or not rel_path:
         return None
-
     src_abs = os.path.join(upload_root, rel_path)
     if not os.path.isfile(src_abs):
         return None
+    variant_rel, variant_abs = _variant_paths(upload_root, rel_path, folder, fmt.lower())
+    return src_abs, variant_rel, variant_abs
 
-    rel_variant, abs_variant = _variant_paths(upload_root, rel_path, folder, fmt.lower())
-    os.makedirs(os.path.dirname(abs_variant), exist_ok=True)
-
-    if os.path.isfile(abs_variant):
-        return rel_variant
 
+def render_variant(src_abs: str, abs_variant: str, width: int, quality: int, fmt: str = DEFAULT_FMT) -> Tuple[bool, float]:
+    """
+    Decode/resize/encode one variant (runs in a worker process).
+    Output is written to a temp file in the same folder and atomically renamed,
+    so readers never see a partial file. Returns (ok, seconds spent).
+    """
+    started = time.perf_counter()
+    pil = load_pil()
+    if pil is None or width <= 0:
+        return False, 0.0
+    os.makedirs(os.path.dirname(abs_variant), exist_ok=True)
     im = _safe_open_image(src_abs)
     if im is None:
-        return None
-
+        return False, time.perf_counter() - started
+    tmp = f"{abs_variant}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
     try:
-        im.thumbnail((width, width * 10_000), Image.LANCZOS)
-        im.save(abs_variant, format=fmt.upper(), quality=quality, optimize=True)
-        return rel_variant
+        im.thumbnail((width, width * 10_000), pil.Image.LANCZOS)
+        im.save(tmp, format=fmt.upper(), quality=quality, optimize=True)
+        os.replace(tmp, abs_variant)
+        return True, time.perf_counter() - started
     except Exception:
         try:
-            # Clean up partial files on failure
-            if os.path.isfile(abs_variant):
-                os.remove(abs_variant)
+            if os.path.isfile(tmp):
+                os.remove(tmp)
         except Exception:
             pass
+        return False, time.perf_counter() - started
+
+
+def generate_variant(upload_root: str, rel_path: str, width: int, quality: int, folder: str, fmt: str = DEFAULT_FMT) -> Optional[str]:
+    """
+    Create (or return existing) variant file synchronously and return its *relative* path from upload root.
+    برای درخواست‌های HTTP از app.services.image_variants استفاده شود (پردازش پس‌زمینه + single-flight).
+    """
+    if width <= 0 or load_pil() is None:
         return None
+    target = variant_target(upload_root, rel_path, folder, fmt)
+    if target is None:
+        return None
+    src_abs, rel_variant, abs_variant = target
+    if os.path.isfile(abs_variant):
+        return rel_variant
+    ok, _ = render_variant(src_abs, abs_variant, width, quality, fmt)
+    return rel_variant if ok else None
 
 
 def generate_thumb_and_full(upload_root: str, rel_path: str) -> Dict[str, Optional[str]]:
@@ -126,10 +222,11 @@ def generate_thumb_and_full(upload_root: str, rel_path: str) -> Dict[str, Option
     Generate both thumb and full variants, returning their relative paths.
     Keys: thumb_rel, full_rel
     """
-    return {
-        "thumb_rel": generate_variant(upload_root, rel_path, THUMB_WIDTH, THUMB_QUALITY, "thumb", DEFAULT_FMT),
-        "full_rel": generate_variant(upload_root, rel_path, FULL_WIDTH, FULL_QUALITY, "full", DEFAULT_FMT),
-    }
+    out: Dict[str, Optional[str]] = {}
+    for name in ("thumb", "full"):
+        _, w, q, folder = resolve_variant(preset=name)
+        out[f"{name}_rel"] = generate_variant(upload_root, rel_path, w, q, folder, DEFAULT_FMT)
+    return out
 
 
 def variant_headers_for_width(width: int) -> str:
@@ -146,14 +243,46 @@ def variant_headers_for_width(width: int) -> str:
     return "public, max-age=86400, stale-while-revalidate=86400"
 
 
-def prepare_variants_dict(url: str) -> Dict[str, str]:
+def preset_url(base_url: str, preset: str) -> str:
+    """URL یک preset برای آدرس پایهٔ آپلود."""
+    if not base_url or preset not in VARIANT_PRESETS:
+        return ""
+    return build_variant_url(base_url, VARIANT_PRESETS[preset], PRESET_QUALITY[preset], "webp", preset)
+
+
+def build_srcset(url: str, presets: Tuple[str, ...] = ("thumb", "card", "full", "2x")) -> str:
+    """srcset با توصیف‌گر عرض (``…?w=400… 400w, …``)؛ برای URLهای خارجی/استاتیک رشتهٔ خالی."""
+    base = normalize_upload_url(url)
+    if not base.startswith("/uploads/"):
+        return ""
+    return ", ".join(f"{preset_url(base, p)} {VARIANT_PRESETS[p]}w" for p in presets if p in VARIANT_PRESETS)
+
+
+def image_meta_for(item: Optional[Dict[str, Any]], path: Optional[str]) -> Dict[str, Any]:
+    """Ingest metadata of one stored image path from a listing's ``image_meta`` ({} if unknown)."""
+    meta = (item or {}).get("image_meta") if isinstance(item, dict) else None
+    if not isinstance(meta, dict) or not isinstance(path, str):
+        return {}
+    entry = meta.get(path)
+    return entry if isinstance(entry, dict) else {}
+
+
+def prepare_variants_dict(url: str, sizes: str = CARD_SIZES,
+                          meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
-    Convenience helper to build thumb/full URLs with query parameters for a given base upload URL.
+    Responsive set for a given base upload URL:
+    raw, one URL per preset (thumb/card/full/2x), plus ``srcset`` and ``sizes``.
+    ``width``/``height``/``placeholder``/``color`` come from ``meta`` (the image's
+    ``image_meta`` entry) and are None when the image predates ingest metadata.
     """
     base = normalize_upload_url(url)
-    return {
-        "raw": base,
-        "thumb": build_variant_url(base, THUMB_WIDTH, THUMB_QUALITY, "webp", "thumb") if base else "",
-        "full": build_variant_url(base, FULL_WIDTH, FULL_QUALITY, "webp", "full") if base else "",
-    }
-
+    out: Dict[str, Any] = {"raw": base}
+    resizable = base.startswith("/uploads/")
+    for name in VARIANT_PRESETS:
+        out[name] = preset_url(base, name) if resizable else base
+    out["srcset"] = build_srcset(base) if resizable else ""
+    out["sizes"] = sizes if resizable else ""
+    meta = meta or {}
+    for key in ("width", "height", "placeholder", "color"):
+        out[key] = meta.get(key)
+    return out
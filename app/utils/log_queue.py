@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Log queue – لاگ غیرمسدودکننده با صف، نرخ‌محدودسازی و نمونه‌برداری
+
+thread درخواست هیچ‌وقت منتظر دیسک/ترمینال نمی‌ماند:
+  - app.logger (و loggerهای ``app.*`` که به آن propagate می‌شوند) فقط یک ``QueueHandler``
+    دارد؛ ``put_nowait`` روی صف محدود. اگر صف پر باشد رکورد دور ریخته و شمرده می‌شود.
+  - یک ``QueueListener`` در thread پس‌زمینه رکوردها را به handlerهای واقعی می‌دهد (ترمینال،
+    فایل چرخشی run.py و ...). rotate فایل هم در همان thread انجام می‌شود.
+  - نرخ‌محدودسازی به ازای هر logger برای سطوح تا WARNING (token bucket)؛ ERROR و بالاتر همیشه
+    عبور می‌کنند. تعداد رکوردهای حذف‌شده روی رکورد بعدی همان logger (``suppressed``) می‌آید.
+  - نمونه‌برداری برای پیام‌های پرتکرار به ازای هر call site:
+        current_app.logger.debug("poll: %s", phone, extra=sampled(100))   # ۱ از هر ۱۰۰
+  - handlerهای فایل (``add_log_handler``) خطوط JSON ساخت‌یافته می‌نویسند:
+        {"ts": ..., "level": "INFO", "logger": "app", "msg": ..., "module": ..., "line": ...,
+         "method": "GET", "path": "/express/partner/api/check-status", "exc": ...}
+
+تنظیمات (app.config):
+  LOG_QUEUE_ENABLED    فعال/غیرفعال صف (پیش‌فرض True؛ False یعنی handlerها مثل قبل روی thread درخواست)
+  LOG_QUEUE_SIZE       ظرفیت صف (پیش‌فرض 10000)
+  LOG_RATE_LIMIT       رکورد در ثانیه برای هر logger (سطوح تا WARNING؛ 0 یعنی بدون محدودیت؛ پیش‌فرض 50)
+  LOG_RATE_BURST       ظرفیت burst همان bucket (پیش‌فرض 200)
+  LOG_FORMAT           قالب handlerهای افزوده‌شده با add_log_handler: json | text (پیش‌فرض json)
+"""
+from __future__ import annotations
+
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Tuple
+
+from flask import has_request_context, request
+
+from ..services.metrics import get_registry
+
+_TEXT_FORMAT = "[%(asctime)s] %(levelname)s in %(module)s: %(message)s"
+
+# خصیصه‌های استاندارد LogRecord؛ بقیه (extra) در خروجی JSON می‌آیند
+_RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'log_sample', 'suppressed', 'http_method', 'http_path',
+}
+
+
+def sampled(every: int) -> Dict[str, int]:
+    """extra برای نمونه‌برداری: از هر ``every`` فراخوانی همین خط فقط یکی ثبت می‌شود."""
+    return {'log_sample': max(1, int(every))}
+
+
+class JsonLineFormatter(logging.Formatter):
+    """هر رکورد یک خط JSON (UTF-8، بدون escape فارسی)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out: Dict[str, Any] = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+        }
+        method = getattr(record, 'http_method', None)
+        if method:
+            out['method'] = method
+            out['path'] = getattr(record, 'http_path', '')
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            out['suppressed'] = suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out['exc'] = record.exc_text
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and key not in out and not key.startswith('_'):
+                out[key] = value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+        return json.dumps(out, ensure_ascii=False)
+
+
+class RateLimitSampler(logging.Filter):
+    """نمونه‌برداری call siteها و token bucket به ازای هر logger (روی thread فراخواننده؛ فقط شمارنده)."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        super().__init__()
+        self.rate = float(rate)
+        self.burst = float(max(1, burst))
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, list] = {}  # name → [tokens, updated, suppressed]
+        self._sites: Dict[Tuple[str, int], itertools.count] = {}
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, 'log_sample', 1)
+        if every > 1:
+            site = (record.pathname, record.lineno)
+            counter = self._sites.get(site)
+            if counter is None:
+                counter = self._sites.setdefault(site, itertools.count())
+            if next(counter) % every:
+                self.sampled_out += 1
+                return False
+        if self.rate <= 0 or record.levelno >= logging.ERROR:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = self._buckets[record.name] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.dropped += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler با صف محدود: هرگز block نمی‌شود؛ پیام و traceback روی thread فراخواننده ساخته می‌شوند."""
+
+    def __init__(self, q: queue.Queue) -> None:
+        super().__init__(q)
+        self.overflow = 0
+        self.listener: Optional[_Listener] = None
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.overflow += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # args ممکن است اشیای mutable درخواست باشند؛ پیام همین‌جا ثابت می‌شود
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if has_request_context():
+            record.http_method = request.method
+            record.http_path = request.path
+        return record
+
+
+class _Listener(QueueListener):
+    """QueueListener که handlerهایش بعد از start هم قابل افزودن است و بعد از fork دوباره راه می‌افتد."""
+
+    def add_handler(self, handler: logging.Handler) -> None:
+        self.handlers = tuple(self.handlers) + (handler,)
+
+    def restart_after_fork(self, queue_handler: NonBlockingQueueHandler) -> None:
+        # thread writer به پردازهٔ فرزند (Passenger smart spawning / gunicorn --preload) نمی‌رسد
+        fresh: queue.Queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.queue = queue_handler.queue = fresh
+        self._thread = None
+        self.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        try:
+            super().stop()
+        except queue.Full:
+            pass
+
+    def handle(self, record: logging.LogRecord) -> None:
+        try:
+            super().handle(record)
+        except Exception:
+            pass
+
+
+# listenerهای فعال این پردازه؛ hook fork و atexit یک بار (در سطح ماژول) روی همین فهرست کار می‌کنند
+_LIVE: Dict[int, Tuple[_Listener, NonBlockingQueueHandler]] = {}
+_LIVE_LOCK = threading.Lock()
+
+
+def _restart_listeners_after_fork() -> None:
+    for listener, queue_handler in list(_LIVE.values()):
+        listener.restart_after_fork(queue_handler)
+
+
+def _stop_listeners() -> None:
+    for listener, _ in list(_LIVE.values()):
+        listener.stop()
+
+
+atexit.register(_stop_listeners)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listeners_after_fork)
+
+
+def effective_handlers(logger: logging.Logger) -> list:
+    """handlerهای logger با احتساب handlerهای پشت صف (برای بررسی «handler از قبل هست؟»)."""
+    out = []
+    for handler in logger.handlers:
+        listener = getattr(handler, 'listener', None) if isinstance(handler, NonBlockingQueueHandler) else None
+        out.extend(listener.handlers if listener is not None else (handler,))
+    return out
+
+
+def _unwrap_handlers(logger: logging.Logger) -> list:
+    """
+    handlerهای واقعی logger. ``app.logger`` برای همهٔ appهای پردازه همان ``logging.getLogger('app')``
+    است؛ اگر app قبلی صف گذاشته باشد، به‌جای زنجیر کردن صف روی صف، handlerهای اصلی پشت آن برداشته
+    و listener قبلی (پس از خالی شدن صفش) متوقف می‌شود.
+    """
+    handlers = []
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        if isinstance(handler, NonBlockingQueueHandler):
+            listener = handler.listener
+            if listener is not None:
+                listener.stop()
+                with _LIVE_LOCK:
+                    _LIVE.pop(id(listener), None)
+                handlers.extend(h for h in listener.handlers if h not in handlers)
+        elif handler not in handlers:
+            handlers.append(handler)
+    return handlers
+
+
+def init_log_queue(app) -> None:
+    """جایگزینی handlerهای app.logger با QueueHandler و شروع writer پس‌زمینه (یک بار برای هر app)."""
+    if 'log_queue' in app.extensions:
+        return
+    logger = app.logger
+    sampler = RateLimitSampler(
+        rate=float(app.config.get('LOG_RATE_LIMIT', 50) or 0),
+        burst=int(app.config.get('LOG_RATE_BURST', 200) or 200),
+    )
+    get_registry().register_collector('logging', lambda: log_queue_stats(app))
+    if not app.config.get('LOG_QUEUE_ENABLED', True):
+        for handler in logger.handlers:
+            handler.addFilter(sampler)
+        app.extensions['log_queue'] = {'handler': None, 'listener': None, 'sampler': sampler}
+        return
+
+    handlers = _unwrap_handlers(logger)
+    q: queue.Queue = queue.Queue(maxsize=int(app.config.get('LOG_QUEUE_SIZE', 10000) or 10000))
+    queue_handler = NonBlockingQueueHandler(q)
+    queue_handler.addFilter(sampler)
+    listener = _Listener(q, *handlers, respect_handler_level=True)
+    queue_handler.listener = listener
+    listener.start()
+    with _LIVE_LOCK:
+        _LIVE[id(listener)] = (listener, queue_handler)
+    logger.addHandler(queue_handler)
+    app.extensions['log_queue'] = {'handler': queue_handler, 'listener': listener, 'sampler': sampler}
+
+
+def add_log_handler(app, handler: logging.Handler, json_lines: Optional[bool] = None) -> None:
+    """افزودن handler (مثلاً فایل چرخشی) پشت صف؛ بدون صف مستقیماً روی app.logger."""
+    if json_lines is None:
+        json_lines = str(app.config.get('LOG_FORMAT', 'json')).lower() == 'json'
+    handler.setFormatter(JsonLineFormatter() if json_lines else logging.Formatter(_TEXT_FORMAT))
+    state = app.extensions.get('log_queue') or {}
+    listener = state.get('listener')
+    if listener is not None:
+        listener.add_handler(handler)
+    else:
+        if state.get('sampler') is not None:
+            handler.addFilter(state['sampler'])
+        app.logger.addHandler(handler)
+
+
+def log_queue_stats(app) -> Dict[str, int]:
+    state = app.extensions.get('log_queue') or {}
+    handler, sampler = state.get('handler'), state.get('sampler')
+    return {
+        'queued': handler.queue.qsize() if handler is not None else 0,
+        'overflow_dropped': handler.overflow if handler is not None else 0,
+        'rate_limited': sampler.dropped if sampler is not None else 0,
+        'sampled_out': sampler.sampled_out if sampler is not None else 0,
+    }
+
+
+__all__ = [
+    'sampled', 'JsonLineFormatter', 'RateLimitSampler', 'NonBlockingQueueHandler',
+    'init_log_queue', 'add_log_handler', 'log_queue_stats', 'effective_handlers',
+]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+دسته‌بندی اعلانی routeها – مسیر سریع برای فایل‌های static و media
+
+هر درخواست در یکی از این دسته‌ها قرار می‌گیرد:
+  static   فایل‌های /static، sw.js و manifestها
+  media    /uploads/<path> (تصاویر، ویدئو و مدارک آپلودی)
+  api      /api/*
+  admin    /admin/*
+  html     بقیهٔ صفحات
+
+برای static و media (``LIGHTWEIGHT``) کار اضافهٔ هر درخواست حذف می‌شود:
+  - session نه از کوکی خوانده می‌شود (بدون بررسی امضا) و نه ذخیره (بدون ``Set-Cookie`` و ``Vary: Cookie``)
+  - کوکی XSRF-TOKEN ساخته نمی‌شود، landing_gate و hookهای ردیابی آنلاین اجرا نمی‌شوند
+پاسخ تصاویر بدون کوکی، توسط proxy/CDN هم قابل کش است.
+
+دسته از روی endpoint (دکوریتور ``route_class`` روی view) و در نبود آن از پیشوند مسیر تعیین می‌شود.
+session قبل از تطبیق URL باز می‌شود؛ در آن لحظه فقط پیشوند مسیر ملاک است و endpointهای اعلانی
+خارج از این پیشوندها (مثل /express/partner/sw.js) فقط از ذخیرهٔ session معاف می‌شوند.
+
+تنظیمات (app.config):
+  ROUTE_FAST_PATH   فعال/غیرفعال کردن مسیر سریع (پیش‌فرض True)
+"""
+from __future__ import annotations
+
+from typing import Callable, Dict, Optional
+
+from flask import current_app, request
+from flask.sessions import SecureCookieSessionInterface
+
+STATIC = 'static'
+MEDIA = 'media'
+API = 'api'
+ADMIN = 'admin'
+HTML = 'html'
+LIGHTWEIGHT = frozenset({STATIC, MEDIA})
+
+_ENVIRON_KEY = 'vinor.route_class'
+
+
+def route_class(kind: str) -> Callable:
+    """Decorator اعلان دستهٔ یک view: ``@route_class(MEDIA)`` (زیر دکوریتور route قرار می‌گیرد)."""
+    def decorator(fn):
+        fn.route_class = kind
+        return fn
+    return decorator
+
+
+def _path_prefixes(app):
+    prefixes = app.extensions.get('route_class_prefixes')
+    if prefixes is None:
+        static = (app.static_url_path or '/static').rstrip('/') + '/'
+        prefixes = ((static, STATIC), ('/uploads/', MEDIA), ('/api/', API), ('/admin', ADMIN))
+        app.extensions['route_class_prefixes'] = prefixes
+    return prefixes
+
+
+def classify_path(path: str, app=None) -> str:
+    app = app or current_app
+    for prefix, kind in _path_prefixes(app):
+        if path.startswith(prefix):
+            return kind
+    return HTML
+
+
+def classify_endpoint(endpoint: Optional[str], app=None) -> Optional[str]:
+    """دستهٔ اعلان‌شده روی view (یک بار برای هر endpoint محاسبه و کش می‌شود)."""
+    if not endpoint:
+        return None
+    app = app or current_app
+    cache: Dict[str, Optional[str]] = app.extensions.setdefault('route_class_endpoints', {})
+    try:
+        return cache[endpoint]
+    except KeyError:
+        pass
+    if endpoint == 'static' or endpoint.endswith('.static'):
+        kind = STATIC
+    else:
+        kind = getattr(app.view_functions.get(endpoint), 'route_class', None)
+    cache[endpoint] = kind
+    return kind
+
+
+def current_route_class() -> str:
+    """دستهٔ درخواست جاری؛ پس از تطبیق URL روی environ کش می‌شود."""
+    environ = request.environ
+    kind = environ.get(_ENVIRON_KEY)
+    if kind is not None:
+        return kind
+    rule = request.url_rule
+    kind = classify_endpoint(rule.endpoint if rule is not None else None) or classify_path(request.path)
+    if rule is not None or request.routing_exception is not None:
+        environ[_ENVIRON_KEY] = kind
+    return kind
+
+
+def is_lightweight() -> bool:
+    """static/media و مسیر سریع فعال → hookهای session/CSRF/gate/tracking رد می‌شوند."""
+    if not current_app.config.get('ROUTE_FAST_PATH', True):
+        return False
+    return current_route_class() in LIGHTWEIGHT
+
+
+class RouteAwareSessionInterface(SecureCookieSessionInterface):
+    """session کوکی معمول Flask؛ برای static/media نه خوانده و نه ذخیره می‌شود."""
+
+    def open_session(self, app, request):
+        if app.config.get('ROUTE_FAST_PATH', True) and classify_path(request.path, app) in LIGHTWEIGHT:
+            return self.session_class()
+        return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        if is_lightweight():
+            return
+        return super().save_session(app, session, response)
+
+
+__all__ = [
+    'STATIC', 'MEDIA', 'API', 'ADMIN', 'HTML', 'LIGHTWEIGHT', 'route_class', 'classify_path',
+    'classify_endpoint', 'current_route_class', 'is_lightweight', 'RouteAwareSessionInterface',
+]
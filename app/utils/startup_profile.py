@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Startup profile – زمان‌سنجی importها و مراحل create_app (cold start)
+
+با ``VINOR_STARTUP_PROFILE=1`` در environment، create_app:
+  - هر import جدید (ماژولی که هنوز در sys.modules نیست) را با زمان inclusive و عمق ثبت می‌کند
+  - بین مراحل (config، فیلترها، manifest، DB، بلوپرینت‌ها، قالب‌ها، ...) checkpoint می‌گذارد
+  - در پایان گزارش را در لاگ می‌نویسد و در ``app.extensions['startup_profile']`` نگه می‌دارد
+
+بدون این متغیر ``begin()`` یک نمونهٔ بی‌اثر برمی‌گرداند و هزینه‌ای ندارد.
+importهای قبل از create_app (خود پکیج app و flask) در این گزارش نیستند؛ برای آن‌ها
+``python -X importtime`` یا ``scripts/bench_cold_start.py --profile`` را ببینید.
+"""
+from __future__ import annotations
+
+import builtins
+import os
+import sys
+import time
+from importlib.util import resolve_name
+from typing import Any, Dict, List, Optional, Tuple
+
+ENV_FLAG = 'VINOR_STARTUP_PROFILE'
+
+
+class StartupProfile:
+    enabled = True
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.steps: List[Tuple[str, float]] = []
+        self.imports: List[Tuple[str, float, int]] = []
+        self._depth = 0
+        self._original_import = None
+
+    # -------- importها --------
+    def _install(self) -> None:
+        original = builtins.__import__
+        self._original_import = original
+        profile = self
+
+        def profiled_import(name, globals=None, locals=None, fromlist=(), level=0):
+            full = name
+            if level and globals:
+                try:
+                    full = resolve_name('.' * level + name, globals.get('__package__') or '')
+                except (ImportError, ValueError):
+                    pass
+            if full in sys.modules:
+                return original(name, globals, locals, fromlist, level)
+            depth = profile._depth
+            profile._depth += 1
+            t0 = time.perf_counter()
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                profile._depth = depth
+                profile.imports.append((full, time.perf_counter() - t0, depth))
+
+        builtins.__import__ = profiled_import
+
+    def _uninstall(self) -> None:
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    # -------- مراحل --------
+    def mark(self, step: str) -> None:
+        """پایان یک مرحله: زمان از checkpoint قبلی به نام این مرحله ثبت می‌شود."""
+        now = time.perf_counter()
+        self.steps.append((step, now - self._last))
+        self._last = now
+
+    def finish(self, app) -> Dict[str, Any]:
+        self._uninstall()
+        report = self.report()
+        app.extensions['startup_profile'] = report
+        app.logger.info("Startup profile:\n%s", format_report(report))
+        return report
+
+    def report(self, top: int = 15) -> Dict[str, Any]:
+        slowest = sorted(self.imports, key=lambda item: item[1], reverse=True)[:top]
+        return {
+            'total_ms': round((self._last - self.started) * 1000, 1),
+            'steps': [{'step': name, 'ms': round(sec * 1000, 1)} for name, sec in self.steps],
+            'imports': [
+                {'module': name, 'ms': round(sec * 1000, 1), 'depth': depth} for name, sec, depth in slowest
+            ],
+            'imports_total_ms': round(sum(sec for _, sec, depth in self.imports if depth == 0) * 1000, 1),
+            'modules_loaded': len(self.imports),
+        }
+
+
+class _NullProfile:
+    enabled = False
+
+    def mark(self, step: str) -> None:
+        pass
+
+    def finish(self, app) -> None:
+        return None
+
+
+def begin() -> Any:
+    """شروع پروفایل در ابتدای create_app (فقط با VINOR_STARTUP_PROFILE=1)."""
+    if os.environ.get(ENV_FLAG, '') not in ('1', 'true', 'yes'):
+        return _NullProfile()
+    profile = StartupProfile()
+    profile._install()
+    return profile
+
+
+def format_report(report: Optional[Dict[str, Any]]) -> str:
+    if not report:
+        return ''
+    lines = [f"  create_app total: {report['total_ms']:.1f} ms"]
+    for item in report['steps']:
+        lines.append(f"    {item['step']:<28} {item['ms']:>8.1f} ms")
+    lines.append(
+        f"  imports during create_app: {report['imports_total_ms']:.1f} ms "
+        f"({report['modules_loaded']} modules), slowest (inclusive):"
+    )
+    for item in report['imports']:
+        lines.append(f"    {'  ' * item['depth']}{item['module']:<{44 - 2 * item['depth']}} {item['ms']:>8.1f} ms")
+    return '\n'.join(lines)
+
+
+__all__ = ['ENV_FLAG', 'StartupProfile', 'begin', 'format_report']
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Static asset manifest – fingerprint محتوایی فایل‌های static برای URLهای cache-busting
+
+- یک بار در startup (یا با ``scripts/build_static_manifest.py`` در زمان build) همهٔ فایل‌های
+  ``app/static`` و ``admin/static`` هش (SHA-256، ۱۲ کاراکتر اول) می‌شوند؛ جست‌وجو در حافظه است،
+  بدون stat یا خواندن فایل در هر render
+- ``url_for('static', filename=...)`` به‌صورت خودکار ``?v=<hash>`` می‌گیرد (``app.url_defaults``)؛
+  چون هش از محتواست، deploy بدون تغییر فایل URL و کش مرورگر را باطل نمی‌کند
+- درخواست static با ``v`` برابر هش فعلی → ``Cache-Control: immutable`` یک‌ساله؛ بقیه مثل قبل revalidate
+- manifest ذخیره‌شده هنگام بارگذاری با size/mtime فایل‌ها مقایسه می‌شود و فقط فایل‌های تغییرکرده
+  دوباره هش می‌شوند (manifest کهنه هرگز هش غلط نمی‌دهد)
+- حالت dev: یک thread پس‌زمینه با polling (بدون وابستگی اضافه) تغییرات را دنبال می‌کند
+
+تنظیمات (app.config):
+  STATIC_MANIFEST_PATH             مسیر فایل manifest (پیش‌فرض <instance>/data/static_manifest.json)
+  STATIC_MANIFEST_WATCH            پایش تغییرات فایل‌ها (پیش‌فرض: فقط در debug)
+  STATIC_MANIFEST_WATCH_INTERVAL   فاصلهٔ polling به ثانیه (پیش‌فرض 1.0)
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+HASH_LENGTH = 12
+DEFAULT_WATCH_INTERVAL = 1.0
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_SKIP_DIRS = {'__pycache__', 'uploads', '__variants__'}
+# نسخه‌های از پیش فشرده (scripts/precompress_static.py) جزو manifest نیستند
+_SKIP_SUFFIXES = ('.gz', '.br', '.tmp')
+
+
+def _file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(256 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()[:HASH_LENGTH]
+
+
+class StaticManifest:
+    """namespace ('static' / 'admin') → {مسیر نسبی: {'hash', 'size', 'mtime'}}"""
+
+    def __init__(self, roots: Dict[str, str], path: Optional[str] = None):
+        self.roots = {ns: root for ns, root in roots.items() if root}
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Dict[str, Any]]] = {ns: {} for ns in self.roots}
+        self._stats = {'hashed': 0, 'reused': 0, 'built_at': 0.0, 'build_seconds': 0.0, 'refreshes': 0}
+        self._watcher: Optional[threading.Thread] = None
+
+    # ---------- ساخت ----------
+    def _walk(self, root: str):
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in _SKIP_DIRS and not d.startswith('.')]
+            for fn in filenames:
+                if fn.startswith('.') or fn.endswith(_SKIP_SUFFIXES):
+                    continue
+                abs_path = os.path.join(dirpath, fn)
+                yield os.path.relpath(abs_path, root).replace(os.sep, '/'), abs_path
+
+    def _scan(self, previous: Dict[str, Dict[str, Dict[str, Any]]]) -> Tuple[Dict[str, Dict[str, Dict[str, Any]]], int, int]:
+        entries: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        hashed = reused = 0
+        for ns, root in self.roots.items():
+            out: Dict[str, Dict[str, Any]] = {}
+            old = previous.get(ns) or {}
+            for rel, abs_path in self._walk(root):
+                try:
+                    st = os.stat(abs_path)
+                except OSError:
+                    continue
+                prev = old.get(rel)
+                if prev and prev.get('size') == st.st_size and prev.get('mtime') == st.st_mtime:
+                    out[rel] = prev
+                    reused += 1
+                    continue
+                try:
+                    out[rel] = {'hash': _file_hash(abs_path), 'size': st.st_size, 'mtime': st.st_mtime}
+                    hashed += 1
+                except OSError:
+                    continue
+            entries[ns] = out
+        return entries, hashed, reused
+
+    def build(self, reuse: bool = True) -> Dict[str, Any]:
+        """ساخت/به‌روزرسانی manifest؛ فایل‌های بدون تغییر (size/mtime) از manifest ذخیره‌شده برداشته می‌شوند."""
+        started = time.perf_counter()
+        previous = self._entries
+        if reuse and not any(previous.values()) and self.path:
+            previous = self._read(self.path)
+        entries, hashed, reused = self._scan(previous if reuse else {})
+        with self._lock:
+            self._entries = entries
+            self._stats.update(hashed=hashed, reused=reused, built_at=time.time(),
+                               build_seconds=round(time.perf_counter() - started, 4))
+        return self.stats()
+
+    def refresh(self) -> int:
+        """بررسی stat همهٔ فایل‌ها و هش دوبارهٔ تغییرکرده‌ها (watcher)؛ خروجی: تعداد تغییرات."""
+        entries, hashed, _ = self._scan(self._entries)
+        changed = hashed + sum(
+            len(set(self._entries.get(ns, {})) - set(entries.get(ns, {}))) for ns in self.roots
+        )
+        if changed:
+            with self._lock:
+                self._entries = entries
+                self._stats['refreshes'] += 1
+        return changed
+
+    # ---------- ذخیره ----------
+    @staticmethod
+    def _read(path: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            files = data.get('files') if isinstance(data, dict) else None
+            return files if isinstance(files, dict) else {}
+        except Exception:
+            return {}
+
+    def save(self, path: Optional[str] = None) -> Optional[str]:
+        path = path or self.path
+        if not path:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with self._lock:
+            payload = {'generated_at': int(time.time()), 'files': self._entries}
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, path)
+        return path
+
+    # ---------- جست‌وجو ----------
+    def fingerprint(self, filename: Optional[str], ns: str = 'static') -> Optional[str]:
+        if not filename:
+            return None
+        entry = self._entries.get(ns, {}).get(str(filename).lstrip('/'))
+        return entry['hash'] if entry else None
+
+    def is_fingerprinted(self, filename: Optional[str], version: Optional[str], ns: str = 'static') -> bool:
+        return bool(version) and version == self.fingerprint(filename, ns)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out['files'] = {ns: len(v) for ns, v in self._entries.items()}
+        out['watching'] = bool(self._watcher and self._watcher.is_alive())
+        return out
+
+    # ---------- dev watcher ----------
+    def start_watcher(self, interval: float = DEFAULT_WATCH_INTERVAL, logger=None) -> None:
+        if self._watcher and self._watcher.is_alive():
+            return
+
+        def _loop():
+            while True:
+                time.sleep(max(0.2, interval))
+                try:
+                    changed = self.refresh()
+                    if changed and logger:
+                        logger.info("Static manifest refreshed (%d changed files)", changed)
+                except Exception:
+                    if logger:
+                        logger.debug("Static manifest refresh failed", exc_info=True)
+
+        self._watcher = threading.Thread(target=_loop, name='static-manifest-watch', daemon=True)
+        self._watcher.start()
+
+
+def manifest_roots(app) -> Dict[str, str]:
+    admin_static = os.path.join(os.path.dirname(app.root_path), 'admin', 'static')
+    return {
+        'static': app.static_folder or '',
+        'admin': admin_static if os.path.isdir(admin_static) else '',
+    }
+
+
+def manifest_path(app) -> str:
+    if app.config.get('STATIC_MANIFEST_PATH'):
+        return app.config['STATIC_MANIFEST_PATH']
+    from .storage import data_dir
+    return os.path.join(data_dir(app), 'static_manifest.json')
+
+
+def get_static_manifest(app=None) -> StaticManifest:
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    manifest = app.extensions.get('static_manifest')
+    if manifest is None:
+        manifest = StaticManifest(manifest_roots(app), manifest_path(app))
+        app.extensions['static_manifest'] = manifest
+    return manifest
+
+
+def init_static_manifest(app) -> StaticManifest:
+    """ساخت manifest در startup، اتصال به url_for('static') و (در dev) شروع watcher."""
+    manifest = get_static_manifest(app)
+    try:
+        manifest.build()
+        if manifest.stats()['hashed']:
+            manifest.save()
+    except Exception:
+        app.logger.warning("Static manifest build failed; static URLs stay unversioned", exc_info=True)
+
+    @app.url_defaults
+    def _static_fingerprint(endpoint, values):
+        if endpoint == 'static' and 'v' not in values:
+            fp = manifest.fingerprint(values.get('filename'))
+            if fp:
+                values['v'] = fp
+
+    watch = app.config.get('STATIC_MANIFEST_WATCH')
+    if watch is None:
+        watch = app.debug
+    if watch:
+        manifest.start_watcher(float(app.config.get('STATIC_MANIFEST_WATCH_INTERVAL') or DEFAULT_WATCH_INTERVAL),
+                               logger=app.logger)
+    return manifest
+
+
+__all__ = [
+    'StaticManifest', 'get_static_manifest', 'init_static_manifest', 'manifest_roots', 'manifest_path',
+    'IMMUTABLE_CACHE_CONTROL',
+]
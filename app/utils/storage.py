@@ -1,6 +1,7 @@
 # app/utils/storage.py
-import os, json, shutil, logging
+import os, json, time, shutil, logging
 from flask import current_app
+from ..services.metrics import record_cache, record_storage_io
 
 _log = logging.getLogger(__name__)
 
@@ -116,17 +117,58 @@ def migrate_legacy(app=None):
             pass
 
 # -------- IO ساده JSON --------
+# هر load/save در متریک‌ها ثبت می‌شود (تعداد، بایت و زمان به تفکیک فایل؛ app.services.metrics)
 def _load(path):
     if os.path.exists(path):
+        started = time.perf_counter()
         with open(path, 'r', encoding='utf-8') as f:
-            try:    return json.load(f)
-            except: return []
+            try:    data = json.load(f)
+            except: data = []
+            record_storage_io(path, 'load', os.fstat(f.fileno()).st_size, time.perf_counter() - started)
+        return data
     return []
 
 def _save(path, data):
     os.makedirs(os.path.dirname(path), exist_ok=True)
+    started = time.perf_counter()
     with open(path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+        nbytes = f.tell()
+    record_storage_io(path, 'save', nbytes, time.perf_counter() - started)
+
+# -------- نسخهٔ فایل‌ها (ETag / conditional GET) --------
+# نام منطقی مجموعه → (کلید config، نام فایل)؛ همان مسیرهایی که load_*/save_* استفاده می‌کنند
+STORAGE_FILES = {
+    'lands': ('LANDS_FILE', 'lands.json'),
+    'settings': ('SETTINGS_FILE', 'settings.json'),
+    'notifications': ('NOTIFICATIONS_FILE', 'notifications.json'),
+    'express_partners': ('EXPRESS_PARTNERS_FILE', 'express_partners.json'),
+    'express_partner_apps': ('EXPRESS_PARTNER_APPS_FILE', 'express_partner_applications.json'),
+    'express_assignments': ('EXPRESS_ASSIGNMENTS_FILE', 'express_assignments.json'),
+    'express_commissions': ('EXPRESS_COMMISSIONS_FILE', 'express_commissions.json'),
+    'express_reposts': ('EXPRESS_REPOSTS_FILE', 'express_reposts.json'),
+    'partner_routines': ('EXPRESS_PARTNER_ROUTINES_FILE', 'express_partner_routines.json'),
+    'partner_bank_accounts': ('EXPRESS_PARTNER_BANK_ACCOUNTS_FILE', 'express_partner_bank_accounts.json'),
+}
+
+def storage_path(name, app=None):
+    """مسیر فایل یک مجموعه بدون ساختن آن (برخلاف ensure_file)."""
+    app = _resolve_app(app)
+    config_key, filename = STORAGE_FILES[name]
+    if app is not None and app.config.get(config_key):
+        return app.config[config_key]
+    return os.path.join(data_dir(app), filename)
+
+def storage_version(name, app=None):
+    """
+    نسخهٔ فعلی فایل یک مجموعه: «mtime_ns-size» به hex (فایل ناموجود: «0»).
+    فقط یک stat؛ چون از خود فایل می‌آید بین workerها یکسان است و هر save آن را عوض می‌کند.
+    """
+    try:
+        st = os.stat(storage_path(name, app))
+    except OSError:
+        return '0'
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
 
 # فایل‌های دامنه
 _ADS_CACHE = {"path": None, "mtime": None, "size": None, "data": None}
@@ -148,7 +190,9 @@ def load_ads_cached(app=None):
 
     c = _ADS_CACHE
     if c["path"] == path and c["mtime"] == mtime and c["size"] == size and c["data"] is not None:
+        record_cache('ads', True)
         return c["data"]
+    record_cache('ads', False)
 
     data = _load(path)
     _ADS_CACHE.update({"path": path, "mtime": mtime, "size": size, "data": data})
@@ -170,7 +214,9 @@ def load_express_lands_cached(app=None):
 
     c = _EXPRESS_LANDS_CACHE
     if c["path"] == path and c["mtime"] == mtime and c["size"] == size and c["data"] is not None:
+        record_cache('express_lands', True)
         return c["data"]
+    record_cache('express_lands', False)
 
     # بارگذاری و فیلتر کردن فایل‌های اکسپرس
     all_lands = load_ads_cached(app)
@@ -229,24 +275,49 @@ def save_users(items, app=None): return _save(ensure_file('USERS_FILE','users.js
 def load_consults(app=None):        return _load(ensure_file('CONSULTS_FILE','consults.json',[],app))
 def save_consults(items, app=None): return _save(ensure_file('CONSULTS_FILE','consults.json',[],app), items)
 
-def load_settings(app=None):  
-    default_settings = {
-        "approval_method": "manual",
-        "show_submit_button": True,
-        "ad_expiry_days": 30,
-        "android_apk_url": "",
-        "android_apk_version": "",
-        "android_apk_updated_at": "",
-        "android_apk_size_bytes": "",
-        "android_apk_sha256": "",
-        "android_apk_original_name": "",
-        "sms_line_number": "300089930616",
-        "partner_application_sms_message": "درخواست همکاری شما ثبت شد و در حال بررسی است. وینور",
-        "partner_approval_sms_message": "پنل همکاری وینور برای شما فعال شد. وینور",
-        "partner_application_admin_phone": "09121471301",
-        "partner_application_admin_sms_message": "درخواست همکاری جدید همکار در وینور ثبت شد.",
-    }
-    return _load(ensure_file('SETTINGS_FILE','settings.json',default_settings,app))
+_DEFAULT_SETTINGS = {
+    "approval_method": "manual",
+    "show_submit_button": True,
+    "ad_expiry_days": 30,
+    "android_apk_url": "",
+    "android_apk_version": "",
+    "android_apk_updated_at": "",
+    "android_apk_size_bytes": "",
+    "android_apk_sha256": "",
+    "android_apk_original_name": "",
+    "sms_line_number": "300089930616",
+    "partner_application_sms_message": "درخواست همکاری شما ثبت شد و در حال بررسی است. وینور",
+    "partner_approval_sms_message": "پنل همکاری وینور برای شما فعال شد. وینور",
+    "partner_application_admin_phone": "09121471301",
+    "partner_application_admin_sms_message": "درخواست همکاری جدید همکار در وینور ثبت شد.",
+}
+
+def load_settings(app=None):
+    return _load(ensure_file('SETTINGS_FILE','settings.json',_DEFAULT_SETTINGS,app))
+
+_SETTINGS_CACHE = {"path": None, "mtime": None, "size": None, "data": None}
+
+def load_settings_cached(app=None):
+    """تنظیمات با کش mtime/size (فقط‌خواندنی؛ برای context قالب‌ها و خواندن‌های پرتکرار)."""
+    app = _resolve_app(app)
+    path = ensure_file('SETTINGS_FILE','settings.json',_DEFAULT_SETTINGS,app)
+    try:
+        st = os.stat(path)
+        mtime = st.st_mtime_ns if hasattr(st, 'st_mtime_ns') else int(st.st_mtime * 1e9)
+        size = st.st_size
+    except Exception:
+        mtime = None
+        size = None
+
+    c = _SETTINGS_CACHE
+    if c["path"] == path and c["mtime"] == mtime and c["size"] == size and c["data"] is not None:
+        record_cache('settings', True)
+        return c["data"]
+    record_cache('settings', False)
+
+    data = load_settings(app)
+    _SETTINGS_CACHE.update({"path": path, "mtime": mtime, "size": size, "data": data})
+    return data
 
 # شهرهای فعال برای همکاری
 def load_active_cities(app=None):        return _load(ensure_file('ACTIVE_CITIES_FILE','active_cities.json',["تهران", "کرج", "اصفهان", "شیراز", "مشهد", "تبریز"],app))
@@ -269,7 +340,15 @@ def save_consultants(items, app=None):    return _save(ensure_file('CONSULTANTS_
 def load_express_partner_apps(app=None):   return _load(ensure_file('EXPRESS_PARTNER_APPS_FILE','express_partner_applications.json',[],app))
 def save_express_partner_apps(items, app=None): return _save(ensure_file('EXPRESS_PARTNER_APPS_FILE','express_partner_applications.json',[],app), items)
 def load_express_partners(app=None):       return _load(ensure_file('EXPRESS_PARTNERS_FILE','express_partners.json',[],app))
-def save_express_partners(items, app=None): return _save(ensure_file('EXPRESS_PARTNERS_FILE','express_partners.json',[],app), items)
+def save_express_partners(items, app=None):
+    path = ensure_file('EXPRESS_PARTNERS_FILE','express_partners.json',[],app)
+    from ..services import events
+    try:
+        events.publish_partner_changes(items, lambda: _load(path))
+    except Exception:
+        pass
+    _save(path, items)
+    events.note_write(path)
 def load_express_reposts(app=None):        return _load(ensure_file('EXPRESS_REPOSTS_FILE','express_reposts.json',[],app))
 def save_express_reposts(items, app=None): return _save(ensure_file('EXPRESS_REPOSTS_FILE','express_reposts.json',[],app), items)
 
@@ -301,7 +380,9 @@ def load_express_commissions_cached(app=None):
         size = None
     c = _COMMISSIONS_CACHE
     if c["path"] == path and c["mtime"] == mtime and c["size"] == size and c["data"] is not None:
+        record_cache('express_commissions', True)
         return c["data"]
+    record_cache('express_commissions', False)
     data = _load(path)
     _COMMISSIONS_CACHE.update({"path": path, "mtime": mtime, "size": size, "data": data})
     return data
@@ -325,9 +406,10 @@ def load_partner_bank_accounts(app=None):
 def save_partner_bank_accounts(items, app=None):
     return _save(ensure_file('EXPRESS_PARTNER_BANK_ACCOUNTS_FILE', 'express_partner_bank_accounts.json', [], app), items)
 
-# SMS History
-def load_sms_history(app=None):    return _load(ensure_file('SMS_HISTORY_FILE','sms_history.json',[],app))
-def save_sms_history(items, app=None): return _save(ensure_file('SMS_HISTORY_FILE','sms_history.json',[],app), items)
+# SMS History (append-only؛ نوشتن فقط از طریق app.services.sms_history.record_sms)
+def load_sms_history(app=None):
+    from ..services.sms_history import get_sms_history_sink
+    return get_sms_history_sink(app).all()
 
 # Landing Page Views Statistics
 def load_landing_views(app=None):    return _load(ensure_file('LANDING_VIEWS_FILE','landing_views.json',[],app))
@@ -361,7 +443,9 @@ def load_partner_routines_cached(app=None):
 
     c = _ROUTINES_CACHE
     if c["path"] == path and c["mtime"] == mtime and c["size"] == size and c["data"] is not None:
+        record_cache('partner_routines', True)
         return c["data"]
+    record_cache('partner_routines', False)
 
     data = _load(path)
     _ROUTINES_CACHE.update({"path": path, "mtime": mtime, "size": size, "data": data})
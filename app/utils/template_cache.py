@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Template cache – حالت production قالب‌ها: bytecode cache، بدون auto-reload و precompile در startup
+
+- TEMPLATES_AUTO_RELOAD به‌صورت پیش‌فرض از app.debug پیروی می‌کند؛ در production Jinja در هر render
+  فایل قالب و partialها را stat نمی‌کند (``python run.py`` با debug=True همچنان reload دارد)
+- ``FileSystemBytecodeCache`` در ``<instance>/jinja_cache``: کد کامپایل‌شدهٔ هر قالب (کلید: نام + checksum
+  منبع) بین workerها و ری‌استارت‌ها مشترک است؛ قالب تغییرکرده خودبه‌خود دوباره کامپایل می‌شود
+- warm-up: همهٔ قالب‌های app/templates، express_partner/templates و admin/templates (loader همهٔ
+  بلوپرینت‌ها) در startup بارگذاری می‌شوند تا اولین درخواست هر worker هزینهٔ کامپایل ندهد
+- در زمان deploy: ``python scripts/precompile_templates.py`` قالب‌ها را اعتبارسنجی و cache را پر می‌کند
+
+تنظیمات (app.config):
+  TEMPLATE_BYTECODE_CACHE   فعال/غیرفعال bytecode cache (پیش‌فرض True)
+  TEMPLATE_CACHE_DIR        مسیر cache (پیش‌فرض <instance>/jinja_cache)
+  TEMPLATE_WARMUP           precompile همهٔ قالب‌ها در startup (پیش‌فرض True)
+"""
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Dict, List
+
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+
+TEMPLATE_EXTENSIONS = ('html', 'htm', 'xml', 'txt', 'j2', 'jinja')
+
+
+def template_cache_dir(app) -> str:
+    return app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+
+
+def configure_template_cache(app) -> None:
+    """اتصال FileSystemBytecodeCache به jinja_env (قبل از اولین کامپایل)."""
+    if not app.config.get('TEMPLATE_BYTECODE_CACHE', True):
+        return
+    directory = template_cache_dir(app)
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        app.logger.warning("Template bytecode cache disabled (%s): %s", directory, e)
+        return
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    # همهٔ قالب‌ها در حافظه بمانند (LRU پیش‌فرض 400 است؛ warm-up نباید قالب‌ها را بیرون کند)
+    names = app.jinja_env.list_templates(extensions=TEMPLATE_EXTENSIONS)
+    if app.jinja_env.cache is not None and len(names) > app.jinja_env.cache.capacity:
+        app.jinja_env.cache.capacity = len(names) + 50
+
+
+def precompile_templates(app) -> Dict[str, Any]:
+    """کامپایل/بارگذاری همهٔ قالب‌ها؛ خروجی: {'templates', 'compiled', 'errors': [(name, message)], 'seconds'}"""
+    started = time.perf_counter()
+    env = app.jinja_env
+    names = env.list_templates(extensions=TEMPLATE_EXTENSIONS)
+    errors: List[tuple] = []
+    with app.app_context():
+        for name in names:
+            try:
+                env.get_template(name)
+            except TemplateSyntaxError as e:
+                errors.append((name, f"line {e.lineno}: {e.message}"))
+            except Exception as e:
+                errors.append((name, f"{type(e).__name__}: {e}"))
+    return {
+        'templates': len(names),
+        'compiled': len(names) - len(errors),
+        'errors': errors,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def init_template_cache(app) -> None:
+    """bytecode cache و (در صورت فعال بودن) warm-up؛ بعد از ثبت همهٔ بلوپرینت‌ها صدا زده شود."""
+    configure_template_cache(app)
+    if not app.config.get('TEMPLATE_WARMUP', True):
+        return
+    stats = precompile_templates(app)
+    for name, message in stats['errors']:
+        app.logger.warning("Template %s failed to compile: %s", name, message)
+    app.logger.info("Templates warmed up: %d/%d in %.3fs", stats['compiled'], stats['templates'], stats['seconds'])
+
+
+__all__ = ['configure_template_cache', 'precompile_templates', 'init_template_cache', 'template_cache_dir']
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Template context – یک context processor واحد با مقادیر lazy
+
+به جای چند context processor که در هر render فایل تنظیمات/همکاران را می‌خواندند، یک provider
+ثبت می‌شود که مقادیر پرهزینه را به شکل proxy (``werkzeug.local.LocalProxy``) برمی‌گرداند:
+مقدار فقط وقتی قالب واقعاً از آن استفاده کند (``{% if VINOR_IS_EXPRESS_PARTNER %}``) محاسبه
+و تا پایان همان درخواست روی ``g`` نگه داشته می‌شود. قالبی که به آن‌ها اشاره نکند هیچ IO ندارد.
+
+افزودن مقدار جدید (در هر ماژول، قبل یا بعد از ساخت app):
+
+    @template_value('VINOR_IS_EXPRESS_PARTNER', default=False)
+    def _is_express_partner():
+        ...
+
+نام تکراری جایگزین ثبت قبلی می‌شود. خطای محاسبه (مثلاً render بیرون از درخواست) مقدار default را می‌دهد.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Tuple
+
+from flask import g, session, url_for
+from werkzeug.local import LocalProxy
+
+from .storage import load_settings_cached
+
+_PROVIDERS: Dict[str, Tuple[Callable[[], Any], Any]] = {}
+_PROXIES: Dict[str, LocalProxy] = {}
+
+
+def template_value(name: str, default: Any = None) -> Callable:
+    """ثبت یک مقدار lazy برای همهٔ قالب‌ها."""
+    def decorator(fn):
+        _PROVIDERS[name] = (fn, default)
+        _PROXIES.pop(name, None)
+        return fn
+    return decorator
+
+
+def _memoized(name: str) -> Callable[[], Any]:
+    def resolve():
+        memo = g.setdefault('_template_values', {})
+        try:
+            return memo[name]
+        except KeyError:
+            pass
+        fn, default = _PROVIDERS[name]
+        try:
+            value = fn()
+        except Exception:
+            value = default
+        memo[name] = value
+        return value
+    return resolve
+
+
+def lazy_values() -> Dict[str, LocalProxy]:
+    """proxy هر مقدار ثبت‌شده (یک بار ساخته می‌شود؛ memo روی g است نه روی proxy)."""
+    if len(_PROXIES) != len(_PROVIDERS):
+        for name in _PROVIDERS:
+            if name not in _PROXIES:
+                _PROXIES[name] = LocalProxy(_memoized(name))
+    return _PROXIES
+
+
+def init_template_context(app, csrf_token: Callable[[], str]) -> None:
+    """ثبت provider واحد روی app (csrf_token همان generate_csrf یا fallback آن در app factory)."""
+    @app.context_processor
+    def inject_vinor_globals():
+        ctx: Dict[str, Any] = {
+            "VAPID_PUBLIC_KEY": app.config.get("VAPID_PUBLIC_KEY", ""),
+            "APP_BRAND_NAME": app.config.get("APP_BRAND_NAME", "Vinor Express"),
+            "VINOR_BRAND": "وینور اکسپرس",
+            "VINOR_DOMAIN": "vinor.ir",
+            "csrf_token": csrf_token,
+        }
+        ctx.update(lazy_values())
+        return ctx
+
+
+# -------- مقادیر عمومی --------
+@template_value('VINOR_IS_LOGGED_IN', default=False)
+def _is_logged_in() -> bool:
+    return bool(session.get("user_id"))
+
+
+@template_value('VINOR_HOME_URL', default='/')
+def _home_url() -> str:
+    return url_for("main.index")
+
+
+@template_value('SHOW_SUBMIT_BUTTON', default=True)
+def _show_submit_button() -> bool:
+    return bool((load_settings_cached() or {}).get("show_submit_button", True))
+
+
+__all__ = ['template_value', 'lazy_values', 'init_template_context']
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks – دادهٔ مصنوعی و سنجش مسیرهای داغ در مقیاس 1k/10k/50k آگهی
+
+  benchmarks.synthetic   تولید قطعی داده (آگهی فارسی، همکار، اختصاص، پورسانت، اعلان، لاگ بازدید)
+  benchmarks.handlers    سناریوهای test client و اندازه‌گیری p50/p95/allocation
+  python -m benchmarks   اجرای مجموعه، ذخیره و مقایسه با baseline (بدون شبکه)
+  benchmarks.loadtest    gunicorn چندپردازه‌ای + ترافیک ترکیبی هم‌زمان و بررسی سلامت داده
+"""
+from .synthetic import generate
+
+__all__ = ['generate']
@@ -0,0 +1,96 @@
+"""
+Run the handler benchmark suite at several data scales, optionally against a saved baseline.
+
+Usage:
+  python -m benchmarks                                  # 1k, 10k and 50k listings, 30 iterations
+  python -m benchmarks --scales 1000,10000 -n 50
+  python -m benchmarks --only partner.,api. --save bench-before.json
+  python -m benchmarks --baseline bench-before.json     # adds Δp50 / Δp95 columns
+
+Notes:
+  - Runs offline: data comes from benchmarks.synthetic (seeded) in a temporary instance folder
+    (INSTANCE_PATH), the real data/ and instance/ folders are not touched.
+  - Latency is wall time per request through the Flask test client; "alloc" is the median peak
+    of traced Python allocations for one request (tracemalloc, separate pass).
+  - Slow scenarios stop after --budget seconds (at least 5 samples); "n" is the sample count.
+    At 50k listings the partner dashboard takes seconds per request, so a full run is ~10 minutes.
+  - Exit code is 1 if any scenario returned a 5xx.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+# Ensure project root on sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.handlers import run_scale
+
+
+def _delta(current: float, base: Optional[float]) -> str:
+    if not base:
+        return '      -'
+    return f"{(current - base) / base * 100:+6.0f}%"
+
+
+def _print_scale(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    base_rows = (baseline or {}).get(str(report['listings']), {}).get('results', {})
+    header = f"{'scenario':<26} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'alloc KiB':>10}  status"
+    if baseline:
+        header += f"   {'Δp50':>7} {'Δp95':>7}"
+    print(f"\n== {report['listings']} listings ({report['iterations']} iterations) ==")
+    print(header)
+    for name, row in report['results'].items():
+        statuses = ','.join(f"{k}x{v}" for k, v in row['statuses'].items())
+        line = f"{name:<26} {row['samples']:>4} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['alloc_peak_kib'] or 0:>10.1f}  {statuses}"
+        if baseline:
+            base = base_rows.get(name, {})
+            line += f"   {_delta(row['p50_ms'], base.get('p50_ms'))} {_delta(row['p95_ms'], base.get('p95_ms'))}"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark hot handlers on synthetic data")
+    parser.add_argument('--scales', default='1000,10000,50000', help="comma-separated listing counts")
+    parser.add_argument('-n', '--iterations', type=int, default=30, help="timed requests per scenario")
+    parser.add_argument('--budget', type=float, default=30.0, help="max seconds of timed requests per scenario")
+    parser.add_argument('--seed', type=int, default=1404)
+    parser.add_argument('--only', default='', help="comma-separated scenario name prefixes (e.g. partner.,api.)")
+    parser.add_argument('--save', help="write results as JSON (usable as --baseline later)")
+    parser.add_argument('--baseline', help="compare against a JSON file written by --save")
+    parser.add_argument('--keep', action='store_true', help="keep the temporary instance folders")
+    args = parser.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(',') if s.strip()]
+    only = [s.strip() for s in args.only.split(',') if s.strip()] or None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    reports: Dict[str, Any] = {}
+    for scale in scales:
+        report = run_scale(
+            scale, iterations=args.iterations, seed=args.seed, only=only, keep=args.keep, budget_seconds=args.budget,
+        )
+        reports[str(scale)] = report
+        _print_scale(report, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved: {args.save}")
+
+    failed = any(
+        int(code) >= 500 for report in reports.values() for row in report['results'].values() for code in row['statuses']
+    )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
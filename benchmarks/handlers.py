@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Handler benchmarks – p50/p95 latency و allocation مسیرهای داغ روی دادهٔ مصنوعی
+
+هر سناریو یک درخواست Flask test client است (کل پشتهٔ WSGI، بدون شبکه):
+  partner.dashboard        /express/partner/dashboard                 (همکار سنگین)
+  partner.dashboard_data   /express/partner/dashboard/data
+  partner.land_detail      /express/partner/lands/<code>              (پیمایش لاگ بازدید)
+  api.express_list         /api/express-list?page=…                   (صفحه‌های ۱، ۵ و ۲۰ به نوبت)
+  api.express_search       /api/express-search?q=…                    (search-as-you-type)
+  media.uploaded_file      /uploads/bench/…?variant=card|thumb         (واریانت WebP)
+  admin.express_listings   /admin/express
+  admin.dashboard          /admin/
+
+زمان‌سنجی و اندازه‌گیری حافظه جدا انجام می‌شوند. tracemalloc درخواست را چند برابر کند می‌کند،
+پس اوج allocation هر درخواست در یک دور کوتاه جداگانه گرفته می‌شود.
+"""
+from __future__ import annotations
+
+import gc
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from itertools import count
+from typing import Any, Callable, Dict, List, Optional
+
+from .synthetic import ADMIN_SESSION, generate
+
+
+@dataclass
+class Scenario:
+    name: str
+    url: Callable[[Dict[str, Any], int], Optional[str]]
+    session: Optional[str] = None  # None | 'partner' | 'admin'
+
+
+def _rotate(values: List[str]) -> Callable[[Dict[str, Any], int], str]:
+    return lambda info, i: values[i % len(values)]
+
+
+def _search_url(info: Dict[str, Any], i: int) -> str:
+    # تایپ حرف‌به‌حرف: «آ»، «آپ»، «آپا»، …
+    term = info['search_terms'][(i // 6) % len(info['search_terms'])]
+    return f"/api/express-search?q={term[:1 + i % 6]}"
+
+
+def _image_url(info: Dict[str, Any], i: int) -> Optional[str]:
+    images = info.get('images') or []
+    if not images:
+        return None
+    variant = 'card' if i % 2 else 'thumb'
+    return f"/{images[i % len(images)]}?variant={variant}"
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario('partner.dashboard', _rotate(['/express/partner/dashboard']), 'partner'),
+    Scenario('partner.dashboard_data', _rotate(['/express/partner/dashboard/data']), 'partner'),
+    Scenario('partner.land_detail', lambda info, i: f"/express/partner/lands/{info['detail_code']}", 'partner'),
+    Scenario('api.express_list', _rotate([f"/api/express-list?page={p}&per_page=30" for p in (1, 5, 20)])),
+    Scenario('api.express_search', _search_url),
+    Scenario('media.uploaded_file', _image_url),
+    Scenario('admin.express_listings', _rotate(['/admin/express']), 'admin'),
+    Scenario('admin.dashboard', _rotate(['/admin/']), 'admin'),
+]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def _client(app, kind: Optional[str], info: Dict[str, Any]):
+    client = app.test_client()
+    if kind:
+        with client.session_transaction() as sess:
+            if kind == 'partner':
+                sess['user_phone'] = info['partner_phone']
+            else:
+                sess.update(ADMIN_SESSION)
+    return client
+
+
+def bench_scenario(app, scenario: Scenario, info: Dict[str, Any], iterations: int = 30,
+                   warmup: int = 3, alloc_iterations: int = 5,
+                   budget_seconds: float = 30.0) -> Optional[Dict[str, Any]]:
+    """``iterations`` درخواست زمان‌دار؛ اگر ``budget_seconds`` تمام شود (حداقل ۵ نمونه) زودتر متوقف می‌شود."""
+    if scenario.url(info, 0) is None:
+        return None
+    client = _client(app, scenario.session, info)
+    seq = count()
+    statuses: Dict[int, int] = {}
+
+    def hit() -> None:
+        resp = client.get(scenario.url(info, next(seq)))
+        resp.get_data()
+        statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+        resp.close()
+
+    # warm-up همهٔ URLهای چرخشی (مثلاً ساخت اولیهٔ واریانت هر تصویر) را یک بار می‌بیند
+    distinct = len({scenario.url(info, i) for i in range(64)})
+    for _ in range(max(warmup, distinct)):
+        hit()
+    statuses.clear()
+    gc.collect()
+    timings: List[float] = []
+    deadline = time.perf_counter() + budget_seconds
+    for _ in range(iterations):
+        started = time.perf_counter()
+        hit()
+        timings.append((time.perf_counter() - started) * 1000)
+        if len(timings) >= 5 and started > deadline:
+            break
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_iterations):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            hit()
+            peaks.append((tracemalloc.get_traced_memory()[1] - base) / 1024)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(_percentile(timings, 95), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'samples': len(timings),
+        'alloc_peak_kib': round(statistics.median(peaks), 1) if peaks else None,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def run_scale(listings: int, iterations: int = 30, seed: int = 1404, only: Optional[List[str]] = None,
+              keep: bool = False, budget_seconds: float = 30.0, log=print) -> Dict[str, Any]:
+    """یک instance موقت با ``listings`` آگهی، یک app جدید و اجرای سناریوها."""
+    instance = tempfile.mkdtemp(prefix=f"vinor-bench-{listings}-")
+    previous = {k: os.environ.get(k) for k in ('INSTANCE_PATH', 'TEMPLATE_WARMUP', 'IMAGE_VARIANT_POOL')}
+    try:
+        started = time.perf_counter()
+        info = generate(instance, listings=listings, seed=seed)
+        log(f"[{listings}] generated {info['listings']} listings, {info['partners']} partners, "
+            f"{info['assignments']} assignments, {info['commissions']} commissions, "
+            f"{info['notifications']} notifications, {info['views']} views "
+            f"in {time.perf_counter() - started:.1f}s ({instance})")
+
+        os.environ['INSTANCE_PATH'] = instance
+        os.environ['TEMPLATE_WARMUP'] = '0'
+        os.environ['IMAGE_VARIANT_POOL'] = 'inline'
+        from app import create_app
+        app = create_app()
+        app.config.update(
+            TESTING=True, WTF_CSRF_ENABLED=False, PARTNER_EVENTS_MODE='poll',
+            UPLOAD_FOLDER=os.path.join(instance, 'data', 'uploads'), METRICS_SERVER_TIMING=False,
+        )
+        app.logger.setLevel('WARNING')
+
+        results: Dict[str, Any] = {}
+        for scenario in SCENARIOS:
+            if only and not any(scenario.name.startswith(prefix) for prefix in only):
+                continue
+            row = bench_scenario(app, scenario, info, iterations=iterations, budget_seconds=budget_seconds)
+            if row is None:
+                log(f"[{listings}] {scenario.name}: skipped (no data)")
+                continue
+            results[scenario.name] = row
+        return {'listings': listings, 'seed': seed, 'iterations': iterations, 'results': results}
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        if not keep:
+            shutil.rmtree(instance, ignore_errors=True)
+        gc.collect()
+
+
+__all__ = ['Scenario', 'SCENARIOS', 'bench_scenario', 'run_scale']
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+Load test – اجرای app زیر gunicorn چندپردازه‌ای و بازپخش ترافیک ترکیبی با نرخ ثابت
+
+  python -m benchmarks.loadtest                              # 5k آگهی، 4 worker، 40 req/s، 60 ثانیه
+  python -m benchmarks.loadtest --workers 8 --rate 120 --duration 300 --listings 20000
+  python -m benchmarks.loadtest --server flask               # بدون gunicorn (یک پردازه، threaded)
+
+روند:
+  1. دادهٔ مصنوعی (benchmarks.synthetic) در یک instance موقت؛ app با INSTANCE_PATH همان پوشه
+     و SECRET_KEY تصادفی اجرا می‌شود (push store خالی؛ هیچ درخواست بیرونی ارسال نمی‌شود)
+  2. sessionهای همکار/ادمین و توکن CSRF همین‌جا با همان SECRET_KEY امضا می‌شوند (بدون OTP)
+  3. open-loop: درخواست i در لحظهٔ t0 + i/rate زمان‌بندی می‌شود؛ latency از لحظهٔ زمان‌بندی
+     حساب می‌شود تا صف شدن پشت سرور کند پنهان نماند (coordinated omission)
+  4. گزارش throughput، p50/p95/p99/max هر سناریو و نرخ خطا (5xx یا خطای اتصال)
+  5. بعد از توقف سرور، بررسی سلامت داده:
+       - همهٔ فایل‌های JSON سالم‌اند و رکوردی از assignments گم نشده
+       - id پورسانت‌ها و اختصاص‌ها یکتاست؛ برای هر (همکار، آگهی) حداکثر یک پورسانت
+       - هر toggle که پاسخش «پورسانت اضافه شد» بود و آگهی هنوز در دست همان همکار است،
+         رکورد پورسانت دارد (lost commission)
+       - هر broadcast ادمین به همهٔ همکاران رسیده است (با در نظر گرفتن سقف ۱۰۰ اعلان)
+
+سناریوها (وزن پیش‌فرض): guest_landing 15، dashboard_poll 25، unread_poll 15، search 20،
+image 15، toggle_transaction 8، admin_broadcast 0.2. با --mix وزن‌ها عوض می‌شوند:
+``--mix toggle_transaction=30,admin_broadcast=1``.
+خروج با کد 1 اگر نرخ خطا از --max-error-rate بیشتر باشد یا بررسی داده خطا داشته باشد.
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import random
+import secrets
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+# Ensure project root on sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import ADMIN_SESSION, generate
+
+SESSION_COOKIE = 'vinor_session'
+COMMISSION_ADDED = 'پورسانت شما به لیست انتظار اضافه شد'
+DEFAULT_MIX = {
+    'guest_landing': 15, 'dashboard_poll': 25, 'unread_poll': 15, 'search': 20,
+    'image': 15, 'toggle_transaction': 8, 'admin_broadcast': 0.2,
+}
+
+
+# -------- امضای session و CSRF (همان الگوریتم Flask / Flask-WTF) --------
+class Signer:
+    def __init__(self, secret: str) -> None:
+        from flask import Flask
+        from flask.sessions import SecureCookieSessionInterface
+        from itsdangerous import URLSafeTimedSerializer
+
+        app = Flask('loadtest')
+        app.secret_key = secret
+        self._session = SecureCookieSessionInterface().get_signing_serializer(app)
+        self._csrf = URLSafeTimedSerializer(secret, salt='wtf-csrf-token')
+
+    def identity(self, data: Dict[str, Any]) -> Dict[str, str]:
+        raw = secrets.token_hex(20)
+        cookie = self._session.dumps(dict(data, csrf_token=raw))
+        return {'Cookie': f"{SESSION_COOKIE}={cookie}", 'X-CSRFToken': self._csrf.dumps(raw)}
+
+    def flashes(self, set_cookies: List[str]) -> List[Tuple[str, str]]:
+        """پیام‌های flash از کوکی session پاسخ (کنار XSRF-TOKEN چند Set-Cookie می‌آید)."""
+        for header in set_cookies:
+            if header.startswith(SESSION_COOKIE + '='):
+                value = header.split(';', 1)[0].split('=', 1)[1]
+                try:
+                    return [tuple(f) for f in (self._session.loads(value).get('_flashes') or [])]
+                except Exception:
+                    return []
+        return []
+
+
+# -------- سرور --------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str, instance: str, port: int, workers: int, threads: int, secret: str, log_path: str):
+    env = dict(os.environ)
+    env.update({
+        'INSTANCE_PATH': instance,
+        'SECRET_KEY': secret,
+        'PUSH_STORE_PATH': os.path.join(instance, 'push_subs.json'),
+        'UPLOAD_FOLDER': os.path.join(instance, 'data', 'uploads'),
+        'METRICS_DIR': os.path.join(instance, 'metrics'),
+        'IMAGE_VARIANT_POOL': 'thread',
+        'PYTHONPATH': ROOT + os.pathsep + env.get('PYTHONPATH', ''),
+    })
+    if kind == 'gunicorn':
+        cmd = [
+            sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+            '-b', f"127.0.0.1:{port}", '--timeout', '120', 'app:create_app()',
+        ]
+    else:
+        cmd = [
+            sys.executable, '-m', 'flask', '--app', 'app:create_app()', 'run', '-p', str(port),
+            '--with-threads', '--no-reload', '--no-debugger',
+        ]
+    log = open(log_path, 'ab')
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}; see {log_path}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/healthz')
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.3)
+    proc.terminate()
+    raise RuntimeError(f"server did not become healthy in 60s; see {log_path}")
+
+
+def stop_server(proc) -> None:
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# -------- ترافیک --------
+class Traffic:
+    """سناریوها + ثبت نتایج (thread-safe)."""
+
+    def __init__(self, port: int, signer: Signer, info: Dict[str, Any], instance: str,
+                 partner_count: int, seed: int) -> None:
+        self.port = port
+        self.signer = signer
+        self.info = info
+        self.rnd = random.Random(seed)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[int, int]] = {}
+        self.commissions_added: List[Tuple[str, str]] = []
+        self.broadcasts: List[str] = []
+
+        with open(os.path.join(instance, 'data', 'express_assignments.json'), encoding='utf-8') as f:
+            assignments = json.load(f)
+        with open(os.path.join(instance, 'data', 'express_partners.json'), encoding='utf-8') as f:
+            approved = [p['phone'] for p in json.load(f) if p.get('status') == 'approved']
+        owned: Dict[str, List[str]] = {}
+        for a in assignments:
+            if a.get('status') in ('active', 'in_transaction'):
+                owned.setdefault(a['partner_phone'], []).append(a['land_code'])
+        phones = [p for p in approved if owned.get(p)][:partner_count]
+        self.partners = [(phone, signer.identity({'user_phone': phone}), owned[phone]) for phone in phones]
+        self.admin = signer.identity(ADMIN_SESSION)
+        self.guest: Dict[str, str] = {}
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        return conn
+
+    def _request(self, method: str, path: str, headers: Dict[str, str], body: Optional[str] = None):
+        headers = dict(headers, **({'Content-Type': 'application/x-www-form-urlencoded'} if body else {}))
+        for attempt in (1, 2):
+            conn = self._conn()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                return resp
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None
+                if attempt == 2:
+                    raise
+        return None
+
+    # سناریوها: (method, path, headers, body, callback)
+    def guest_landing(self):
+        return 'GET', '/', self.guest, None, None
+
+    def dashboard_poll(self):
+        _, ident, _ = self.rnd.choice(self.partners)
+        return 'GET', '/express/partner/dashboard/data', ident, None, None
+
+    def unread_poll(self):
+        _, ident, _ = self.rnd.choice(self.partners)
+        return 'GET', '/express/partner/api/notifications/unread-count', ident, None, None
+
+    def search(self):
+        term = self.rnd.choice(self.info['search_terms'])
+        prefix = term[:self.rnd.randrange(1, len(term) + 1)]
+        return 'GET', f"/api/express-search?q={quote(prefix)}", self.guest, None, None
+
+    def image(self):
+        images = self.info.get('images') or []
+        if not images:
+            return self.guest_landing()
+        variant = self.rnd.choice(['thumb', 'card', 'full'])
+        return 'GET', f"/{self.rnd.choice(images)}?variant={variant}", self.guest, None, None
+
+    def toggle_transaction(self):
+        phone, ident, codes = self.rnd.choice(self.partners)
+        code = self.rnd.choice(codes)
+
+        def done(resp):
+            for _, message in self.signer.flashes(resp.msg.get_all('Set-Cookie') or []):
+                if COMMISSION_ADDED in message:
+                    with self._lock:
+                        self.commissions_added.append((phone, code))
+        return 'POST', f"/express/partner/mark-in-transaction/{code}", ident, '', done
+
+    def admin_broadcast(self):
+        title = f"loadtest-{uuid.uuid4().hex[:10]}"
+        body = urlencode({'title': title, 'body': 'پیام آزمایشی بار', 'type': 'info'})
+
+        def done(resp):
+            if resp.status < 400:
+                with self._lock:
+                    self.broadcasts.append(title)
+        return 'POST', '/admin/notifications/colleagues', self.admin, body, done
+
+    def run_one(self, name: str, scheduled: float) -> None:
+        method, path, headers, body, callback = getattr(self, name)()
+        status = 0
+        try:
+            resp = self._request(method, path, headers, body)
+            status = resp.status
+            if callback is not None:
+                callback(resp)
+        except Exception:
+            status = 0
+        latency = (time.perf_counter() - scheduled) * 1000
+        with self._lock:
+            self.samples.setdefault(name, []).append(latency)
+            per = self.statuses.setdefault(name, {})
+            per[status] = per.get(status, 0) + 1
+            if status == 0 or status >= 500:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def replay(traffic: Traffic, mix: Dict[str, float], rate: float, duration: float, concurrency: int) -> float:
+    names = [n for n, w in mix.items() if w > 0]
+    weights = [mix[n] for n in names]
+    rnd = random.Random(7)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        i = 0
+        while True:
+            scheduled = started + i / rate
+            if scheduled - started >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(traffic.run_one, rnd.choices(names, weights)[0], scheduled)
+            i += 1
+    return time.perf_counter() - started
+
+
+def _pct(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def report(traffic: Traffic, elapsed: float) -> Dict[str, Any]:
+    total = sum(len(v) for v in traffic.samples.values())
+    errors = sum(traffic.errors.values())
+    print(f"\n{total} requests in {elapsed:.1f}s → {total / elapsed:.1f} req/s, "
+          f"errors {errors} ({errors / max(1, total) * 100:.2f}%)")
+    print(f"{'scenario':<20} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  statuses")
+    rows = {}
+    for name in sorted(traffic.samples):
+        lat = traffic.samples[name]
+        statuses = ','.join(f"{k}x{v}" for k, v in sorted(traffic.statuses[name].items()))
+        rows[name] = {
+            'count': len(lat), 'p50_ms': round(statistics.median(lat), 1), 'p95_ms': round(_pct(lat, 95), 1),
+            'p99_ms': round(_pct(lat, 99), 1), 'max_ms': round(max(lat), 1), 'errors': traffic.errors.get(name, 0),
+        }
+        r = rows[name]
+        print(f"{name:<20} {r['count']:>6} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+              f"{r['max_ms']:>8.1f}  {statuses}")
+    return {'requests': total, 'seconds': round(elapsed, 2), 'throughput': round(total / elapsed, 2),
+            'errors': errors, 'error_rate': errors / max(1, total), 'scenarios': rows}
+
+
+# -------- بررسی سلامت داده --------
+def check_integrity(instance: str, traffic: Traffic, expected_assignments: int) -> List[str]:
+    data_dir = os.path.join(instance, 'data')
+    problems: List[str] = []
+    loaded: Dict[str, Any] = {}
+    for name in sorted(os.listdir(data_dir)):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(data_dir, name), encoding='utf-8') as f:
+                    loaded[name] = json.load(f)
+            except ValueError as e:
+                problems.append(f"{name}: invalid JSON ({e})")
+
+    assignments = loaded.get('express_assignments.json') or []
+    if len(assignments) != expected_assignments:
+        problems.append(f"assignments: {len(assignments)} rows, expected {expected_assignments}")
+    ids = [a.get('id') for a in assignments]
+    if len(ids) != len(set(ids)):
+        problems.append(f"assignments: {len(ids) - len(set(ids))} duplicate ids")
+
+    commissions = loaded.get('express_commissions.json') or []
+    cids = [c.get('id') for c in commissions]
+    if len(cids) != len(set(cids)):
+        problems.append(f"commissions: {len(cids) - len(set(cids))} duplicate ids")
+    pairs: Dict[Tuple[str, str], int] = {}
+    for c in commissions:
+        key = (str(c.get('partner_phone')), str(c.get('land_code')))
+        pairs[key] = pairs.get(key, 0) + 1
+    dup_pairs = [k for k, v in pairs.items() if v > 1]
+    if dup_pairs:
+        problems.append(f"commissions: {len(dup_pairs)} (partner, land) pairs with more than one record")
+    # فقط آگهی‌هایی که هنوز در دست همان همکارند: رفع معامله پورسانت pending را عمداً حذف می‌کند
+    holders = {(str(a.get('transaction_holder')), str(a.get('land_code')))
+               for a in assignments if a.get('transaction_holder')}
+    lost = sorted({p for p in traffic.commissions_added if p in holders and p not in pairs})
+    if lost:
+        problems.append(f"commissions: {len(lost)} lost (acknowledged but missing), e.g. {lost[:3]}")
+
+    if traffic.broadcasts:
+        notifications = loaded.get('notifications.json') or {}
+        partners = loaded.get('express_partners.json') or []
+        missing = 0
+        for p in partners:
+            items = notifications.get(p.get('phone'), [])
+            titles = {n.get('title') for n in items}
+            if len(items) < 100:  # سقف ۱۰۰ اعلان قدیمی‌ها را حذف می‌کند
+                missing += sum(1 for t in traffic.broadcasts if t not in titles)
+        if missing:
+            problems.append(f"notifications: {missing} broadcast deliveries missing")
+    return problems
+
+
+def _parse_mix(value: str) -> Dict[str, float]:
+    mix = dict(DEFAULT_MIX)
+    for item in (value or '').split(','):
+        name, sep, weight = item.partition('=')
+        if sep:
+            if name.strip() not in mix:
+                raise SystemExit(f"unknown scenario in --mix: {name}")
+            mix[name.strip()] = float(weight)
+    return mix
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Multi-worker load test with mixed traffic and data checks")
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument('--threads', type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument('--rate', type=float, default=40.0, help="requests per second (open loop)")
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds of traffic")
+    parser.add_argument('--concurrency', type=int, default=64, help="client threads")
+    parser.add_argument('--listings', type=int, default=5000)
+    parser.add_argument('--partners', type=int, default=30, help="active partner sessions")
+    parser.add_argument('--mix', default='', help="scenario weights, e.g. toggle_transaction=30,admin_broadcast=1")
+    parser.add_argument('--seed', type=int, default=1404)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--save', help="write the report as JSON")
+    parser.add_argument('--keep', action='store_true', help="keep the temporary instance folder")
+    args = parser.parse_args(argv)
+
+    mix = _parse_mix(args.mix)
+    instance = tempfile.mkdtemp(prefix='vinor-load-')
+    secret = secrets.token_hex(32)
+    proc = None
+    try:
+        info = generate(instance, listings=args.listings, seed=args.seed)
+        print(f"instance {instance}: {info['listings']} listings, {info['partners']} partners, "
+              f"{info['assignments']} assignments")
+        port = _free_port()
+        log_path = os.path.join(instance, 'server.log')
+        proc = start_server(args.server, instance, port, args.workers, args.threads, secret, log_path)
+        print(f"{args.server} on :{port} ({args.workers}x{args.threads} workers/threads)" if args.server == 'gunicorn'
+              else f"flask dev server on :{port} (single process, threaded)")
+
+        traffic = Traffic(port, Signer(secret), info, instance, args.partners, args.seed)
+        if not traffic.partners:
+            raise SystemExit("no partner with assignments in the synthetic data")
+        print(f"replaying {args.rate:g} req/s for {args.duration:g}s, mix: "
+              + ', '.join(f"{k}={v:g}" for k, v in mix.items() if v > 0))
+        elapsed = replay(traffic, mix, args.rate, args.duration, args.concurrency)
+        result = report(traffic, elapsed)
+    finally:
+        if proc is not None:
+            stop_server(proc)
+
+    try:
+        problems = check_integrity(instance, traffic, info['assignments'])
+        print(f"\ntoggles acknowledged with a new commission: {len(traffic.commissions_added)}, "
+              f"admin broadcasts: {len(traffic.broadcasts)}")
+        if problems:
+            print("DATA INTEGRITY PROBLEMS:")
+            for p in problems:
+                print(f"  - {p}")
+        else:
+            print("data integrity: OK")
+        result.update({'integrity_problems': problems, 'server': args.server, 'workers': args.workers,
+                       'rate': args.rate, 'listings': args.listings, 'mix': mix})
+        if args.save:
+            with open(args.save, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+        ok = not problems and result['error_rate'] <= args.max_error_rate
+        return 0 if ok else 1
+    finally:
+        if args.keep:
+            print(f"kept {instance}")
+        else:
+            shutil.rmtree(instance, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic data – دادهٔ مصنوعی قطعی (seeded) در مقیاس دلخواه برای یک پوشهٔ instance
+
+``generate(instance_dir, listings=10000, seed=1404)`` فایل‌های JSON همان مسیرهایی را می‌سازد
+که app.utils.storage و app.services.notifications می‌خوانند (``<instance>/data/*.json``):
+  lands.json                      آگهی‌ها با عنوان/توضیح فارسی؛ بیشترشان اکسپرس، ۱ از ۸ با تصویر
+  express_partners.json           همکاران (تأییدشده به‌جز ۱ از ۱۰)
+  express_partner_applications    درخواست‌های همکاری
+  express_assignments.json        اختصاص آگهی به همکار (active / in_transaction / sold)
+  express_commissions.json        پورسانت‌ها (id عددی یکتا، یک رکورد برای هر همکار و آگهی)
+  notifications.json              اعلان‌ها به ازای هر همکار (حداکثر ۱۰۰، مثل add_notification)
+  express_partner_views.json      لاگ بازدید فایل‌ها (سقف ۵۰٬۰۰۰ مثل land_detail)
+  landing_views.json / express_views.json
+  data/uploads/bench/*.jpg        چند تصویر واقعی (با Pillow) برای /uploads و واریانت‌ها
+
+همکار اول (``BENCH_PARTNER_PHONE``) سنگین‌ترین داشبورد را دارد (۲٪ آگهی‌ها اختصاص یافته).
+بدون شبکه اجرا می‌شود؛ همان seed همیشه همان داده را می‌دهد.
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+BENCH_PARTNER_PHONE = '09120000001'
+ADMIN_SESSION = {'logged_in': True, 'username': 'admin'}
+
+CITIES = ['تهران', 'کرج', 'اصفهان', 'شیراز', 'مشهد', 'تبریز', 'رشت', 'قم']
+NEIGHBORHOODS = [
+    'سعادت آباد', 'ونک', 'پونک', 'تهرانپارس', 'نیاوران', 'شهرک غرب', 'جنت آباد', 'نارمک',
+    'گوهردشت', 'عظیمیه', 'چهارباغ', 'ملاصدرا', 'وکیل آباد', 'ولیعصر', 'گلسار', 'پردیسان',
+]
+CATEGORIES = ['آپارتمان', 'ویلا', 'زمین', 'مغازه', 'دفتر کار', 'باغ', 'سوله']
+FEATURES = ['پارکینگ', 'انباری', 'آسانسور', 'بالکن', 'کابینت MDF', 'استخر', 'سونا', 'لابی', 'نگهبانی', 'روف گاردن']
+DOCS = ['سند تک برگ', 'سند منگوله دار', 'قولنامه ای', 'وقفی']
+SENTENCES = [
+    'نوساز با امکانات کامل در بهترین نقطهٔ محله.',
+    'دسترسی عالی به مترو، مراکز خرید و مدارس.',
+    'نورگیر و دنج با نمای مدرن و طراحی شیک.',
+    'مناسب سکونت و سرمایه‌گذاری، قابل معاوضه.',
+    'مشاعات تمیز، همسایگان محترم و ساختمان کم‌واحد.',
+    'فروش فوری به علت مهاجرت، قیمت قابل مذاکره.',
+    'چشم‌انداز ابدی، کف سرامیک و کمد دیواری.',
+    'جواز ساخت دارد؛ مناسب سازنده و انبوه‌ساز.',
+]
+FIRST_NAMES = ['علی', 'محمد', 'زهرا', 'فاطمه', 'حسین', 'مریم', 'رضا', 'سارا', 'امیر', 'نگار', 'مهدی', 'الهام']
+LAST_NAMES = ['احمدی', 'محمدی', 'کریمی', 'رضایی', 'حسینی', 'موسوی', 'جعفری', 'صادقی', 'قاسمی', 'نوری']
+NOTIFICATION_TITLES = ['فایل جدید', 'پورسانت تأیید شد', 'یادآوری روتین', 'اطلاعیهٔ وینور']
+USER_AGENTS = [
+    'Mozilla/5.0 (Linux; Android 13) AppleWebKit/537.36 Chrome/120 Mobile Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+]
+IMAGE_COUNT = 12
+
+
+def _phone(i: int) -> str:
+    return f"0912{i:07d}"
+
+
+def _iso(dt: datetime) -> str:
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _write(path: str, data: Any) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def _images(upload_dir: str, rnd: random.Random) -> List[str]:
+    """چند JPEG واقعی (در نبود Pillow فهرست خالی؛ سناریوی /uploads رد می‌شود)."""
+    try:
+        from PIL import Image, ImageDraw
+    except Exception:
+        return []
+    bench_dir = os.path.join(upload_dir, 'bench')
+    os.makedirs(bench_dir, exist_ok=True)
+    out = []
+    for i in range(IMAGE_COUNT):
+        img = Image.new('RGB', (1600, 1200), tuple(rnd.randrange(40, 220) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(30):
+            x, y = rnd.randrange(1600), rnd.randrange(1200)
+            draw.rectangle((x, y, x + rnd.randrange(40, 400), y + rnd.randrange(40, 300)),
+                           fill=tuple(rnd.randrange(256) for _ in range(3)))
+        name = f"img_{i:03d}.jpg"
+        img.save(os.path.join(bench_dir, name), 'JPEG', quality=85)
+        out.append(f"uploads/bench/{name}")
+    return out
+
+
+def generate(instance_dir: str, listings: int = 10000, seed: int = 1404,
+             partners: Optional[int] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """ساخت دادهٔ مصنوعی در ``<instance_dir>/data``؛ خروجی: شمار رکوردها و شناسه‌های مفید برای سناریوها."""
+    rnd = random.Random(seed)
+    now = now or datetime(2025, 6, 1, 12, 0, 0)
+    data = os.path.join(instance_dir, 'data')
+    uploads = os.path.join(data, 'uploads')
+    os.makedirs(uploads, exist_ok=True)
+    images = _images(uploads, rnd)
+    n_partners = partners or max(20, listings // 50)
+
+    # -------- همکاران --------
+    partner_rows: List[Dict[str, Any]] = []
+    for i in range(1, n_partners + 1):
+        partner_rows.append({
+            'phone': _phone(i),
+            'name': f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+            'city': rnd.choice(CITIES),
+            'status': 'approved' if (i == 1 or i % 10) else 'pending',
+            'created_at': _iso(now - timedelta(days=rnd.randrange(1, 700))),
+            'commission_pct': rnd.choice([1, 1.5, 2, 2.5, 3]),
+        })
+    apps = [
+        {'id': i, 'phone': p['phone'], 'name': p['name'], 'city': p['city'],
+         'status': 'approved' if p['status'] == 'approved' else 'pending', 'created_at': p['created_at']}
+        for i, p in enumerate(partner_rows, 1)
+    ]
+    approved = [p['phone'] for p in partner_rows if p['status'] == 'approved']
+
+    # -------- آگهی‌ها --------
+    lands: List[Dict[str, Any]] = []
+    for i in range(1, listings + 1):
+        category = rnd.choice(CATEGORIES)
+        size = rnd.randrange(45, 900)
+        price_per_meter = rnd.randrange(20, 400) * 1_000_000
+        hood = rnd.choice(NEIGHBORHOODS)
+        city = rnd.choice(CITIES)
+        is_express = rnd.random() < 0.85
+        pct = rnd.choice([1, 1.5, 2, 2.5])
+        lands.append({
+            'code': str(100000 + i),
+            'title': f"{category} {size} متری در {hood}",
+            'location': f"{city}، {hood}، خیابان {rnd.choice(LAST_NAMES)}",
+            'city': city,
+            'category': category,
+            'size': size,
+            'rooms': rnd.randrange(0, 5),
+            'floor': rnd.randrange(0, 15),
+            'year_built': rnd.randrange(1370, 1404),
+            'docs_status': rnd.choice(DOCS),
+            'price_total': size * price_per_meter,
+            'price_per_meter': price_per_meter,
+            'description': ' '.join(rnd.sample(SENTENCES, rnd.randrange(2, 6))),
+            'features': rnd.sample(FEATURES, rnd.randrange(1, 6)),
+            'images': rnd.sample(images, min(len(images), rnd.randrange(1, 4))) if images and i % 8 == 0 else [],
+            'owner_phone': f"0935{rnd.randrange(10**7):07d}",
+            'vinor_contact': '09123456789',
+            'latitude': round(35.6 + rnd.random() * 0.2, 5),
+            'longitude': round(51.2 + rnd.random() * 0.3, 5),
+            'is_express': is_express,
+            'express_status': 'sold' if is_express and rnd.random() < 0.05 else 'active',
+            'extras': {'express_commission_amount': int(size * price_per_meter * pct / 100), 'express_commission_pct': pct},
+            'created_at': _iso(now - timedelta(minutes=rnd.randrange(1, 60 * 24 * 365))),
+        })
+    express_codes = [l['code'] for l in lands if l['is_express']]
+
+    # -------- اختصاص‌ها و پورسانت‌ها --------
+    assignments: List[Dict[str, Any]] = []
+    commissions: List[Dict[str, Any]] = []
+    heavy = max(10, len(express_codes) // 50)
+    by_code = {l['code']: l for l in lands}
+    for idx, code in enumerate(rnd.sample(express_codes, min(len(express_codes), listings // 2))):
+        phone = BENCH_PARTNER_PHONE if idx < heavy else rnd.choice(approved)
+        status = rnd.choices(['active', 'in_transaction', 'sold'], weights=[80, 12, 8])[0]
+        pct = rnd.choice([1, 1.5, 2, 2.5, 3])
+        assignments.append({
+            'id': str(len(assignments) + 1), 'partner_phone': phone, 'land_code': code, 'status': status,
+            'commission_pct': pct, 'created_at': _iso(now - timedelta(days=rnd.randrange(0, 200))),
+        })
+        if status != 'active':
+            price = int(by_code[code]['price_total'])
+            commissions.append({
+                'id': len(commissions) + 1, 'partner_phone': phone, 'land_code': code, 'sale_amount': price,
+                'commission_pct': pct, 'commission_amount': int(round(price * pct / 100.0)),
+                'status': 'pending' if status == 'in_transaction' else rnd.choice(['approved', 'paid']),
+                'created_at': (now - timedelta(days=rnd.randrange(0, 200))).strftime('%Y-%m-%d %H:%M:%S'),
+            })
+
+    # -------- اعلان‌ها (dict به ازای شماره؛ جدیدترین اول) --------
+    notifications: Dict[str, List[Dict[str, Any]]] = {}
+    base_ts = int(now.timestamp())
+    for phone in approved:
+        count = 100 if phone == BENCH_PARTNER_PHONE else rnd.randrange(0, 40)
+        items = []
+        for k in range(count):
+            items.append({
+                'id': f"bench-{phone}-{k}", 'title': rnd.choice(NOTIFICATION_TITLES),
+                'body': rnd.choice(SENTENCES), 'type': 'info', 'created_at': base_ts - k * 3600,
+                'is_read': rnd.random() < 0.7, 'ad_id': rnd.choice(express_codes) if express_codes else None,
+                'action_url': None, 'user_id': phone,
+            })
+        if items:
+            notifications[phone] = items
+
+    # -------- لاگ بازدیدها --------
+    def _view(code: Optional[str] = None) -> Dict[str, Any]:
+        row = {
+            'timestamp': (now - timedelta(seconds=rnd.randrange(0, 86400 * 60))).isoformat(),
+            'ip': f"10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(1, 255)}",
+            'user_agent': rnd.choice(USER_AGENTS),
+        }
+        if code is not None:
+            row['code'] = code
+        return row
+
+    partner_views = [_view(rnd.choice(express_codes)) for _ in range(min(50000, listings * 2))] if express_codes else []
+    landing_views = [_view() for _ in range(min(10000, listings))]
+    express_views = [_view(rnd.choice(express_codes)) for _ in range(min(10000, listings))] if express_codes else []
+
+    files = {
+        'lands.json': lands,
+        'express_partners.json': partner_rows,
+        'express_partner_applications.json': apps,
+        'express_assignments.json': assignments,
+        'express_commissions.json': commissions,
+        'notifications.json': notifications,
+        'express_partner_views.json': partner_views,
+        'landing_views.json': landing_views,
+        'express_views.json': express_views,
+    }
+    for name, rows in files.items():
+        _write(os.path.join(data, name), rows)
+
+    detail_code = next((a['land_code'] for a in assignments if a['partner_phone'] == BENCH_PARTNER_PHONE), None)
+    return {
+        'listings': len(lands),
+        'express_listings': len(express_codes),
+        'partners': len(partner_rows),
+        'assignments': len(assignments),
+        'commissions': len(commissions),
+        'notifications': sum(len(v) for v in notifications.values()),
+        'views': len(partner_views) + len(landing_views) + len(express_views),
+        'images': images,
+        'partner_phone': BENCH_PARTNER_PHONE,
+        'detail_code': detail_code or (express_codes[0] if express_codes else None),
+        'search_terms': ['آپارتمان', 'ونک', 'ویلا', 'سعادت'],
+    }
+
+
+__all__ = ['generate', 'BENCH_PARTNER_PHONE', 'ADMIN_SESSION']
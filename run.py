@@ -4,6 +4,7 @@ import sys
 from logging.handlers import RotatingFileHandler
 from flask import send_from_directory, request, jsonify
 from app import create_app
+from app.utils.log_queue import add_log_handler
 
 app = create_app()
 
@@ -103,10 +104,10 @@ def _setup_logging(flask_app):
             delay=True  # فایل را تا اولین log باز نمی‌کند
         )
         fh.setLevel(logging.INFO)
-        fh.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
-        
+
+        # فایل پشت صف لاگ نوشته می‌شود (نوشتن و rotate در thread پس‌زمینه، خطوط JSON؛ app.utils.log_queue)
         flask_app.logger.setLevel(logging.INFO)
-        flask_app.logger.addHandler(fh)
+        add_log_handler(flask_app, fh)
     except Exception as e:
         # اگر logging setup با خطا مواجه شد، فقط print می‌کنیم
         # تا برنامه crash نکند
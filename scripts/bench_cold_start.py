@@ -0,0 +1,121 @@
+"""
+Cold-start benchmark: time `import app` + `create_app()` in fresh Python processes.
+
+Usage:
+  python scripts/bench_cold_start.py                 # 10 runs, target 400 ms (median)
+  python scripts/bench_cold_start.py -n 20 --target 300
+  python scripts/bench_cold_start.py --profile       # + per-step / per-import report of the last run
+  python scripts/bench_cold_start.py --no-bytecode   # no .pyc available (first start after a deploy)
+
+Notes:
+  - Every run is a new interpreter, as a Passenger/WSGI worker start would be. One untimed run
+    comes first so .pyc files and the template bytecode cache exist (as on a running server).
+  - "import" is `from app import create_app` (flask, werkzeug, the package itself), "create_app"
+    covers config, blueprints and template warm-up; "process" is the wall time of the whole child.
+  - Target: median import + create_app <= 400 ms with warm bytecode caches. Exit code is 1 when
+    the median is above --target, so it can run in CI after changes to startup code.
+  - Reference (2 vCPU, warm caches): ~1.15 s before lazy imports / deferred DB (SQLAlchemy ~250 ms,
+    pywebpush + aiohttp ~180 ms, requests ~40 ms, Pillow ~30 ms); ~0.30 s after.
+  - Deploy tip: `python -m compileall -q app admin` so the first worker does not compile
+    ~7k lines of admin/express_partner routes (--no-bytecode shows that cost).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# Ensure project root on sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+print("BENCH " + json.dumps({
+    "import": (t1 - t0) * 1000,
+    "create_app": (t2 - t1) * 1000,
+    "profile": app.extensions.get("startup_profile"),
+}))
+"""
+
+
+def _run(env: Dict[str, str]) -> Dict:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=False
+    )
+    wall = (time.perf_counter() - started) * 1000
+    for line in proc.stdout.splitlines():
+        if line.startswith('BENCH '):
+            result = json.loads(line[6:])
+            result['process'] = wall
+            return result
+    raise RuntimeError(f"child failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+
+
+def _summary(values: List[float]) -> str:
+    ordered = sorted(values)
+    p90 = ordered[min(len(ordered) - 1, int(round(0.9 * (len(ordered) - 1))))]
+    return f"median {statistics.median(ordered):7.1f}  p90 {p90:7.1f}  min {ordered[0]:7.1f}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cold-start time of create_app()")
+    parser.add_argument('-n', type=int, default=10, help="number of timed runs")
+    parser.add_argument('--target', type=float, default=400.0, help="target median import + create_app (ms)")
+    parser.add_argument('--profile', action='store_true', help="print the startup profile of the last run")
+    parser.add_argument('--no-bytecode', action='store_true', help="run without cached .pyc files")
+    parser.add_argument('--no-warmup', action='store_true', help="disable template warm-up (TEMPLATE_WARMUP=0)")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    if args.profile:
+        env['VINOR_STARTUP_PROFILE'] = '1'
+    if args.no_warmup:
+        env['TEMPLATE_WARMUP'] = '0'
+
+    pycache_dir = None
+    if args.no_bytecode:
+        pycache_dir = tempfile.TemporaryDirectory(prefix='vinor-pycache-')
+        env['PYTHONDONTWRITEBYTECODE'] = '1'
+        env['PYTHONPYCACHEPREFIX'] = pycache_dir.name
+    else:
+        _run(env)  # warm-up: .pyc و jinja bytecode cache
+
+    runs = [_run(env) for _ in range(max(1, args.n))]
+    if pycache_dir is not None:
+        pycache_dir.cleanup()
+
+    totals = [r['import'] + r['create_app'] for r in runs]
+    print(f"{len(runs)} runs (ms)")
+    print(f"  import app        {_summary([r['import'] for r in runs])}")
+    print(f"  create_app()      {_summary([r['create_app'] for r in runs])}")
+    print(f"  import + create   {_summary(totals)}")
+    print(f"  process wall      {_summary([r['process'] for r in runs])}")
+
+    if args.profile and runs[-1].get('profile'):
+        from app.utils.startup_profile import format_report
+        print("startup profile (last run):")
+        print(format_report(runs[-1]['profile']))
+
+    median = statistics.median(totals)
+    ok = median <= args.target
+    print(f"target {args.target:.0f} ms: {'OK' if ok else 'FAIL'} (median {median:.1f} ms)")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
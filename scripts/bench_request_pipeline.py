@@ -0,0 +1,94 @@
+"""
+Benchmark the request pipeline for static/media routes with and without the fast path.
+
+Usage:
+  python scripts/bench_request_pipeline.py              # 2000 requests per route and mode
+  python scripts/bench_request_pipeline.py -n 5000 --guest
+
+Notes:
+  - Requests go through the Flask test client (full WSGI stack, no network), as a logged-in
+    partner with a permanent session unless --guest is given.
+  - "legacy" runs the same app with ROUTE_FAST_PATH=False: session load/save, XSRF-TOKEN cookie,
+    landing_gate and partner tracking hooks run for every image, as before route classification.
+  - A temporary image is written under UPLOAD_FOLDER and removed afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from typing import List, Optional
+
+# Ensure project root on sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app import create_app
+
+
+def _pick_static_file(static_dir: str) -> Optional[str]:
+    for dirpath, _, filenames in os.walk(static_dir):
+        for fn in sorted(filenames):
+            if fn.endswith(('.css', '.js')) and 'uploads' not in dirpath:
+                return os.path.relpath(os.path.join(dirpath, fn), static_dir).replace(os.sep, '/')
+    return None
+
+
+def _bench(client, url: str, n: int):
+    client.get(url)  # warm-up (resolver cache, manifest)
+    started = time.perf_counter()
+    for _ in range(n):
+        resp = client.get(url)
+        resp.close()
+    elapsed = time.perf_counter() - started
+    return elapsed / n * 1e6, resp
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare per-request overhead of static/media routes")
+    parser.add_argument('-n', type=int, default=2000, help="requests per route and mode")
+    parser.add_argument('--guest', action='store_true', help="benchmark without a session cookie")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    app.config.update(METRICS_SERVER_TIMING=False)
+    upload_dir = app.config['UPLOAD_FOLDER']
+    name = f"bench-{uuid.uuid4().hex[:8]}.jpg"
+    path = os.path.join(upload_dir, name)
+    with open(path, 'wb') as f:
+        f.write(b'\xff\xd8\xff\xe0' + os.urandom(16 * 1024))
+
+    urls = [f"/uploads/{name}"]
+    static_rel = _pick_static_file(app.static_folder)
+    if static_rel:
+        urls.append(f"/static/{static_rel}")
+
+    try:
+        print(f"{'route':<48} {'mode':<7} {'us/req':>9}  Set-Cookie")
+        for url in urls:
+            results = {}
+            for mode, fast in (('legacy', False), ('fast', True)):
+                app.config['ROUTE_FAST_PATH'] = fast
+                client = app.test_client()
+                if not args.guest:
+                    with client.session_transaction() as sess:
+                        sess['user_phone'] = '09120000000'
+                        sess.permanent = True
+                us, resp = _bench(client, url, args.n)
+                results[mode] = us
+                cookies = ', '.join(sorted({c.split('=', 1)[0] for c in resp.headers.getlist('Set-Cookie')})) or '-'
+                print(f"{url[:48]:<48} {mode:<7} {us:>9.1f}  {cookies}")
+            print(f"{'':<48} {'speedup':<7} {results['legacy'] / results['fast']:>8.2f}x")
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,47 @@
+"""
+Build the static asset manifest (content-hash fingerprints for app/static and admin/static).
+
+Usage:
+  python scripts/build_static_manifest.py            # write <instance>/data/static_manifest.json
+  python scripts/build_static_manifest.py --full     # re-hash every file, ignoring the saved manifest
+  python scripts/build_static_manifest.py --out build/static_manifest.json
+
+Notes:
+  - Run it as a deploy/build step: app startup then only stats files and reuses these hashes.
+  - The app never trusts a stale manifest blindly; entries whose size/mtime changed are re-hashed at startup.
+  - Point STATIC_MANIFEST_PATH at --out if you write it somewhere else.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+# Ensure project root on sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app import create_app
+from app.utils.static_manifest import get_static_manifest
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build the static asset fingerprint manifest")
+    parser.add_argument('--out', default=None, help="manifest path (default: STATIC_MANIFEST_PATH)")
+    parser.add_argument('--full', action='store_true', help="re-hash all files")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    manifest = get_static_manifest(app)
+    stats = manifest.build(reuse=not args.full)
+    path = manifest.save(args.out)
+    files = ', '.join(f"{ns}: {n}" for ns, n in stats['files'].items())
+    print(f"Files: {files} | hashed {stats['hashed']}, reused {stats['reused']} in {stats['build_seconds']:.3f}s")
+    print(f"Manifest: {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,64 @@
+"""
+Garbage-collect content-addressed upload blobs that no listing or partner avatar references.
+
+Usage:
+  python scripts/gc_blobs.py                 # rebuild refs from lands.json / partners, then delete
+  python scripts/gc_blobs.py --dry-run       # only report what would be deleted
+  python scripts/gc_blobs.py --grace-hours 0 # also delete blobs uploaded moments ago
+
+Notes:
+  - The reference table is rebuilt from the source of truth (lands.json images/image/cover and
+    partner avatars) before collecting, so refs missed by a crashed request never cause data loss.
+  - A blob is deleted only if it is unreferenced AND older than the grace period (BLOB_GC_GRACE_HOURS,
+    default 24h): an image uploaded for a listing form that was not saved yet is kept.
+  - Each deleted blob also loses all of its ``__variants__/<preset>/blobs/<hh>/<sha256>.*`` files.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+# Ensure project root on sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app import create_app
+from app.services.blob_store import DEFAULT_GC_GRACE_HOURS, collect_owners, get_blob_store
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Delete unreferenced upload blobs and their variants")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be deleted")
+    parser.add_argument('--grace-hours', type=float, default=None,
+                        help="minimum age of an unreferenced blob (default: BLOB_GC_GRACE_HOURS)")
+    parser.add_argument('--no-rebuild', action='store_true',
+                        help="trust the current reference table instead of rebuilding it")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    grace_hours = args.grace_hours
+    if grace_hours is None:
+        grace_hours = float(app.config.get('BLOB_GC_GRACE_HOURS', DEFAULT_GC_GRACE_HOURS))
+    store = get_blob_store(app)
+
+    if not args.no_rebuild:
+        owners = collect_owners(app)
+        refs = store.rebuild_refs(owners)
+        print(f"Refs rebuilt: {refs} references from {len(owners)} owners")
+
+    before = store.stats()
+    print(f"Blobs: {before['blobs']} ({before['bytes'] / 1048576:.1f} MiB) | unreferenced: {before['unreferenced']}")
+    stats = store.gc(grace_seconds=grace_hours * 3600, dry_run=args.dry_run)
+    verb = "Would delete" if args.dry_run else "Deleted"
+    print(
+        f"{verb} {stats['blobs']} blobs and {stats['variants']} variants "
+        f"({stats['bytes'] / 1048576:.1f} MiB); kept {stats['kept_recent']} recent unreferenced blobs"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,21 +1,239 @@
-import subprocess
-from flask import Blueprint, request
+"""
+Pre-generate image variants (thumb / card / full / 2x WebP) for every image that
+listings (lands.json) and partner avatars reference, using a multiprocessing pool.
 
-webhook_bp = Blueprint('webhook', __name__)
+Usage:
+  python scripts/generate_image_versions.py                  # all presets, cpu workers
+  python scripts/generate_image_versions.py --dry-run        # only count what would be rendered
+  python scripts/generate_image_versions.py --presets thumb,card --workers 4
+  python scripts/generate_image_versions.py --retry-failed   # also retry sources that failed last time
 
-@webhook_bp.route('/git-webhook', methods=['POST'])
-def git_webhook():
-    event = request.headers.get('X-GitHub-Event')
-    if event != 'push':
-        return '❌ Unsupported event', 400
+Notes:
+  - Variants are written next to the source root (``<root>/__variants__/<preset>_q<q>/...``),
+    exactly where /uploads/<path>?variant=<preset> looks for them, including legacy static/uploads.
+  - A variant whose mtime is >= the source mtime is considered fresh and skipped.
+  - Progress is checkpointed to a JSON manifest, so an interrupted run resumes where it stopped;
+    sources that failed to decode are not retried unless they change or --retry-failed is given.
+"""
+from __future__ import annotations
 
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Ensure project root on sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app import create_app
+from app.routes.uploads import UploadPathResolver, get_upload_resolver
+from app.utils.images import (
+    DEFAULT_FMT, VARIANT_PRESETS, normalize_upload_url, render_variant, resolve_variant, variant_target,
+)
+from app.utils.storage import data_dir, load_ads, load_express_partners
+
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'}
+CHECKPOINT_EVERY = 25
+
+# (key, src_abs, variant_abs, width, quality, src_mtime)
+Task = Tuple[str, str, str, int, int, float]
+
+
+# -------- جمع‌آوری تصاویر --------
+def _image_values(value) -> Iterator[str]:
+    if isinstance(value, str):
+        if value.strip():
+            yield value.strip()
+    elif isinstance(value, dict):
+        for k in ('url', 'src', 'path'):
+            if isinstance(value.get(k), str) and value[k].strip():
+                yield value[k].strip()
+                break
+    elif isinstance(value, list):
+        for v in value:
+            yield from _image_values(v)
+
+
+def referenced_images(app) -> List[str]:
+    """مسیرهای تصویر آگهی‌ها و آواتار همکاران (بدون تکرار، به ترتیب اولین ظهور)."""
+    refs: List[str] = []
+    with app.app_context():
+        for ad in load_ads(app) or []:
+            if isinstance(ad, dict):
+                for key in ('images', 'image', 'cover'):
+                    refs.extend(_image_values(ad.get(key)))
+        for partner in load_express_partners(app) or []:
+            if isinstance(partner, dict):
+                refs.extend(_image_values(partner.get('avatar')))
+    return list(dict.fromkeys(refs))
+
+
+def locate(ref: str, resolver: UploadPathResolver) -> Optional[Tuple[str, str]]:
+    """ref ذخیره‌شده → (upload_root, rel_path) با همان resolver مسیر /uploads/<path>؛ URL خارجی/ناموجود → None."""
+    if '://' in ref or ref.startswith('/static/') or ref.startswith('data:'):
+        return None
+    url = normalize_upload_url(ref.split('?', 1)[0])
+    if not url.startswith('/uploads/'):
+        return None
+    rel = os.path.normpath(url[len('/uploads/'):]).replace('\\', '/')
+    if not rel or rel.startswith('..') or rel.startswith('__variants__/'):
+        return None
+    if os.path.splitext(rel)[1].lower() not in IMAGE_EXTS:
+        return None
+    return resolver.resolve(rel)
+
+
+def plan(sources: Iterable[Tuple[str, str]], presets: List[str], manifest: Dict[str, dict],
+         force: bool = False, retry_failed: bool = False) -> Tuple[List[Task], Dict[str, int]]:
+    """واریانت‌هایی که باید ساخته شوند؛ تازه‌ها (mtime) و خطاهای قبلی کنار گذاشته می‌شوند."""
+    tasks: List[Task] = []
+    counts = {'fresh': 0, 'failed_before': 0}
+    for root, rel in sources:
+        for preset in presets:
+            _, width, quality, folder = resolve_variant(preset=preset)
+            target = variant_target(root, rel, folder, DEFAULT_FMT)
+            if target is None:
+                continue
+            src_abs, _, variant_abs = target
+            src_mtime = os.path.getmtime(src_abs)
+            key = os.path.relpath(variant_abs, ROOT).replace('\\', '/')
+            if not force:
+                try:
+                    if os.path.getmtime(variant_abs) >= src_mtime:
+                        counts['fresh'] += 1
+                        continue
+                except OSError:
+                    pass
+                prev = manifest.get(key) or {}
+                if prev.get('status') == 'failed' and prev.get('src_mtime') == src_mtime and not retry_failed:
+                    counts['failed_before'] += 1
+                    continue
+            tasks.append((key, src_abs, variant_abs, width, quality, src_mtime))
+    return tasks, counts
+
+
+# -------- manifest --------
+def load_manifest(path: str) -> Dict[str, dict]:
     try:
-        # مسیر واقعی پروژه روی سرور
-        project_path = '/home/garmabs2/myapp'
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data.get('variants', {}) if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def save_manifest(path: str, variants: Dict[str, dict]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'updated_at': int(time.time()), 'variants': variants}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+# -------- اجرا --------
+def _render(task: Task) -> Tuple[str, bool, float, int]:
+    key, src_abs, variant_abs, width, quality, _ = task
+    ok, seconds = render_variant(src_abs, variant_abs, width, quality, DEFAULT_FMT)
+    size = os.path.getsize(variant_abs) if ok and os.path.isfile(variant_abs) else 0
+    return key, ok, seconds, size
+
+
+def run(tasks: List[Task], manifest: Dict[str, dict], manifest_path: str, workers: int) -> Dict[str, float]:
+    by_key = {t[0]: t for t in tasks}
+    stats = {'rendered': 0, 'failed': 0, 'bytes': 0, 'render_seconds': 0.0}
+    started = time.perf_counter()
+    pool = Pool(processes=workers)
+    try:
+        for i, (key, ok, seconds, size) in enumerate(pool.imap_unordered(_render, tasks, chunksize=4), 1):
+            stats['rendered' if ok else 'failed'] += 1
+            stats['bytes'] += size
+            stats['render_seconds'] += seconds
+            manifest[key] = {
+                'status': 'done' if ok else 'failed',
+                'src_mtime': by_key[key][5],
+                'bytes': size,
+                'seconds': round(seconds, 4),
+            }
+            if not ok:
+                print(f"  failed: {by_key[key][1]}", file=sys.stderr)
+            if i % CHECKPOINT_EVERY == 0:
+                save_manifest(manifest_path, manifest)
+                elapsed = time.perf_counter() - started
+                print(f"  {i}/{len(tasks)} variants ({i / elapsed:.1f}/s)")
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print("Interrupted; progress saved to manifest.", file=sys.stderr)
+    finally:
+        pool.join()
+        save_manifest(manifest_path, manifest)
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pre-generate responsive image variants")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--presets', default=','.join(VARIANT_PRESETS),
+                        help="comma separated presets (default: %(default)s)")
+    parser.add_argument('--manifest', default=None,
+                        help="progress manifest (default: <instance>/data/image_variants_manifest.json)")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be rendered")
+    parser.add_argument('--force', action='store_true', help="re-render even fresh variants")
+    parser.add_argument('--retry-failed', action='store_true', help="retry sources that failed before")
+    parser.add_argument('--limit', type=int, default=0, help="render at most N variants this run")
+    args = parser.parse_args(argv)
+
+    presets = [p.strip() for p in args.presets.split(',') if p.strip()]
+    unknown = [p for p in presets if p not in VARIANT_PRESETS]
+    if unknown:
+        parser.error(f"unknown presets: {', '.join(unknown)} (choose from {', '.join(VARIANT_PRESETS)})")
+
+    app = create_app()
+    with app.app_context():
+        manifest_path = args.manifest or os.path.join(data_dir(app), 'image_variants_manifest.json')
+    manifest = load_manifest(manifest_path)
+
+    with app.app_context():
+        resolver = get_upload_resolver(app)
+    refs = referenced_images(app)
+    sources = []
+    skipped = 0
+    for ref in refs:
+        hit = locate(ref, resolver)
+        if hit is None:
+            skipped += 1
+        else:
+            sources.append(hit)
+    sources = list(dict.fromkeys(sources))
+
+    tasks, counts = plan(sources, presets, manifest, force=args.force, retry_failed=args.retry_failed)
+    if args.limit > 0:
+        tasks = tasks[:args.limit]
+    print(f"References: {len(refs)} | images: {len(sources)} | skipped (external/missing): {skipped}")
+    print(f"Variants: {len(tasks)} to render | {counts['fresh']} fresh | {counts['failed_before']} failed before")
+    if args.dry_run or not tasks:
+        return 0
+
+    stats = run(tasks, manifest, manifest_path, max(1, args.workers))
+    elapsed = max(stats['elapsed'], 1e-6)
+    images = len({t[1] for t in tasks})
+    print(
+        f"Done in {elapsed:.1f}s: {stats['rendered']} rendered, {stats['failed']} failed, "
+        f"{stats['bytes'] / 1048576:.1f} MiB written"
+    )
+    print(
+        f"Throughput: {images / elapsed:.1f} images/s, {(stats['rendered'] + stats['failed']) / elapsed:.1f} variants/s "
+        f"(avg render {stats['render_seconds'] / max(1, stats['rendered'] + stats['failed']):.3f}s)"
+    )
+    print(f"Manifest: {manifest_path}")
+    return 1 if stats['failed'] else 0
 
-        # اجرای git pull
-        subprocess.Popen(['git', '-C', project_path, 'pull'])
-        return '✅ Git pull triggered successfully.', 200
 
-    except Exception as e:
-        return f'❌ Error during git pull: {str(e)}', 500
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,56 @@
+"""
+Validate and precompile all Jinja templates (app, express_partner and admin) into the bytecode cache.
+
+Usage:
+  python scripts/precompile_templates.py             # compile into <instance>/jinja_cache
+  python scripts/precompile_templates.py --clear     # drop stale cache files first
+  python scripts/precompile_templates.py --check     # only validate (no cache writes)
+
+Notes:
+  - Run it as a deploy step: every worker then loads compiled bytecode instead of parsing templates.
+  - Exit code is 1 if any template fails to compile, so a broken template blocks the deploy.
+  - Point TEMPLATE_CACHE_DIR at a shared path if workers run with a different instance folder.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+# Ensure project root on sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# startup warm-up را خاموش می‌کنیم؛ کامپایل همین‌جا و با گزارش خطا انجام می‌شود
+os.environ.setdefault("TEMPLATE_WARMUP", "0")
+
+from app import create_app
+from app.utils.template_cache import precompile_templates, template_cache_dir
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Validate and precompile Jinja templates")
+    parser.add_argument('--clear', action='store_true', help="clear the bytecode cache before compiling")
+    parser.add_argument('--check', action='store_true', help="validate only, without writing the cache")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    cache = app.jinja_env.bytecode_cache
+    if args.check:
+        app.jinja_env.bytecode_cache = None
+    elif cache is not None and args.clear:
+        cache.clear()
+
+    stats = precompile_templates(app)
+    for name, message in stats['errors']:
+        print(f"ERROR {name}: {message}")
+    print(f"Templates: {stats['compiled']}/{stats['templates']} compiled in {stats['seconds']:.3f}s")
+    if not args.check and cache is not None:
+        print(f"Bytecode cache: {template_cache_dir(app)}")
+    return 1 if stats['errors'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,93 @@
+"""
+Write precompressed .gz (and .br, when brotli is installed) siblings next to static text assets.
+
+Usage:
+  python scripts/precompress_static.py            # app/static and admin/static
+  python scripts/precompress_static.py --force    # rebuild every sibling, even if up to date
+  python scripts/precompress_static.py --check    # report missing/stale siblings, exit 1 if any
+  python scripts/precompress_static.py --clean    # delete all .gz/.br siblings
+
+Notes:
+  - Run it as a deploy/build step next to build_static_manifest.py. At request time the static
+    endpoints serve a sibling only if its mtime matches the source, so a stale one is ignored.
+  - Siblings get the source file's mtime; a file is skipped if compression saves less than 5%.
+  - Without brotli (pip install brotli) only .gz files are written and br is never negotiated.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+# Ensure project root on sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.utils.compression import ENCODINGS, brotli_module, iter_precompress_sources, precompress_file
+
+STATIC_ROOTS = [os.path.join(ROOT, 'app', 'static'), os.path.join(ROOT, 'admin', 'static')]
+
+
+def _siblings(root: str):
+    for dirpath, _, filenames in os.walk(root):
+        for fn in filenames:
+            if fn.endswith(tuple(ext for _, ext in ENCODINGS)):
+                yield os.path.join(dirpath, fn)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Precompress static text assets (.gz/.br siblings)")
+    parser.add_argument('--force', action='store_true', help="rewrite siblings that are up to date")
+    parser.add_argument('--check', action='store_true', help="only report missing or stale siblings")
+    parser.add_argument('--clean', action='store_true', help="remove all .gz/.br siblings")
+    parser.add_argument('--min-size', type=int, default=256, help="skip files smaller than this (bytes)")
+    args = parser.parse_args(argv)
+
+    roots = [r for r in STATIC_ROOTS if os.path.isdir(r)]
+    if args.clean:
+        removed = 0
+        for root in roots:
+            for path in _siblings(root):
+                os.remove(path)
+                removed += 1
+        print(f"Removed {removed} precompressed files")
+        return 0
+
+    encodings = [(enc, ext) for enc, ext in ENCODINGS if enc != 'br' or brotli_module()]
+    if args.check:
+        stale = []
+        for root in roots:
+            for path in iter_precompress_sources(root):
+                if os.path.getsize(path) < args.min_size:
+                    continue
+                mtime = os.stat(path).st_mtime
+                for _, ext in encodings:
+                    if os.path.exists(path + ext) and os.stat(path + ext).st_mtime != mtime:
+                        stale.append(path + ext)
+                if not any(os.path.exists(path + ext) for _, ext in encodings):
+                    stale.append(path)
+        for path in stale:
+            print(f"missing/stale: {os.path.relpath(path, ROOT)}")
+        print(f"{len(stale)} files need precompressing")
+        return 1 if stale else 0
+
+    files = written = size_in = size_out = 0
+    for root in roots:
+        for path in iter_precompress_sources(root):
+            files += 1
+            for encoding, original, compressed in precompress_file(path, min_size=args.min_size, force=args.force):
+                written += 1
+                if encoding == 'gzip':
+                    size_in += original
+                    size_out += compressed
+    print(f"Encodings: {', '.join(enc for enc, _ in encodings)}"
+          + ("" if brotli_module() else " (brotli not installed)"))
+    print(f"Scanned {files} files, wrote {written} siblings"
+          + (f"; gzip {size_in / 1024:.0f} KiB → {size_out / 1024:.0f} KiB" if size_in else ""))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
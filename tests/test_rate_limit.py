@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""قواعد چندگانهٔ rate limit همه یا هیچ‌اند: درخواست ردشده سهمیهٔ قاعدهٔ دیگر را مصرف نمی‌کند."""
+import pytest
+from flask import Flask
+
+from app.express_partner.routes import OTP_RULES
+from app.services.rate_limit import check
+
+VICTIM = '09120000001'
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def app(request, tmp_path):
+    app = Flask(__name__)
+    app.config.update(RATE_LIMIT_BACKEND=request.param,
+                      RATE_LIMIT_SQLITE_PATH=str(tmp_path / 'rate_limits.sqlite3'))
+    return app
+
+
+def _otp(app, phone, ip):
+    with app.test_request_context('/', method='POST', json={'phone': phone},
+                                  environ_base={'REMOTE_ADDR': ip}):
+        return check(OTP_RULES, app)
+
+
+def test_throttled_ip_does_not_drain_victim_phone(app):
+    attacker = '10.0.0.66'
+    for i in range(10):
+        assert _otp(app, '0935000%04d' % i, attacker) is None
+    assert _otp(app, '09350009999', attacker) is not None
+    for _ in range(3):
+        assert _otp(app, VICTIM, attacker) is not None
+    # سطل otp_phone قربانی دست‌نخورده است
+    for _ in range(3):
+        assert _otp(app, VICTIM, '10.0.0.7') is None
+    assert _otp(app, VICTIM, '10.0.0.7') is not None
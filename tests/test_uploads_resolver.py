@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""سرو /uploads/<path> برای مسیرهای blob ذخیره‌شده با پیشوند 'uploads/' (پیش‌نمایش پنل ادمین)."""
+import os
+
+import pytest
+
+from app import create_app
+from app.routes.uploads import UploadPathResolver, upload_roots
+
+BLOB_REL = 'blobs/ab/' + 'ab' + '0' * 62 + '.jpg'
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    upload_folder = tmp_path / 'uploads'
+    monkeypatch.setenv('INSTANCE_PATH', str(tmp_path / 'instance'))
+    monkeypatch.setenv('UPLOAD_FOLDER', str(upload_folder))
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, IMAGE_VARIANT_POOL='inline')
+    blob = upload_folder / BLOB_REL
+    blob.parent.mkdir(parents=True)
+    blob.write_bytes(b'\xff\xd8\xff\xe0' + b'\0' * 64)
+    return app
+
+
+def test_resolver_strips_uploads_prefix_for_upload_folder(app):
+    resolver = UploadPathResolver(upload_roots(app))
+    root, rel = resolver.resolve('uploads/' + BLOB_REL)
+    assert root == app.config['UPLOAD_FOLDER']
+    assert rel == BLOB_REL
+    assert resolver.resolve(BLOB_REL) == (root, rel)
+
+
+def test_admin_preview_url_serves_blob(app):
+    # قالب‌های ویرایش ادمین: '/uploads/' + 'uploads/blobs/...'
+    image = 'uploads/' + BLOB_REL
+    resp = app.test_client().get('/uploads/' + image)
+    assert resp.status_code == 200
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], BLOB_REL))